@@ -0,0 +1,177 @@
+# This file contains a local stand-in for Minecraft Java servers, used by the benchmarks.
+#
+# It speaks the real Server List Ping protocol (handshake, status request/response, ping/pong),
+# so MCPClient and mcstatus run their normal code paths against it. Each server can be given a
+# response latency (with jitter), a loss rate (the connection is dropped without an answer) and
+# can be blackholed (connections are accepted but never answered, so clients run into their timeout).
+#
+# Usage (from the project root), e.g. to try the app against a slow server by hand:
+#   python benchmarks/fake_minecraft.py --port 25565 --latency 0.2 --loss 0.1
+
+import argparse
+import asyncio
+import json
+import random
+
+
+def encode_varint(value):
+    """Encodes an int as a protocol VarInt (7 bits per byte, two's complement for negatives)."""
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+async def read_varint(reader):
+    value = 0
+    for shift in range(0, 35, 7):
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value
+    raise ValueError("VarInt is too long")
+
+
+def decode_varint(data, offset=0):
+    """Decodes a VarInt from a bytes buffer. Returns (value, new_offset)."""
+    value = 0
+    for shift in range(0, 35, 7):
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+    raise ValueError("VarInt is too long")
+
+
+def encode_packet(packet_id, payload=b''):
+    body = encode_varint(packet_id) + payload
+    return encode_varint(len(body)) + body
+
+
+async def read_packet(reader):
+    """Reads one length-prefixed packet. Returns (packet_id, payload)."""
+    length = await read_varint(reader)
+    data = await reader.readexactly(length)
+    packet_id, offset = decode_varint(data)
+    return packet_id, data[offset:]
+
+
+class FakeMinecraftServer:
+    """A Server List Ping responder with configurable latency, loss and blackholing."""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, loss=0.0, blackhole=False,
+                 players=10, max_players=100, version='1.20.4', protocol=765, motd='Benchmark server', seed=None):
+        """
+        Args:
+            host (str), port (int): Address to listen on (port 0 picks a free port; see .port after start()).
+            latency (float): Seconds to wait before answering a status request or ping.
+            jitter (float): Up to this many seconds are randomly added to `latency`.
+            loss (float): Fraction of connections (0-1) dropped without an answer.
+            blackhole (bool): Accept connections but never answer them.
+            players, max_players, version, protocol, motd: Reported in the status response.
+            seed (int): Seed for the loss/jitter random numbers, for repeatable runs.
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.blackhole = blackhole
+        self.status = {
+            "version": {"name": version, "protocol": protocol},
+            "players": {"online": players, "max": max_players},
+            "description": {"text": motd},
+        }
+        self._random = random.Random(seed)
+        self._server = None
+
+        # Counters
+        self.connections = 0
+        self.answered = 0
+        self.dropped = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def stats(self):
+        return {"port": self.port, "connections": self.connections, "answered": self.answered, "dropped": self.dropped}
+
+    async def _delay(self):
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            if self.blackhole:
+                await reader.read() # Hold the connection open until the client gives up
+                return
+            if self.loss and self._random.random() < self.loss:
+                self.dropped += 1
+                return
+            packet_id, _ = await read_packet(reader) # Handshake (next state 1 = status)
+            if packet_id != 0:
+                return
+            while True:
+                packet_id, payload = await read_packet(reader)
+                await self._delay()
+                if packet_id == 0: # Status request
+                    body = json.dumps(self.status).encode('utf-8')
+                    writer.write(encode_packet(0, encode_varint(len(body)) + body))
+                    self.answered += 1
+                elif packet_id == 1: # Ping: echo the token
+                    writer.write(encode_packet(1, payload[:8]))
+                else:
+                    return
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass # The client closed the connection (normal after a status exchange)
+        finally:
+            writer.close()
+
+
+async def serve_many(specs):
+    """Starts one FakeMinecraftServer per keyword-argument dict in `specs` and returns them."""
+    return [await FakeMinecraftServer(**spec).start() for spec in specs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Minecraft Java server (Server List Ping only).")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=25565)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds before each answer.")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Random extra seconds per answer, up to this.")
+    parser.add_argument('--loss', type=float, default=0.0, help="Fraction of connections dropped unanswered.")
+    parser.add_argument('--blackhole', action='store_true', help="Never answer (clients time out).")
+    parser.add_argument('--players', type=int, default=10)
+    args = parser.parse_args()
+
+    async def run():
+        server = await FakeMinecraftServer(args.host, args.port, args.latency, args.jitter, args.loss,
+                                           args.blackhole, players=args.players).start()
+        print(f"Fake Minecraft server listening on {args.host}:{server.port}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
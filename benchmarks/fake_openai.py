@@ -0,0 +1,134 @@
+# This file contains a local stand-in for the OpenAI chat completions API, used by the benchmarks.
+#
+# It answers POST /v1/chat/completions in the OpenAI wire format, both as one JSON response and as
+# a server-sent event stream, so the real OpenAI client library (and its connection pool) is used.
+# The time to first token and the token rate are configurable; replies are a fixed number of words.
+#
+# Usage (from the project root), e.g. to point the app at it by hand (config.OPENAI_BASE_URL):
+#   python benchmarks/fake_openai.py --port 8001 --ttft 0.3 --tokens-per-second 50
+
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+import uvicorn
+
+
+class FakeOpenAI:
+    """An ASGI app implementing the chat completions endpoint with simulated model timing."""
+
+    def __init__(self, ttft=0.3, tokens_per_second=50.0, reply_tokens=40):
+        """
+        Args:
+            ttft (float): Seconds until the first token (for non-streamed replies: before any output).
+            tokens_per_second (float): Rate at which the remaining tokens are produced (0 = instantly).
+            reply_tokens (int): Number of tokens (words) in each reply.
+        """
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self._ids = itertools.count(1)
+
+        # Counters
+        self.requests = 0
+        self.streamed = 0
+
+    def _generation_time(self):
+        return self.ttft + (self.reply_tokens - 1) / self.tokens_per_second if self.tokens_per_second else self.ttft
+
+    def _tokens(self):
+        return [("Reply" if i == 0 else " word") for i in range(self.reply_tokens)]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        if scope['method'] != 'POST' or not scope['path'].endswith('/chat/completions'):
+            return await self._send_json(send, {"error": {"message": "Not found"}}, 404)
+
+        request = json.loads(body or b'{}')
+        self.requests += 1
+        completion_id = f"chatcmpl-bench{next(self._ids)}"
+        model = request.get('model', 'gpt-3.5-turbo')
+        prompt_tokens = len(json.dumps(request.get('messages', []))) // 4
+        if request.get('stream'):
+            self.streamed += 1
+            usage = (request.get('stream_options') or {}).get('include_usage')
+            return await self._stream(send, completion_id, model, prompt_tokens if usage else None)
+
+        await asyncio.sleep(self._generation_time())
+        await self._send_json(send, {
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(self._tokens())},
+                         "finish_reason": "stop"}],
+            "usage": self._usage(prompt_tokens),
+        })
+
+    def _usage(self, prompt_tokens):
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": self.reply_tokens,
+                "total_tokens": prompt_tokens + self.reply_tokens}
+
+    async def _stream(self, send, completion_id, model, prompt_tokens=None):
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')]})
+
+        async def event(delta, finish_reason=None, usage=None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            if usage is not None: # Final chunk requested with stream_options={"include_usage": true}
+                chunk.update(choices=[], usage=usage)
+            await send({'type': 'http.response.body', 'body': f"data: {json.dumps(chunk)}\n\n".encode(),
+                        'more_body': True})
+
+        await asyncio.sleep(self.ttft)
+        interval = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        for i, token in enumerate(self._tokens()):
+            if i and interval:
+                await asyncio.sleep(interval)
+            await event({"role": "assistant", "content": token} if i == 0 else {"content": token})
+        await event({}, "stop")
+        if prompt_tokens is not None:
+            await event(None, usage=self._usage(prompt_tokens))
+        await send({'type': 'http.response.body', 'body': b"data: [DONE]\n\n", 'more_body': False})
+
+    @staticmethod
+    async def _send_json(send, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def build_server(app, host='127.0.0.1', port=8001):
+    """Returns a uvicorn Server for the app (call .run() or await .serve())."""
+    return uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level='warning', lifespan='off',
+                                         backlog=4096))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI chat completions endpoint.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--ttft', type=float, default=0.3, help="Seconds until the first token.")
+    parser.add_argument('--tokens-per-second', type=float, default=50.0, help="Token rate after the first token.")
+    parser.add_argument('--reply-tokens', type=int, default=40, help="Tokens per reply.")
+    args = parser.parse_args()
+    print(f"Fake OpenAI endpoint on http://{args.host}:{args.port}/v1")
+    build_server(FakeOpenAI(args.ttft, args.tokens_per_second, args.reply_tokens), args.host, args.port).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+# This file load-tests the chat endpoints against local stand-ins for Minecraft servers and OpenAI.
+#
+# The stand-ins (fake_minecraft.py, fake_openai.py) run in a child process and speak the real
+# protocols, so the app exercises its full stack: DNS cache, status probes over TCP, status cache,
+# request coalescing, the pooled OpenAI client over HTTP. The app itself runs in this process in
+# either serving mode. Requests are sent open-loop at a fixed rate (not "as fast as responses come
+# back"), and latency is measured from each request's scheduled send time, so a server that falls
+# behind shows it in its percentiles instead of hiding it by slowing the load down.
+#
+# Results are written as JSON together with the git commit, so runs can be compared across commits:
+#   python benchmarks/load_test.py --rps 50 --duration 20 --json bench-base.json
+#   (change something)
+#   python benchmarks/load_test.py --rps 50 --duration 20 --json bench-new.json --compare bench-base.json
+#
+# Other knobs: --mode sync|asgi, --stream, --servers/--mc-latency/--mc-loss/--blackholed for the
+# Minecraft servers, --ttft/--tokens-per-second for OpenAI, --distinct-messages to control how
+# often requests repeat (and so what the caches and coalescing can save), --no-cache for cold runs.
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fake_minecraft import FakeMinecraftServer
+from fake_openai import FakeOpenAI, build_server as build_openai_server
+from serving_modes import free_port, percentile, start_asgi_server, start_sync_server
+
+from mcp_chat_app import config
+from mcp_chat_app.admission import client_limiter, openai_limits, probe_limiter
+from mcp_chat_app.llm_client import client_manager
+from mcp_chat_app.response_cache import response_cache
+from mcp_chat_app.status_cache import status_cache
+
+# Metrics compared by --compare, and whether a higher value is better.
+COMPARED_METRICS = {
+    "throughput_rps": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "error_rate": False,
+    "rss_growth_mb": False,
+}
+
+
+# --- Upstream stand-ins (child process) ---
+def run_upstreams(args, mc_ports, openai_port, ready):
+    """Runs the fake Minecraft servers and the fake OpenAI endpoint until the process is terminated."""
+    async def serve():
+        for index, port in enumerate(mc_ports):
+            await FakeMinecraftServer(port=port, latency=args.mc_latency, jitter=args.mc_jitter, loss=args.mc_loss,
+                                      blackhole=index >= len(mc_ports) - args.blackholed, seed=index).start()
+        openai = build_openai_server(FakeOpenAI(args.ttft, args.tokens_per_second, args.reply_tokens),
+                                     port=openai_port)
+        task = asyncio.ensure_future(openai.serve())
+        while not openai.started:
+            await asyncio.sleep(0.01)
+        ready.set()
+        await task
+
+    asyncio.run(serve())
+
+
+def start_upstreams(args):
+    """Starts the stand-ins in a child process. Returns (process, Minecraft ports, OpenAI port)."""
+    mc_ports = [free_port() for _ in range(args.servers)]
+    openai_port = free_port()
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=run_upstreams, args=(args, mc_ports, openai_port, ready), daemon=True)
+    process.start()
+    if not ready.wait(30):
+        process.terminate()
+        raise RuntimeError("The upstream stand-ins did not start")
+    return process, mc_ports, openai_port
+
+
+def configure_app(args, mc_ports, openai_port):
+    """Points the app at the stand-ins."""
+    config.MCP_SERVERS.clear()
+    config.MCP_SERVERS.add_many([{'name': f'Bench {i}', 'host': '127.0.0.1', 'port': port, 'type': 'Minecraft Java'}
+                                 for i, port in enumerate(mc_ports)])
+    config.OPENAI_API_KEY = 'benchmark-key'
+    config.OPENAI_BASE_URL = f"http://127.0.0.1:{openai_port}/v1"
+    client_manager.reset()
+    if args.no_cache: # Every request pays for the probe and the completion
+        status_cache.ttl = status_cache.negative_ttl = status_cache.stale_ttl = 0
+        response_cache.enabled = False
+    if not args.rate_limits: # All load comes from one address; the admission queue still applies
+        for limiter in (client_limiter, openai_limits.requests, openai_limits.tokens, probe_limiter):
+            limiter.rate = None
+
+
+# --- Load generator ---
+class BenchConnection:
+    """
+    A minimal keep-alive HTTP/1.1 client connection that understands fixed-length, chunked and
+    close-delimited bodies and notes when the first body byte arrived (time to first token for streams).
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._reader = self._writer = None
+
+    async def post_json(self, path, payload):
+        """Sends a JSON POST. Returns (status, first_byte_at) with perf_counter timestamps."""
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode('utf-8')
+        self._writer.write(f"POST {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                           f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body)
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        first_byte_at = None
+        if 'content-length' in headers:
+            await self._reader.readexactly(int(headers['content-length']))
+            first_byte_at = time.perf_counter()
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await self._reader.readline()).split(b';')[0], 16)
+                if size and first_byte_at is None:
+                    first_byte_at = time.perf_counter()
+                await self._reader.readexactly(size + 2) # Chunk data and its CRLF
+                if not size:
+                    break
+        else: # No length: the body runs until the server closes the connection
+            first_byte_at = time.perf_counter() if await self._reader.read(1) else None
+            await self._reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, first_byte_at
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+def build_payloads(args):
+    """Returns a function giving the request body of the i-th request."""
+    server_ids = [str(record.id) for record in config.MCP_SERVERS]
+
+    def payload(i):
+        key = i % args.distinct_messages if args.distinct_messages else i
+        body = {'message': f'How is the server doing? ({key})', 'server_id': server_ids[key % len(server_ids)]}
+        if args.no_cache:
+            body['cache'] = False
+        return body
+    return payload
+
+
+async def drive(host, port, path, rps, duration, payload, max_connections):
+    """
+    Sends requests open-loop at `rps` for `duration` seconds, with at most `max_connections` in flight.
+    Returns the raw samples: (status, latency_s, first_byte_s) per request and the elapsed time.
+    """
+    loop = asyncio.get_running_loop()
+    idle = []
+    slots = asyncio.Semaphore(max_connections)
+    samples = []
+
+    async def send_one(i, scheduled):
+        async with slots:
+            connection = idle.pop() if idle else BenchConnection(host, port)
+            try:
+                status, first_byte_at = await connection.post_json(path, payload(i))
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                connection.close()
+                status, first_byte_at = None, None
+            done = time.perf_counter()
+            if connection._writer is not None:
+                idle.append(connection)
+        samples.append((status, done - scheduled, first_byte_at - scheduled if first_byte_at else None))
+
+    started = time.perf_counter()
+    offset = started - loop.time()
+    tasks = []
+    for i in range(int(rps * duration)):
+        scheduled_loop_time = loop.time() if i == 0 else started - offset + i / rps
+        delay = scheduled_loop_time - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(send_one(i, scheduled_loop_time + offset)))
+    await asyncio.gather(*tasks)
+    for connection in idle:
+        connection.close()
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    """Turns raw samples into throughput, latency percentiles and error counts."""
+    ok = sorted(latency for status, latency, _ in samples if status == 200)
+    first_bytes = sorted(first for status, _, first in samples if status == 200 and first is not None)
+    errors = {}
+    for status, _, _ in samples:
+        if status != 200:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+    ms = lambda values, pct: round(percentile(values, pct) * 1000, 1)
+    return {
+        "requests": len(samples),
+        "succeeded": len(ok),
+        "errors": errors,
+        "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": ms(ok, 50),
+        "p95_ms": ms(ok, 95),
+        "p99_ms": ms(ok, 99),
+        "max_ms": round(ok[-1] * 1000, 1) if ok else 0.0,
+        "first_byte_p50_ms": ms(first_bytes, 50),
+        "first_byte_p99_ms": ms(first_bytes, 99),
+    }
+
+
+def memory_mb():
+    """Returns (current RSS, peak RSS) of this process in MB."""
+    current = peak = None
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    current = int(line.split()[1]) / 1024
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) / 1024
+    except OSError: # Not Linux: ru_maxrss is in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return current, peak
+
+
+def fetch_app_stats(port):
+    """Returns the app's /admin/stats counters (caches, coalescing, circuit breaker) after the run."""
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/admin/stats", timeout=10) as response:
+            return json.load(response)
+    except OSError as e:
+        return {"error": str(e)}
+
+
+def git_commit():
+    """Returns (commit, dirty) for the working tree, or (None, None) outside a git checkout."""
+    root = os.path.join(os.path.dirname(__file__), '..')
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def compare(result, baseline, tolerance):
+    """Prints the change of each compared metric against a baseline run. Returns the regressed metrics."""
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('timestamp')}):")
+    regressions = []
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        old, new = baseline['result'].get(metric), result.get(metric)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else (0.0 if new == old else float('inf'))
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance:
+            flag = "  <-- regression"
+            regressions.append(metric)
+        print(f"  {metric:<16} {old:>10} -> {new:<10} ({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /chat_with_llm against local Minecraft/OpenAI stand-ins.")
+    parser.add_argument('--mode', choices=('sync', 'asgi'), default='asgi', help="Serving mode under test.")
+    parser.add_argument('--sync-workers', type=int, default=16, help="Worker threads in sync mode.")
+    parser.add_argument('--rps', type=float, default=50, help="Target requests per second.")
+    parser.add_argument('--duration', type=float, default=20, help="Seconds of measured load.")
+    parser.add_argument('--warmup', type=float, default=3, help="Seconds of unmeasured load first.")
+    parser.add_argument('--max-connections', type=int, default=500, help="Most requests in flight at once.")
+    parser.add_argument('--stream', action='store_true', help="Drive /chat_with_llm/stream instead.")
+    parser.add_argument('--distinct-messages', type=int, default=0,
+                        help="Cycle through this many distinct requests (0 = every request is distinct).")
+    parser.add_argument('--no-cache', action='store_true', help="Disable the status and reply caches.")
+    parser.add_argument('--rate-limits', action='store_true',
+                        help="Keep the per-client, OpenAI and probe rate limits (lifted by default).")
+    parser.add_argument('--servers', type=int, default=4, help="Number of fake Minecraft servers.")
+    parser.add_argument('--blackholed', type=int, default=0, help="How many of them never answer.")
+    parser.add_argument('--mc-latency', type=float, default=0.02, help="Seconds before a server answers.")
+    parser.add_argument('--mc-jitter', type=float, default=0.01, help="Random extra answer delay, up to this.")
+    parser.add_argument('--mc-loss', type=float, default=0.0, help="Fraction of probes dropped unanswered.")
+    parser.add_argument('--ttft', type=float, default=0.3, help="OpenAI time to first token in seconds.")
+    parser.add_argument('--tokens-per-second', type=float, default=50, help="OpenAI token rate.")
+    parser.add_argument('--reply-tokens', type=int, default=40, help="Tokens per OpenAI reply.")
+    parser.add_argument('--json', help="Write the results to this JSON file.")
+    parser.add_argument('--compare', help="Compare with the results JSON of an earlier run.")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Relative change counted as a regression.")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Exit with status 1 on a regression.")
+    args = parser.parse_args()
+
+    upstreams, mc_ports, openai_port = start_upstreams(args) # Before any threads exist in this process
+    try:
+        configure_app(args, mc_ports, openai_port)
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        port = free_port()
+        stop = start_sync_server(port, args.sync_workers) if args.mode == 'sync' else start_asgi_server(port)
+        path = '/chat_with_llm/stream' if args.stream else '/chat_with_llm'
+        payload = build_payloads(args)
+        try:
+            if args.warmup:
+                print(f"Warming up for {args.warmup:g}s...")
+                asyncio.run(drive('127.0.0.1', port, path, args.rps, args.warmup, payload, args.max_connections))
+            rss_before, _ = memory_mb()
+            print(f"Running {args.mode} mode at {args.rps:g} req/s for {args.duration:g}s against {path}...")
+            samples, elapsed = asyncio.run(drive('127.0.0.1', port, path, args.rps, args.duration, payload,
+                                                 args.max_connections))
+            rss_after, rss_peak = memory_mb()
+            app_stats = fetch_app_stats(port)
+        finally:
+            stop()
+    finally:
+        upstreams.terminate()
+
+    result = summarize(samples, elapsed)
+    result.update({
+        "rss_mb": round(rss_after, 1) if rss_after is not None else None,
+        "rss_peak_mb": round(rss_peak, 1) if rss_peak is not None else None,
+        "rss_growth_mb": round(rss_after - rss_before, 1) if rss_after is not None and rss_before is not None else None,
+    })
+    print(f"  {result['throughput_rps']} req/s ({result['succeeded']}/{result['requests']} ok), "
+          f"p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, p99 {result['p99_ms']} ms, "
+          f"errors {result['errors'] or 0}, RSS {result['rss_mb']} MB (peak {result['rss_peak_mb']} MB)")
+    if args.stream:
+        print(f"  first byte p50 {result['first_byte_p50_ms']} ms, p99 {result['first_byte_p99_ms']} ms")
+
+    commit, dirty = git_commit()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "args": vars(args),
+        "result": result,
+        "app_stats": app_stats,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
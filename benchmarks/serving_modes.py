@@ -0,0 +1,268 @@
+# This file benchmarks the sync (Flask/WSGI) and async (ASGI) serving modes against each other.
+#
+# Both modes are started as real HTTP servers on localhost and driven with the same concurrent
+# load on POST /chat_with_llm. The OpenAI API and the Minecraft status ping are replaced by
+# stand-ins that only sleep for a configurable latency, so the numbers reflect how each serving
+# mode copes with slow upstreams rather than network conditions.
+#
+# Usage (from the project root):
+#   python benchmarks/serving_modes.py --requests 1000 --concurrency 200
+#   python benchmarks/serving_modes.py --modes asgi --llm-latency 0.5 --json results.json
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import uvicorn
+from werkzeug.serving import BaseWSGIServer
+
+from mcp_chat_app import config
+from mcp_chat_app.app import app as flask_app
+from mcp_chat_app.asgi import app as asgi_app
+from mcp_chat_app.llm_client import client_manager
+from mcp_chat_app.mcp_client import MCPClient
+from mcp_chat_app.response_cache import response_cache
+from mcp_chat_app.status_cache import status_cache
+
+
+# --- Upstream stand-ins ---
+def _completion(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+class FakeOpenAI:
+    """Blocking stand-in for the OpenAI client: sleeps for the configured latency."""
+
+    def __init__(self, latency):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self._latency = latency
+
+    def _create(self, **kwargs):
+        time.sleep(self._latency)
+        return _completion("benchmark reply")
+
+
+class FakeAsyncOpenAI:
+    """Async stand-in for the OpenAI client: awaits the configured latency."""
+
+    def __init__(self, latency):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self._latency = latency
+
+    async def _create(self, **kwargs):
+        await asyncio.sleep(self._latency)
+        return _completion("benchmark reply")
+
+
+def install_fakes(llm_latency, ping_latency):
+    """Replaces the upstream calls with latency-only stand-ins and disables caching."""
+    online = {"online": True, "version": "1.20", "motd": "bench", "player_count": 1, "player_max": 10, "latency": 1.0}
+
+    def get_server_status(host, port=25565, timeout=5, **kwargs):
+        time.sleep(ping_latency)
+        return dict(online)
+
+    async def async_get_server_status(host, port=25565, timeout=5, **kwargs):
+        await asyncio.sleep(ping_latency)
+        return dict(online)
+
+    MCPClient.get_server_status = staticmethod(get_server_status)
+    MCPClient.async_get_server_status = staticmethod(async_get_server_status)
+    client_manager.get_client = lambda: FakeOpenAI(llm_latency)
+    client_manager.get_async_client = lambda: FakeAsyncOpenAI(llm_latency)
+
+    # Every request should pay for the ping and the LLM call, as on a cold cache.
+    status_cache.ttl = status_cache.negative_ttl = status_cache.stale_ttl = 0
+    response_cache.enabled = False
+    config.OPENAI_API_KEY = 'benchmark-key'
+    if not config.MCP_SERVERS:
+        config.MCP_SERVERS.add_many(config.DEFAULT_MCP_SERVERS)
+
+
+# --- Servers ---
+class PooledWSGIServer(BaseWSGIServer):
+    """A WSGI server with a fixed pool of worker threads, like a threaded gunicorn worker."""
+    multithread = True # Makes werkzeug speak keep-alive HTTP/1.1
+    request_queue_size = 4096
+
+    def __init__(self, host, port, app, workers):
+        super().__init__(host, port, app)
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_sync_server(port, workers):
+    server = PooledWSGIServer('127.0.0.1', port, flask_app, workers)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown
+
+
+def start_asgi_server(port):
+    server = uvicorn.Server(uvicorn.Config(asgi_app, host='127.0.0.1', port=port, log_level='warning',
+                                           lifespan='off', backlog=4096))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+    return stop
+
+
+# --- Load generator ---
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class HTTPConnection:
+    """
+    A minimal keep-alive HTTP/1.1 client connection.
+    General-purpose async HTTP clients spend more CPU per request than the servers under test
+    at high concurrency, which would skew the comparison, so the load generator uses this instead.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._reader = self._writer = None
+
+    async def post_json(self, path, payload):
+        """Sends a JSON POST and returns the response status code (the body is read and discarded)."""
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode('utf-8')
+        self._writer.write(f"POST {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                           f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body)
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if 'content-length' in headers:
+            await self._reader.readexactly(int(headers['content-length']))
+        else: # No length: the body runs until the server closes the connection
+            await self._reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+async def drive(host, port, total_requests, concurrency, path='/chat_with_llm', payload=None):
+    """Sends `total_requests` chat requests with `concurrency` in flight and returns the results."""
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for i in range(total_requests):
+        queue.put_nowait(i)
+
+    async def worker():
+        nonlocal errors
+        connection = HTTPConnection(host, port)
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                connection.close()
+                return
+            started = time.perf_counter()
+            try:
+                status = await connection.post_json(path, payload or {'message': f'bench {i}', 'server_id': '0'})
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                connection.close()
+                status = None
+            if status == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total_requests,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the sync (WSGI) and ASGI serving modes.")
+    parser.add_argument('--modes', default='sync,asgi', help="Comma-separated modes to run (sync, asgi).")
+    parser.add_argument('--requests', type=int, default=1000, help="Total requests per mode.")
+    parser.add_argument('--concurrency', type=int, default=200, help="Requests in flight at once.")
+    parser.add_argument('--sync-workers', type=int, default=16, help="Worker threads for the sync server.")
+    parser.add_argument('--llm-latency', type=float, default=0.3, help="Simulated OpenAI latency in seconds.")
+    parser.add_argument('--ping-latency', type=float, default=0.05, help="Simulated status ping latency in seconds.")
+    parser.add_argument('--json', help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    install_fakes(args.llm_latency, args.ping_latency)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR) # No per-request access log lines
+    results = {}
+    for mode in args.modes.split(','):
+        port = free_port()
+        stop = start_sync_server(port, args.sync_workers) if mode == 'sync' else start_asgi_server(port)
+        try:
+            print(f"Running {mode} mode: {args.requests} requests, concurrency {args.concurrency}...")
+            results[mode] = asyncio.run(drive('127.0.0.1', port, args.requests, args.concurrency))
+        finally:
+            stop()
+        r = results[mode]
+        print(f"  {r['requests_per_s']} req/s, p50 {r['p50_ms']} ms, p99 {r['p99_ms']} ms, errors {r['errors']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,451 @@
+# This file contains rate limiting and admission control for the chat endpoints.
+# Nothing used to limit how many chat turns ran at once, so a spike saturated the workers, every
+# turn hit OpenAI's 429s and all of them timed out together. Now token buckets limit each client,
+# the OpenAI request and token rates, and the probe rate per Minecraft host. A bounded admission
+# queue lets a fixed number of requests run at a time: admin requests go ahead of chat turns and
+# have slots reserved for them, and requests that can't be served soon are rejected at once with
+# 429/503 and a Retry-After instead of piling up.
+
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from . import config
+from .metrics import ADMISSION_REJECTIONS # Rejection counters for /metrics
+
+# Admission lanes and their priority (lower is admitted first).
+LANE_PRIORITY = {'admin': 0, 'chat': 1}
+
+
+def lane_for(path):
+    """Returns the admission lane of a request, or None for cheap routes that aren't admission controlled."""
+    if path.startswith('/chat_with_llm'):
+        return 'chat'
+    if path.startswith('/admin') or path == '/metrics':
+        return 'admin'
+    return None
+
+
+class Rejected(Exception):
+    """A request that was not admitted: its HTTP status (429 or 503) and seconds after which to retry."""
+
+    def __init__(self, message, status, retry_after, reason):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = max(1, math.ceil(retry_after)) # Retry-After is in whole seconds
+        self.reason = reason # Label of the rejection counter, e.g. 'client_rate'
+
+    def payload(self):
+        """The JSON body of the rejection response."""
+        return {"error": str(self), "retry_after": self.retry_after}
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """
+    Thread-safe token buckets, one per key (e.g. per client address or per host).
+
+    Each bucket refills at `rate` tokens per second up to `burst`. Buckets of the least recently
+    seen keys are dropped beyond `max_keys` (a dropped key simply starts again with a full bucket).
+    """
+
+    def __init__(self, name, rate, burst=None, max_keys=4096, clock=time.monotonic):
+        """
+        Args:
+            name (str): Label used in messages and stats.
+            rate (float): Tokens per second; None or 0 disables the limit.
+            burst (float): Bucket size. Defaults to `rate` (one second's worth, at least 1).
+            max_keys (int): Maximum number of keys tracked.
+            clock (callable): Monotonic clock, replaceable in tests.
+        """
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets = OrderedDict() # key -> _Bucket, least recently used first
+        self._lock = threading.Lock()
+
+        # Counters
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def enabled(self):
+        return bool(self.rate)
+
+    def _size(self):
+        return self.burst if self.burst else max(self.rate, 1)
+
+    def acquire(self, key=None, amount=1):
+        """
+        Takes `amount` tokens from the key's bucket if it has them.
+
+        A request for more than the whole bucket is allowed once the bucket is full, so large
+        requests are slowed down rather than refused forever.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the seconds until they would be available.
+        """
+        if not self.enabled:
+            return 0.0
+        size = self._size()
+        amount = min(amount, size)
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = _Bucket(size, now)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket.tokens = min(size, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+            if bucket.tokens >= amount:
+                bucket.tokens -= amount
+                self.allowed += 1
+                return 0.0
+            self.limited += 1
+            return (amount - bucket.tokens) / self.rate
+
+    def refund(self, key=None, amount=1):
+        """Gives back tokens taken by acquire() for a request that was then not sent after all."""
+        if not self.enabled:
+            return
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.tokens = min(self._size(), bucket.tokens + amount)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self.allowed = self.limited = 0
+
+    def stats(self):
+        with self._lock:
+            return {"rate": self.rate, "burst": self._size() if self.enabled else None, "keys": len(self._buckets),
+                    "allowed": self.allowed, "limited": self.limited}
+
+
+class _Waiter:
+    """A request queued for admission. Woken through its event (threads) or future (event loop)."""
+    __slots__ = ('lane', 'admitted', 'event', 'loop', 'future')
+
+    def __init__(self, lane):
+        self.lane = lane
+        self.admitted = False
+        self.event = None
+        self.loop = None
+        self.future = None
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        elif self.future is not None:
+            try:
+                self.loop.call_soon_threadsafe(_wake, self.future)
+            except RuntimeError: # The waiter's event loop has been closed
+                pass
+
+
+def _wake(future):
+    if not future.done(): # The waiter may have timed out or been cancelled meanwhile
+        future.set_result(None)
+
+
+class AdmissionController:
+    """
+    Lets at most `max_concurrent` requests run at a time, queueing up to `max_queue` more.
+
+    Queued requests are admitted by lane priority, then in arrival order. Chat turns may only use
+    `max_concurrent - admin_reserved` slots, so admin pages stay reachable while chat is saturated.
+    A request that finds the queue full, or isn't admitted within `queue_timeout` seconds, is
+    rejected with a Retry-After estimated from the queue depth and recent service times.
+    """
+
+    def __init__(self, max_concurrent=None, max_queue=None, queue_timeout=None, admin_reserved=None):
+        self.max_concurrent = config.ADMISSION_MAX_CONCURRENT if max_concurrent is None else max_concurrent
+        self.max_queue = config.ADMISSION_MAX_QUEUE if max_queue is None else max_queue
+        self.queue_timeout = config.ADMISSION_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        self.admin_reserved = config.ADMISSION_ADMIN_RESERVED if admin_reserved is None else admin_reserved
+        self.active = 0
+        self._queue = [] # Heap of (priority, sequence, _Waiter)
+        self._sequence = itertools.count()
+        self._service_time = 1.0 # Moving average of seconds a request holds its slot
+        self._lock = threading.Lock()
+
+        # Counters
+        self.admitted = 0
+        self.queued = 0
+        self.max_queue_depth = 0
+        self.rejected = {} # reason -> count
+
+    def enter(self, lane):
+        """
+        Waits until the request may run. Call release() when it is done.
+
+        Raises:
+            Rejected: The queue is full or the request wasn't admitted within queue_timeout.
+        """
+        waiter = self._admit_or_queue(lane)
+        if waiter is None:
+            return
+        waiter.event.wait(self.queue_timeout)
+        self._leave_queue(waiter)
+
+    async def async_enter(self, lane):
+        """Async version of enter(): waits on the event loop instead of blocking a thread."""
+        waiter = self._admit_or_queue(lane, loop=asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError: # The client went away; give back a slot it may have been handed
+            with self._lock:
+                self._cancel(waiter)
+            raise
+        self._leave_queue(waiter)
+
+    def release(self, held):
+        """Frees a slot taken by enter(), `held` seconds after it was admitted, and admits queued requests."""
+        with self._lock:
+            self.active -= 1
+            self._service_time += (held - self._service_time) * 0.1
+            woken = self._dispatch()
+        for waiter in woken:
+            waiter.wake()
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def clear_counters(self):
+        with self._lock:
+            self.admitted = self.queued = self.max_queue_depth = 0
+            self.rejected = {}
+
+    def stats(self):
+        with self._lock:
+            return {"active": self.active, "queue_depth": len(self._queue), "max_concurrent": self.max_concurrent,
+                    "max_queue": self.max_queue, "admitted": self.admitted, "queued": self.queued,
+                    "max_queue_depth": self.max_queue_depth, "rejected": dict(self.rejected),
+                    "service_time": round(self._service_time, 3)}
+
+    # --- Internal helpers ---
+    def _limit(self, lane):
+        return self.max_concurrent if lane == 'admin' else self.max_concurrent - self.admin_reserved
+
+    def _admit_or_queue(self, lane, loop=None):
+        """Admits the request at once (returns None) or queues it (returns its _Waiter)."""
+        priority = LANE_PRIORITY[lane]
+        with self._lock:
+            ahead = self._queue and self._queue[0][0] <= priority # Don't overtake queued requests
+            if not ahead and self.active < self._limit(lane):
+                self.active += 1
+                self.admitted += 1
+                return None
+            if len(self._queue) >= self.max_queue:
+                raise self._reject(lane, "The server is busy; try again shortly.", 'queue_full')
+            waiter = _Waiter(lane)
+            if loop is None:
+                waiter.event = threading.Event()
+            else:
+                waiter.loop, waiter.future = loop, loop.create_future()
+            heapq.heappush(self._queue, (priority, next(self._sequence), waiter))
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            return waiter
+
+    def _leave_queue(self, waiter):
+        """Returns if the waiter was admitted; otherwise takes it out of the queue and raises Rejected."""
+        with self._lock:
+            if waiter.admitted:
+                return
+            self._cancel(waiter)
+            raise self._reject(waiter.lane, "The server is busy; timed out waiting for a free slot.", 'queue_timeout')
+
+    def _cancel(self, waiter):
+        """Removes a waiter from the queue, or frees the slot it was handed. Must be called with the lock held."""
+        if waiter.admitted:
+            self.active -= 1
+            for woken in self._dispatch():
+                woken.wake()
+            return
+        self._queue = [entry for entry in self._queue if entry[2] is not waiter]
+        heapq.heapify(self._queue)
+
+    def _dispatch(self):
+        """Hands free slots to queued requests. Must be called with the lock held. Returns the waiters to wake."""
+        woken = []
+        while self._queue and self.active < self._limit(self._queue[0][2].lane):
+            _, _, waiter = heapq.heappop(self._queue)
+            waiter.admitted = True
+            self.active += 1
+            self.admitted += 1
+            woken.append(waiter)
+        return woken
+
+    def _reject(self, lane, message, reason):
+        """Counts a rejection and builds its exception. Must be called with the lock held."""
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        ADMISSION_REJECTIONS.inc(lane, reason)
+        slots = max(self._limit(lane), 1)
+        retry_after = (len(self._queue) + 1) / slots * self._service_time
+        return Rejected(message, 503, retry_after, reason)
+
+
+class AdmissionGate:
+    """
+    The checks a request passes before it runs: its client's rate limit (chat lane only), then
+    admission by the AdmissionController. Used by AdmissionMiddleware and the ASGI routes.
+    """
+
+    def __init__(self, controller, client_limiter):
+        self.controller = controller
+        self.client_limiter = client_limiter
+
+    def _check_client(self, lane, client):
+        if lane != 'chat':
+            return
+        wait = self.client_limiter.acquire(client)
+        if wait:
+            ADMISSION_REJECTIONS.inc(lane, 'client_rate')
+            raise Rejected("Too many requests; slow down.", 429, wait, 'client_rate')
+
+    def enter(self, lane, client):
+        """Admits a request (blocking while it is queued). Returns the time it was admitted. Raises Rejected."""
+        self._check_client(lane, client)
+        self.controller.enter(lane)
+        return time.perf_counter()
+
+    async def async_enter(self, lane, client):
+        """Async version of enter()."""
+        self._check_client(lane, client)
+        await self.controller.async_enter(lane)
+        return time.perf_counter()
+
+    def release(self, admitted_at):
+        self.controller.release(time.perf_counter() - admitted_at)
+
+
+class AdmissionMiddleware:
+    """
+    WSGI middleware applying the admission gate to the chat and admin routes. The slot is held
+    until the response body has been sent, so streamed replies count for as long as they run.
+    Rejected requests get a JSON error with a Retry-After header.
+    """
+
+    def __init__(self, wsgi_app, gate):
+        self.wsgi_app = wsgi_app
+        self.gate = gate
+
+    def __call__(self, environ, start_response):
+        lane = lane_for(environ.get('PATH_INFO', ''))
+        if lane is None or not config.ADMISSION_ENABLED:
+            return self.wsgi_app(environ, start_response)
+        try:
+            admitted_at = self.gate.enter(lane, environ.get('REMOTE_ADDR'))
+        except Rejected as e:
+            return rejection_response(e, start_response)
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except Exception:
+            self.gate.release(admitted_at)
+            raise
+        return _ReleasingIterator(body, lambda: self.gate.release(admitted_at))
+
+
+class _ReleasingIterator:
+    """Wraps a WSGI response body and calls `release` once when it is closed."""
+
+    def __init__(self, body, release):
+        self._body = body
+        self._iterator = iter(body)
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+def rejection_headers(rejected):
+    return [('Content-Type', 'application/json'), ('Retry-After', str(rejected.retry_after))]
+
+
+def rejection_response(rejected, start_response):
+    """Sends a rejection as a WSGI response."""
+    body = json.dumps(rejected.payload()).encode('utf-8')
+    start_response(f"{rejected.status} {'Too Many Requests' if rejected.status == 429 else 'Service Unavailable'}",
+                   rejection_headers(rejected) + [('Content-Length', str(len(body)))])
+    return [body]
+
+
+# --- Upstream limits ---
+class OpenAILimits:
+    """OpenAI's requests-per-minute and tokens-per-minute limits, enforced before a turn is sent."""
+
+    def __init__(self, rpm=None, tpm=None, clock=time.monotonic):
+        rpm = config.OPENAI_RPM_LIMIT if rpm is None else rpm
+        tpm = config.OPENAI_TPM_LIMIT if tpm is None else tpm
+        self.requests = RateLimiter('openai_rpm', rpm / 60 if rpm else None, rpm, clock=clock)
+        self.tokens = RateLimiter('openai_tpm', tpm / 60 if tpm else None, tpm, clock=clock)
+
+    def acquire(self, tokens):
+        """
+        Takes one request and `tokens` tokens (the prompt plus config.OPENAI_TPM_REPLY_ESTIMATE).
+
+        Raises:
+            Rejected: With status 429 if either limit is exhausted.
+        """
+        wait = self.requests.acquire()
+        if wait:
+            ADMISSION_REJECTIONS.inc('chat', 'openai_rpm')
+            raise Rejected("OpenAI request rate limit reached; try again shortly.", 429, wait, 'openai_rpm')
+        wait = self.tokens.acquire(amount=tokens)
+        if wait:
+            self.requests.refund()
+            ADMISSION_REJECTIONS.inc('chat', 'openai_tpm')
+            raise Rejected("OpenAI token rate limit reached; try again shortly.", 429, wait, 'openai_tpm')
+
+    def clear(self):
+        self.requests.clear()
+        self.tokens.clear()
+
+    def stats(self):
+        return {"requests": self.requests.stats(), "tokens": self.tokens.stats()}
+
+
+# Process-wide admission state, shown under 'admission' in /admin/stats.
+admission = AdmissionController()
+client_limiter = RateLimiter('client', config.CLIENT_RATE_LIMIT, config.CLIENT_RATE_BURST)
+admission_gate = AdmissionGate(admission, client_limiter)
+openai_limits = OpenAILimits()
+# Probe rate per Minecraft host (see MCPClient._tracked_probe).
+probe_limiter = RateLimiter('probe', config.PROBE_RATE_PER_HOST, config.PROBE_BURST_PER_HOST)
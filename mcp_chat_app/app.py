@@ -1,12 +1,43 @@
 # This is the main Flask application file.
 
 import copy
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
-from openai import OpenAI # Import OpenAI
+import csv
+import json
+import math
+import time
+from flask import (Flask, Response, render_template, request, jsonify, redirect, url_for, flash, stream_with_context,
+                   got_request_exception, make_response)
+from markupsafe import Markup # Installed with Flask
 
 # Import configurations. We will be modifying MCP_SERVERS and OPENAI_API_KEY.
 from . import config # Use relative import for config within the package
+from .admission import (AdmissionMiddleware, Rejected, admission, admission_gate, client_limiter, # Rate limits
+                        openai_limits, probe_limiter)
 from .mcp_client import MCPClient # Import MCPClient
+from .chat_tools import (TOOLS_SYSTEM_PROMPT, ToolTurn, complete_with_tools, selection_hint, # LLM tool calling
+                         stream_with_tools, tool_stats)
+from .conversation import conversation_store # Server-side conversation memory
+from .dns_cache import resolver_cache # DNS resolution cache used by the status probes
+from .host_health import host_health # Per-host adaptive timeouts and circuit breaker
+from .llm_client import client_manager # Shared, pooled OpenAI client
+from .metrics import (CONTENT_TYPE as METRICS_CONTENT_TYPE, ERRORS, FIRST_TOKEN_SECONDS, HTTP_IN_FLIGHT, # /metrics
+                      OPENAI_SECONDS, PROMPT_BUILD_SECONDS, REPLY_CACHE, ROUTE_ENVIRON_KEY, RequestMetricsMiddleware,
+                      registry as metrics_registry)
+from .persistence import ConfigStore # Optional SQLite persistence of servers and settings
+from .prompts import (SYSTEM_PROMPT, fit_to_budget, select_model, server_context, token_usage, # Prompt building
+                      user_message as build_user_message)
+from .response_cache import response_cache, make_key, status_fingerprint # Cache of LLM replies
+from .server_context import build_context as build_multi_server_context # Multi-server prompt table
+from .server_io import (EXPORT_CONTENT_TYPES, ImportFormatError, detect_format, import_servers, # Bulk import/export
+                        iter_export, validate_row)
+from .server_listing import normalize_query, server_listing # Cached, paged and searchable server list
+from .server_registry import parse_port # Port validation shared by the admin forms and bulk import
+from .server_status import is_unknown # Placeholders for probes that didn't finish
+from .single_flight import llm_flight, probe_flight, prompt_key # Coalescing of identical concurrent calls
+from .status_cache import status_cache # Shared status cache in front of MCPClient
+from .status_history import RESOLUTIONS, status_history # Per-server status time series
+from .status_poller import status_poller # Optional background poller publishing status snapshots
+from .status_push import HEARTBEAT, parse_server_ids, status_push # Live status changes for browsers
 
 # Create a Flask application instance
 app = Flask(__name__)
@@ -15,24 +46,164 @@ app = Flask(__name__)
 # IMPORTANT: Change this to a random, secure key in a real application!
 app.secret_key = 'dev_secret_key_123!'
 
+# Rate limits and admission queue of the chat and admin routes (see admission.py)
+app.wsgi_app = AdmissionMiddleware(app.wsgi_app, admission_gate)
+# Times every request until its body has been sent (see metrics.py)
+app.wsgi_app = RequestMetricsMiddleware(app.wsgi_app)
+
+# Fresh status results (from the poller or chat turns) are pushed to /status/stream subscribers
+status_cache.subscribe(status_push.observe)
+
+
+# Store that saves servers and settings, set up by initialize_app_config() when persistence is enabled.
+config_store = None
+
 
 # --- Application Initialization ---
 def initialize_app_config():
-    """Initializes application configuration, like loading default servers."""
+    """Initializes application configuration, like loading saved or default servers."""
+    global config_store
+    if config.PERSISTENCE_ENABLED and config_store is None:
+        config_store = ConfigStore(config.PERSISTENCE_DB_PATH)
+        config_store.load(config.MCP_SERVERS)
+        saved_api_key = config_store.get_setting('openai_api_key')
+        if saved_api_key and not config.OPENAI_API_KEY:
+            config.OPENAI_API_KEY = saved_api_key
+
     if hasattr(config, 'DEFAULT_MCP_SERVERS') and not config.MCP_SERVERS:
         print("MCP_SERVERS is empty, loading defaults.")
-        config.MCP_SERVERS.extend(copy.deepcopy(config.DEFAULT_MCP_SERVERS))
+        config.MCP_SERVERS.add_many(copy.deepcopy(config.DEFAULT_MCP_SERVERS))
     else:
         print(f"MCP_SERVERS already populated or no defaults found. Count: {len(config.MCP_SERVERS)}")
 
+    if config_store is not None and not config_store.attached:
+        config_store.attach(config.MCP_SERVERS) # Admin changes are saved in batches from now on
+
+
+def start_status_poller():
+    """Starts the background status poller if it is enabled in config."""
+    if config.STATUS_POLLER_ENABLED:
+        status_poller.start()
+
 initialize_app_config()
+start_status_poller()
+
+
+def lookup_server_status(server_info, timeout=3):
+    """
+    Returns the status of a configured server for use in a chat turn.
+    When the background poller is running its snapshot is used, which involves no network I/O.
+    Otherwise (or for servers not polled yet) the shared status cache is used.
+    """
+    if status_poller.running:
+        entry = status_poller.snapshot.get(server_info.host, server_info.port, server_info.type)
+        if entry is not None:
+            return entry.status # Status records are immutable, so the snapshot's can be shared
+    return status_cache.get(server_info.host, server_info.port, server_info.type, timeout=timeout)
+
+
+def snapshot_statuses(servers):
+    """
+    Returns the poller snapshot status of each server (None where there is none) and the servers
+    still needing a lookup. Shared by the Flask and ASGI multi-server lookups.
+    """
+    if not status_poller.running:
+        return [None] * len(servers), list(servers)
+    snapshot = status_poller.snapshot
+    statuses = []
+    for server_info in servers:
+        entry = snapshot.get(server_info.host, server_info.port, server_info.type)
+        statuses.append(entry.status if entry is not None else None)
+    return statuses, [server for server, status in zip(servers, statuses) if status is None]
+
+
+def merge_statuses(statuses, looked_up):
+    """Fills the None entries of `statuses` with `looked_up`, in order."""
+    looked_up = iter(looked_up)
+    return [status if status is not None else next(looked_up) for status in statuses]
+
+
+def lookup_server_statuses(servers):
+    """
+    Returns the status of several servers for a multi-server chat turn: poller snapshot first, then
+    the shared cache, with all remaining servers probed concurrently under one shared deadline
+    (config.CHAT_MULTI_SERVER_DEADLINE), however many servers were selected.
+    """
+    statuses, missing = snapshot_statuses(servers)
+    if missing:
+        looked_up = status_cache.get_many(missing, timeout=config.CHAT_MULTI_SERVER_TIMEOUT,
+                                          deadline=config.CHAT_MULTI_SERVER_DEADLINE)
+        statuses = merge_statuses(statuses, looked_up)
+    return statuses
+
+
+def component_metrics():
+    """Exports the counters the shared components keep (also shown by /admin/stats) to /metrics."""
+    caches = {"status": status_cache.stats(), "dns": resolver_cache.stats(), "reply": response_cache.stats()}
+    yield ("mcp_chat_cache_hits_total", "counter", "Cache hits, including stale and negative hits.",
+           [({"cache": name}, stats["hits"] + stats.get("stale_hits", 0) + stats.get("negative_hits", 0))
+            for name, stats in caches.items()])
+    yield ("mcp_chat_cache_misses_total", "counter", "Cache misses.",
+           [({"cache": name}, stats["misses"]) for name, stats in caches.items()])
+    yield ("mcp_chat_cache_entries", "gauge", "Entries currently cached.",
+           [({"cache": name}, stats["size"]) for name, stats in caches.items()])
+    flights = {"probe": probe_flight.stats(), "llm": llm_flight.stats()}
+    yield ("mcp_chat_single_flight_executions_total", "counter", "Operations run by a single-flight group.",
+           [({"group": name}, stats["executions"]) for name, stats in flights.items()])
+    yield ("mcp_chat_single_flight_coalesced_total", "counter", "Calls that shared an operation already in flight.",
+           [({"group": name}, stats["coalesced"]) for name, stats in flights.items()])
+    health = host_health.stats()
+    yield ("mcp_chat_circuit_short_circuits_total", "counter", "Probes skipped because the host's circuit was open.",
+           [({}, health["short_circuits"])])
+    yield ("mcp_chat_open_circuits", "gauge", "Hosts whose circuit is open or half-open.",
+           [({}, len(health["open_circuits"]))])
+    yield ("mcp_chat_conversations", "gauge", "Conversations kept in memory.",
+           [({}, conversation_store.stats()["conversations"])])
+    yield ("mcp_chat_admission_active", "gauge", "Admitted chat and admin requests currently running.",
+           [({}, admission.active)])
+    yield ("mcp_chat_admission_queue_depth", "gauge", "Requests waiting for an admission slot.",
+           [({}, admission.queue_depth)])
+
+metrics_registry.add_collector(component_metrics)
+
+
+@app.before_request
+def start_request_metrics():
+    """Labels the request's metrics with its route pattern and counts it as in flight."""
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request.environ[ROUTE_ENVIRON_KEY] = route
+    HTTP_IN_FLIGHT.inc(route)
+
+
+def count_unhandled_error(sender, exception, **extra):
+    """Counts exceptions that escaped a view (Flask turns them into 500 responses)."""
+    ERRORS.inc(request.environ.get(ROUTE_ENVIRON_KEY, 'unmatched'), type(exception).__name__)
+
+got_request_exception.connect(count_unhandled_error, app)
 
 
 # --- Routes ---
+def render_server_page(template, query, page_number):
+    """
+    Renders one page of the (filtered) server list with a fragment template.
+    Called through server_listing.fragment(), which reuses the result until the server list changes.
+    """
+    page = server_listing.page(query, (page_number - 1) * server_listing.page_size)
+    return Markup(render_template(template, **page))
+
+
 @app.route('/')
 def index():
-    """Serves the main chat interface page. Passes server list for dropdown."""
-    return render_template('index.html', servers=config.MCP_SERVERS)
+    """
+    Serves the main chat interface page. The dropdown gets the first page of servers;
+    script.js fetches further pages and search results from /api/servers.
+    """
+    server_options = server_listing.fragment('index_options', render_server_page, '_server_options.html', "", 1)
+    response = make_response(render_template('index.html', has_servers=bool(config.MCP_SERVERS),
+                                             server_options=server_options))
+    response.set_etag(f"index-{server_listing.etag()}") # The page only changes with the server list
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 @app.route('/admin', methods=['GET', 'POST'])
@@ -55,11 +226,8 @@ def admin():
 
         if server_name and server_host and server_port_str:
             try:
-                port = int(server_port_str)
-                if port <= 0 or port > 65535:
-                    raise ValueError("Port out of range")
-                new_server = {"name": server_name, "host": server_host, "port": port, "type": server_type}
-                config.MCP_SERVERS.append(new_server)
+                port = parse_port(server_port_str)
+                config.MCP_SERVERS.add(server_name, server_host, port, server_type)
                 flash(f"Server '{server_name}' added successfully!", "success")
                 return redirect(url_for('admin'))
             except ValueError:
@@ -67,8 +235,24 @@ def admin():
         else:
             error_message = "All fields (Server Name, Host, Port) for adding a server are required."
 
+    # The server table is paged and searchable (?q=...&page=N); its rows are cached per page until the list changes.
+    query = normalize_query(request.args.get('q', ''))
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        page = 1
+    total = len(server_listing.search(query))
+    pages = max(1, math.ceil(total / server_listing.page_size))
+    page = min(page, pages) # E.g. after deleting the last servers of the last page
+    server_rows = server_listing.fragment('admin_rows', render_server_page, '_server_rows.html', query, page)
+
     return render_template('admin.html',
-                           servers=config.MCP_SERVERS,
+                           has_servers=bool(config.MCP_SERVERS),
+                           server_rows=server_rows,
+                           query=query,
+                           total=total,
+                           page=page,
+                           pages=pages,
                            error=error_message,
                            openai_api_key_set=openai_api_key_set,
                            openai_api_key_display=openai_api_key_display)
@@ -81,6 +265,9 @@ def save_api_key():
         api_key = request.form.get('openai-api-key')
         if api_key:
             config.OPENAI_API_KEY = api_key
+            client_manager.set_api_key(api_key) # Swap in a client for the new key
+            if config_store is not None:
+                config_store.set_setting('openai_api_key', api_key)
             flash("OpenAI API Key saved successfully.", "success")
             print(f"OpenAI API Key updated. Current key (partial): {config.OPENAI_API_KEY[:4]}...")
         else:
@@ -92,14 +279,11 @@ def save_api_key():
 @app.route('/admin/delete_server/<int:server_id>', methods=['POST'])
 def delete_server(server_id):
     """Handles deletion of an MCP server."""
-    try:
-        if 0 <= server_id < len(config.MCP_SERVERS):
-            deleted_server = config.MCP_SERVERS.pop(server_id)
-            flash(f"Server '{deleted_server.get('name')}' deleted successfully.", "success")
-        else:
-            flash("Error: Attempted to delete server with invalid ID.", "error")
-    except IndexError:
-        flash("Error: Server ID out of range during delete.", "error")
+    deleted_server = config.MCP_SERVERS.remove(server_id) # IDs are stable, so other servers keep theirs
+    if deleted_server is not None:
+        flash(f"Server '{deleted_server.name}' deleted successfully.", "success")
+    else:
+        flash("Error: Attempted to delete server with invalid ID.", "error")
     return redirect(url_for('admin'))
 
 
@@ -107,32 +291,23 @@ def delete_server(server_id):
 def edit_server(server_id):
     """Handles editing of an MCP server."""
     error_message = None
-    server_to_edit = None
+    server_to_edit = config.MCP_SERVERS.get(server_id)
 
-    try:
-        if not (0 <= server_id < len(config.MCP_SERVERS)):
-            flash("Error: Server ID for edit is invalid or out of range.", "error")
-            return redirect(url_for('admin'))
-        server_to_edit = config.MCP_SERVERS[server_id]
-    except IndexError: # Should be caught by the check above
-        flash("Critical Error: Server ID out of range during edit access.", "error")
+    if server_to_edit is None:
+        flash("Error: Server ID for edit is invalid or out of range.", "error")
         return redirect(url_for('admin'))
 
     if request.method == 'POST':
         new_server_name = request.form.get('server-name')
         new_server_host = request.form.get('server-host')
         new_server_port_str = request.form.get('server-port')
-        new_server_type = request.form.get('server-type', server_to_edit.get('type', 'Unknown'))
+        new_server_type = request.form.get('server-type', server_to_edit.type)
 
         if new_server_name and new_server_host and new_server_port_str:
             try:
-                new_port = int(new_server_port_str)
-                if not (0 < new_port <= 65535): raise ValueError("Port out of range")
-
-                config.MCP_SERVERS[server_id] = {
-                    "name": new_server_name, "host": new_server_host,
-                    "port": new_port, "type": new_server_type
-                }
+                new_port = parse_port(new_server_port_str)
+                config.MCP_SERVERS.update(server_id, name=new_server_name, host=new_server_host,
+                                          port=new_port, type=new_server_type)
                 flash(f"Server '{new_server_name}' updated successfully.", "success")
                 return redirect(url_for('admin'))
             except ValueError:
@@ -147,77 +322,764 @@ def edit_server(server_id):
     return render_template('edit_server.html', server=server_to_edit, server_id=server_id, error=error_message)
 
 
-@app.route('/chat_with_llm', methods=['POST'])
-def chat_with_llm():
+# --- Bulk server administration ---
+def probe_imported_servers(records):
     """
-    Handles chat messages, optionally fetches MCP server data,
-    and interacts with OpenAI LLM.
+    Checks the reachability of newly imported servers concurrently and warms the status cache.
+
+    Returns:
+        dict: 'checked', 'online' and 'unchecked' (not checked within the deadline) counts, and
+              'offline' (at most config.BULK_IMPORT_MAX_ERRORS of {'id', 'name', 'error'}).
+    """
+    results = MCPClient.get_many(records, deadline=config.BULK_IMPORT_PROBE_DEADLINE,
+                                 timeout=config.BULK_IMPORT_PROBE_TIMEOUT)
+    return summarize_import_probe(records, results)
+
+
+def summarize_import_probe(records, results):
+    """Caches the probe results of imported servers and counts them (see probe_imported_servers)."""
+    online = unchecked = 0
+    offline = []
+    for record, result in zip(records, results):
+        if is_unknown(result): # Cut off by the deadline: no verdict to cache or report
+            unchecked += 1
+            continue
+        status_cache.put(record.host, record.port, record.type, result)
+        if result.get("online"):
+            online += 1
+        elif len(offline) < config.BULK_IMPORT_MAX_ERRORS:
+            offline.append({"id": record.id, "name": record.name, "error": result.get("error")})
+    return {"checked": len(records) - unchecked, "online": online, "unchecked": unchecked, "offline": offline}
+
+
+@app.route('/admin/servers/export', methods=['GET'])
+def export_servers():
+    """Streams all servers as CSV, JSON or NDJSON (?format=..., JSON by default)."""
+    fmt = detect_format(request.args.get('format', 'json'))
+    if fmt is None:
+        return jsonify({"error": "Unsupported format. Use csv, json or ndjson."}), 400
+    servers = config.MCP_SERVERS.all() # Immutable snapshot: edits during a long export don't affect it
+    return Response(iter_export(servers, fmt), mimetype=EXPORT_CONTENT_TYPES[fmt],
+                    headers={"Content-Disposition": f"attachment; filename=mcp_servers.{fmt}"})
+
+
+IMPORT_FORMAT_ERROR = "Could not determine the import format. Use a .csv, .json or .ndjson file or pass format=..."
+
+
+def import_summary(result, dry_run):
+    """The JSON summary of an import_servers() result returned to API clients."""
+    return {"imported": len(result['imported']), "valid": result['valid'], "skipped": result['skipped'],
+            "invalid": result['invalid'], "errors": result['errors'], "dry_run": dry_run}
+
+
+def log_import(fmt, summary):
+    print(f"Bulk import ({fmt}): {summary['imported']} imported, {summary['skipped']} skipped, "
+          f"{summary['invalid']} invalid.")
+
+
+@app.route('/admin/servers/import', methods=['POST'])
+def import_servers_route():
+    """
+    Imports servers from a CSV, JSON or NDJSON file, streamed from either a form upload
+    ('file' field, from the admin page) or the raw request body (API clients).
+    Options (form fields or query parameters): format, probe=1 to check reachability of the
+    imported servers, dry_run=1 to only validate (API only).
+    Form uploads redirect back to the admin page; API clients get a JSON summary.
+    """
+    upload = request.files.get('file')
+    options = request.form if upload else request.args
+    if upload:
+        stream, fmt = upload.stream, detect_format(options.get('format'), upload.mimetype, upload.filename)
+    else:
+        stream, fmt = request.stream, detect_format(options.get('format'), request.content_type)
+    probe = options.get('probe') in ('1', 'true', 'on')
+    dry_run = not upload and options.get('dry_run') in ('1', 'true')
+
+    if fmt is None:
+        error = IMPORT_FORMAT_ERROR
+        if upload:
+            flash(error, "error")
+            return redirect(url_for('admin'))
+        return jsonify({"error": error}), 400
+
+    try:
+        result = import_servers(config.MCP_SERVERS, stream, fmt, dry_run=dry_run)
+    except (ImportFormatError, UnicodeDecodeError, csv.Error) as e:
+        if upload:
+            flash(f"Import failed: {e}", "error")
+            return redirect(url_for('admin'))
+        return jsonify({"error": f"Import failed: {e}"}), 400
+
+    summary = import_summary(result, dry_run)
+    if probe and result['imported']:
+        summary["probe"] = probe_imported_servers(result['imported'])
+    log_import(fmt, summary)
+
+    if not upload:
+        return jsonify(summary)
+    flash(f"Imported {summary['imported']} servers ({summary['skipped']} duplicates skipped, "
+          f"{summary['invalid']} invalid rows).", "success" if not summary['invalid'] else "warning")
+    if "probe" in summary:
+        flash(f"Reachability check: {summary['probe']['online']} of {summary['probe']['checked']} "
+              f"imported servers are online.", "success")
+    return redirect(url_for('admin'))
+
+
+@app.route('/admin/servers/batch', methods=['POST'])
+def batch_servers():
+    """
+    Applies batch edits and deletions as a single registry change.
+    JSON body: {"update": {"<id>": {"name": ..., "host": ..., "port": ..., "type": ...}}, "delete": [<id>, ...]}.
+    The admin page's bulk delete form posts 'server_ids' instead and is redirected back.
+    Nothing is applied if any update is invalid.
     """
     if not request.is_json:
-        return jsonify({"error": "Request must be JSON"}), 400
+        server_ids = [int(server_id) for server_id in request.form.getlist('server_ids') if server_id.isdigit()]
+        _, removed = config.MCP_SERVERS.apply(removals=server_ids)
+        if removed:
+            flash(f"Deleted {len(removed)} servers.", "success")
+        else:
+            flash("No servers selected for deletion.", "warning")
+        return redirect(url_for('admin'))
 
-    data = request.get_json()
+    data = request.get_json(silent=True)
+    update, delete = (data.get('update') or {}, data.get('delete') or []) if isinstance(data, dict) else (None, None)
+    if not isinstance(update, dict) or not isinstance(delete, list):
+        return jsonify({"error": "Expected an object with an 'update' object and a 'delete' list."}), 400
+    if not all(str(server_id).isdigit() for server_id in delete):
+        return jsonify({"error": "'delete' must be a list of numeric server IDs."}), 400
+
+    updates, missing, errors = {}, set(), []
+    for server_id, changes in update.items():
+        if not str(server_id).isdigit() or not isinstance(changes, dict):
+            errors.append({"id": server_id, "error": "Expected a numeric server ID and an object of fields."})
+            continue
+        record = config.MCP_SERVERS.get(int(server_id))
+        if record is None:
+            missing.add(int(server_id))
+            continue
+        # Validate the server as it would be after the update, the same way imported rows are
+        changes = {k: v for k, v in changes.items() if k in ('name', 'host', 'port', 'type')}
+        server, error = validate_row(dict(record.to_dict(), **changes))
+        if error:
+            errors.append({"id": server_id, "error": error})
+            continue
+        updates[int(server_id)] = {k: server[k] for k in changes}
+    if errors:
+        return jsonify({"error": "Invalid updates; no changes were applied.", "errors": errors}), 400
+
+    removals = [int(server_id) for server_id in delete]
+    missing.update(server_id for server_id in removals if server_id not in config.MCP_SERVERS)
+    updated, removed = config.MCP_SERVERS.apply(updates=updates, removals=removals)
+    return jsonify({"updated": len(updated), "deleted": len(removed), "missing": sorted(missing)})
+
+
+def parse_chat_request(data):
+    """
+    Validates a chat request and resolves the selected server.
+
+    Args:
+        data (dict): The JSON body of the chat request.
+
+    A turn can be about one server ('server_id') or several: 'server_ids' is a list of
+    server IDs or "all" (a 'server_id' of "all" works too). 'model' optionally picks one of
+    config.CHAT_MODELS instead of config.CHAT_MODEL.
+
+    Returns:
+        tuple: (chat_request, None) on success, where chat_request is a dict with 'message',
+               'server_info' (None for general chat), 'servers' (list of ServerRecords for a
+               multi-server turn, otherwise None), 'invalid_server', 'use_cache', 'use_tools',
+               'conversation_id' and 'model';
+               or (None, (error_dict, status_code)) if the request can't be served.
+    """
     user_message = data.get('message')
-    server_id_str = data.get('server_id') # Will be string like "0", "1", or ""
+    server_id_str = data.get('server_id') # Will be string like "0", "1", "all" or ""
+    use_cache = data.get('cache', True) is not False # Requests can opt out of the response cache
 
     if not user_message:
-        return jsonify({"error": "No message content provided"}), 400
+        return None, ({"error": "No message content provided"}, 400)
 
     if not config.OPENAI_API_KEY:
-        return jsonify({"error": "OpenAI API Key not configured by admin."}), 503 # Service Unavailable
+        return None, ({"error": "OpenAI API Key not configured by admin."}, 503) # Service Unavailable
+
+    try:
+        model = select_model(data.get('model'))
+    except ValueError as e:
+        return None, ({"error": str(e)}, 400)
+
+    use_tools = bool(data.get('tools', config.CHAT_TOOLS_ENABLED)) # Requests can opt in or out of tool calling
+    conversation_id = data.get('conversation_id') # Returned by earlier replies; None starts a new conversation
+    server_ids = data.get('server_ids')
+    if server_id_str == 'all' and server_ids is None:
+        server_ids = 'all'
+
+    server_info = None
+    servers = None
+    invalid_server = False
+    if server_ids is not None:
+        if server_ids == 'all':
+            servers = list(config.MCP_SERVERS)
+        elif isinstance(server_ids, list):
+            servers = []
+            seen = set()
+            for server_id in server_ids:
+                server_id = str(server_id)
+                record = config.MCP_SERVERS.get(int(server_id)) if server_id.isdigit() else None
+                if record is None:
+                    invalid_server = True # Unknown IDs are mentioned in the prompt, the rest are still used
+                elif record.id not in seen:
+                    seen.add(record.id)
+                    servers.append(record)
+        else:
+            return None, ({"error": "server_ids must be a list of server IDs or \"all\""}, 400)
+    elif server_id_str and server_id_str.isdigit():
+        server_info = config.MCP_SERVERS.get(int(server_id_str)) # O(1) lookup by stable ID
+        invalid_server = server_info is None
+
+    return {"message": user_message, "server_info": server_info, "servers": servers,
+            "invalid_server": invalid_server, "use_cache": use_cache, "use_tools": use_tools,
+            "conversation_id": conversation_id if isinstance(conversation_id, str) else None, "model": model}, None
+
+
+def build_chat_turn(chat_request, status_result):
+    """
+    Builds the messages to send to the LLM for a parsed chat request.
 
-    client = OpenAI(api_key=config.OPENAI_API_KEY)
-    server_data_for_llm = None
-    server_name_for_prompt = "the selected server" # Default
+    Args:
+        chat_request (dict): As returned by parse_chat_request ('server_info' is a ServerRecord).
+        status_result (dict): Status of the selected server, or None for general chat.
+                              For a multi-server turn, a list with the status of each server.
+                              Not used for tool-calling turns, where the model looks statuses up itself.
+
+    Returns:
+        dict: 'messages', 'prompt_context', 'server_data_used', 'cache_key', 'use_cache', 'use_tools',
+              'message', 'conversation' (see attach_conversation), 'model' and 'prompt_tokens' (see fit_turn).
+    """
+    user_message = chat_request['message']
+    if chat_request.get('use_tools'):
+        return build_tool_turn(chat_request)
+    server_info = chat_request['server_info']
 
     prompt_context = ""
+    fingerprint = "" # Coarse server status fingerprint for the response cache key
 
-    if server_id_str and server_id_str.isdigit():
-        server_id = int(server_id_str)
-        if 0 <= server_id < len(config.MCP_SERVERS):
-            server_info = config.MCP_SERVERS[server_id]
-            server_name_for_prompt = server_info.get('name', 'this server')
-            print(f"Fetching status for {server_info['host']}:{server_info['port']} for LLM context.")
-            # Use a shorter timeout for LLM integration to avoid long waits
-            status_result = MCPClient.get_server_status(server_info['host'], server_info['port'], timeout=3)
-            server_data_for_llm = status_result # For returning to client
-
-            if status_result.get("online"):
-                prompt_context = (
-                    f"The user is asking about the Minecraft server named '{server_name_for_prompt}' "
-                    f"(Host: {server_info['host']}:{server_info['port']}). "
-                    f"It is currently online. Version: {status_result.get('version', 'N/A')}. "
-                    f"MOTD: \"{status_result.get('motd', 'N/A')}\". "
-                    f"Players: {status_result.get('player_count', 'N/A')}/{status_result.get('player_max', 'N/A')}. "
-                )
-            else:
-                prompt_context = (
-                    f"The user is asking about the Minecraft server named '{server_name_for_prompt}' "
-                    f"(Host: {server_info['host']}:{server_info['port']}). "
-                    f"It appears to be offline or there was an issue fetching its status. "
-                    f"Error: {status_result.get('error', 'Not specified')}. "
-                )
+    server_data_used = dict(status_result) if server_info is not None else None # JSON-serialisable copy
+
+    if chat_request.get('servers') is not None:
+        servers = chat_request['servers']
+        shown = []
+        if servers:
+            prompt_context, shown = build_multi_server_context(user_message, servers, status_result)
+            fingerprint = ",".join(status_fingerprint(server, status) for server, status in zip(servers, status_result))
+            if chat_request['invalid_server']:
+                prompt_context += "Some of the selected server IDs were invalid. "
+                fingerprint += "|invalid-server"
         else:
-            prompt_context = "The user selected a server, but the ID was invalid. "
+            prompt_context = "The user selected servers, but none of the IDs were valid. "
+            fingerprint = "invalid-server"
+        server_data_used = [{"id": server.id, "name": server.name, "status": dict(status)} for server, status in shown]
+    elif server_info is not None:
+        fingerprint = status_fingerprint(server_info, status_result)
+        # Trends come from the recorded history (no network I/O). The text is coarse, so it can
+        # be part of the cache key: a reply is only reused while the trends it was given still hold.
+        trends = status_history.describe(status_cache.make_key(server_info.host, server_info.port, server_info.type))
+        fingerprint += f"|{trends}"
+        prompt_context = server_context(server_info, status_result, trends) # Precompiled per kind of server
+    elif chat_request['invalid_server']:
+        prompt_context = "The user selected a server, but the ID was invalid. "
+        fingerprint = "invalid-server"
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT}, # Fixed prefix, so OpenAI can reuse its prompt cache
+        {"role": "user", "content": build_user_message(prompt_context, user_message)}
+    ]
+    return fit_turn(chat_request, {
+        "messages": messages, "prompt_context": prompt_context, "server_data_used": server_data_used,
+        "cache_key": make_key(user_message, chat_request['model'], SYSTEM_PROMPT, fingerprint),
+        "use_cache": chat_request['use_cache'], "use_tools": False})
+
+
+def build_tool_turn(chat_request):
+    """
+    Builds a tool-calling chat turn: the prompt only says which server(s) were selected, and the
+    model calls get_server_status etc. when it needs them (see chat_tools.py). Replies depend on
+    the live data the model fetched, so these turns bypass the response cache.
+    """
+    prompt_context = selection_hint(chat_request)
+    servers = chat_request['servers']
+    baseline_probes = len(servers) if servers is not None else int(chat_request['server_info'] is not None)
+    messages = [
+        {"role": "system", "content": TOOLS_SYSTEM_PROMPT},
+        {"role": "user", "content": build_user_message(prompt_context, chat_request['message'])}
+    ]
+    return fit_turn(chat_request, {
+        "messages": messages, "prompt_context": prompt_context, "server_data_used": None, "cache_key": None,
+        "use_cache": False, "use_tools": True, "baseline_probes": baseline_probes})
+
+
+def attach_conversation(chat_request, turn):
+    """
+    Adds the conversation's history (a summary of older turns plus the recent turns that fit
+    config.CONVERSATION_HISTORY_TOKEN_BUDGET) between the system prompt and the new message.
+    Follow-up replies depend on that history, so only a conversation's first turn uses the response cache.
+    """
+    turn['message'] = chat_request['message']
+    turn['conversation'] = None
+    if not config.CONVERSATION_MEMORY_ENABLED:
+        return turn
+    conversation = conversation_store.get_or_create(chat_request['conversation_id'])
+    history = conversation_store.history(conversation)
+    if history:
+        turn['messages'] = turn['messages'][:1] + history + turn['messages'][1:]
+        turn['use_cache'] = False
+    turn['conversation'] = conversation
+    return turn
 
-    full_prompt = prompt_context + f"User's message: \"{user_message}\""
 
+def fit_turn(chat_request, turn):
+    """
+    Adds the conversation history to a turn (see attach_conversation) and keeps its prompt within the
+    chosen model's token budget, leaving out the oldest history if needed (see prompts.fit_to_budget).
+    Sets the turn's 'model' and 'prompt_tokens'.
+    """
+    turn = attach_conversation(chat_request, turn)
+    turn['model'] = chat_request['model']
+    turn['messages'], turn['prompt_tokens'], dropped = fit_to_budget(turn['messages'], turn['model'])
+    if dropped:
+        print(f"Prompt over the token budget of {turn['model']}: left out {dropped} history messages.")
+    return turn
+
+
+def remember_turn(turn, reply):
+    """Records a completed reply in the turn's conversation. Returns the response fields identifying it."""
+    conversation = turn['conversation']
+    if conversation is None:
+        return {}
+    conversation_store.add_turn(conversation, turn['message'], reply)
+    return conversation_fields(turn)
+
+
+def conversation_fields(turn):
+    """Response fields identifying the turn's conversation, which the client sends back with its next message."""
+    return {'conversation_id': turn['conversation'].id} if turn['conversation'] is not None else {}
+
+
+def prepare_chat_turn(data):
+    """
+    Validates a chat request and builds the messages to send to the LLM,
+    fetching MCP server data for the prompt context if a server was selected.
+
+    Args:
+        data (dict): The JSON body of the chat request.
+
+    Returns:
+        tuple: (turn, None) on success (see build_chat_turn),
+               or (None, (error_dict, status_code)) if the request can't be served.
+    """
+    started = time.perf_counter()
+    chat_request, error_response = parse_chat_request(data)
+    if error_response:
+        return None, error_response
+
+    route = request.url_rule.rule
+    if chat_request['use_tools']:
+        turn = build_chat_turn(chat_request, None) # The model looks status up itself, only when needed
+        return timed_turn(turn, chat_request, route, started), None
+
+    status_result = None
+    server_info = chat_request['server_info']
+    if chat_request['servers'] is not None:
+        print(f"Looking up status for {len(chat_request['servers'])} servers for LLM context.")
+        status_result = lookup_server_statuses(chat_request['servers'])
+    elif server_info is not None:
+        print(f"Looking up status for {server_info.host}:{server_info.port} for LLM context.")
+        # Use a shorter timeout for LLM integration to avoid long waits.
+        # Recent results come from the poller snapshot or the shared cache, so most turns skip the ping entirely.
+        status_result = lookup_server_status(server_info, timeout=3)
+
+    return timed_turn(build_chat_turn(chat_request, status_result), chat_request, route, started), None
+
+
+def metrics_server_label(chat_request):
+    """The 'server' label of a chat turn's metrics: the selected server's address, or the kind of turn."""
+    if chat_request['use_tools']:
+        return 'tools'
+    if chat_request['servers'] is not None:
+        return 'multiple'
+    if chat_request['server_info'] is not None:
+        return chat_request['server_info'].address
+    return 'none'
+
+
+def timed_turn(turn, chat_request, route, started):
+    """Labels a chat turn's metrics with its route and server and records how long its prompt took to build."""
+    turn['metrics_labels'] = (route, metrics_server_label(chat_request))
+    PROMPT_BUILD_SECONDS.observe(time.perf_counter() - started, *turn['metrics_labels'])
+    return turn
+
+
+def lookup_cached_reply(turn):
+    """Returns the turn's cached reply (or None), counting the lookup as a hit, miss or bypass."""
+    cached_reply = response_cache.get(turn['cache_key'], turn['use_cache'])
+    if cached_reply is not None:
+        result = 'hit'
+    elif turn['use_cache'] and response_cache.enabled:
+        result = 'miss'
+    else:
+        result = 'bypass'
+    REPLY_CACHE.inc(*turn['metrics_labels'], result)
+    return cached_reply
+
+
+def reserve_openai_capacity(turn):
+    """
+    Reserves one request and the turn's tokens under the OpenAI rate limits before it is sent.
+    Returns None, or a 429 error response (body, status, headers) if a limit is exhausted.
+    """
     try:
-        print(f"Sending to OpenAI. Prompt context prefix: {prompt_context[:200]}...") # Log part of context
-        completion = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant. If the user asks about a Minecraft server and context for that server is provided, use that context to inform your answer. Otherwise, answer generally."},
-                {"role": "user", "content": full_prompt}
-            ]
-        )
-        llm_response = completion.choices[0].message.content
-        return jsonify({'reply': llm_response, 'server_data_used': server_data_for_llm})
+        openai_limits.acquire(turn['prompt_tokens'] + config.OPENAI_TPM_REPLY_ESTIMATE)
+    except Rejected as e:
+        return e.payload(), e.status, {'Retry-After': str(e.retry_after)}
+    return None
+
+
+@app.route('/chat_with_llm', methods=['POST'])
+def chat_with_llm():
+    """
+    Handles chat messages, optionally fetches MCP server data,
+    and interacts with OpenAI LLM.
+    """
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    turn, error_response = prepare_chat_turn(request.get_json())
+    if error_response:
+        return error_response
+
+    cached_reply = lookup_cached_reply(turn)
+    if cached_reply is not None:
+        return jsonify({'reply': cached_reply, 'server_data_used': turn['server_data_used'], 'cached': True,
+                        **remember_turn(turn, cached_reply)})
+
+    error_response = reserve_openai_capacity(turn)
+    if error_response:
+        return error_response
+
+    client = client_manager.get_client() # Reuses pooled keep-alive connections across requests
+
+    started = time.perf_counter()
+    try:
+        print(f"Sending to OpenAI. Prompt context prefix: {turn['prompt_context'][:200]}...") # Log part of context
+        if turn['use_tools']:
+            tool_turn = ToolTurn(lookup_server_statuses, turn['baseline_probes'])
+            llm_response = complete_with_tools(client, turn['model'], turn['messages'], tool_turn)
+            OPENAI_SECONDS.observe(time.perf_counter() - started, *turn['metrics_labels'])
+            return jsonify({'reply': llm_response, 'cached': False, **finish_tool_turn(tool_turn),
+                            **usage_fields(turn, tool_turn.usage), **remember_turn(turn, llm_response)})
+        usage = {}
+        llm_response = complete_chat(client, turn['model'], turn['messages'], usage)
+        OPENAI_SECONDS.observe(time.perf_counter() - started, *turn['metrics_labels'])
+        response_cache.put(turn['cache_key'], llm_response, turn['use_cache'])
+        return jsonify({'reply': llm_response, 'server_data_used': turn['server_data_used'], 'cached': False,
+                        **usage_fields(turn, usage), **remember_turn(turn, llm_response)})
     except Exception as e:
         print(f"OpenAI API error: {str(e)}")
+        ERRORS.inc(turn['metrics_labels'][0], type(e).__name__)
         return jsonify({'error': f'OpenAI API error: {str(e)}'}), 500
 
 
+def complete_chat(client, model, messages, usage):
+    """
+    Returns the reply to a chat prompt. Concurrent turns with exactly the same prompt share one
+    OpenAI call (config.SINGLE_FLIGHT_LLM), including turns streaming the reply.
+
+    The token usage of the call is recorded (see prompts.token_usage) and put in the `usage` dict.
+    Turns that shared another turn's call leave it empty, as they cost no tokens of their own.
+    """
+    def create():
+        completion = client.chat.completions.create(
+            model=model,
+            messages=messages
+        )
+        usage.update(token_usage.record(model, completion.usage) or {})
+        return completion.choices[0].message.content
+
+    if not config.SINGLE_FLIGHT_LLM:
+        return create()
+    return llm_flight.do(prompt_key(model, messages), create)
+
+
+def stream_chat(client, model, messages, usage):
+    """
+    Yields the text deltas of the reply to a chat prompt. If the same prompt is already being
+    answered (see complete_chat), its complete reply is yielded as one delta when it is ready.
+    The stream asks OpenAI for a final usage chunk, which is recorded like in complete_chat.
+    """
+    def create():
+        stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            if chunk.choices:
+                yield chunk.choices[0].delta.content
+            else: # The final chunk only carries the usage
+                usage.update(token_usage.record(model, chunk.usage) or {})
+
+    if not config.SINGLE_FLIGHT_LLM:
+        return create()
+    return llm_flight.stream(prompt_key(model, messages), create)
+
+
+def usage_fields(turn, usage):
+    """Response fields with the turn's model, its counted prompt tokens and the token usage OpenAI reported."""
+    return {'model': turn['model'], 'prompt_tokens': turn['prompt_tokens'], 'usage': usage or None}
+
+
+def finish_tool_turn(tool_turn):
+    """Records a finished tool-calling turn and returns the response fields describing it."""
+    metrics = tool_turn.metrics()
+    tool_stats.record(metrics)
+    return {'server_data_used': tool_turn.server_data_used or None, 'tool_metrics': metrics}
+
+
+def sse_event(payload, event=None):
+    """Formats a JSON payload as a server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+
+@app.route('/chat_with_llm/stream', methods=['POST'])
+def chat_with_llm_stream():
+    """
+    Streaming version of /chat_with_llm. Proxies the LLM's token deltas to the
+    browser as server-sent events as soon as they arrive:
+      event: meta   -> {"server_data_used": ..., "conversation_id": ...} (sent first)
+      data          -> {"delta": "..."} (one per chunk)
+      event: done   -> {"model", "prompt_tokens", "usage"} when the reply is complete
+                       (tool-calling turns also: "server_data_used", "tool_metrics")
+      event: error  -> {"error": "..."} if the OpenAI call fails mid-way
+    """
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    turn, error_response = prepare_chat_turn(request.get_json())
+    if error_response:
+        return error_response
+
+    cached_reply = lookup_cached_reply(turn)
+
+    def generate_cached():
+        yield sse_event({"server_data_used": turn['server_data_used'], "cached": True,
+                         **remember_turn(turn, cached_reply)}, event="meta")
+        yield sse_event({"delta": cached_reply})
+        yield sse_event({}, event="done")
+
+    if cached_reply is not None:
+        return Response(generate_cached(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+    error_response = reserve_openai_capacity(turn) # Rejected before the event stream starts
+    if error_response:
+        return error_response
+
+    client = client_manager.get_client()
+
+    def generate():
+        yield sse_event({"server_data_used": turn['server_data_used'], "cached": False,
+                         **conversation_fields(turn)}, event="meta")
+        reply_parts = []
+        tool_turn = ToolTurn(lookup_server_statuses, turn['baseline_probes']) if turn['use_tools'] else None
+        usage = tool_turn.usage if tool_turn is not None else {}
+        started = time.perf_counter()
+        try:
+            print(f"Streaming from OpenAI. Prompt context prefix: {turn['prompt_context'][:200]}...")
+            if tool_turn is not None: # Tool rounds run in between; only the answer's text is streamed
+                deltas = stream_with_tools(client, turn['model'], turn['messages'], tool_turn)
+            else:
+                deltas = stream_chat(client, turn['model'], turn['messages'], usage)
+            for delta in deltas:
+                if delta:
+                    if not reply_parts:
+                        FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, *turn['metrics_labels'])
+                    reply_parts.append(delta)
+                    yield sse_event({"delta": delta})
+            OPENAI_SECONDS.observe(time.perf_counter() - started, *turn['metrics_labels'])
+            response_cache.put(turn['cache_key'], "".join(reply_parts), turn['use_cache']) # Only complete replies
+            remember_turn(turn, "".join(reply_parts))
+            done = finish_tool_turn(tool_turn) if tool_turn is not None else {}
+            yield sse_event({**done, **usage_fields(turn, usage)}, event="done")
+        except Exception as e:
+            print(f"OpenAI API streaming error: {str(e)}")
+            ERRORS.inc(turn['metrics_labels'][0], type(e).__name__)
+            yield sse_event({"error": f"OpenAI API error: {str(e)}"}, event="error")
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}) # Disable proxy buffering
+
+
+@app.route('/conversations/<conversation_id>', methods=['DELETE'])
+def delete_conversation(conversation_id):
+    """Forgets a conversation's history (e.g. when the user starts over)."""
+    if not conversation_store.forget(conversation_id):
+        return jsonify({"error": "Conversation not found"}), 404
+    return jsonify({"deleted": conversation_id})
+
+
+@app.route('/status', methods=['GET'])
+def status():
+    """Returns the latest background-polled status of all servers as JSON (no network I/O)."""
+    snapshot = status_poller.snapshot.to_dict()
+    snapshot["poller_running"] = status_poller.running
+    return jsonify(snapshot)
+
+
+def open_status_stream(servers, max_subscribers=None):
+    """
+    Subscribes to live status changes for a /status/stream request.
+
+    Args:
+        servers (str): The 'servers' query parameter ("all" or comma-separated server IDs).
+        max_subscribers (int): Lower cap on open streams (see StatusBroadcaster.subscribe), optional.
+
+    Returns:
+        tuple: (subscriber, None) or (None, (error_dict, status_code, headers)).
+    """
+    if not config.STATUS_PUSH_ENABLED:
+        return None, ({"error": "Live status push is disabled (STATUS_PUSH_ENABLED)."}, 404, {})
+    try:
+        ids = parse_server_ids(servers)
+    except ValueError as e:
+        return None, ({"error": str(e)}, 400, {})
+    subscriber = status_push.subscribe(ids, max_subscribers)
+    if subscriber is None:
+        return None, ({"error": "Too many open status streams, please retry later."}, 503,
+                      {'Retry-After': str(config.STATUS_PUSH_HEARTBEAT)})
+    return subscriber, None
+
+
+@app.route('/status/stream', methods=['GET'])
+def status_stream():
+    """
+    Pushes status changes of the selected servers to the browser as server-sent events (no network I/O).
+    Query parameters:
+      servers  -> "all" (default) or comma-separated server IDs
+    The stream starts with the latest known state of each server, then sends
+      event: status -> {"id", "name", "online", "player_count", "player_max", "changed"}
+    whenever a server goes online/offline or its player count changes noticeably.
+    Each open stream holds a request thread here, so at most config.STATUS_PUSH_MAX_WSGI_SUBSCRIBERS
+    are served at once (the ASGI mode serves this route natively, without that limit).
+    """
+    subscriber, error_response = open_status_stream(request.args.get('servers'),
+                                                    config.STATUS_PUSH_MAX_WSGI_SUBSCRIBERS)
+    if error_response:
+        return error_response
+
+    def generate():
+        try:
+            yield status_push.initial_events(subscriber.ids) or HEARTBEAT
+            while True:
+                yield subscriber.next(config.STATUS_PUSH_HEARTBEAT) or HEARTBEAT
+        finally: # Runs when the client disconnects and the server closes the response
+            status_push.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/servers', methods=['GET'])
+def api_servers():
+    """
+    Returns one page of the configured servers as JSON (no network I/O).
+    Query parameters:
+      q       -> case-insensitive search in name, host:port and type (optional)
+      offset  -> index of the first matching server to return (default 0)
+      limit   -> page size (default config.SERVER_LIST_PAGE_SIZE, at most config.SERVER_LIST_MAX_PAGE_SIZE)
+    The ETag changes whenever the server list does; a request whose If-None-Match still matches
+    gets an empty 304 Not Modified.
+    """
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+    version, body = server_listing.page_json(request.args.get('q', ''), offset, limit)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(server_listing.etag(version))
+    response.cache_control.no_cache = True # Browsers may keep the page but must revalidate it
+    return response.make_conditional(request)
+
+
+@app.route('/servers/<int:server_id>/history', methods=['GET'])
+def server_history(server_id):
+    """
+    Returns the recorded status history of a server as JSON (no network I/O).
+    Query parameters:
+      limit       -> number of newest raw samples to return (default 100)
+      window      -> seconds covered by the summary and buckets (default 3600)
+      resolution  -> also return rollup buckets: '1m', '1h' or '1d' (optional)
+    """
+    server_info = config.MCP_SERVERS.get(server_id)
+    if server_info is None:
+        return jsonify({"error": "Server not found"}), 404
+    try:
+        limit = int(request.args.get('limit', 100))
+        window = float(request.args.get('window', 3600))
+    except ValueError:
+        return jsonify({"error": "limit and window must be numbers"}), 400
+    if not math.isfinite(window) or window <= 0: # float() accepts 'nan' and 'inf', which aren't valid JSON
+        return jsonify({"error": "window must be a positive number of seconds"}), 400
+    resolution = request.args.get('resolution')
+    if resolution is not None and resolution not in RESOLUTIONS:
+        return jsonify({"error": f"resolution must be one of: {', '.join(RESOLUTIONS)}"}), 400
+
+    key = status_cache.make_key(server_info.host, server_info.port, server_info.type)
+    history = {
+        "server": server_info.to_dict(),
+        "samples": status_history.recent(key, limit),
+        "summary": status_history.summary(key, window),
+    }
+    player_trend = status_history.trend(key, 'player_count', window)
+    history["player_trend"] = round(player_trend, 1) if player_trend is not None else None # Percent change
+    if resolution is not None:
+        history["resolution"] = resolution
+        history["buckets"] = status_history.buckets(key, resolution, window)
+    return jsonify(history)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Serves request, probe and OpenAI timings and component counters in the Prometheus text format."""
+    if not metrics_registry.enabled:
+        return jsonify({"error": "Metrics are disabled (METRICS_ENABLED)."}), 404
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route('/admin/stats', methods=['GET'])
+def admin_stats():
+    """Returns internal counters (e.g. status cache hits/misses) as JSON."""
+    return jsonify({
+        "status_cache": status_cache.stats(),
+        "dns_cache": resolver_cache.stats(),
+        "host_health": host_health.stats(),
+        "status_history": status_history.stats(),
+        "openai_client": client_manager.stats(),
+        "response_cache": response_cache.stats(),
+        "status_poller": {"running": status_poller.running, "sweeps": status_poller.snapshot.sweeps,
+                          "servers": len(status_poller.snapshot.entries)},
+        "chat_tools": tool_stats.stats(),
+        "conversations": conversation_store.stats(),
+        "single_flight": {"probes": probe_flight.stats(), "llm": llm_flight.stats()},
+        "server_listing": server_listing.stats(),
+        "token_usage": token_usage.stats(),
+        "status_push": status_push.stats(),
+        "admission": dict(admission.stats(), clients=client_limiter.stats(), openai=openai_limits.stats(),
+                          probes=probe_limiter.stats()),
+        "persistence": config_store.stats() if config_store is not None else None,
+    })
+
+
 @app.route('/send_message', methods=['POST']) # Old endpoint, can be deprecated or removed
 def send_message_route():
     if not request.is_json: return jsonify({"status": "error", "message": "Request must be JSON"}), 400
@@ -0,0 +1,415 @@
+# This file provides the ASGI serving mode for the chat app.
+# Run it with:  uvicorn mcp_chat_app.asgi:app --host 0.0.0.0 --port 5000
+#
+# The chat endpoints, /status and /status/stream are served natively on the event loop with async OpenAI and
+# async mcstatus calls, so an in-flight chat costs a coroutine instead of a worker thread. So are API
+# imports that probe the imported servers (/admin/servers/import?probe=1), which can take up to
+# BULK_IMPORT_PROBE_DEADLINE. Every other route (chat page, admin pages, static files) is handed to the
+# existing Flask app through a WSGI bridge, so templates, flash messages and sessions keep working unchanged.
+
+import asyncio
+import csv
+import io
+import json
+import time
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+
+from . import config
+from .admission import Rejected, admission_gate, lane_for
+from .app import (app as flask_app, parse_chat_request, build_chat_turn, sse_event, conversation_fields,
+                  finish_tool_turn, lookup_cached_reply, merge_statuses, remember_turn, snapshot_statuses, timed_turn,
+                  reserve_openai_capacity, usage_fields, open_status_stream, IMPORT_FORMAT_ERROR, import_summary,
+                  log_import, summarize_import_probe)
+from .chat_tools import ToolTurn, async_complete_with_tools, async_stream_with_tools
+from .llm_client import client_manager
+from .mcp_client import MCPClient
+from .metrics import (ERRORS, FIRST_TOKEN_SECONDS, HTTP_IN_FLIGHT, HTTP_REQUEST_SECONDS, HTTP_REQUESTS,
+                      OPENAI_SECONDS)
+from .prompts import token_usage
+from .response_cache import response_cache
+from .server_io import ImportFormatError, detect_format, import_servers
+from .single_flight import llm_flight, prompt_key
+from .status_cache import status_cache
+from .status_poller import status_poller
+from .status_push import HEARTBEAT, status_push
+
+# Worker threads for routes delegated to Flask. Those routes do no network I/O, except an import from
+# the admin page's upload form with "probe" ticked (a person at a browser, not an API client), so a
+# few suffice.
+WSGI_BRIDGE_WORKERS = 8
+
+
+async def lookup_server_status(server_info, timeout=3):
+    """Async version of app.lookup_server_status: poller snapshot first, then the shared status cache."""
+    if status_poller.running:
+        entry = status_poller.snapshot.get(server_info.host, server_info.port, server_info.type)
+        if entry is not None:
+            return entry.status
+    return await status_cache.async_get(server_info.host, server_info.port, server_info.type,
+                                        timeout=timeout)
+
+
+async def lookup_server_statuses(servers):
+    """Async version of app.lookup_server_statuses: snapshot, cache, then one concurrent batch of probes."""
+    statuses, missing = snapshot_statuses(servers)
+    if missing:
+        looked_up = await status_cache.async_get_many(missing, timeout=config.CHAT_MULTI_SERVER_TIMEOUT,
+                                                      deadline=config.CHAT_MULTI_SERVER_DEADLINE)
+        statuses = merge_statuses(statuses, looked_up)
+    return statuses
+
+
+async def prepare_chat_turn(data, route):
+    """Async version of app.prepare_chat_turn. Returns (turn, None) or (None, (error_dict, status_code))."""
+    started = time.perf_counter()
+    chat_request, error_response = parse_chat_request(data)
+    if error_response:
+        return None, error_response
+
+    if chat_request['use_tools']:
+        turn = build_chat_turn(chat_request, None) # The model looks status up itself (see chat_tools.py)
+        return timed_turn(turn, chat_request, route, started), None
+
+    status_result = None
+    if chat_request['servers'] is not None:
+        status_result = await lookup_server_statuses(chat_request['servers'])
+    elif chat_request['server_info'] is not None:
+        status_result = await lookup_server_status(chat_request['server_info'], timeout=3)
+    return timed_turn(build_chat_turn(chat_request, status_result), chat_request, route, started), None
+
+
+async def complete_chat(client, model, messages, usage):
+    """Async version of app.complete_chat: identical concurrent prompts share one OpenAI call."""
+    async def create():
+        completion = await client.chat.completions.create(model=model, messages=messages)
+        usage.update(token_usage.record(model, completion.usage) or {})
+        return completion.choices[0].message.content
+
+    if not config.SINGLE_FLIGHT_LLM:
+        return await create()
+    return await llm_flight.async_do(prompt_key(model, messages), create)
+
+
+async def stream_chat(client, model, messages, usage):
+    """Async version of app.stream_chat. Yields the reply's text deltas."""
+    async def deltas(stream):
+        async for chunk in stream:
+            if chunk.choices:
+                yield chunk.choices[0].delta.content
+            else: # The final chunk only carries the usage
+                usage.update(token_usage.record(model, chunk.usage) or {})
+
+    async def create():
+        return deltas(await client.chat.completions.create(model=model, messages=messages, stream=True,
+                                                           stream_options={"include_usage": True}))
+
+    if not config.SINGLE_FLIGHT_LLM:
+        async for delta in await create():
+            yield delta
+        return
+    async for delta in llm_flight.async_stream(prompt_key(model, messages), create):
+        yield delta
+
+
+# --- Minimal ASGI request/response helpers ---
+async def read_body(receive):
+    """Reads the whole request body."""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def read_json_body(scope, receive):
+    """Reads the request body and parses it as JSON. Returns None if it isn't a JSON request."""
+    headers = dict(scope.get('headers') or [])
+    if not headers.get(b'content-type', b'').startswith(b'application/json'):
+        return None
+    body = await read_body(receive)
+    try:
+        data = json.loads(body or b'null')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def send_json(send, payload, status=200, headers=None):
+    """Sends a complete JSON response, with optional extra headers (a dict)."""
+    body = json.dumps(payload).encode('utf-8')
+    extra = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in (headers or {}).items()]
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode())] + extra})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def start_event_stream(send):
+    """Starts a server-sent events response."""
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'text/event-stream; charset=utf-8'),
+                            (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]})
+
+
+async def send_event(send, payload, event=None, more_body=True):
+    await send({'type': 'http.response.body', 'body': sse_event(payload, event).encode('utf-8'), 'more_body': more_body})
+
+
+# --- Native async routes ---
+async def chat_with_llm(scope, receive, send):
+    """Async version of the /chat_with_llm route (same request and response format)."""
+    data = await read_json_body(scope, receive)
+    if data is None:
+        return await send_json(send, {"error": "Request must be JSON"}, 400)
+
+    turn, error_response = await prepare_chat_turn(data, scope['path'])
+    if error_response:
+        return await send_json(send, *error_response)
+
+    cached_reply = lookup_cached_reply(turn)
+    if cached_reply is not None:
+        return await send_json(send, {'reply': cached_reply, 'server_data_used': turn['server_data_used'],
+                                      'cached': True, **remember_turn(turn, cached_reply)})
+
+    error_response = reserve_openai_capacity(turn)
+    if error_response:
+        return await send_json(send, *error_response)
+
+    client = client_manager.get_async_client()
+    started = time.perf_counter()
+    try:
+        if turn['use_tools']:
+            tool_turn = ToolTurn(lookup_server_statuses, turn['baseline_probes'])
+            llm_response = await async_complete_with_tools(client, turn['model'], turn['messages'], tool_turn)
+            OPENAI_SECONDS.observe(time.perf_counter() - started, *turn['metrics_labels'])
+            return await send_json(send, {'reply': llm_response, 'cached': False, **finish_tool_turn(tool_turn),
+                                          **usage_fields(turn, tool_turn.usage), **remember_turn(turn, llm_response)})
+        usage = {}
+        llm_response = await complete_chat(client, turn['model'], turn['messages'], usage)
+        OPENAI_SECONDS.observe(time.perf_counter() - started, *turn['metrics_labels'])
+        response_cache.put(turn['cache_key'], llm_response, turn['use_cache'])
+        await send_json(send, {'reply': llm_response, 'server_data_used': turn['server_data_used'], 'cached': False,
+                               **usage_fields(turn, usage), **remember_turn(turn, llm_response)})
+    except Exception as e:
+        print(f"OpenAI API error: {str(e)}")
+        ERRORS.inc(turn['metrics_labels'][0], type(e).__name__)
+        await send_json(send, {'error': f'OpenAI API error: {str(e)}'}, 500)
+
+
+async def chat_with_llm_stream(scope, receive, send):
+    """Async version of the /chat_with_llm/stream route (same server-sent event format)."""
+    data = await read_json_body(scope, receive)
+    if data is None:
+        return await send_json(send, {"error": "Request must be JSON"}, 400)
+
+    turn, error_response = await prepare_chat_turn(data, scope['path'])
+    if error_response:
+        return await send_json(send, *error_response)
+
+    cached_reply = lookup_cached_reply(turn)
+    error_response = reserve_openai_capacity(turn) if cached_reply is None else None
+    if error_response: # Rejected before the event stream starts
+        return await send_json(send, *error_response)
+
+    await start_event_stream(send)
+    if cached_reply is not None:
+        await send_event(send, {"server_data_used": turn['server_data_used'], "cached": True,
+                                **remember_turn(turn, cached_reply)}, event="meta")
+        await send_event(send, {"delta": cached_reply})
+        return await send_event(send, {}, event="done", more_body=False)
+
+    await send_event(send, {"server_data_used": turn['server_data_used'], "cached": False,
+                            **conversation_fields(turn)}, event="meta")
+    client = client_manager.get_async_client()
+    reply_parts = []
+    tool_turn = ToolTurn(lookup_server_statuses, turn['baseline_probes']) if turn['use_tools'] else None
+    usage = tool_turn.usage if tool_turn is not None else {}
+    started = time.perf_counter()
+    try:
+        if tool_turn is not None:
+            deltas = async_stream_with_tools(client, turn['model'], turn['messages'], tool_turn)
+        else:
+            deltas = stream_chat(client, turn['model'], turn['messages'], usage)
+        async for delta in deltas:
+            if delta:
+                if not reply_parts:
+                    FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, *turn['metrics_labels'])
+                reply_parts.append(delta)
+                await send_event(send, {"delta": delta})
+        OPENAI_SECONDS.observe(time.perf_counter() - started, *turn['metrics_labels'])
+        response_cache.put(turn['cache_key'], "".join(reply_parts), turn['use_cache'])
+        remember_turn(turn, "".join(reply_parts))
+        done = finish_tool_turn(tool_turn) if tool_turn is not None else {}
+        await send_event(send, {**done, **usage_fields(turn, usage)}, event="done", more_body=False)
+    except Exception as e:
+        print(f"OpenAI API streaming error: {str(e)}")
+        ERRORS.inc(turn['metrics_labels'][0], type(e).__name__)
+        await send_event(send, {"error": f"OpenAI API error: {str(e)}"}, event="error", more_body=False)
+
+
+async def status(scope, receive, send):
+    """Async version of the /status route."""
+    snapshot = status_poller.snapshot.to_dict()
+    snapshot["poller_running"] = status_poller.running
+    await send_json(send, snapshot)
+
+
+async def status_stream(scope, receive, send):
+    """
+    Async version of the /status/stream route. Each open stream is a waiting coroutine, so thousands
+    of browser tabs can follow status changes without a thread each.
+    """
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    subscriber, error_response = open_status_stream(query.get('servers', [None])[0])
+    if error_response:
+        return await send_json(send, *error_response)
+
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await start_event_stream(send)
+        chunk = status_push.initial_events(subscriber.ids) or HEARTBEAT
+        while not disconnected.done():
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            pushed = asyncio.ensure_future(subscriber.async_next(config.STATUS_PUSH_HEARTBEAT))
+            await asyncio.wait((pushed, disconnected), return_when=asyncio.FIRST_COMPLETED)
+            if not pushed.done():
+                pushed.cancel()
+                break
+            chunk = pushed.result() or HEARTBEAT
+    finally:
+        disconnected.cancel()
+        status_push.unsubscribe(subscriber)
+
+
+async def import_servers_route(scope, receive, send):
+    """
+    Async version of the /admin/servers/import route for API imports with probe=1 (see
+    ChatASGIApp.is_native_import). The file is parsed on a worker thread and the imported servers
+    are probed with MCPClient.async_get_many, so the reachability check holds no thread.
+    """
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    content_type = dict(scope.get('headers') or []).get(b'content-type', b'').decode('latin-1')
+    fmt = detect_format(query.get('format', [None])[0], content_type)
+    dry_run = query.get('dry_run', [''])[0] in ('1', 'true')
+    if fmt is None:
+        return await send_json(send, {"error": IMPORT_FORMAT_ERROR}, 400)
+
+    body = await read_body(receive)
+    try:
+        result = await asyncio.to_thread(import_servers, config.MCP_SERVERS, io.BytesIO(body), fmt, dry_run=dry_run)
+    except (ImportFormatError, UnicodeDecodeError, csv.Error) as e:
+        return await send_json(send, {"error": f"Import failed: {e}"}, 400)
+
+    summary = import_summary(result, dry_run)
+    if result['imported']:
+        results = await MCPClient.async_get_many(result['imported'], deadline=config.BULK_IMPORT_PROBE_DEADLINE,
+                                                 timeout=config.BULK_IMPORT_PROBE_TIMEOUT)
+        summary["probe"] = summarize_import_probe(result['imported'], results)
+    log_import(fmt, summary)
+    await send_json(send, summary)
+
+
+async def wait_for_disconnect(receive):
+    """Returns once the client has closed the connection."""
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class ChatASGIApp:
+    """
+    ASGI application that serves the latency-sensitive routes natively and
+    delegates everything else to the Flask app.
+    """
+
+    def __init__(self, wsgi_app, wsgi_workers=WSGI_BRIDGE_WORKERS):
+        self.wsgi = WSGIMiddleware(wsgi_app, workers=wsgi_workers)
+        self.routes = {
+            ('POST', '/chat_with_llm'): chat_with_llm,
+            ('POST', '/chat_with_llm/stream'): chat_with_llm_stream,
+            ('GET', '/status'): status,
+            ('GET', '/status/stream'): status_stream,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http':
+            handler = self.routes.get((scope['method'], scope['path']))
+            if handler is None and self.is_native_import(scope):
+                handler = import_servers_route
+            if handler is not None:
+                return await self._serve(handler, scope, receive, send)
+        return await self.wsgi(scope, receive, send) # Flask's requests are measured by its own middleware
+
+    @staticmethod
+    def is_native_import(scope):
+        """
+        Whether a request is an API import with probe=1. Form uploads from the admin page (which
+        flash their result and redirect) stay with Flask.
+        """
+        if scope['method'] != 'POST' or scope['path'] != '/admin/servers/import':
+            return False
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        content_type = dict(scope.get('headers') or []).get(b'content-type', b'')
+        return (query.get('probe', [''])[0] in ('1', 'true', 'on')
+                and not content_type.startswith(b'multipart/form-data'))
+
+    @staticmethod
+    async def _serve(handler, scope, receive, send):
+        """
+        Runs a native route, recording the same request metrics as metrics.RequestMetricsMiddleware
+        and applying the same admission control as admission.AdmissionMiddleware.
+        """
+        route = scope['path']
+        lane = lane_for(route) if config.ADMISSION_ENABLED else None
+        if lane is not None:
+            try:
+                admitted_at = await admission_gate.async_enter(lane, (scope.get('client') or (None,))[0])
+            except Rejected as e:
+                HTTP_REQUESTS.inc(route, str(e.status))
+                return await send_json(send, e.payload(), e.status, {'Retry-After': str(e.retry_after)})
+        started = time.perf_counter()
+        status = ['500']
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = str(message['status'])
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(route)
+        try:
+            await handler(scope, receive, send_with_status)
+        except Exception as e:
+            ERRORS.inc(route, type(e).__name__)
+            raise
+        finally:
+            if lane is not None:
+                admission_gate.release(admitted_at)
+            HTTP_IN_FLIGHT.dec(route)
+            HTTP_REQUESTS.inc(route, status[0])
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route)
+
+    @staticmethod
+    async def _lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if config.STATUS_POLLER_ENABLED: # Already started when app.py was imported; no-op then
+                    status_poller.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                status_poller.stop()
+                status_push.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = ChatASGIApp(flask_app)
+
+# Main execution block
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5000)
@@ -0,0 +1,366 @@
+# This file contains the OpenAI function-calling ("tools") mode of the chat endpoints.
+# Instead of pinging the selected server before every message (even for "thanks!"), the model is
+# given get_server_status, list_servers and get_server_history as tools and decides itself when live
+# data is needed. Status lookups requested in the same round (parallel tool calls) are batched into
+# one concurrent probe, and every turn reports how many probes it avoided.
+
+import json
+import threading
+
+from . import config
+from .prompts import add_usage, token_usage
+from .status_cache import status_cache
+from .status_history import status_history
+
+# Tool definitions sent to the model (OpenAI "tools" format).
+_SERVER_REFERENCE = {
+    "server_id": {"type": "integer", "description": "The server's ID (preferred)."},
+    "name": {"type": "string", "description": "The server's name, if the ID is not known."},
+}
+TOOLS = [
+    {"type": "function", "function": {
+        "name": "get_server_status",
+        "description": "Gets the live status of a configured Minecraft server: online/offline, version, "
+                       "MOTD, player count, latency and, when available, online player names.",
+        "parameters": {"type": "object", "properties": dict(_SERVER_REFERENCE)},
+    }},
+    {"type": "function", "function": {
+        "name": "list_servers",
+        "description": "Lists the configured Minecraft servers (ID, name, address and type).",
+        "parameters": {"type": "object", "properties": {
+            "query": {"type": "string", "description": "Only servers whose name or host contains this text."},
+            "limit": {"type": "integer", "description": "Maximum number of servers to return (default 50)."},
+        }},
+    }},
+    {"type": "function", "function": {
+        "name": "get_server_history",
+        "description": "Gets a server's recorded status history: uptime, latency and player count "
+                       "percentiles and the player count trend over a recent window.",
+        "parameters": {"type": "object", "properties": dict(_SERVER_REFERENCE, window_minutes={
+            "type": "integer", "description": "How far back to look, in minutes (default 60)."})},
+    }},
+]
+
+TOOLS_SYSTEM_PROMPT = (
+    "You are a helpful assistant for Minecraft server users. You can look up configured servers with "
+    "the provided tools. Only call a tool when the question needs live or historical server data; "
+    "answer greetings, thanks and general questions directly. Call tools for several servers at once "
+    "when comparing them.")
+
+LIST_SERVERS_MAX = 200
+# Servers named in the prompt's selection hint; larger selections point the model to list_servers.
+SELECTION_HINT_MAX = 20
+
+
+class ToolStats:
+    """Process-wide counters for tool-mode chat turns, exposed in /admin/stats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def record(self, metrics):
+        with self._lock:
+            self.turns += 1
+            self.tool_calls += metrics['tool_calls']
+            self.status_lookups += metrics['status_lookups']
+            self.probes_avoided += metrics['probes_avoided']
+
+    def reset(self):
+        self.turns = self.tool_calls = self.status_lookups = self.probes_avoided = 0
+
+    def stats(self):
+        with self._lock:
+            return {"turns": self.turns, "tool_calls": self.tool_calls,
+                    "status_lookups": self.status_lookups, "probes_avoided": self.probes_avoided}
+
+
+tool_stats = ToolStats()
+
+
+class ToolTurn:
+    """
+    Executes the tool calls of one chat turn and keeps its metrics.
+
+    `lookup_statuses` returns the status of a list of servers (e.g. app.lookup_server_statuses,
+    which reads the poller snapshot and cache before probing the rest concurrently). It is a
+    coroutine function when the turn is run with async_run().
+    """
+
+    def __init__(self, lookup_statuses, baseline_probes=0):
+        """
+        Args:
+            lookup_statuses (callable): Returns one status per server in a list.
+            baseline_probes (int): Status lookups the turn would have made without tools
+                                   (the number of selected servers).
+        """
+        self._lookup_statuses = lookup_statuses
+        self.baseline_probes = baseline_probes
+        self.rounds = 0
+        self.tool_calls = 0
+        self.status_lookups = 0
+        self.server_data_used = [] # Statuses the model asked for, returned to the browser
+        self.usage = {} # Tokens used by all rounds of the turn (see prompts.usage_fields)
+
+    def run(self, calls):
+        """
+        Executes the tool calls of one model round.
+
+        Args:
+            calls (list): Dicts with 'id', 'name' and 'arguments' (a JSON string).
+
+        Returns:
+            list: One 'tool' message per call, to append to the conversation.
+        """
+        parsed = self._parse(calls)
+        servers = self._status_servers(parsed)
+        return self._results(parsed, self._lookup_statuses(servers) if servers else [])
+
+    async def async_run(self, calls):
+        """Async version of run(); `lookup_statuses` must be a coroutine function."""
+        parsed = self._parse(calls)
+        servers = self._status_servers(parsed)
+        return self._results(parsed, await self._lookup_statuses(servers) if servers else [])
+
+    def record_usage(self, model, usage):
+        """Records the token usage of one model round (ignored if the response reported none)."""
+        fields = token_usage.record(model, usage)
+        if fields is not None:
+            add_usage(self.usage, fields)
+
+    def metrics(self):
+        """Returns the turn's metrics, e.g. for the chat response."""
+        return {"rounds": self.rounds, "tool_calls": self.tool_calls, "status_lookups": self.status_lookups,
+                "probes_avoided": max(self.baseline_probes - self.status_lookups, 0)}
+
+    # --- Internal helpers ---
+    def _parse(self, calls):
+        """Returns (call, name, arguments, server, error) for each call."""
+        self.rounds += 1
+        self.tool_calls += len(calls)
+        parsed = []
+        for call in calls:
+            try:
+                arguments = json.loads(call['arguments'] or '{}')
+                if not isinstance(arguments, dict):
+                    raise ValueError("arguments must be an object")
+            except ValueError as e:
+                parsed.append((call, call['name'], {}, None, f"Invalid arguments: {e}"))
+                continue
+            server, error = None, None
+            if call['name'] in ('get_server_status', 'get_server_history'):
+                server = resolve_server(arguments)
+                if server is None:
+                    error = "Unknown server. Use list_servers to find server IDs."
+            elif call['name'] != 'list_servers':
+                error = f"Unknown tool '{call['name']}'."
+            parsed.append((call, call['name'], arguments, server, error))
+        return parsed
+
+    def _status_servers(self, parsed):
+        """The servers to look up in this round; parallel calls share one concurrent batch."""
+        servers = [server for _, name, _, server, error in parsed if name == 'get_server_status' and not error]
+        self.status_lookups += len(servers)
+        return servers
+
+    def _results(self, parsed, statuses):
+        statuses = iter(statuses)
+        messages = []
+        for call, name, arguments, server, error in parsed:
+            if error:
+                result = {"error": error}
+            elif name == 'get_server_status':
+                status = dict(next(statuses))
+                self.server_data_used.append({"id": server.id, "name": server.name, "status": status})
+                result = dict(server_summary(server), status=status)
+            elif name == 'list_servers':
+                result = list_servers(arguments.get('query'), arguments.get('limit'))
+            else:
+                result = server_history(server, arguments.get('window_minutes'))
+            messages.append({"role": "tool", "tool_call_id": call['id'], "content": json.dumps(result)})
+        return messages
+
+
+def server_summary(server):
+    return {"server_id": server.id, "name": server.name, "address": server.address, "type": server.type}
+
+
+def resolve_server(arguments):
+    """Finds the server a tool call refers to (by 'server_id', else by 'name'), or None."""
+    server_id = arguments.get('server_id')
+    if server_id is not None:
+        try:
+            return config.MCP_SERVERS.get(int(server_id))
+        except (TypeError, ValueError):
+            return None
+    name = arguments.get('name')
+    if isinstance(name, str) and name.strip():
+        matches = config.MCP_SERVERS.find_by_name(name)
+        return matches[0] if matches else None
+    return None
+
+
+def list_servers(query=None, limit=None):
+    """Result of the list_servers tool."""
+    try:
+        limit = min(max(int(limit), 1), LIST_SERVERS_MAX) if limit is not None else 50
+    except (TypeError, ValueError):
+        limit = 50
+    servers = config.MCP_SERVERS.all()
+    if query:
+        query = str(query).lower()
+        servers = [s for s in servers if query in s.name.lower() or query in s.host.lower()]
+    return {"total": len(servers), "servers": [server_summary(s) for s in servers[:limit]],
+            "truncated": len(servers) > limit}
+
+
+def server_history(server, window_minutes=None):
+    """Result of the get_server_history tool (recorded history only, no network I/O)."""
+    try:
+        window = max(float(window_minutes), 1) * 60 if window_minutes is not None else 3600
+    except (TypeError, ValueError):
+        window = 3600
+    key = status_cache.make_key(server.host, server.port, server.type)
+    summary = status_history.summary(key, window)
+    trend = status_history.trend(key, 'player_count', window)
+    return dict(server_summary(server), window_minutes=round(window / 60), samples=summary['samples'],
+                uptime_percent=summary['uptime'], latency_ms=summary['latency'],
+                player_count=summary['player_count'],
+                player_trend_percent=round(trend, 1) if trend is not None else None)
+
+
+def selection_hint(chat_request):
+    """Tells the model which server(s) the user selected, without looking up their status."""
+    servers = chat_request['servers']
+    if servers is None:
+        server_info = chat_request['server_info']
+        if server_info is not None:
+            return f"The user has selected the Minecraft server '{server_info.name}' (server_id {server_info.id}). "
+        if chat_request['invalid_server']:
+            return "The user selected a server, but the ID was invalid. "
+        return ""
+    if not servers:
+        return "The user selected servers, but none of the IDs were valid. "
+    if len(servers) > SELECTION_HINT_MAX:
+        return (f"The user has selected {len(servers)} Minecraft servers; use list_servers to see them "
+                f"(they include server_ids {', '.join(str(s.id) for s in servers[:SELECTION_HINT_MAX])}, ...). ")
+    return ("The user has selected these Minecraft servers (server_id: name): "
+            f"{'; '.join(f'{s.id}: {s.name}' for s in servers)}. ")
+
+
+# --- Model round trips ---
+def _tool_options(final_round):
+    """The last allowed round forbids further tool calls so the model has to answer."""
+    return {"tools": TOOLS, "tool_choice": "none" if final_round else "auto"}
+
+
+def _calls_from_message(message):
+    return [{"id": call.id, "name": call.function.name, "arguments": call.function.arguments}
+            for call in (message.tool_calls or ())]
+
+
+def _assistant_message(content, calls):
+    return {"role": "assistant", "content": content,
+            "tool_calls": [{"id": call['id'], "type": "function",
+                            "function": {"name": call['name'], "arguments": call['arguments']}} for call in calls]}
+
+
+def _add_streamed_calls(calls, tool_call_deltas):
+    """Accumulates streamed tool call fragments (keyed by their index) into `calls`."""
+    for delta in tool_call_deltas or ():
+        call = calls.setdefault(delta.index, {"id": None, "name": "", "arguments": ""})
+        if delta.id:
+            call['id'] = delta.id
+        if delta.function is not None:
+            call['name'] += delta.function.name or ""
+            call['arguments'] += delta.function.arguments or ""
+
+
+def complete_with_tools(client, model, messages, tool_turn, max_rounds=None):
+    """
+    Runs a chat completion, executing tool calls until the model answers.
+
+    Returns:
+        str: The model's final reply.
+    """
+    max_rounds = config.CHAT_TOOLS_MAX_ROUNDS if max_rounds is None else max_rounds
+    messages = list(messages)
+    for round_number in range(max_rounds + 1):
+        completion = client.chat.completions.create(model=model, messages=messages,
+                                                    **_tool_options(round_number == max_rounds))
+        tool_turn.record_usage(model, completion.usage)
+        message = completion.choices[0].message
+        calls = _calls_from_message(message)
+        if not calls:
+            return message.content
+        messages.append(_assistant_message(message.content, calls))
+        messages.extend(tool_turn.run(calls))
+
+
+async def async_complete_with_tools(client, model, messages, tool_turn, max_rounds=None):
+    """Async version of complete_with_tools() for an AsyncOpenAI client."""
+    max_rounds = config.CHAT_TOOLS_MAX_ROUNDS if max_rounds is None else max_rounds
+    messages = list(messages)
+    for round_number in range(max_rounds + 1):
+        completion = await client.chat.completions.create(model=model, messages=messages,
+                                                          **_tool_options(round_number == max_rounds))
+        tool_turn.record_usage(model, completion.usage)
+        message = completion.choices[0].message
+        calls = _calls_from_message(message)
+        if not calls:
+            return message.content
+        messages.append(_assistant_message(message.content, calls))
+        messages.extend(await tool_turn.async_run(calls))
+
+
+def stream_with_tools(client, model, messages, tool_turn, max_rounds=None):
+    """
+    Streaming version of complete_with_tools(): yields reply text deltas as they arrive.
+    Rounds that end in tool calls are executed in between, so the user only waits on them when needed.
+    """
+    max_rounds = config.CHAT_TOOLS_MAX_ROUNDS if max_rounds is None else max_rounds
+    messages = list(messages)
+    for round_number in range(max_rounds + 1):
+        stream = client.chat.completions.create(model=model, messages=messages, stream=True,
+                                                stream_options={"include_usage": True},
+                                                **_tool_options(round_number == max_rounds))
+        content, calls = [], {}
+        for chunk in stream:
+            if not chunk.choices: # The final chunk only carries the round's usage
+                tool_turn.record_usage(model, chunk.usage)
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content.append(delta.content)
+                yield delta.content
+            _add_streamed_calls(calls, delta.tool_calls)
+        if not calls:
+            return
+        calls = [calls[index] for index in sorted(calls)]
+        messages.append(_assistant_message("".join(content) or None, calls))
+        messages.extend(tool_turn.run(calls))
+
+
+async def async_stream_with_tools(client, model, messages, tool_turn, max_rounds=None):
+    """Async version of stream_with_tools() for an AsyncOpenAI client."""
+    max_rounds = config.CHAT_TOOLS_MAX_ROUNDS if max_rounds is None else max_rounds
+    messages = list(messages)
+    for round_number in range(max_rounds + 1):
+        stream = await client.chat.completions.create(model=model, messages=messages, stream=True,
+                                                      stream_options={"include_usage": True},
+                                                      **_tool_options(round_number == max_rounds))
+        content, calls = [], {}
+        async for chunk in stream:
+            if not chunk.choices: # The final chunk only carries the round's usage
+                tool_turn.record_usage(model, chunk.usage)
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content.append(delta.content)
+                yield delta.content
+            _add_streamed_calls(calls, delta.tool_calls)
+        if not calls:
+            return
+        calls = [calls[index] for index in sorted(calls)]
+        messages.append(_assistant_message("".join(content) or None, calls))
+        messages.extend(await tool_turn.async_run(calls))
@@ -1,5 +1,7 @@
 # This file is for storing configurations.
 
+from .server_registry import ServerRegistry
+
 # Default list of MCP (Minecraft Profile) server configurations.
 DEFAULT_MCP_SERVERS = [
     {'name': 'Hypixel', 'host': 'mc.hypixel.net', 'port': 25565, 'type': 'Minecraft Java'},
@@ -8,8 +10,9 @@ DEFAULT_MCP_SERVERS = [
     {'name': 'Another Java Server', 'host': 'javaminecraft.example.org', 'port': 25565, 'type': 'Minecraft Java'}
 ]
 
-# In-memory store for MCP server configurations.
-MCP_SERVERS = []
+# In-memory registry of MCP server configurations (see server_registry.py).
+# Servers have stable IDs; use its add/update/remove methods rather than mutating records.
+MCP_SERVERS = ServerRegistry()
 
 # OpenAI API Key
 # IMPORTANT: Storing API keys directly in config files or committing them to version control
@@ -17,6 +20,276 @@ MCP_SERVERS = []
 # Consider using environment variables or a secure vault for production.
 OPENAI_API_KEY = None
 
+# Server list pages and search (see server_listing.py)
+# Servers per page in the chat page's dropdown, the admin table and /api/servers.
+SERVER_LIST_PAGE_SIZE = 50
+# Largest page size /api/servers hands out when a client asks for more.
+SERVER_LIST_MAX_PAGE_SIZE = 500
+# Maximum number of cached search results, pages and rendered fragments (all dropped when the list changes).
+SERVER_LIST_CACHE_SIZE = 256
+
+# Server status cache (see status_cache.py)
+# Seconds an online status result is reused before the server is pinged again.
+STATUS_CACHE_TTL = 30
+# Seconds an offline/error result is reused. Kept short so recovered servers show up quickly.
+STATUS_CACHE_NEGATIVE_TTL = 10
+# Extra seconds an expired result may still be served while it is refreshed in the background.
+STATUS_CACHE_STALE_TTL = 120
+# Maximum number of servers kept in the cache before least recently used entries are evicted.
+STATUS_CACHE_MAX_ENTRIES = 1024
+
+# DNS resolution cache used by the status probes (see dns_cache.py)
+# Shortest and longest time in seconds a resolution is cached, whatever the record TTL says.
+DNS_CACHE_MIN_TTL = 30
+DNS_CACHE_MAX_TTL = 3600
+# Seconds a 'name does not exist' answer is cached when the zone doesn't provide an SOA TTL.
+DNS_CACHE_NEGATIVE_TTL = 300
+# Maximum number of cached host names before least recently used entries are evicted.
+DNS_CACHE_MAX_ENTRIES = 4096
+# Seconds to wait for the resolver before falling back to the last-known-good address.
+DNS_CACHE_SLOW_THRESHOLD = 0.5
+
+# Status probes (see mcp_client.py)
+# Also ask Java servers for their full player list over the Query protocol (UDP). Servers only answer
+# this if 'enable-query=true' is set in their server.properties; others are not asked again for a while.
+STATUS_QUERY_ENABLED = False
+# Timeout in seconds for a Query request.
+STATUS_QUERY_TIMEOUT = 1
+# Seconds before Query is tried again against a server that didn't answer it.
+STATUS_QUERY_RETRY_AFTER = 600
+# Maximum number of servers remembered as not answering Query before the least recently marked are dropped.
+STATUS_QUERY_UNSUPPORTED_MAX_ENTRIES = 4096
+# Maximum number of player names kept in a status result.
+STATUS_MAX_PLAYER_NAMES = 50
+
+# Per-host adaptive timeouts and circuit breaker (see host_health.py)
+# When enabled, probe timeouts follow each host's recent probe times, and hosts that keep failing are
+# not probed for a cooldown: callers get their last offline result immediately instead.
+HOST_HEALTH_ENABLED = True
+# Number of recent probe durations kept per host.
+HOST_LATENCY_SAMPLES = 50
+# Probes needed before a host's timeout is adapted.
+HOST_LATENCY_MIN_SAMPLES = 5
+# Adapted timeout = p99 probe duration x this factor, at least HOST_TIMEOUT_MIN seconds and never
+# more than the timeout the caller asked for.
+HOST_TIMEOUT_MULTIPLIER = 3
+HOST_TIMEOUT_MIN = 0.5
+# Consecutive failed probes after which a host's circuit opens.
+CIRCUIT_FAILURE_THRESHOLD = 3
+# Seconds an open circuit waits before a trial probe. Doubles after each failed trial, up to the maximum.
+CIRCUIT_COOLDOWN = 30
+CIRCUIT_MAX_COOLDOWN = 600
+# Maximum number of tracked hosts before the least recently probed ones are dropped.
+HOST_HEALTH_MAX_HOSTS = 4096
+
+# Rate limiting and admission control (see admission.py)
+# Admit chat and admin requests through a bounded queue; cheap routes (pages, /status) are not limited.
+ADMISSION_ENABLED = True
+# Requests running at once. Chat turns may use all but ADMISSION_ADMIN_RESERVED of these slots.
+ADMISSION_MAX_CONCURRENT = 64
+ADMISSION_ADMIN_RESERVED = 4
+# Requests waiting for a slot (admin first) before new ones are rejected with 503 and Retry-After.
+ADMISSION_MAX_QUEUE = 128
+# Seconds a request may wait for a slot before it is rejected.
+ADMISSION_QUEUE_TIMEOUT = 10
+# Chat turns per second per client address, and the burst allowed above that rate (429 beyond it).
+CLIENT_RATE_LIMIT = 2
+CLIENT_RATE_BURST = 20
+# OpenAI requests and tokens per minute (your account's limits; None disables a limit). Turns over
+# them get a 429 before anything is sent. Each turn reserves its prompt plus the reply estimate.
+OPENAI_RPM_LIMIT = 3500
+OPENAI_TPM_LIMIT = 90000
+OPENAI_TPM_REPLY_ESTIMATE = 256
+# Status probes per second per Minecraft host, and the burst allowed above that rate.
+PROBE_RATE_PER_HOST = 2
+PROBE_BURST_PER_HOST = 10
+
+# Request coalescing (see single_flight.py)
+# Concurrent status probes of the same server share one probe, and all callers get its result.
+SINGLE_FLIGHT_PROBES = True
+# Concurrent chat turns with exactly the same prompt share one OpenAI completion (tool-calling turns
+# never do). A streamed turn that joins another one gets the complete reply at once when it is ready.
+SINGLE_FLIGHT_LLM = True
+
+# Concurrent status probes in one process (see MCPClient.async_get_many in mcp_client.py)
+# Probes in flight at once across all hosts, for chat turns about many servers, the poller and imports.
+MCP_PROBE_CONCURRENCY = 64
+# Probes in flight against a single host.
+MCP_PROBE_PER_HOST_LIMIT = 4
+
+# Multi-process status sweeps of very large fleets (see sweep.py)
+# Worker processes per sweep; 0 starts one per CPU core.
+SWEEP_WORKERS = 0
+# Probes in flight at once in each worker process.
+SWEEP_CONCURRENCY_PER_WORKER = 256
+# Probes in flight against a single host (all servers on a host are probed by the same worker).
+SWEEP_PER_HOST_LIMIT = 4
+# Timeout in seconds for each probe of a sweep.
+SWEEP_PROBE_TIMEOUT = 3
+# Results per batch sent back from a worker, and seconds after which a partial batch is sent anyway.
+SWEEP_BATCH_SIZE = 200
+SWEEP_FLUSH_INTERVAL = 0.25
+# How worker processes are started. 'spawn' is safe next to the app's threads; 'fork' starts faster on Linux.
+SWEEP_START_METHOD = 'spawn'
+
+# Status history (see status_history.py)
+# Every probe result is kept per server: the newest raw samples, plus 1 minute / 1 hour / 1 day rollups.
+# Memory per server is bounded by these counts (about 20 bytes per raw sample, 50 bytes per bucket).
+STATUS_HISTORY_RAW_SAMPLES = 720
+STATUS_HISTORY_MINUTE_BUCKETS = 360
+STATUS_HISTORY_HOUR_BUCKETS = 336
+STATUS_HISTORY_DAY_BUCKETS = 400
+# Maximum number of servers with history before the least recently updated ones are dropped.
+STATUS_HISTORY_MAX_SERIES = 4096
+# Window in seconds over which the player count trend in chat prompts is measured.
+STATUS_HISTORY_TREND_WINDOW = 3600
+# Smallest player count change in percent worth mentioning in chat prompts.
+STATUS_HISTORY_TREND_MIN_CHANGE = 10
+# Window in seconds for the uptime and latency summary in chat prompts.
+STATUS_HISTORY_UPTIME_WINDOW = 86400
+# Minimum number of samples before uptime and latency are mentioned in chat prompts.
+STATUS_HISTORY_MIN_SAMPLES = 5
+
+# Background status poller (see status_poller.py)
+# When enabled, all servers are polled in the background and chat requests read the latest
+# published snapshot instead of pinging servers themselves.
+STATUS_POLLER_ENABLED = False
+# Interval in seconds for servers without history yet.
+STATUS_POLLER_BASE_INTERVAL = 15
+# Interval in seconds for servers that recently flipped between online and offline.
+STATUS_POLLER_FAST_INTERVAL = 5
+# Longest interval in seconds for servers that stay online.
+STATUS_POLLER_STABLE_INTERVAL = 60
+# Longest interval in seconds for servers that stay offline.
+STATUS_POLLER_OFFLINE_INTERVAL = 300
+# Fraction by which each interval is randomly stretched or shrunk to spread probes out.
+STATUS_POLLER_JITTER = 0.2
+# Timeout in seconds for each background probe.
+STATUS_POLLER_TIMEOUT = 3
+
+# Live status push (see status_push.py)
+# Browsers can follow servers over /status/stream and are sent their changes as server-sent events.
+# Changes come from fresh probe results, so enable STATUS_POLLER_ENABLED for continuous updates.
+STATUS_PUSH_ENABLED = True
+# Seconds between pushes. Changes of a server within one tick are sent as a single event.
+STATUS_PUSH_TICK = 1.0
+# A player count change is pushed when it is at least this many players and at least this
+# fraction of the count last pushed; online/offline changes are always pushed.
+STATUS_PUSH_PLAYER_CHANGE = 2
+STATUS_PUSH_PLAYER_CHANGE_RATIO = 0.1
+# Seconds between keep-alive comments on idle streams.
+STATUS_PUSH_HEARTBEAT = 15
+# Unsent pushes kept per stream before the oldest are dropped (for clients that read too slowly).
+STATUS_PUSH_MAX_BACKLOG = 64
+# Maximum number of open streams; more get a 503.
+STATUS_PUSH_MAX_SUBSCRIBERS = 10000
+# Maximum number of open streams when served by Flask (app.run or another WSGI server), where each one
+# holds a request thread for as long as the tab is open. The ASGI mode (asgi.py) uses the limit above.
+STATUS_PUSH_MAX_WSGI_SUBSCRIBERS = 32
+
+# Chat turns about several servers at once (see server_context.py)
+# Overall time budget in seconds for probing the selected servers; servers that haven't answered by
+# then are reported as unreachable, so the turn's latency doesn't grow with the number of servers.
+CHAT_MULTI_SERVER_DEADLINE = 4
+# Timeout in seconds for each probe.
+CHAT_MULTI_SERVER_TIMEOUT = 3
+# Token budget for the server status table in the prompt (least relevant rows are dropped).
+CHAT_CONTEXT_TOKEN_BUDGET = 1000
+
+# LLM tool calling (see chat_tools.py)
+# When enabled, the model is given get_server_status/list_servers/get_server_history tools and only
+# looks servers up when a question needs it, instead of every turn pinging the selected server.
+# Individual requests can override this by sending "tools": true or false. Tool turns skip the response cache.
+CHAT_TOOLS_ENABLED = False
+# Maximum number of tool-calling rounds per turn before the model must answer.
+CHAT_TOOLS_MAX_ROUNDS = 3
+
+# Conversation memory (see conversation.py)
+# Keep each conversation's turns on the server so follow-up questions have context. Chat requests
+# send back the "conversation_id" they were given; requests without one start a new conversation.
+CONVERSATION_MEMORY_ENABLED = True
+# Token budget for the history sent with each message. Older turns are summarized in the background.
+CONVERSATION_HISTORY_TOKEN_BUDGET = 1500
+# Maximum number of conversations kept before the least recently used ones are dropped.
+CONVERSATION_MAX_SESSIONS = 1000
+# Seconds after which an idle conversation is forgotten.
+CONVERSATION_IDLE_TTL = 3600
+# Hard limit on unsummarized turns per conversation (only reached if summaries keep failing).
+CONVERSATION_MAX_TURNS = 50
+# Model, length limit and number of worker threads for the background summaries.
+CONVERSATION_SUMMARY_MODEL = 'gpt-3.5-turbo'
+CONVERSATION_SUMMARY_MAX_WORDS = 150
+CONVERSATION_SUMMARY_WORKERS = 2
+
+# Chat models and prompt budgets (see prompts.py)
+# Default model of chat turns.
+CHAT_MODEL = 'gpt-3.5-turbo'
+# Models a chat request may choose with "model", and their context windows in tokens.
+CHAT_MODELS = {
+    'gpt-3.5-turbo': 16385,
+    'gpt-4o-mini': 128000,
+    'gpt-4o': 128000,
+}
+# Tokens of the context window kept free for the reply.
+CHAT_REPLY_TOKEN_RESERVE = 1024
+# Token budget for a chat turn's prompt; the oldest conversation history is left out to stay within it.
+PROMPT_TOKEN_BUDGET = 6000
+
+# Token counting (see token_count.py)
+# Model whose tokenizer is used for token budgets (exact with the optional 'tiktoken' package).
+TOKEN_COUNT_MODEL = 'gpt-3.5-turbo'
+
+# Metrics (see metrics.py)
+# Record request, status probe and OpenAI timings and serve them at /metrics in the Prometheus text format.
+METRICS_ENABLED = True
+
+# OpenAI HTTP connection pool (see llm_client.py)
+# Base URL of an OpenAI-compatible API (e.g. a proxy or benchmarks/fake_openai.py). None uses api.openai.com.
+# Takes effect when the client is next built (at first use or when the API key changes).
+OPENAI_BASE_URL = None
+# Use HTTP/2 to the OpenAI API when the 'h2' package is installed.
+OPENAI_HTTP2 = True
+# Maximum number of concurrent connections to the OpenAI API.
+OPENAI_POOL_MAX_CONNECTIONS = 20
+# Maximum number of idle keep-alive connections kept open.
+OPENAI_POOL_MAX_KEEPALIVE = 10
+# Seconds an idle keep-alive connection is kept before it is closed.
+OPENAI_POOL_KEEPALIVE_EXPIRY = 60
+# Timeout in seconds for OpenAI API requests.
+OPENAI_TIMEOUT = 60
+
+# LLM response cache (see response_cache.py)
+# Cache replies keyed on the normalized message, model, system prompt and a coarse server status fingerprint.
+# Individual requests can opt out by sending "cache": false.
+RESPONSE_CACHE_ENABLED = True
+# 'memory' (in-process LRU) or 'sqlite' (on disk, survives restarts).
+RESPONSE_CACHE_BACKEND = 'memory'
+# Database file used by the 'sqlite' backend.
+RESPONSE_CACHE_SQLITE_PATH = 'response_cache.sqlite3'
+# Seconds a cached reply is reused.
+RESPONSE_CACHE_TTL = 300
+# Maximum number of cached replies before least recently used ones are evicted.
+RESPONSE_CACHE_MAX_ENTRIES = 2048
+# Player counts are bucketed by this ratio for the status fingerprint (1.25 = a ~25% change invalidates).
+RESPONSE_CACHE_PLAYER_BUCKET_RATIO = 1.25
+
+# Persistence of servers and admin settings (see persistence.py)
+# When enabled, servers and the OpenAI API key are saved to a SQLite database and reloaded at startup
+# instead of falling back to DEFAULT_MCP_SERVERS. Note that the API key is stored in plain text.
+PERSISTENCE_ENABLED = False
+# Database file for the saved configuration.
+PERSISTENCE_DB_PATH = 'mcp_chat_config.sqlite3'
+# Seconds to collect admin changes before writing them in one transaction.
+PERSISTENCE_FLUSH_INTERVAL = 0.5
+
+# Bulk server import/export (see server_io.py)
+# Maximum number of invalid rows reported back after an import (all of them are still counted).
+BULK_IMPORT_MAX_ERRORS = 100
+# Overall time budget in seconds for the optional "probe on import" reachability check.
+BULK_IMPORT_PROBE_DEADLINE = 15
+# Timeout in seconds for each probe during an import.
+BULK_IMPORT_PROBE_TIMEOUT = 3
+
 # Example of other configurations we might add later:
 # DEBUG = True
 # SECRET_KEY = 'your_secret_key_here'
@@ -0,0 +1,213 @@
+# This file contains server-side conversation memory for the chat endpoints.
+# Each conversation keeps its recent turns in a bounded store. Only as many recent turns as fit
+# a token budget are sent with a new message; older turns are folded into a running summary by a
+# background worker, so follow-up questions keep their context while the prompt size stays flat.
+
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config
+from .llm_client import client_manager
+from .prompts import token_usage
+from .token_count import MESSAGE_OVERHEAD_TOKENS, count_tokens
+
+SUMMARY_PROMPT = ("You maintain a running summary of a conversation between a user and an assistant about "
+                  "Minecraft servers. Update the summary with the new turns. Keep names, servers, numbers and "
+                  "open questions that later messages may refer to. Reply with the summary only, at most "
+                  "{words} words.")
+
+
+class _Turn:
+    """One user message and the assistant's reply, with their token count."""
+    __slots__ = ('user', 'assistant', 'tokens')
+
+    def __init__(self, user, assistant):
+        self.user = user
+        self.assistant = assistant
+        self.tokens = count_tokens(user) + count_tokens(assistant) + 2 * MESSAGE_OVERHEAD_TOKENS
+
+
+class Conversation:
+    """The memory of one conversation: a running summary plus the turns not summarized yet."""
+
+    def __init__(self, conversation_id, clock):
+        self.id = conversation_id
+        self.summary = ""
+        self.summary_tokens = 0
+        self.turns = deque() # Not yet summarized, oldest first
+        self.summarizing = False # True while a background summary of the oldest turns is in flight
+        self.last_used = clock()
+        self.lock = threading.Lock()
+
+
+class ConversationStore:
+    """
+    A thread-safe LRU store of conversations.
+
+    history() returns the messages to put before a new user message: the summary of older turns
+    (if any) and the newest turns that fit into `token_budget`. When turns no longer fit, they are
+    summarized on a background thread and removed once the new summary is in; until then they are
+    simply left out, so a chat request never waits for a summary.
+    """
+
+    def __init__(self, max_conversations=None, idle_ttl=None, token_budget=None, max_turns=None,
+                 summarizer=None, executor=None, clock=time.monotonic):
+        """
+        Args:
+            max_conversations (int): Maximum number of conversations kept before LRU eviction.
+            idle_ttl (float): Seconds after which an unused conversation is forgotten.
+            token_budget (int): Token budget for the history sent with each message (summary included).
+            max_turns (int): Hard limit on unsummarized turns kept per conversation.
+            summarizer (callable): summarizer(previous_summary, turns) -> new summary, where turns is a
+                                   list of (user, assistant) pairs. Defaults to summarize_turns (OpenAI).
+            executor (concurrent.futures.Executor): Runs summaries. Defaults to a small thread pool.
+            clock (callable): Monotonic time source, injectable for tests.
+        """
+        self.max_conversations = config.CONVERSATION_MAX_SESSIONS if max_conversations is None else max_conversations
+        self.idle_ttl = config.CONVERSATION_IDLE_TTL if idle_ttl is None else idle_ttl
+        self.token_budget = config.CONVERSATION_HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+        self.max_turns = config.CONVERSATION_MAX_TURNS if max_turns is None else max_turns
+        self._summarizer = summarizer or summarize_turns
+        self._executor = executor
+        self._clock = clock
+
+        self._conversations = OrderedDict() # id -> Conversation, least recently used first
+        self._lock = threading.Lock()
+
+        # Counters, exposed through stats()
+        self.created = 0
+        self.evictions = 0
+        self.summaries = 0
+        self.summary_failures = 0
+        self.turns_summarized = 0
+
+    def get_or_create(self, conversation_id=None):
+        """
+        Returns the conversation with the given ID, or a new one (with a new ID) if it is unknown
+        or expired. IDs are always generated here, so clients can't pick each other's.
+        """
+        now = self._clock()
+        with self._lock:
+            conversation = self._conversations.get(conversation_id) if conversation_id else None
+            if conversation is not None and now - conversation.last_used > self.idle_ttl:
+                del self._conversations[conversation_id]
+                conversation = None
+            if conversation is None:
+                conversation = Conversation(secrets.token_urlsafe(16), self._clock)
+                self._conversations[conversation.id] = conversation
+                self.created += 1
+                while len(self._conversations) > self.max_conversations:
+                    self._conversations.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._conversations.move_to_end(conversation_id)
+            conversation.last_used = now
+            return conversation
+
+    def history(self, conversation):
+        """
+        Returns the history messages for the next turn (oldest first), within the token budget.
+        Schedules a background summary of the turns that no longer fit.
+        """
+        with conversation.lock:
+            budget = self.token_budget - conversation.summary_tokens
+            recent = []
+            for turn in reversed(conversation.turns):
+                if turn.tokens > budget:
+                    break
+                budget -= turn.tokens
+                recent.append(turn)
+            overflow = len(conversation.turns) - len(recent) # The oldest turns that didn't fit
+            if overflow and not conversation.summarizing:
+                conversation.summarizing = True
+                turns = [(turn.user, turn.assistant) for turn in list(conversation.turns)[:overflow]]
+                self._submit(conversation, conversation.summary, turns)
+            messages = []
+            if conversation.summary:
+                messages.append({"role": "system",
+                                 "content": f"Summary of the earlier conversation: {conversation.summary}"})
+            for turn in reversed(recent):
+                messages.append({"role": "user", "content": turn.user})
+                messages.append({"role": "assistant", "content": turn.assistant})
+            return messages
+
+    def add_turn(self, conversation, user_message, reply):
+        """Records a completed turn. Token counts are computed once, here."""
+        if not reply:
+            return
+        turn = _Turn(user_message, reply)
+        with conversation.lock:
+            conversation.turns.append(turn)
+            # Hard limit in case summaries keep failing. Not while one is in flight: it removes
+            # the oldest turns itself when it finishes.
+            if len(conversation.turns) > self.max_turns and not conversation.summarizing:
+                conversation.turns.popleft()
+            conversation.last_used = self._clock()
+
+    def forget(self, conversation_id):
+        """Deletes a conversation. Returns True if it existed."""
+        with self._lock:
+            return self._conversations.pop(conversation_id, None) is not None
+
+    def clear(self):
+        """Drops all conversations and resets the counters."""
+        with self._lock:
+            self._conversations.clear()
+            self.created = self.evictions = self.summaries = self.summary_failures = self.turns_summarized = 0
+
+    def stats(self):
+        """Returns a snapshot of the store counters."""
+        with self._lock:
+            return {"conversations": len(self._conversations), "max_conversations": self.max_conversations,
+                    "created": self.created, "evictions": self.evictions, "summaries": self.summaries,
+                    "summary_failures": self.summary_failures, "turns_summarized": self.turns_summarized}
+
+    # --- Internal helpers ---
+    def _submit(self, conversation, previous_summary, turns):
+        """Starts a background summary. Must be called with the conversation's lock held."""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=config.CONVERSATION_SUMMARY_WORKERS,
+                                                        thread_name_prefix="conversation-summary")
+        self._executor.submit(self._summarize, conversation, previous_summary, turns)
+
+    def _summarize(self, conversation, previous_summary, turns):
+        try:
+            summary = (self._summarizer(previous_summary, turns) or "").strip()
+        except Exception as e: # Keep the turns; they are retried with the next message
+            print(f"Conversation summary failed: {e}")
+            summary = ""
+        with conversation.lock:
+            conversation.summarizing = False
+            if not summary:
+                with self._lock:
+                    self.summary_failures += 1
+                return
+            for _ in range(min(len(turns), len(conversation.turns))):
+                conversation.turns.popleft() # Only appends happened meanwhile, so these are the summarized turns
+            conversation.summary = summary
+            conversation.summary_tokens = count_tokens(summary) + MESSAGE_OVERHEAD_TOKENS
+        with self._lock:
+            self.summaries += 1
+            self.turns_summarized += len(turns)
+
+
+def summarize_turns(previous_summary, turns):
+    """Default summarizer: asks the OpenAI model to fold the turns into the running summary."""
+    transcript = "\n".join(f"User: {user}\nAssistant: {assistant}" for user, assistant in turns)
+    content = (f"Current summary: {previous_summary or '(none)'}\n\nNew turns:\n{transcript}")
+    completion = client_manager.get_client().chat.completions.create(
+        model=config.CONVERSATION_SUMMARY_MODEL,
+        messages=[{"role": "system", "content": SUMMARY_PROMPT.format(words=config.CONVERSATION_SUMMARY_MAX_WORDS)},
+                  {"role": "user", "content": content}],
+    )
+    token_usage.record(config.CONVERSATION_SUMMARY_MODEL, completion.usage)
+    return completion.choices[0].message.content
+
+
+# Process-wide conversation store.
+conversation_store = ConversationStore()
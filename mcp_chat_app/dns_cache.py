@@ -0,0 +1,274 @@
+# This file contains a cache of DNS resolutions for server host names, used by MCPClient.
+# Without it every status probe resolved the host again (and an unresolvable host did so on every
+# probe). Answers are kept for their record TTL, NXDOMAIN answers for the zone's negative-caching
+# TTL, and when the resolver is slow or failing the last address that worked is used instead.
+
+import asyncio
+import ipaddress
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+from . import config
+
+try:
+    import dns.asyncresolver # dnspython is installed with mcstatus; it gives us the record TTLs
+    import dns.rdatatype
+    import dns.resolver
+except ImportError:
+    dns = None
+
+
+class HostNotFoundError(Exception):
+    """Raised when a host name has no A/AAAA records. `ttl` is how long that answer may be cached."""
+
+    def __init__(self, host, ttl):
+        super().__init__(f"Server address '{host}' could not be resolved.")
+        self.ttl = ttl
+
+
+class _DNSEntry:
+    """
+    A cached resolution: an address, or None for a cached 'not found'.
+    After it expires, the address is kept as the last-known-good fallback.
+    """
+    __slots__ = ('ip', 'expires_at')
+
+    def __init__(self, ip, expires_at):
+        self.ip = ip
+        self.expires_at = expires_at
+
+
+def ip_literal(host):
+    """Returns the host as a normalized IP address string if it already is one, otherwise None."""
+    try:
+        return str(ipaddress.ip_address(host.strip().strip('[]')))
+    except ValueError:
+        return None
+
+
+class ResolverCache:
+    """
+    A thread-safe LRU cache of host name -> IP address resolutions.
+
+    Answers are kept for their record TTL; names that don't exist are kept for the SOA
+    negative-caching TTL (or `negative_ttl` if the answer has no SOA). Both are clamped to
+    [min_ttl, max_ttl]. Once an entry has expired and a last-known-good address exists, the resolver only
+    gets `slow_threshold` seconds to answer before that address is used again.
+    Names the DNS resolver doesn't know (e.g. /etc/hosts entries) fall back to the system resolver.
+    """
+
+    def __init__(self, min_ttl=None, max_ttl=None, negative_ttl=None, max_entries=None,
+                 slow_threshold=None, clock=time.monotonic):
+        """
+        Args:
+            min_ttl (float): Shortest time in seconds an answer is cached, whatever its TTL.
+            max_ttl (float): Longest time in seconds an answer is cached, whatever its TTL.
+            negative_ttl (float): Seconds a 'not found' answer is cached if the zone gives no SOA TTL.
+            max_entries (int): Maximum number of cached host names before LRU eviction.
+            slow_threshold (float): Seconds to wait for the resolver when a last-known-good address exists.
+            clock (callable): Monotonic time source, injectable for tests.
+        """
+        self.min_ttl = config.DNS_CACHE_MIN_TTL if min_ttl is None else min_ttl
+        self.max_ttl = config.DNS_CACHE_MAX_TTL if max_ttl is None else max_ttl
+        self.negative_ttl = config.DNS_CACHE_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        self.max_entries = config.DNS_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.slow_threshold = config.DNS_CACHE_SLOW_THRESHOLD if slow_threshold is None else slow_threshold
+        self._clock = clock
+
+        self._entries = OrderedDict() # host -> _DNSEntry, least recently used first
+        self._lock = threading.Lock()
+
+        # Counters, exposed through stats()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.stale_fallbacks = 0
+        self.evictions = 0
+
+    def resolve(self, host, timeout=5):
+        """
+        Resolves a host name, using the cache whenever possible.
+
+        Args:
+            host (str): Host name or IP address.
+            timeout (float): Time budget in seconds for a DNS query on a miss.
+
+        Returns:
+            tuple: (ip, resolve_ms), where resolve_ms is the time spent resolving in milliseconds.
+
+        Raises:
+            HostNotFoundError: If the name does not exist (also served from the cache).
+            Exception: Resolver errors (e.g. a timeout) when there is no last-known-good address.
+        """
+        started = time.perf_counter()
+        literal = ip_literal(host)
+        if literal is not None:
+            return literal, 0.0
+        key, cached, lifetime = self._get_cached(host, timeout)
+        if cached is not None:
+            return cached, self._elapsed_ms(started)
+        try:
+            ip, ttl = self._query(key, lifetime)
+        except Exception as e:
+            return self._handle_failure(key, e), self._elapsed_ms(started)
+        self._store(key, ip, ttl)
+        return ip, self._elapsed_ms(started)
+
+    async def async_resolve(self, host, timeout=5):
+        """Async version of resolve(); queries use dnspython's async resolver."""
+        started = time.perf_counter()
+        literal = ip_literal(host)
+        if literal is not None:
+            return literal, 0.0
+        key, cached, lifetime = self._get_cached(host, timeout)
+        if cached is not None:
+            return cached, self._elapsed_ms(started)
+        try:
+            ip, ttl = await self._async_query(key, lifetime)
+        except Exception as e:
+            return self._handle_failure(key, e), self._elapsed_ms(started)
+        self._store(key, ip, ttl)
+        return ip, self._elapsed_ms(started)
+
+    def put(self, host, ip, ttl):
+        """Stores an answer (ip=None caches 'not found')."""
+        self._store(host.strip().lower().rstrip('.'), ip, ttl)
+
+    def clear(self):
+        """Drops all cached answers and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.negative_hits = self.misses = self.stale_fallbacks = self.evictions = 0
+
+    def stats(self):
+        """Returns a snapshot of the cache counters."""
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "stale_fallbacks": self.stale_fallbacks,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            }
+
+    # --- Internal helpers ---
+    def _get_cached(self, host, timeout):
+        """
+        Returns (key, cached_ip, query_lifetime). cached_ip is None on a miss or an expired entry.
+        Raises HostNotFoundError for a cached 'not found' answer.
+        """
+        key = host.strip().lower().rstrip('.')
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry.expires_at:
+                self._entries.move_to_end(key)
+                if entry.ip is None:
+                    self.negative_hits += 1
+                    raise HostNotFoundError(host, entry.expires_at - now)
+                self.hits += 1
+                return key, entry.ip, timeout
+            self.misses += 1
+            has_fallback = entry is not None and entry.ip is not None
+        return key, None, min(timeout, self.slow_threshold) if has_fallback else timeout
+
+    def _handle_failure(self, key, error):
+        """
+        Handles a failed query: caches 'not found' answers, and falls back to the last-known-good
+        address for resolver errors. Returns that address or re-raises the error.
+        """
+        if isinstance(error, HostNotFoundError):
+            self._store(key, None, error.ttl) # The name is gone; forget the old address too
+            raise error
+        with self._lock:
+            entry = self._entries.get(key)
+            fallback = entry.ip if entry is not None else None
+            if fallback is not None:
+                self.stale_fallbacks += 1
+                entry.expires_at = self._clock() + self.min_ttl # Give the resolver a rest before retrying
+                return fallback
+        raise error
+
+    def _store(self, key, ip, ttl):
+        ttl = min(max(ttl, self.min_ttl), self.max_ttl)
+        with self._lock:
+            self._entries[key] = _DNSEntry(ip, self._clock() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    @staticmethod
+    def _elapsed_ms(started):
+        return round((time.perf_counter() - started) * 1000, 3)
+
+    def _query(self, host, lifetime):
+        """Returns (ip, ttl) for a host. Raises HostNotFoundError or a resolver error."""
+        if dns is None:
+            return self._query_system(host)
+        try:
+            for rdtype in (dns.rdatatype.A, dns.rdatatype.AAAA): # Prefer IPv4, like mcstatus
+                answer = dns.resolver.resolve(host, rdtype, lifetime=lifetime, search=True, raise_on_no_answer=False)
+                if answer.rrset is not None:
+                    return str(answer[0]).rstrip('.'), answer.rrset.ttl
+            negative_ttl = self._soa_ttl(answer.response)
+        except dns.resolver.NXDOMAIN as e:
+            negative_ttl = self._soa_ttl(next(iter((e.kwargs.get('responses') or {}).values()), None))
+        except dns.resolver.NoResolverConfiguration: # No usable resolv.conf
+            return self._query_system(host)
+        return self._query_system(host, negative_ttl)
+
+    async def _async_query(self, host, lifetime):
+        """Async version of _query()."""
+        if dns is None:
+            return await self._async_query_system(host)
+        try:
+            for rdtype in (dns.rdatatype.A, dns.rdatatype.AAAA):
+                answer = await dns.asyncresolver.resolve(host, rdtype, lifetime=lifetime, search=True,
+                                                         raise_on_no_answer=False)
+                if answer.rrset is not None:
+                    return str(answer[0]).rstrip('.'), answer.rrset.ttl
+            negative_ttl = self._soa_ttl(answer.response)
+        except dns.resolver.NXDOMAIN as e:
+            negative_ttl = self._soa_ttl(next(iter((e.kwargs.get('responses') or {}).values()), None))
+        except dns.resolver.NoResolverConfiguration:
+            return await self._async_query_system(host)
+        return await self._async_query_system(host, negative_ttl)
+
+    def _query_system(self, host, negative_ttl=None):
+        """Resolves through the system resolver (covers /etc/hosts). Its answers carry no TTL."""
+        try:
+            infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        except socket.gaierror:
+            raise HostNotFoundError(host, self.negative_ttl if negative_ttl is None else negative_ttl)
+        return self._first_address(infos), self.min_ttl
+
+    async def _async_query_system(self, host, negative_ttl=None):
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        except socket.gaierror:
+            raise HostNotFoundError(host, self.negative_ttl if negative_ttl is None else negative_ttl)
+        return self._first_address(infos), self.min_ttl
+
+    @staticmethod
+    def _first_address(infos):
+        """Picks the first IPv4 address from getaddrinfo results, or the first address."""
+        addresses = [info[4][0] for info in infos]
+        return next((a for a in addresses if ':' not in a), addresses[0])
+
+    def _soa_ttl(self, response):
+        """Negative-caching TTL from the SOA record in an NXDOMAIN/NODATA response (RFC 2308)."""
+        for rrset in getattr(response, 'authority', None) or ():
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return min(rrset.ttl, rrset[0].minimum)
+        return self.negative_ttl
+
+
+# Process-wide resolver cache shared by all probes.
+resolver_cache = ResolverCache()
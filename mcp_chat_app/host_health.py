@@ -0,0 +1,225 @@
+# This file tracks how each Minecraft host has behaved in recent status probes.
+# Probes used a fixed timeout however fast the host usually answers, and a dead host cost every
+# chat turn about it the full timeout. Here each host gets a timeout derived from its recent p99
+# probe time, and a circuit breaker: after repeated failures the host is not probed for a cooldown
+# and callers get its last offline result at once. A single trial probe then checks for recovery.
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+from . import config
+from .status_history import percentile
+
+# Circuit states
+CLOSED = 'closed'       # Probed normally
+OPEN = 'open'           # Known dead: not probed until the cooldown ends
+HALF_OPEN = 'half_open' # Cooldown over: one trial probe is running, other callers still get the verdict
+
+
+class _HostState:
+    """Recent probe durations and circuit breaker state of one host:port."""
+    __slots__ = ('durations', 'failures', 'state', 'open_until', 'cooldown', 'verdict', 'trial_started')
+
+    def __init__(self, samples, cooldown):
+        self.durations = deque(maxlen=samples) # Seconds per probe, newest last
+        self.failures = 0                      # Consecutive failed probes
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.cooldown = cooldown               # Cooldown used the next time the circuit opens
+        self.verdict = None                    # Last offline result, served while the circuit is open
+        self.trial_started = 0.0
+
+
+class HostHealth:
+    """
+    A thread-safe registry of per-host probe statistics and circuit breakers, keyed by (host, port).
+
+    MCPClient calls check() before a probe (a non-None result means: don't probe, use this),
+    timeout_for() to pick the probe's timeout and record() with the outcome.
+    """
+
+    def __init__(self, enabled=None, samples=None, min_samples=None, timeout_multiplier=None, min_timeout=None,
+                 failure_threshold=None, cooldown=None, max_cooldown=None, max_hosts=None, clock=time.monotonic):
+        """
+        Args:
+            enabled (bool): When False, check() never short-circuits and timeouts are not adapted.
+            samples (int): Number of recent probe durations kept per host.
+            min_samples (int): Samples needed before a host's timeout is adapted.
+            timeout_multiplier (float): The adapted timeout is the p99 probe duration times this.
+            min_timeout (float): Lower bound in seconds for an adapted timeout.
+            failure_threshold (int): Consecutive failures after which a host's circuit opens.
+            cooldown (float): Seconds the circuit stays open before the first trial probe.
+            max_cooldown (float): Upper bound in seconds for the cooldown, which doubles after each failed trial.
+            max_hosts (int): Maximum number of tracked hosts before the least recently probed are dropped.
+            clock (callable): Monotonic time source, injectable for tests.
+        """
+        self.enabled = config.HOST_HEALTH_ENABLED if enabled is None else enabled
+        self.samples = config.HOST_LATENCY_SAMPLES if samples is None else samples
+        self.min_samples = config.HOST_LATENCY_MIN_SAMPLES if min_samples is None else min_samples
+        self.timeout_multiplier = config.HOST_TIMEOUT_MULTIPLIER if timeout_multiplier is None else timeout_multiplier
+        self.min_timeout = config.HOST_TIMEOUT_MIN if min_timeout is None else min_timeout
+        self.failure_threshold = config.CIRCUIT_FAILURE_THRESHOLD if failure_threshold is None else failure_threshold
+        self.cooldown = config.CIRCUIT_COOLDOWN if cooldown is None else cooldown
+        self.max_cooldown = config.CIRCUIT_MAX_COOLDOWN if max_cooldown is None else max_cooldown
+        self.max_hosts = config.HOST_HEALTH_MAX_HOSTS if max_hosts is None else max_hosts
+        self._clock = clock
+
+        self._hosts = OrderedDict() # (host, port) -> _HostState, least recently probed first
+        self._lock = threading.Lock()
+
+        # Counters, exposed through stats()
+        self.short_circuits = 0
+        self.opens = 0
+        self.trials = 0
+        self.recoveries = 0
+        self.adapted_timeouts = 0
+
+    @staticmethod
+    def make_key(host, port):
+        return (host.lower(), int(port))
+
+    def check(self, host, port):
+        """
+        Returns the cached offline result if the host's circuit is open (the caller should not probe),
+        or None if it may be probed. Once the cooldown is over, exactly one caller gets None (the trial).
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            state = self._hosts.get(self.make_key(host, port))
+            if state is None or state.state == CLOSED:
+                return None
+            now = self._clock()
+            if state.state == OPEN and now >= state.open_until:
+                state.state = HALF_OPEN
+                state.trial_started = now
+                self.trials += 1
+                return None
+            if state.state == HALF_OPEN and now - state.trial_started > self.max_cooldown:
+                state.trial_started = now # The trial never reported back; let another caller try
+                self.trials += 1
+                return None
+            self.short_circuits += 1
+            return state.verdict
+
+    def timeout_for(self, host, port, timeout):
+        """
+        Returns the timeout to use for a probe of the host: its recent p99 probe duration times the
+        multiplier, but never less than the minimum nor more than the caller's `timeout`.
+        """
+        if not self.enabled:
+            return timeout
+        with self._lock:
+            state = self._hosts.get(self.make_key(host, port))
+            if state is None or len(state.durations) < self.min_samples:
+                return timeout
+            p99 = percentile(sorted(state.durations), 99)
+        adapted = min(timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+        if adapted < timeout:
+            with self._lock:
+                self.adapted_timeouts += 1
+        return adapted
+
+    def record(self, host, port, result, elapsed, timeout, clipped=False):
+        """
+        Records a probe outcome.
+
+        Args:
+            host (str), port (int): The probed server.
+            result (ServerStatus): The probe result; offline results count as failures.
+            elapsed (float): Seconds the probe took.
+            timeout (float): The timeout the probe ran with. A failure that ran into it counts as a
+                             duration sample too, so a timeout adapted too tightly grows back.
+            clipped (bool): The timeout was cut below the host's own by a batch deadline. A failure
+                            then says nothing about the host and isn't counted (see release_trial).
+        """
+        if not self.enabled:
+            return
+        if clipped and not result.get('online'):
+            self.release_trial(host, port)
+            return
+        key = self.make_key(host, port)
+        now = self._clock()
+        with self._lock:
+            state = self._hosts.get(key)
+            if state is None:
+                state = self._hosts[key] = _HostState(self.samples, self.cooldown)
+                while len(self._hosts) > self.max_hosts:
+                    self._hosts.popitem(last=False)
+            else:
+                self._hosts.move_to_end(key)
+
+            if result.get('online'):
+                state.durations.append(elapsed)
+                if state.state != CLOSED:
+                    self.recoveries += 1
+                    print(f"{host}:{port} answered again; closing its circuit.")
+                state.state = CLOSED
+                state.failures = 0
+                state.cooldown = self.cooldown
+                state.verdict = None
+                return
+
+            if elapsed >= timeout * 0.95:
+                state.durations.append(elapsed)
+            state.failures += 1
+            state.verdict = result
+            if state.state == HALF_OPEN: # The trial failed: back off further
+                state.cooldown = min(state.cooldown * 2, self.max_cooldown)
+                self._open(state, host, port, now)
+            elif state.state == CLOSED and state.failures >= self.failure_threshold:
+                self._open(state, host, port, now)
+
+    def release_trial(self, host, port):
+        """
+        Called when a probe was cancelled or cut short before it could tell whether the host is up.
+        If it was the trial of a half-open circuit, the circuit goes back to open with its cooldown
+        already over, so the next caller runs a new trial instead of waiting for max_cooldown.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            state = self._hosts.get(self.make_key(host, port))
+            if state is not None and state.state == HALF_OPEN:
+                state.state = OPEN
+
+    def state(self, host, port):
+        """Returns the circuit state of a host (CLOSED if it isn't tracked)."""
+        with self._lock:
+            state = self._hosts.get(self.make_key(host, port))
+            return state.state if state is not None else CLOSED
+
+    def clear(self):
+        """Forgets all hosts and resets the counters."""
+        with self._lock:
+            self._hosts.clear()
+            self.short_circuits = self.opens = self.trials = self.recoveries = self.adapted_timeouts = 0
+
+    def stats(self):
+        """Returns a snapshot of the counters and the hosts whose circuit is not closed."""
+        with self._lock:
+            not_closed = {f"{host}:{port}": state.state for (host, port), state in self._hosts.items()
+                          if state.state != CLOSED}
+            return {
+                "enabled": self.enabled,
+                "hosts": len(self._hosts),
+                "open_circuits": not_closed,
+                "short_circuits": self.short_circuits,
+                "opens": self.opens,
+                "trials": self.trials,
+                "recoveries": self.recoveries,
+                "adapted_timeouts": self.adapted_timeouts,
+            }
+
+    # --- Internal helpers ---
+    def _open(self, state, host, port, now):
+        """Opens a host's circuit. Must be called with the lock held."""
+        state.state = OPEN
+        state.open_until = now + state.cooldown
+        self.opens += 1
+        print(f"{host}:{port} failed {state.failures} probes in a row; not probing it for {state.cooldown:g}s.")
+
+
+# Process-wide host health registry used by MCPClient.
+host_health = HostHealth()
@@ -0,0 +1,189 @@
+# This file manages the process-wide OpenAI client.
+# Building an OpenAI client per request also builds a new HTTP connection pool, so every chat
+# turn paid for fresh TCP + TLS handshakes. The manager below keeps one client (and its
+# keep-alive pool) for the whole process and only rebuilds it when the API key changes.
+
+import asyncio
+import importlib.util
+import threading
+
+from openai import AsyncOpenAI, OpenAI
+
+from . import config
+
+try:
+    import httpx # Installed with openai; used directly to configure the connection pool
+except ImportError:
+    httpx = None
+
+# HTTP/2 support in httpx needs the optional 'h2' package (pip install "httpx[http2]").
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+# Seconds to keep a replaced client open so in-flight requests on it can finish.
+RETIRED_CLIENT_GRACE_PERIOD = 60
+
+
+class OpenAIClientManager:
+    """
+    Owns a single shared OpenAI client backed by a keep-alive (optionally HTTP/2)
+    connection pool. The client is swapped atomically when the API key changes;
+    callers simply use get_client() on every request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._http_client = None
+        self._api_key = None
+        self._async_client = None # AsyncOpenAI client for the ASGI mode (see asgi.py)
+        self._async_http_client = None
+        self._async_api_key = None
+
+        # Counters, exposed through stats()
+        self.builds = 0
+        self.requests = 0
+        self.tcp_connects = 0
+        self.tls_handshakes = 0
+
+    def get_client(self):
+        """
+        Returns the shared OpenAI client for the currently configured API key,
+        building it on first use or if the key has changed since it was built.
+        """
+        api_key = config.OPENAI_API_KEY
+        client = self._client
+        if client is not None and self._api_key == api_key:
+            return client # Fast path: no locking once the client exists
+        with self._lock:
+            if self._client is None or self._api_key != api_key:
+                self._rebuild(api_key)
+            return self._client
+
+    def get_async_client(self):
+        """
+        Returns the shared AsyncOpenAI client for the currently configured API key.
+        Must be called from the event loop that will use the client; an async connection
+        pool cannot be shared across loops.
+        """
+        api_key = config.OPENAI_API_KEY
+        if self._async_client is None or self._async_api_key != api_key:
+            old_http_client = self._async_http_client
+            self._async_http_client = self._build_http_client(asynchronous=True)
+            kwargs = {"api_key": api_key}
+            if config.OPENAI_BASE_URL:
+                kwargs["base_url"] = config.OPENAI_BASE_URL
+            if self._async_http_client is not None:
+                kwargs["http_client"] = self._async_http_client
+            self._async_client = AsyncOpenAI(**kwargs)
+            self._async_api_key = api_key
+            self.builds += 1
+            if old_http_client is not None: # In-flight requests keep their own reference to the old pool
+                asyncio.get_running_loop().call_later(RETIRED_CLIENT_GRACE_PERIOD,
+                                                      lambda: asyncio.ensure_future(old_http_client.aclose()))
+        return self._async_client
+
+    def set_api_key(self, api_key):
+        """Rebuilds the client for a new API key (no-op if the key is unchanged)."""
+        with self._lock:
+            if self._client is None or self._api_key != api_key:
+                self._rebuild(api_key)
+
+    def reset(self):
+        """Drops the current client. The next get_client() call builds a new one."""
+        with self._lock:
+            self._retire(self._http_client)
+            self._client = self._http_client = self._api_key = None
+            self._async_client = self._async_http_client = self._async_api_key = None
+            self.builds = self.requests = self.tcp_connects = self.tls_handshakes = 0
+
+    def stats(self):
+        """Returns connection pool and handshake statistics."""
+        stats = {
+            "client_built": self._client is not None,
+            "async_client_built": self._async_client is not None,
+            "builds": self.builds,
+            "http2": bool(httpx is not None and config.OPENAI_HTTP2 and HTTP2_AVAILABLE),
+            "requests": self.requests,
+            "tcp_connects": self.tcp_connects,
+            "tls_handshakes": self.tls_handshakes,
+            "reused_connection_requests": max(self.requests - self.tcp_connects, 0),
+        }
+        pool = self._pool_connections()
+        if pool is not None:
+            stats["pool_connections"] = len(pool)
+            stats["pool_idle_connections"] = sum(1 for conn in pool if conn.is_idle())
+        return stats
+
+    # --- Internal helpers ---
+    def _rebuild(self, api_key):
+        """Builds a new client and swaps it in. Must be called with the lock held."""
+        old_http_client = self._http_client
+        http_client = self._build_http_client()
+        kwargs = {"api_key": api_key}
+        if config.OPENAI_BASE_URL:
+            kwargs["base_url"] = config.OPENAI_BASE_URL
+        if http_client is not None:
+            kwargs["http_client"] = http_client
+        self._client = OpenAI(**kwargs)
+        self._http_client = http_client
+        self._api_key = api_key
+        self.builds += 1
+        self._retire(old_http_client)
+        print(f"OpenAI client (re)built. HTTP/2: {self.stats()['http2']}")
+
+    def _build_http_client(self, asynchronous=False):
+        if httpx is None:
+            return None # Fall back to the OpenAI library's default client
+        http2 = config.OPENAI_HTTP2 and HTTP2_AVAILABLE
+        if config.OPENAI_HTTP2 and not HTTP2_AVAILABLE:
+            print("HTTP/2 requested for OpenAI but the 'h2' package is not installed; using HTTP/1.1.")
+        client_class = httpx.AsyncClient if asynchronous else httpx.Client
+        return client_class(
+            http2=http2,
+            timeout=config.OPENAI_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=config.OPENAI_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=config.OPENAI_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=config.OPENAI_POOL_KEEPALIVE_EXPIRY,
+            ),
+            event_hooks={"request": [self._on_async_request if asynchronous else self._on_request]},
+        )
+
+    def _on_request(self, request):
+        """httpx request hook: counts requests and attaches a trace callback for handshakes."""
+        self.requests += 1
+        request.extensions["trace"] = self._on_trace
+
+    async def _on_async_request(self, request):
+        """Async variant of _on_request; httpx.AsyncClient needs awaitable hooks and trace callbacks."""
+        self.requests += 1
+        request.extensions["trace"] = self._on_async_trace
+
+    def _on_trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            self.tcp_connects += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+
+    async def _on_async_trace(self, event_name, info):
+        self._on_trace(event_name, info)
+
+    def _pool_connections(self):
+        """Returns the underlying pool's connections, if the transport exposes them."""
+        try:
+            return list(self._http_client._transport._pool.connections)
+        except AttributeError:
+            return None
+
+    @staticmethod
+    def _retire(http_client):
+        """Closes a replaced HTTP client after a grace period so in-flight requests can finish."""
+        if http_client is None:
+            return
+        timer = threading.Timer(RETIRED_CLIENT_GRACE_PERIOD, http_client.close)
+        timer.daemon = True
+        timer.start()
+
+
+# Process-wide client manager shared by all request threads.
+client_manager = OpenAIClientManager()
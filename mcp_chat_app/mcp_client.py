@@ -1,6 +1,10 @@
 # This file contains the MCP client logic for fetching Minecraft server status.
 
+import asyncio
 import sys
+import threading
+import time
+from collections import OrderedDict
 # Attempt to ensure user-local site-packages is in path, common in some environments
 # This is a workaround for potential PYTHONPATH issues in specific execution contexts.
 # The path /home/jules/.local/lib/python3.10/site-packages was identified via `pip show python-mcstatus`.
@@ -8,10 +12,16 @@ user_site_packages = "/home/jules/.local/lib/python3.10/site-packages"
 if user_site_packages not in sys.path:
     sys.path.insert(0, user_site_packages)
 
-from mcstatus import JavaServer
-# For Bedrock servers, you might use: from mcstatus import BedrockServer
-# However, mcstatus library's Bedrock support can be less comprehensive than Java.
-# For simplicity, this example primarily focuses on JavaServer.
+from mcstatus import BedrockServer, JavaServer
+# mcstatus opens its socket to the same address it writes into the handshake. The probes connect to
+# the cached IP themselves and keep the configured host name in the handshake (see _java_status).
+# That uses mcstatus internals (pinned in requirements.txt); without them the public API is used.
+try:
+    from mcstatus._protocol.io.connection import TCPAsyncSocketConnection, TCPSocketConnection
+except ImportError:
+    TCPAsyncSocketConnection = TCPSocketConnection = None
+_CONNECT_TO_IP = (TCPSocketConnection is not None and hasattr(JavaServer, '_retry_status')
+                  and hasattr(JavaServer, '_retry_async_status'))
 
 # Import config to use a default server for testing in __main__
 # This assumes mcp_client.py is run from a context where 'config' can be imported,
@@ -21,71 +31,416 @@ if __name__ == '__main__':
     import os
     # Adjust path to import config if running mcp_client.py directly for testing
     sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    from . import config
+    from .admission import probe_limiter # Probe rate limit per Minecraft server
+    from .dns_cache import HostNotFoundError, resolver_cache # Caches host name resolutions between probes
+    from .host_health import host_health # Per-host adaptive timeouts and circuit breaker
+    from .metrics import DNS_SECONDS, PROBE_SECONDS # Probe timing histograms for /metrics
+    from .server_status import EDITION_BEDROCK, EDITION_JAVA, ServerStatus, edition_for_type # Typed results
+    from .single_flight import probe_flight # Coalesces concurrent probes of the same server
+except ImportError: # Run directly as a script (see the path setup above)
     from mcp_chat_app import config
+    from mcp_chat_app.admission import probe_limiter
+    from mcp_chat_app.dns_cache import HostNotFoundError, resolver_cache
+    from mcp_chat_app.host_health import host_health
+    from mcp_chat_app.metrics import DNS_SECONDS, PROBE_SECONDS
+    from mcp_chat_app.server_status import EDITION_BEDROCK, EDITION_JAVA, ServerStatus, edition_for_type
+    from mcp_chat_app.single_flight import probe_flight
+
+# (ip, port) -> time.monotonic() until which Query is not retried against a server that didn't answer it,
+# least recently marked first (bounded by config.STATUS_QUERY_UNSUPPORTED_MAX_ENTRIES).
+_query_unsupported = OrderedDict()
+_query_unsupported_lock = threading.Lock()
+
+
+def _connect_address(ip, port):
+    """Formats a resolved address for BedrockServer/JavaServer.lookup (IPv6 addresses need brackets)."""
+    return f"[{ip}]:{port}" if ':' in ip else f"{ip}:{port}"
+
+
+def _java_status(host, ip, port, timeout):
+    """
+    Runs the Java status exchange over a connection to the resolved IP. The handshake still names
+    the configured host, which virtual-host proxies (BungeeCord, Velocity, TCPShield) route on.
+    Without the mcstatus internals this needs, mcstatus connects to the host name itself.
+    """
+    server = JavaServer(host, port, timeout=timeout)
+    if not _CONNECT_TO_IP:
+        return server.status()
+    with TCPSocketConnection((ip, port), timeout) as connection:
+        return server._retry_status(connection, tries=3, version=47, ping_token=None)
+
+
+async def _async_java_status(host, ip, port, timeout):
+    """Async version of _java_status."""
+    server = JavaServer(host, port, timeout=timeout)
+    if not _CONNECT_TO_IP:
+        return await server.async_status()
+    async with TCPAsyncSocketConnection((ip, port), timeout) as connection:
+        return await server._retry_async_status(connection, tries=3, version=47, ping_token=None)
 
 
 class MCPClient:
     """
     A client for fetching status information from Minecraft Profile (MCP) servers.
-    It uses the 'mcstatus' library to query Java Edition Minecraft servers.
+    It uses the 'mcstatus' library: the status protocol (plus optionally Query) for Java Edition
+    servers and the UDP ping for Bedrock Edition servers, chosen from the configured server type.
     """
 
     @staticmethod
-    def get_server_status(host: str, port: int = 25565, timeout: int = 5):
+    def get_server_status(host: str, port: int = 25565, timeout: int = 5, server_type: str = None,
+                          query: bool = None):
         """
-        Fetches the status of a Minecraft Java Edition server.
+        Fetches the status of a Minecraft server.
 
         Args:
             host (str): The hostname or IP address of the Minecraft server.
             port (int): The port number of the Minecraft server (default is 25565).
             timeout (int): Connection timeout in seconds.
+            server_type (str): The configured server type. Types containing 'Bedrock' are probed
+                               with the Bedrock protocol, everything else as a Java server.
+            query (bool): Also ask Java servers for their player list over the Query protocol.
+                          Defaults to config.STATUS_QUERY_ENABLED.
 
         Returns:
-            dict: A dictionary containing server status information if online,
-                  or an error message if offline or an error occurs.
-                  Example online response:
+            ServerStatus: The status record. It also supports dict-style reads.
+                  'resolve_ms' is the time spent resolving the host name (usually ~0 thanks to
+                  the resolver cache) and 'latency' the status ping itself.
+                  Example online response (as to_dict()):
                   {
                       "online": True,
+                      "edition": "java",
                       "version": "1.19.4 (Paper)",
                       "motd": "A Minecraft Server - Powered by SpigotMC",
                       "player_count": 10,
                       "player_max": 100,
-                      "latency": 42.5
+                      "latency": 42.5,
+                      "resolve_ms": 0.02
                   }
                   Example offline/error response:
                   {
                       "online": False,
-                      "error": "Connection timed out"
+                      "edition": "java",
+                      "error": "Connection timed out",
+                      "resolve_ms": 0.02
                   }
+                  Concurrent calls for the same server share one probe (see single_flight.py).
+                  A host that keeps failing isn't probed for a while; its last offline result
+                  is returned at once instead (see host_health.py).
         """
-        full_address = f"{host}:{port}"
+        verdict = host_health.check(host, port)
+        if verdict is not None:
+            return verdict
+        if not config.SINGLE_FLIGHT_PROBES:
+            return MCPClient._tracked_probe(host, port, timeout, server_type, query)
+        try:
+            return probe_flight.do(MCPClient._flight_key(host, port, server_type, query),
+                                   lambda: MCPClient._tracked_probe(host, port, timeout, server_type, query),
+                                   timeout=timeout)
+        except TimeoutError as e: # The shared probe outlived this caller's timeout
+            return MCPClient._error_result(e, host, timeout, edition_for_type(server_type))
+
+    @staticmethod
+    async def async_get_server_status(host: str, port: int = 25565, timeout: int = 5, server_type: str = None,
+                                      query: bool = None, clipped: bool = False):
+        """
+        Asynchronous version of get_server_status, built on mcstatus' async lookup/status APIs.
+
+        The whole lookup + status exchange is bounded by `timeout`, so a black-holed host
+        cannot hold the caller longer than that. Concurrent calls for the same server share one
+        probe, also with get_server_status callers on other threads, and the same circuit breaker applies.
+
+        Args:
+            host (str): The hostname or IP address of the Minecraft server.
+            port (int): The port number of the Minecraft server (default is 25565).
+            timeout (int): Timeout in seconds for the whole check.
+            server_type (str): The configured server type (see get_server_status).
+            query (bool): Also use the Query protocol for Java servers (see get_server_status).
+            clipped (bool): `timeout` was cut short by a batch deadline (see async_get_many). A probe
+                            that runs into it returns an UnknownStatus and doesn't count against the host.
+
+        Returns:
+            ServerStatus: Same format as get_server_status.
+        """
+        verdict = host_health.check(host, port)
+        if verdict is not None:
+            return verdict
+        if not config.SINGLE_FLIGHT_PROBES:
+            return await MCPClient._async_tracked_probe(host, port, timeout, server_type, query, clipped)
+        try:
+            return await probe_flight.async_do(MCPClient._flight_key(host, port, server_type, query),
+                                               lambda: MCPClient._async_tracked_probe(host, port, timeout,
+                                                                                      server_type, query, clipped),
+                                               timeout=timeout)
+        except TimeoutError as e:
+            return MCPClient._error_result(e, host, timeout, edition_for_type(server_type))
+
+    @staticmethod
+    def _flight_key(host, port, server_type, query):
+        """Identifies a probe for coalescing: the same server, protocol and Query setting."""
+        query = config.STATUS_QUERY_ENABLED if query is None else query
+        return (host.lower(), int(port), edition_for_type(server_type), bool(query))
+
+    @staticmethod
+    def _tracked_probe(host, port, timeout, server_type, query):
+        """
+        Probes with the host's adaptive timeout and reports the outcome to its circuit breaker.
+        A server probed more often than config.PROBE_RATE_PER_HOST allows isn't probed again yet.
+        """
+        limited = MCPClient._probe_rate_limited(host, port, server_type)
+        if limited is not None:
+            return limited
+        probe_timeout = host_health.timeout_for(host, port, timeout)
+        started = time.perf_counter()
+        result = MCPClient._probe_status(host, port, probe_timeout, server_type, query)
+        elapsed = time.perf_counter() - started
+        host_health.record(host, port, result, elapsed, probe_timeout)
+        MCPClient._observe_probe(host, port, result, elapsed)
+        return result
+
+    @staticmethod
+    async def _async_tracked_probe(host, port, timeout, server_type, query, clipped=False):
+        """
+        Async version of _tracked_probe. With a `clipped` timeout (see async_get_server_status), a
+        failure isn't held against the host, and one that ran out of time becomes an UnknownStatus.
+        """
+        limited = MCPClient._probe_rate_limited(host, port, server_type)
+        if limited is not None:
+            return limited
+        probe_timeout = host_health.timeout_for(host, port, timeout)
+        clipped = clipped and probe_timeout == timeout # An adapted timeout below it is the host's own
+        started = time.perf_counter()
+        try:
+            result = await MCPClient._async_probe_status(host, port, probe_timeout, server_type, query)
+        except asyncio.CancelledError: # Cancelled at a deadline: if this was a circuit's trial, let another run
+            host_health.release_trial(host, port)
+            raise
+        elapsed = time.perf_counter() - started
+        host_health.record(host, port, result, elapsed, probe_timeout, clipped=clipped)
+        MCPClient._observe_probe(host, port, result, elapsed)
+        if clipped and not result.get('online') and elapsed >= probe_timeout * 0.95:
+            return ServerStatus.unknown(f"Status check was cut off by the deadline after {probe_timeout:.2g} seconds.",
+                                        edition=result.edition, resolve_ms=result.resolve_ms)
+        return result
+
+    @staticmethod
+    def _probe_rate_limited(host, port, server_type):
+        """
+        Returns an UnknownStatus if the server's probe rate limit is exhausted, otherwise None.
+        Not probing says nothing about the server, so the status cache keeps its last result instead.
+        """
+        wait = probe_limiter.acquire(host_health.make_key(host, port))
+        if not wait:
+            return None
+        return ServerStatus.unknown(f"Status probe rate limit reached for this server; retry in {wait:.1f} seconds.",
+                                    edition=edition_for_type(server_type))
+
+    @staticmethod
+    def _observe_probe(host, port, result, elapsed):
+        """Records a probe's duration and its host name resolution time in the metrics."""
+        server = f"{host.lower()}:{port}"
+        PROBE_SECONDS.observe(elapsed, server, 'online' if result.get('online') else 'offline')
+        if result.get('resolve_ms') is not None:
+            DNS_SECONDS.observe(result['resolve_ms'] / 1000, server)
+
+    @staticmethod
+    def _probe_status(host, port, timeout, server_type, query):
+        """Probes a server (see get_server_status). Never raises; errors become offline results."""
+        edition = edition_for_type(server_type)
+        resolve_ms = None
         try:
-            # JavaServer.lookup() can take a bit of time, especially if the server is offline.
-            # It attempts to resolve the address and create a server object.
-            # The actual status check happens with server.status().
-            # We can pass a timeout to the lookup method directly in some versions,
-            # or it's handled by the underlying socket operations.
-            # For mcstatus, the timeout is usually applied to the socket connection.
-            server = JavaServer.lookup(full_address, timeout=timeout)
+            # The host name is resolved through the shared resolver cache (which honors DNS TTLs
+            # and caches names that don't exist), so only the first probe pays for DNS.
+            ip, resolve_ms = resolver_cache.resolve(host, timeout=timeout)
+            address = _connect_address(ip, port)
+
+            if edition == EDITION_BEDROCK:
+                # A single UDP ping/pong, so even offline Bedrock servers fail fast. One attempt only:
+                # mcstatus retries Bedrock pings 3 times by default, which would triple the timeout.
+                status = BedrockServer.lookup(address, timeout=timeout).status(tries=1)
+                return MCPClient._bedrock_result(status, resolve_ms)
 
             # Query the server's status. This performs the network request.
-            status = server.status()
-
-            return {
-                "online": True,
-                "version": status.version.name,
-                "protocol_version": status.version.protocol,
-                "motd": status.motd.to_plain(), # Get plain text MOTD
-                "player_count": status.players.online,
-                "player_max": status.players.max,
-                "latency": status.latency, # Latency of the status ping
-                # 'players_sample': status.players.sample # List of Player objects if available
-            }
-        except ConnectionRefusedError:
-            return {"online": False, "error": "Connection refused."}
-        except TimeoutError: # Python's built-in TimeoutError
-            return {"online": False, "error": f"Connection timed out after {timeout} seconds."}
+            status = _java_status(host, ip, port, timeout)
+            result = MCPClient._online_result(status, resolve_ms)
+
+            if MCPClient._should_query(ip, port, query):
+                try: # Query is plain UDP without a host name, so the IP is enough
+                    response = JavaServer.lookup(address, timeout=config.STATUS_QUERY_TIMEOUT).query(tries=1)
+                    result = MCPClient._with_query(result, response)
+                except Exception:
+                    MCPClient._mark_query_unsupported(ip, port)
+            return result
         except Exception as e:
+            return MCPClient._error_result(e, host, timeout, edition, resolve_ms)
+
+    @staticmethod
+    async def _async_probe_status(host, port, timeout, server_type, query):
+        """Async version of _probe_status (see async_get_server_status)."""
+        edition = edition_for_type(server_type)
+        timings = {}
+
+        async def _probe():
+            ip, timings['resolve_ms'] = await resolver_cache.async_resolve(host, timeout=timeout)
+            address = _connect_address(ip, port)
+            if edition == EDITION_BEDROCK:
+                status = await BedrockServer.lookup(address, timeout=timeout).async_status(tries=1)
+                return MCPClient._bedrock_result(status, timings['resolve_ms'])
+
+            result = MCPClient._online_result(await _async_java_status(host, ip, port, timeout), timings['resolve_ms'])
+            if MCPClient._should_query(ip, port, query):
+                try:
+                    query_server = await JavaServer.async_lookup(address, timeout=config.STATUS_QUERY_TIMEOUT)
+                    result = MCPClient._with_query(result, await query_server.async_query(tries=1))
+                except Exception:
+                    MCPClient._mark_query_unsupported(ip, port)
+            return result
+
+        try:
+            return await asyncio.wait_for(_probe(), timeout=timeout)
+        except Exception as e:
+            return MCPClient._error_result(e, host, timeout, edition, timings.get('resolve_ms'))
+
+    @staticmethod
+    async def async_get_many(servers, concurrency: int = None, per_host_limit: int = None,
+                             deadline: float = None, timeout: int = 5):
+        """
+        Probes many servers concurrently.
+
+        Args:
+            servers (iterable): Servers with 'host', 'port' and optional 'type' keys (dicts or
+                               ServerRecords, e.g. config.MCP_SERVERS).
+            concurrency (int): Maximum number of probes in flight at once. Defaults to config.MCP_PROBE_CONCURRENCY.
+            per_host_limit (int): Maximum number of probes in flight against the same host.
+                                  Defaults to config.MCP_PROBE_PER_HOST_LIMIT.
+            deadline (float): Overall time budget in seconds. Probes still running when it
+                              expires are cancelled and reported as UnknownStatus placeholders.
+            timeout (int): Timeout in seconds for each individual probe.
+
+        Returns:
+            list: One ServerStatus per server, in the same order as `servers`.
+        """
+        concurrency = concurrency or config.MCP_PROBE_CONCURRENCY
+        per_host_limit = per_host_limit or config.MCP_PROBE_PER_HOST_LIMIT
+        servers = list(servers)
+        if not servers:
+            return []
+
+        global_limit = asyncio.Semaphore(concurrency)
+        host_limits = {}
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + deadline if deadline is not None else None
+
+        async def _probe_one(server):
+            host = server['host']
+            host_limit = host_limits.setdefault(host.lower(), asyncio.Semaphore(per_host_limit))
+            async with global_limit, host_limit:
+                probe_timeout = timeout
+                if deadline_at is not None: # Never start a probe that would outlive the deadline
+                    probe_timeout = min(timeout, max(deadline_at - loop.time(), 0.001))
+                return await MCPClient.async_get_server_status(host, int(server['port']), timeout=probe_timeout,
+                                                              server_type=server.get('type'),
+                                                              clipped=probe_timeout < timeout)
+
+        tasks = [asyncio.ensure_future(_probe_one(server)) for server in servers]
+        _, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+
+        results = []
+        for server, task in zip(servers, tasks):
+            if task in pending:
+                results.append(ServerStatus.unknown(f"Status check did not finish within the {deadline} second deadline.",
+                                                    edition=edition_for_type(server.get('type'))))
+            else:
+                results.append(task.result())
+        return results
+
+    @staticmethod
+    def get_many(servers, **kwargs):
+        """
+        Blocking wrapper around async_get_many for callers without an event loop
+        (e.g. Flask request threads). Accepts the same keyword arguments.
+        """
+        return asyncio.run(MCPClient.async_get_many(servers, **kwargs))
+
+    # --- Result helpers shared by the sync and async paths ---
+    @staticmethod
+    def _online_result(status, resolve_ms=None):
+        """Converts an mcstatus Java status response into a ServerStatus."""
+        sample = getattr(status.players, 'sample', None) or [] # Some servers include a few player names
+        return ServerStatus(
+            True,
+            edition=EDITION_JAVA,
+            version=status.version.name,
+            protocol_version=status.version.protocol,
+            motd=status.motd.to_plain(), # Get plain text MOTD
+            player_count=status.players.online,
+            player_max=status.players.max,
+            players=[player.name for player in sample][:config.STATUS_MAX_PLAYER_NAMES] or None,
+            latency=status.latency, # Latency of the status ping
+            resolve_ms=resolve_ms,
+        )
+
+    @staticmethod
+    def _bedrock_result(status, resolve_ms=None):
+        """Converts an mcstatus Bedrock status response into a ServerStatus."""
+        return ServerStatus(
+            True,
+            edition=EDITION_BEDROCK,
+            version=status.version.name,
+            protocol_version=status.version.protocol,
+            motd=status.motd.to_plain(),
+            player_count=status.players.online,
+            player_max=status.players.max,
+            map_name=status.map_name,
+            gamemode=status.gamemode,
+            latency=status.latency,
+            resolve_ms=resolve_ms,
+        )
+
+    @staticmethod
+    def _with_query(result, response):
+        """Adds the full player list and map name from a Query response."""
+        return result.replace(players=response.players.list[:config.STATUS_MAX_PLAYER_NAMES],
+                              player_count=response.players.online, player_max=response.players.max,
+                              map_name=response.map_name)
+
+    @staticmethod
+    def _should_query(ip, port, query):
+        """Whether to try Query: enabled, and the server has not recently ignored it."""
+        if not (config.STATUS_QUERY_ENABLED if query is None else query):
+            return False
+        with _query_unsupported_lock:
+            retry_at = _query_unsupported.get((ip, port))
+            if retry_at is None:
+                return True
+            if retry_at > time.monotonic():
+                return False
+            del _query_unsupported[(ip, port)] # Time to ask again
+            return True
+
+    @staticmethod
+    def _mark_query_unsupported(ip, port):
+        """Remembers that a server doesn't answer Query (enable-query=false is the default)."""
+        with _query_unsupported_lock:
+            _query_unsupported[(ip, port)] = time.monotonic() + config.STATUS_QUERY_RETRY_AFTER
+            _query_unsupported.move_to_end((ip, port))
+            while len(_query_unsupported) > config.STATUS_QUERY_UNSUPPORTED_MAX_ENTRIES:
+                _query_unsupported.popitem(last=False)
+
+    @staticmethod
+    def _error_result(e, host, timeout, edition=None, resolve_ms=None):
+        """Converts an exception raised while checking a server into an offline ServerStatus."""
+        if isinstance(e, HostNotFoundError):
+            error_message = f"Server address '{host}' could not be resolved."
+        elif isinstance(e, ConnectionRefusedError):
+            error_message = "Connection refused."
+        elif isinstance(e, (TimeoutError, asyncio.TimeoutError)): # Python's built-in TimeoutError
+            error_message = f"Connection timed out after {timeout} seconds."
+        else:
             # Catch other exceptions from mcstatus (e.g., socket errors, invalid responses)
             # or if the host is not found.
             # str(e) can sometimes be verbose or not user-friendly.
@@ -94,10 +449,7 @@ class MCPClient:
                 error_message = f"Server address '{host}' could not be resolved."
             elif not error_message: # Handle cases where str(e) is empty
                 error_message = "An unknown error occurred while trying to reach the server."
-            return {
-                "online": False,
-                "error": error_message
-            }
+        return ServerStatus.offline(error_message, edition=edition, resolve_ms=resolve_ms)
 
 if __name__ == '__main__':
     print("MCP Client Test - Fetching Server Status")
@@ -112,7 +464,8 @@ if __name__ == '__main__':
         # test_server_info = {'name': 'A Public Server', 'host': 'demo.mcstatus.io', 'port': 25565} # mcstatus example server
 
         print(f"\nAttempting to get status for: {test_server_info['name']} ({test_server_info['host']}:{test_server_info['port']})")
-        status_result = MCPClient.get_server_status(test_server_info['host'], int(test_server_info['port']))
+        status_result = MCPClient.get_server_status(test_server_info['host'], int(test_server_info['port']),
+                                                    server_type=test_server_info.get('type'))
 
         if status_result["online"]:
             print(f"  Status: Online")
@@ -135,4 +488,15 @@ if __name__ == '__main__':
     else:
         print(f"  Unexpectedly online: {offline_status_result}")
 
+    # Example of probing every default server concurrently
+    if config.DEFAULT_MCP_SERVERS:
+        import time
+        print(f"\nProbing all {len(config.DEFAULT_MCP_SERVERS)} default servers concurrently (deadline 6s)...")
+        started = time.perf_counter()
+        results = MCPClient.get_many(config.DEFAULT_MCP_SERVERS, deadline=6, timeout=5)
+        for server_info, result in zip(config.DEFAULT_MCP_SERVERS, results):
+            state = "Online" if result["online"] else f"Offline ({result.get('error')})"
+            print(f"  {server_info['name']}: {state}")
+        print(f"  Fan-out took {time.perf_counter() - started:.2f}s")
+
     print("\nMCP Client test finished.")
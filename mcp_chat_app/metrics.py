@@ -0,0 +1,328 @@
+# This file contains low-overhead metrics for the chat app, exported by /metrics in the Prometheus
+# text format. Hot paths only touch a per-thread shard (a plain dict owned by the calling thread),
+# so recording a value takes no lock; the shards are summed when /metrics is scraped. The counters
+# the shared components already keep (caches, coalescing, circuit breaker) are read at scrape time.
+
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+from werkzeug.wsgi import ClosingIterator # Installed with Flask
+
+from . import config
+
+# Default histogram buckets in seconds, from DNS cache hits (sub-millisecond) to slow OpenAI replies.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Dead threads' shards are folded into the retired totals once this many shards are registered.
+_COMPACT_THRESHOLD = 64
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self._registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+
+class Counter(_Metric):
+    """A monotonically increasing count, e.g. requests or errors."""
+    kind = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        """Adds `amount`. Label values are passed positionally, in the order of `labelnames`."""
+        if not self._registry.enabled:
+            return
+        shard = self._registry._shard()
+        key = (self, labelvalues)
+        shard[key] = shard.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    """A value that goes up and down, e.g. requests in flight (may be raised and lowered on different threads)."""
+    kind = 'gauge'
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+
+class Histogram(_Metric):
+    """A distribution of observed values (durations in seconds) in cumulative buckets."""
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        """Records one value. Label values are passed positionally, in the order of `labelnames`."""
+        if not self._registry.enabled:
+            return
+        shard = self._registry._shard()
+        key = (self, labelvalues)
+        cell = shard.get(key)
+        if cell is None:
+            cell = shard[key] = [0] * (len(self.bounds) + 1) + [0.0] # Per-bucket counts, +Inf count, sum
+        cell[bisect_left(self.bounds, value)] += 1
+        cell[-1] += value
+
+    def time(self, *labelvalues):
+        """Returns a context manager that observes the duration of its block."""
+        return _Timer(self, labelvalues)
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labelvalues', 'started')
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+        return False
+
+
+def _merge(into, key, value):
+    """Adds a shard value (a number, or a histogram cell list) into a totals dict."""
+    current = into.get(key)
+    if current is None:
+        into[key] = list(value) if isinstance(value, list) else value
+    elif isinstance(value, list):
+        for index, part in enumerate(value):
+            current[index] += part
+    else:
+        into[key] = current + value
+
+
+class MetricsRegistry:
+    """
+    Holds the metric definitions and the per-thread shards with their values.
+
+    Each thread records into its own shard, so no lock is taken when a value is recorded. When a
+    thread has ended, its shard is folded into the retired totals so short-lived request threads
+    don't accumulate shards.
+    """
+
+    def __init__(self, enabled=None):
+        """
+        Args:
+            enabled (bool): When False, recording is a no-op. Defaults to config.METRICS_ENABLED.
+        """
+        self.enabled = config.METRICS_ENABLED if enabled is None else enabled
+        self._metrics = [] # In registration order, which is also the output order
+        self._collectors = []
+        self._local = threading.local()
+        self._shards = [] # (weak reference to the owning thread, shard)
+        self._retired = {} # Totals of the shards of threads that have ended
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """
+        Adds a function called at every scrape. It returns (or yields) metric families as
+        (name, kind, documentation, samples) tuples, where samples is a list of (labels dict, value).
+        """
+        self._collectors.append(collector)
+
+    def totals(self):
+        """Returns {(metric, labelvalues): value} summed over all threads."""
+        totals = {}
+        with self._lock:
+            self._compact()
+            for key, value in self._retired.items():
+                _merge(totals, key, value)
+            shards = [shard for _, shard in self._shards]
+        for shard in shards:
+            for key, value in shard.copy().items(): # copy() is atomic; the owner may be writing meanwhile
+                _merge(totals, key, value)
+        return totals
+
+    def value(self, metric, *labelvalues):
+        """Returns the current total of a counter or gauge (or a histogram's observation count)."""
+        value = self.totals().get((metric, labelvalues))
+        if isinstance(value, list):
+            return sum(value[:-1])
+        return value or 0
+
+    def render(self):
+        """Renders all metrics in the Prometheus text exposition format."""
+        totals = self.totals()
+        by_metric = {}
+        for (metric, labelvalues), value in totals.items():
+            by_metric.setdefault(metric, []).append((labelvalues, value))
+
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for labelvalues, value in sorted(by_metric.get(metric, []), key=lambda item: item[0]):
+                pairs = list(zip(metric.labelnames, labelvalues))
+                if metric.kind != 'histogram':
+                    lines.append(f"{metric.name}{_format_labels(pairs)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.bounds + (float('inf'),), value):
+                    cumulative += count
+                    lines.append(f"{metric.name}_bucket{_format_labels(pairs + [('le', _format_value(bound))])} {cumulative}")
+                lines.append(f"{metric.name}_sum{_format_labels(pairs)} {_format_value(value[-1])}")
+                lines.append(f"{metric.name}_count{_format_labels(pairs)} {cumulative}")
+
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e: # A broken collector must not break the whole scrape
+                print(f"Metrics collector {collector.__name__} failed: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        """Drops all recorded values (definitions and collectors are kept)."""
+        with self._lock:
+            for _, shard in self._shards:
+                shard.clear()
+            self._retired.clear()
+
+    # --- Internal helpers ---
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+                if len(self._shards) > _COMPACT_THRESHOLD:
+                    self._compact()
+        return shard
+
+    def _compact(self):
+        """Folds the shards of ended threads into the retired totals. Must be called with the lock held."""
+        alive = []
+        for thread_ref, shard in self._shards:
+            thread = thread_ref()
+            if thread is not None and thread.is_alive():
+                alive.append((thread_ref, shard))
+                continue
+            for key, value in shard.items():
+                _merge(self._retired, key, value)
+        self._shards = alive
+
+
+# WSGI environ key under which the app stores the matched route pattern (the 'route' label).
+ROUTE_ENVIRON_KEY = 'mcp_chat.metrics_route'
+
+
+class RequestMetricsMiddleware:
+    """
+    WSGI middleware recording each request's status and total time, measured until the response
+    body has been sent, so streamed replies are timed in full. The app marks a request as in flight
+    and stores its route pattern under ROUTE_ENVIRON_KEY once the route is known.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        status = ['500']
+
+        def capture_status(status_line, headers, exc_info=None):
+            status[0] = status_line.split(' ', 1)[0]
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            body = self.wsgi_app(environ, capture_status)
+        except Exception:
+            self._finish(environ, started, status[0])
+            raise
+        return ClosingIterator(body, lambda: self._finish(environ, started, status[0]))
+
+    @staticmethod
+    def _finish(environ, started, status):
+        route = environ.get(ROUTE_ENVIRON_KEY)
+        if route is None: # Failed before the route was known; it was never counted as in flight
+            route = 'unmatched'
+        else:
+            HTTP_IN_FLIGHT.dec(route)
+        HTTP_REQUESTS.inc(route, status)
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route)
+
+
+# Process-wide registry and the metrics recorded on the hot paths.
+registry = MetricsRegistry()
+
+HTTP_REQUESTS = registry.counter(
+    'mcp_chat_http_requests_total', 'HTTP requests by route and response status.', ('route', 'status'))
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'mcp_chat_http_request_duration_seconds', 'Total request time, including streamed bodies.', ('route',))
+HTTP_IN_FLIGHT = registry.gauge(
+    'mcp_chat_http_requests_in_flight', 'Requests currently being served.', ('route',))
+ERRORS = registry.counter(
+    'mcp_chat_errors_total', 'Errors by route and exception type.', ('route', 'type'))
+
+DNS_SECONDS = registry.histogram(
+    'mcp_chat_dns_lookup_seconds', 'Host name resolution time per status probe (mostly cache hits).', ('server',))
+PROBE_SECONDS = registry.histogram(
+    'mcp_chat_status_probe_seconds', 'Status ping time, including resolution.', ('server', 'outcome'))
+
+PROMPT_BUILD_SECONDS = registry.histogram(
+    'mcp_chat_prompt_build_seconds', 'Time to look up server status and build the prompt of a chat turn.',
+    ('route', 'server'))
+OPENAI_SECONDS = registry.histogram(
+    'mcp_chat_openai_seconds', 'Time from sending a chat turn to OpenAI until the reply is complete.',
+    ('route', 'server'))
+FIRST_TOKEN_SECONDS = registry.histogram(
+    'mcp_chat_openai_first_token_seconds', 'Time from sending a streamed chat turn to OpenAI until the first token.',
+    ('route', 'server'))
+REPLY_CACHE = registry.counter(
+    'mcp_chat_reply_cache_lookups_total', 'Response cache lookups of chat turns by result (hit, miss, bypass).',
+    ('route', 'server', 'result'))
+LLM_TOKENS = registry.counter(
+    'mcp_chat_llm_tokens_total', 'Tokens OpenAI reported by model and kind (prompt, completion, cached_prompt).',
+    ('model', 'kind'))
+ADMISSION_REJECTIONS = registry.counter(
+    'mcp_chat_admission_rejections_total',
+    'Requests rejected before running, by lane and reason (client_rate, queue_full, queue_timeout, openai_rpm, '
+    'openai_tpm).', ('lane', 'reason'))
@@ -0,0 +1,185 @@
+# This file persists the server registry and admin settings (e.g. the OpenAI API key) to SQLite,
+# so a restart no longer falls back to DEFAULT_MCP_SERVERS.
+#
+# The database runs in WAL mode. Startup reads the servers table in a single query (with SQLite's
+# memory-mapped I/O enabled), so loading stays fast with tens of thousands of servers.
+# Writes are batched: registry changes only mark the store dirty, and a background thread waits
+# `flush_interval` seconds to collect further changes, then writes the difference between the last
+# saved state and the current registry in one transaction. A burst of admin edits costs one commit.
+
+import atexit
+import sqlite3
+import threading
+
+from . import config
+from .server_registry import ServerRecord
+
+# Memory-mapped I/O size for reading the database (bytes).
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Settings key that stores the registry's next server ID, so IDs of deleted servers are never reused.
+NEXT_ID_SETTING = 'next_server_id'
+
+
+class ConfigStore:
+    """
+    SQLite-backed store for the server registry and admin settings.
+
+    Call load() at startup, then attach() to keep the database in sync with the registry.
+    Settings are written with set_setting() and are batched with the registry changes.
+    """
+
+    def __init__(self, path, flush_interval=None):
+        """
+        Args:
+            path (str): Database file path (':memory:' works for tests).
+            flush_interval (float): Seconds to collect changes before writing them.
+                                    Defaults to config.PERSISTENCE_FLUSH_INTERVAL.
+        """
+        self.path = path
+        self.flush_interval = config.PERSISTENCE_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL") # In WAL mode only checkpoints fsync the main file
+        self._conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS servers ("
+            " id INTEGER PRIMARY KEY, name TEXT NOT NULL, host TEXT NOT NULL, port INTEGER NOT NULL, type TEXT NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+
+        self._lock = threading.Lock()  # Serializes flushes and guards the pending settings
+        self._registry = None
+        self._saved = {}               # server_id -> ServerRecord as last written to the database
+        self._pending_settings = {}
+        self._dirty = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        # Counters, exposed through stats()
+        self.changes = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    def load(self, registry):
+        """
+        Replaces the registry contents with the saved servers.
+
+        Returns:
+            int: The number of servers loaded (0 if nothing has been saved yet, in which case
+                 the registry is left untouched).
+        """
+        rows = self._conn.execute("SELECT id, name, host, port, type FROM servers").fetchall()
+        next_id = self.get_setting(NEXT_ID_SETTING)
+        if not rows and next_id is None:
+            return 0
+        records = [ServerRecord(*row) for row in rows]
+        registry.restore(records, int(next_id or 0))
+        with self._lock:
+            self._saved = dict(registry.records_by_id())
+        print(f"Loaded {len(records)} servers from {self.path}.")
+        return len(records)
+
+    @property
+    def attached(self):
+        return self._registry is not None
+
+    def attach(self, registry):
+        """Starts writing registry changes to the database in the background."""
+        self._registry = registry
+        registry.subscribe(self._on_change)
+        self._thread = threading.Thread(target=self._run, name="config-store-writer", daemon=True)
+        self._thread.start()
+        self._on_change(registry) # Saves anything added before attaching (e.g. the defaults)
+        atexit.register(self.close)
+
+    def get_setting(self, key, default=None):
+        """Returns a saved setting, including one that is still waiting to be flushed."""
+        with self._lock:
+            if key in self._pending_settings:
+                return self._pending_settings[key]
+        row = self._conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else default
+
+    def set_setting(self, key, value):
+        """Saves a setting with the next batched write."""
+        with self._lock:
+            self._pending_settings[key] = value
+        self._on_change(None)
+
+    def flush(self):
+        """
+        Writes all pending changes in a single transaction.
+
+        Returns:
+            int: The number of rows written or deleted.
+        """
+        with self._lock:
+            self._dirty.clear()
+            current = self._registry.records_by_id() if self._registry is not None else None
+            upserts, deletes = [], []
+            if current is not None:
+                # Records are immutable, so an identity check finds every added or updated server.
+                upserts = [record for server_id, record in current.items() if self._saved.get(server_id) is not record]
+                deletes = [(server_id,) for server_id in self._saved if server_id not in current]
+            settings = dict(self._pending_settings)
+            if upserts or deletes:
+                settings[NEXT_ID_SETTING] = str(self._registry.next_id)
+            if not (upserts or deletes or settings):
+                return 0
+
+            try:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("INSERT OR REPLACE INTO servers (id, name, host, port, type) VALUES (?, ?, ?, ?, ?)",
+                                       [(r.id, r.name, r.host, r.port, r.type) for r in upserts])
+                self._conn.executemany("DELETE FROM servers WHERE id = ?", deletes)
+                self._conn.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", settings.items())
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                self._conn.execute("ROLLBACK")
+                print(f"Failed to save configuration to {self.path}: {e}")
+                self._dirty.set() # Retry with the next flush
+                return 0
+
+            if current is not None:
+                self._saved = dict(current)
+            self._pending_settings.clear()
+            written = len(upserts) + len(deletes) + len(settings)
+            self.flushes += 1
+            self.rows_written += written
+            return written
+
+    def close(self):
+        """Stops the writer thread after a final flush."""
+        self._stopping.set()
+        self._dirty.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+        if self._registry is not None:
+            self._registry.unsubscribe(self._on_change)
+        self.flush()
+
+    def stats(self):
+        """Returns write batching counters."""
+        return {
+            "path": self.path,
+            "changes": self.changes,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "pending": self._dirty.is_set(),
+        }
+
+    # --- Internal helpers ---
+    def _on_change(self, registry):
+        """Registry listener: runs under the registry's write lock, so it only marks the store dirty."""
+        self.changes += 1
+        self._dirty.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._dirty.wait()
+            self._stopping.wait(self.flush_interval) # Collect the rest of the burst
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Configuration writer error: {e}")
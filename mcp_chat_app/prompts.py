@@ -0,0 +1,228 @@
+# This file builds the prompts of chat turns and accounts for the tokens they cost.
+# The server context used to be assembled per request from chains of f-strings and dict.get calls.
+# Here each kind of server (Java, Bedrock, offline) has a template compiled once at import, so a
+# request only fills in values. Messages are laid out for provider-side prompt caching: the system
+# prompt is a fixed prefix shared by every request, conversation history follows (it only grows
+# between a conversation's turns), and everything that changes per request comes last. Prompts are
+# counted with the chosen model's tokenizer and kept within a budget, and the usage OpenAI reports
+# for each completion is recorded per model.
+
+import string
+import threading
+
+from . import config
+from .metrics import LLM_TOKENS # Token usage counters for /metrics
+from .token_count import count_message_tokens
+
+# Fixed system prompt: identical for every request, so it forms a cacheable prompt prefix.
+SYSTEM_PROMPT = ("You are a helpful assistant. If the user asks about a Minecraft server and context for that "
+                 "server is provided, use that context to inform your answer. Otherwise, answer generally.")
+
+
+class PromptTemplate:
+    """
+    A prompt fragment compiled once into literal text and field references.
+
+    The template is a sequence of sections (usually one sentence each). A section is only rendered
+    when all of its fields have a value, so optional facts need no conditionals per request.
+    """
+
+    def __init__(self, *sections):
+        self.sections = tuple(self._compile(section) for section in sections)
+
+    @staticmethod
+    def _compile(section):
+        parts = []
+        fields = []
+        for literal, field, _, _ in string.Formatter().parse(section):
+            if literal:
+                parts.append((literal, None))
+            if field is not None:
+                parts.append((None, field))
+                fields.append(field)
+        return tuple(parts), tuple(fields)
+
+    def render(self, values):
+        """Renders the template with a mapping of field values (None or "" leaves a section out)."""
+        out = []
+        for parts, fields in self.sections:
+            if any(values.get(field) in (None, "") for field in fields):
+                continue
+            for literal, field in parts:
+                out.append(literal if field is None else str(values[field]))
+        return "".join(out)
+
+
+_SERVER = "The user is asking about the Minecraft server named '{name}' (Host: {address}). "
+_ONLINE = (_SERVER, "It is currently online. ", "Version: {version}. ", "MOTD: \"{motd}\". ",
+           "Players: {player_count}/{player_max}. ")
+
+# Server context templates by kind of server (see template_for).
+SERVER_TEMPLATES = {
+    'java': PromptTemplate(*_ONLINE, "Online players: {players}. ", "Map: {map_name}. ", "{trends}"),
+    'bedrock': PromptTemplate(*_ONLINE, "It is a Bedrock Edition server. ", "Game mode: {gamemode}. ",
+                              "Map: {map_name}. ", "{trends}"),
+    'offline': PromptTemplate(_SERVER, "It appears to be offline or there was an issue fetching its status. ",
+                              "Error: {error}. ", "{trends}"),
+}
+USER_MESSAGE = PromptTemplate("{context}", "User's message: \"{message}\"")
+
+
+def template_for(status):
+    """Picks the server context template for a status result."""
+    if not status.get('online'):
+        return SERVER_TEMPLATES['offline']
+    return SERVER_TEMPLATES['bedrock' if status.get('edition') == 'bedrock' else 'java']
+
+
+def server_context(server_info, status, trends=""):
+    """
+    Renders the prompt context for one server.
+
+    Args:
+        server_info (ServerRecord): The selected server.
+        status (ServerStatus or dict): Its status result.
+        trends (str): Notable trends from the status history (see StatusHistory.describe).
+
+    Returns:
+        str: The context text.
+    """
+    players = status.get('players')
+    return template_for(status).render({
+        'name': server_info.name or 'this server',
+        'address': f"{server_info.host}:{server_info.port}",
+        'version': status.get('version'),
+        'motd': status.get('motd'),
+        'player_count': status.get('player_count'),
+        'player_max': status.get('player_max'),
+        'players': ", ".join(players) if players else None,
+        'map_name': status.get('map_name'),
+        'gamemode': status.get('gamemode'),
+        'error': status.get('error', 'Not specified'),
+        'trends': trends,
+    })
+
+
+def user_message(context, message):
+    """The final user message of a turn: the per-request context, then the user's own words."""
+    return USER_MESSAGE.render({'context': context, 'message': message})
+
+
+# --- Model selection and budgets ---
+def select_model(requested=None):
+    """
+    Returns the model for a chat turn: the requested one if it is in config.CHAT_MODELS, else config.CHAT_MODEL.
+
+    Raises:
+        ValueError: If a model was requested that isn't allowed.
+    """
+    if requested in (None, ""):
+        return config.CHAT_MODEL
+    if requested not in config.CHAT_MODELS:
+        raise ValueError(f"Unknown model '{requested}'. Available models: {', '.join(config.CHAT_MODELS)}.")
+    return requested
+
+
+def prompt_budget(model):
+    """Returns the prompt token budget for a model: config.PROMPT_TOKEN_BUDGET, capped by its context window."""
+    window = config.CHAT_MODELS.get(model)
+    if window is None:
+        return config.PROMPT_TOKEN_BUDGET
+    return min(config.PROMPT_TOKEN_BUDGET, window - config.CHAT_REPLY_TOKEN_RESERVE)
+
+
+def fit_to_budget(messages, model, budget=None):
+    """
+    Counts a turn's prompt tokens and drops conversation history until it fits the budget.
+
+    The system prompt (first message) and the new user message (last) are always kept. History
+    turns go oldest first; a summary of earlier turns (a system message right after the system
+    prompt) goes last, as it covers the most conversation per token.
+
+    Returns:
+        tuple: (messages, prompt_tokens, dropped) where dropped is the number of history messages left out.
+    """
+    budget = prompt_budget(model) if budget is None else budget
+    tokens = count_message_tokens(messages, model)
+    if tokens <= budget or len(messages) <= 2:
+        return messages, tokens, 0
+
+    history = messages[1:-1]
+    summary = history[:1] if history[0]['role'] == 'system' else []
+    turns = history[len(summary):]
+    dropped = 0
+    while tokens > budget and (turns or summary):
+        removed = turns.pop(0) if turns else summary.pop()
+        tokens -= count_message_tokens([removed], model)
+        dropped += 1
+    return messages[:1] + summary + turns + messages[-1:], tokens, dropped
+
+
+# --- Token usage ---
+def usage_fields(usage):
+    """
+    Converts the usage object of an OpenAI completion into a dict of token counts, or None if the
+    response didn't report usage.
+    """
+    prompt_tokens = getattr(usage, 'prompt_tokens', None)
+    completion_tokens = getattr(usage, 'completion_tokens', None)
+    if not isinstance(prompt_tokens, int) or not isinstance(completion_tokens, int):
+        return None
+    cached_tokens = getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', None)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "cached_prompt_tokens": cached_tokens if isinstance(cached_tokens, int) else 0, # Served from the prompt cache
+    }
+
+
+def add_usage(total, fields):
+    """Adds usage fields (see usage_fields) into a running total dict. Returns the total."""
+    for key, value in fields.items():
+        total[key] = total.get(key, 0) + value
+    return total
+
+
+class TokenUsage:
+    """Thread-safe totals of the token usage OpenAI reported, per model."""
+
+    def __init__(self):
+        self._models = {} # model -> {'requests': n, 'prompt_tokens': n, ...}
+        self._lock = threading.Lock()
+
+    def record(self, model, usage):
+        """
+        Records the usage of one completion.
+
+        Args:
+            model (str): The model the completion was requested from.
+            usage: The completion's `usage` object.
+
+        Returns:
+            dict: The usage as token counts (see usage_fields), or None if the completion reported none.
+        """
+        fields = usage_fields(usage)
+        if fields is None:
+            return None
+        with self._lock:
+            totals = self._models.setdefault(model, {"requests": 0})
+            totals["requests"] += 1
+            add_usage(totals, fields)
+        LLM_TOKENS.inc(model, 'prompt', amount=fields["prompt_tokens"])
+        LLM_TOKENS.inc(model, 'completion', amount=fields["completion_tokens"])
+        LLM_TOKENS.inc(model, 'cached_prompt', amount=fields["cached_prompt_tokens"])
+        return fields
+
+    def reset(self):
+        with self._lock:
+            self._models.clear()
+
+    def stats(self):
+        """Returns the totals per model."""
+        with self._lock:
+            return {model: dict(totals) for model, totals in self._models.items()}
+
+
+# Process-wide token usage totals, shown under 'token_usage' in /admin/stats.
+token_usage = TokenUsage()
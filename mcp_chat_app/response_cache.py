@@ -0,0 +1,217 @@
+# This file contains the LLM response cache used by the chat endpoints.
+# Many users ask the same questions about the same servers; a cached answer skips the OpenAI
+# round trip entirely. Keys include a coarse fingerprint of the server status used in the prompt,
+# so answers go stale as soon as the server's online state or player count changes materially.
+
+import hashlib
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from . import config
+
+
+def normalize_message(message):
+    """Normalizes a user message so trivially different phrasings share a cache entry."""
+    message = re.sub(r'\s+', ' ', message.strip().lower())
+    return message.rstrip('?!. ')
+
+
+def status_fingerprint(server_info, status_result):
+    """
+    Builds a coarse fingerprint of the server status used in a prompt.
+
+    Player counts are bucketed on a logarithmic scale (see config.RESPONSE_CACHE_PLAYER_BUCKET_RATIO),
+    so small fluctuations keep the same fingerprint while material changes produce a new one.
+
+    Args:
+        server_info (dict): The configured server (host/port identify it).
+        status_result (dict): The status result used for the prompt context.
+
+    Returns:
+        str: The fingerprint.
+    """
+    server = f"{server_info['host'].lower()}:{server_info['port']}"
+    if not status_result.get("online"):
+        return f"{server}|offline"
+    players = status_result.get("player_count") or 0
+    bucket = 0 if players <= 0 else 1 + int(math.log(players, config.RESPONSE_CACHE_PLAYER_BUCKET_RATIO))
+    return f"{server}|online|{status_result.get('version')}|{status_result.get('player_max')}|{bucket}"
+
+
+def make_key(message, model, system_prompt, fingerprint):
+    """Builds the cache key for a chat turn."""
+    raw = "\x1f".join([normalize_message(message), model, system_prompt, fingerprint or ""])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class MemoryBackend:
+    """An in-memory LRU backend with per-entry TTL."""
+
+    def __init__(self, max_entries, ttl, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict() # key -> (reply, expires_at), least recently used first
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            reply, expires_at = entry
+            if self._clock() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return reply
+
+    def put(self, key, reply):
+        with self._lock:
+            self._entries[key] = (reply, self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """An on-disk backend so cached answers survive restarts. Evicts least recently used entries."""
+
+    def __init__(self, path, max_entries, ttl, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, reply TEXT NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def get(self, key):
+        now = self._clock()
+        with self._lock:
+            row = self._conn.execute("SELECT reply, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now >= row[1]:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def put(self, key, reply):
+        now = self._clock()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, reply, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                               (key, reply, now + self.ttl, now))
+            overflow = len(self) - self.max_entries
+            if overflow > 0:
+                self._conn.execute("DELETE FROM responses WHERE key IN "
+                                   "(SELECT key FROM responses ORDER BY last_used LIMIT ?)", (overflow,))
+                self.evictions += overflow
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class ResponseCache:
+    """Caches LLM replies in a pluggable backend and keeps hit-rate metrics."""
+
+    def __init__(self, backend, enabled=True):
+        self.backend = backend
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+        # Counters, exposed through stats()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.bypasses = 0
+
+    def get(self, key, use_cache=True):
+        """
+        Returns the cached reply for a key, or None on a miss.
+
+        Args:
+            key (str): Key from make_key().
+            use_cache (bool): False if the request opted out of caching.
+        """
+        if not self.enabled or not use_cache:
+            with self._lock:
+                self.bypasses += 1
+            return None
+        reply = self.backend.get(key)
+        with self._lock:
+            if reply is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return reply
+
+    def put(self, key, reply, use_cache=True):
+        """Stores a reply (skipped if caching is disabled or the request opted out)."""
+        if not self.enabled or not use_cache or not reply:
+            return
+        self.backend.put(key, reply)
+        with self._lock:
+            self.stores += 1
+
+    def clear(self):
+        """Drops all cached replies and resets the counters."""
+        self.backend.clear()
+        with self._lock:
+            self.hits = self.misses = self.stores = self.bypasses = 0
+            self.backend.evictions = 0
+
+    def stats(self):
+        """Returns a snapshot of the cache counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "backend": type(self.backend).__name__,
+                "size": len(self.backend),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "bypasses": self.bypasses,
+                "evictions": self.backend.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def create_response_cache():
+    """Builds the response cache configured in config.py."""
+    if config.RESPONSE_CACHE_BACKEND == 'sqlite':
+        backend = SQLiteBackend(config.RESPONSE_CACHE_SQLITE_PATH, config.RESPONSE_CACHE_MAX_ENTRIES,
+                                config.RESPONSE_CACHE_TTL)
+    elif config.RESPONSE_CACHE_BACKEND == 'memory':
+        backend = MemoryBackend(config.RESPONSE_CACHE_MAX_ENTRIES, config.RESPONSE_CACHE_TTL)
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: '{config.RESPONSE_CACHE_BACKEND}'")
+    return ResponseCache(backend, enabled=config.RESPONSE_CACHE_ENABLED)
+
+
+# Process-wide response cache shared by all request threads.
+response_cache = create_response_cache()
@@ -0,0 +1,101 @@
+# This file builds the prompt context for chat turns about several servers at once, e.g.
+# "which of my servers has the lowest ping?". Statuses are rendered as a compact table, most
+# relevant servers first, and the table is cut off at a token budget so "all" stays affordable.
+
+from . import config
+from .server_status import is_unknown
+from .token_count import count_tokens
+
+# Words in the user's message that say which column a comparison is about.
+LATENCY_WORDS = ('ping', 'latency', 'lag', 'fast', 'slow', 'response time')
+PLAYER_WORDS = ('player', 'busy', 'popular', 'crowded', 'empty', 'people', 'active')
+
+TABLE_HEADER = "name | address | status | players | version | latency_ms"
+
+
+def _cell(value):
+    """Formats a table cell; '|' and newlines would break the table layout."""
+    if value is None or value == '':
+        return '-'
+    return str(value).replace('|', '/').replace('\n', ' ').strip()
+
+
+def format_row(server, status):
+    """Formats one server as a table row."""
+    if is_unknown(status): # Not checked (in time); it may well be online
+        return " | ".join([_cell(server['name']), f"{server['host']}:{server['port']}",
+                           f"unknown ({_cell(status.get('error'))})", "-", "-", "-"])
+    if status.get('online'):
+        latency = status.get('latency')
+        return " | ".join([
+            _cell(server['name']), f"{server['host']}:{server['port']}", "online",
+            f"{_cell(status.get('player_count'))}/{_cell(status.get('player_max'))}",
+            _cell(status.get('version')), _cell(round(latency) if latency is not None else None),
+        ])
+    return " | ".join([_cell(server['name']), f"{server['host']}:{server['port']}",
+                       f"offline ({_cell(status.get('error', 'unknown error'))})", "-", "-", "-"])
+
+
+def rank_servers(message, servers, statuses):
+    """
+    Orders servers by relevance to the user's message: servers named in the message first,
+    then online ones, then by the column the question is about (lowest latency or most players),
+    and otherwise in the order they were selected.
+
+    Returns:
+        list: (server, status) pairs, most relevant first.
+    """
+    text = (message or '').lower()
+    by_latency = any(word in text for word in LATENCY_WORDS)
+    by_players = not by_latency and any(word in text for word in PLAYER_WORDS)
+
+    def relevance(item):
+        index, (server, status) = item
+        named = bool(server['name']) and server['name'].lower() in text or server['host'].lower() in text
+        online = bool(status.get('online'))
+        if by_latency and online:
+            metric = status.get('latency') if status.get('latency') is not None else float('inf')
+        elif by_players and online:
+            metric = -(status.get('player_count') or 0)
+        else:
+            metric = 0
+        return (not named, not online, metric, index)
+
+    return [pair for _, pair in sorted(enumerate(zip(servers, statuses)), key=relevance)]
+
+
+def build_context(message, servers, statuses, token_budget=None):
+    """
+    Builds the prompt context for a multi-server chat turn.
+
+    Args:
+        message (str): The user's message (used to rank the servers).
+        servers (list): The selected servers (ServerRecords or dicts).
+        statuses (list): One status result per server, in the same order.
+        token_budget (int): Token limit for the context (see token_count.py). Rows that don't fit are left
+                            out (least relevant first) and counted in a final note.
+
+    Returns:
+        tuple: (context_text, shown) where shown lists the (server, status) pairs included in the table.
+    """
+    token_budget = config.CHAT_CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    ranked = rank_servers(message, servers, statuses)
+    online = sum(1 for _, status in ranked if status.get('online'))
+    lines = [
+        f"The user is asking about {len(ranked)} Minecraft servers ({online} online). "
+        f"Current status, most relevant first:",
+        TABLE_HEADER,
+    ]
+    used = sum(count_tokens(line) + 1 for line in lines)
+    shown = []
+    for server, status in ranked:
+        row = format_row(server, status)
+        cost = count_tokens(row) + 1
+        if used + cost > token_budget and shown: # Always show at least one server
+            break
+        lines.append(row)
+        used += cost
+        shown.append((server, status))
+    if len(shown) < len(ranked):
+        lines.append(f"({len(ranked) - len(shown)} more servers not shown.)")
+    return "\n".join(lines) + "\n", shown
@@ -0,0 +1,227 @@
+# This file contains bulk import and export of server configurations (CSV, JSON and NDJSON).
+# Imports are parsed incrementally from a binary stream (an upload or the raw request body) and
+# exports are produced as a generator of chunks, so large files never sit fully in memory.
+
+import codecs
+import csv
+import io
+import json
+
+from . import config
+from .server_registry import parse_port
+
+FORMATS = ('csv', 'json', 'ndjson')
+CSV_FIELDS = ('id', 'name', 'host', 'port', 'type')
+
+# Content types and file extensions used to guess the format when none is given.
+CONTENT_TYPE_FORMATS = {
+    'text/csv': 'csv',
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+EXTENSION_FORMATS = {'.csv': 'csv', '.json': 'json', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+EXPORT_CONTENT_TYPES = {'csv': 'text/csv', 'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+
+# Bytes read from the input stream at a time.
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class ImportFormatError(ValueError):
+    """Raised when an import file can't be parsed at all (as opposed to individual invalid rows)."""
+
+
+def detect_format(requested=None, content_type=None, filename=None):
+    """
+    Picks the import/export format from an explicit value, the content type or the file name.
+
+    Returns:
+        str: One of FORMATS, or None if it can't be determined.
+    """
+    if requested:
+        return requested.lower() if requested.lower() in FORMATS else None
+    if content_type:
+        fmt = CONTENT_TYPE_FORMATS.get(content_type.split(';')[0].strip().lower())
+        if fmt:
+            return fmt
+    if filename and '.' in filename:
+        return EXTENSION_FORMATS.get(filename[filename.rindex('.'):].lower())
+    return None
+
+
+# --- Import ---
+def iter_rows(stream, fmt):
+    """
+    Yields (line_number, row) pairs from a binary stream, where row is whatever the file
+    contained for one server (usually a dict). Raises ImportFormatError for malformed files.
+    """
+    if fmt == 'csv':
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig')
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                yield line_number, ImportFormatError(f"Invalid JSON: {e}")
+    elif fmt == 'json':
+        yield from _iter_json_array(stream)
+    else:
+        raise ImportFormatError(f"Unsupported format '{fmt}'. Use one of: {', '.join(FORMATS)}.")
+
+
+def _iter_json_array(stream):
+    """
+    Incrementally parses a top-level JSON array, yielding (item_number, item).
+    Only the current chunk and a partially read item are kept in memory.
+    """
+    decoder = json.JSONDecoder()
+    reader = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    position = 0
+    eof = False
+    started = False
+    item_number = 0
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = stream.read(READ_CHUNK_SIZE)
+        eof = not chunk
+        buffer = buffer[position:] + reader.decode(chunk or b'', final=eof)
+        position = 0
+
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            if buffer[position] == ',' and not started:
+                raise ImportFormatError("Expected a JSON array of servers.")
+            position += 1
+        if position >= len(buffer):
+            if eof:
+                raise ImportFormatError("Unexpected end of JSON input.")
+            fill()
+            continue
+
+        if not started:
+            if buffer[position] != '[':
+                raise ImportFormatError("Expected a JSON array of servers.")
+            started = True
+            position += 1
+            continue
+        if buffer[position] == ']':
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except ValueError as e:
+            if eof:
+                raise ImportFormatError(f"Invalid JSON: {e}")
+            fill() # The item is probably cut off at the end of the chunk
+            continue
+        item_number += 1
+        position = end
+        yield item_number, item
+
+
+def validate_row(row):
+    """
+    Validates one imported row.
+
+    Returns:
+        tuple: (server_dict, None) for a valid row, or (None, error_message).
+    """
+    if isinstance(row, Exception):
+        return None, str(row)
+    if not isinstance(row, dict):
+        return None, "Expected an object with name, host and port."
+    name = str(row.get('name') or '').strip()
+    host = str(row.get('host') or '').strip()
+    port = row.get('port')
+    if not name or not host or port in (None, ''):
+        return None, "Fields name, host and port are required."
+    try:
+        port = parse_port(port)
+    except (TypeError, ValueError):
+        return None, f"Invalid port number: '{port}'. Port must be between 1 and 65535."
+    server_type = str(row.get('type') or '').strip() or 'Unknown'
+    return {'name': name, 'host': host, 'port': port, 'type': server_type}, None
+
+
+def import_servers(registry, stream, fmt, skip_duplicates=True, dry_run=False):
+    """
+    Validates every row in an import stream and adds the valid servers to the registry
+    in a single registry change.
+
+    Args:
+        registry (ServerRegistry): The registry to add to (e.g. config.MCP_SERVERS).
+        stream: A binary file-like object.
+        fmt (str): One of FORMATS.
+        skip_duplicates (bool): Skip rows whose host:port is already configured (or repeated in the file).
+        dry_run (bool): Validate only; don't change the registry.
+
+    Returns:
+        dict: 'imported' (list of new records), 'skipped', 'invalid' and 'errors'
+              (at most config.BULK_IMPORT_MAX_ERRORS of {'line': n, 'error': message}).
+
+    Raises:
+        ImportFormatError: If the file can't be parsed.
+    """
+    servers = []
+    seen = set()
+    skipped = invalid = 0
+    errors = []
+    for line_number, row in iter_rows(stream, fmt):
+        server, error = validate_row(row)
+        if error:
+            invalid += 1
+            if len(errors) < config.BULK_IMPORT_MAX_ERRORS:
+                errors.append({'line': line_number, 'error': error})
+            continue
+        if skip_duplicates:
+            address = (server['host'].lower(), server['port'])
+            if address in seen or registry.get_by_address(server['host'], server['port']) is not None:
+                skipped += 1
+                continue
+            seen.add(address)
+        servers.append(server)
+
+    imported = [] if dry_run else registry.add_many(servers)
+    return {'imported': imported, 'valid': len(servers), 'skipped': skipped, 'invalid': invalid, 'errors': errors}
+
+
+# --- Export ---
+def iter_export(servers, fmt):
+    """
+    Yields the servers encoded as `fmt`, one small chunk at a time.
+
+    Args:
+        servers (iterable): ServerRecords, e.g. config.MCP_SERVERS.all().
+        fmt (str): One of FORMATS.
+    """
+    if fmt == 'csv':
+        line = io.StringIO()
+        writer = csv.writer(line)
+        writer.writerow(CSV_FIELDS)
+        for record in servers:
+            writer.writerow([record.id, record.name, record.host, record.port, record.type])
+            yield line.getvalue()
+            line.seek(0)
+            line.truncate()
+        if line.tell(): # Header only (no servers)
+            yield line.getvalue()
+    elif fmt == 'json':
+        separator = '\n'
+        yield '['
+        for record in servers:
+            yield separator + json.dumps(record.to_dict())
+            separator = ',\n'
+        yield '\n]\n'
+    elif fmt == 'ndjson':
+        for record in servers:
+            yield json.dumps(record.to_dict()) + '\n'
+    else:
+        raise ValueError(f"Unsupported format '{fmt}'. Use one of: {', '.join(FORMATS)}.")
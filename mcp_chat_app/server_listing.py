@@ -0,0 +1,156 @@
+# This file serves the server list in pages, for the /api/servers endpoint and the chat and admin pages.
+# Rendering every configured server into each page load gets slow with thousands of servers, so
+# pages only carry one page of servers and the chat page's dropdown fetches more as the user searches.
+# Search results, serialized pages and rendered HTML fragments are cached by the registry version:
+# they are reused until the server list changes and dropped all at once when it does.
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from . import config
+
+
+def normalize_query(query):
+    """Normalizes a search query: case-insensitive, surrounding and repeated whitespace ignored."""
+    return " ".join((query or "").lower().split())
+
+
+def _search_text(record):
+    return f"{record.name} {record.host}:{record.port} {record.type}".lower()
+
+
+class ServerListing:
+    """
+    Filters and pages the server registry, caching results until the registry version changes.
+
+    All cached values are keyed on the version they were built from, so a change to the server
+    list (an add, edit, import or delete anywhere) is picked up by the next call without explicit
+    invalidation.
+    """
+
+    def __init__(self, registry=None, page_size=None, max_page_size=None, max_entries=None):
+        """
+        Args:
+            registry (ServerRegistry): The servers to list. Defaults to config.MCP_SERVERS (looked up per call).
+            page_size (int): Servers per page when the caller doesn't ask for a size.
+            max_page_size (int): Largest page size a caller may ask for.
+            max_entries (int): Maximum number of cached searches, pages and fragments.
+        """
+        self._registry = registry
+        self.page_size = config.SERVER_LIST_PAGE_SIZE if page_size is None else page_size
+        self.max_page_size = config.SERVER_LIST_MAX_PAGE_SIZE if max_page_size is None else max_page_size
+        self.max_entries = config.SERVER_LIST_CACHE_SIZE if max_entries is None else max_entries
+        # Distinguishes this process's versions from another process's (versions restart at startup).
+        self._instance = os.urandom(4).hex()
+
+        self._version = None
+        self._entries = OrderedDict() # (kind, args) -> value for self._version, least recently used first
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def registry(self):
+        return self._registry if self._registry is not None else config.MCP_SERVERS
+
+    def etag(self, version=None):
+        """Returns the entity tag for listings of a registry version (the current one by default)."""
+        return f"{self._instance}-{self.registry.version if version is None else version}"
+
+    def clamp(self, offset, limit):
+        """Returns (offset, limit) forced into the allowed range; a missing limit means the default page size."""
+        limit = self.page_size if limit is None else limit
+        return max(0, offset), max(1, min(limit, self.max_page_size))
+
+    def search(self, query=""):
+        """Returns the records matching `query` (substring of name, host:port or type), in ID order."""
+        registry = self.registry
+        version = registry.version
+        query = normalize_query(query)
+        return self._cached(version, ('search', query), lambda: self._search(registry, query))
+
+    def page(self, query="", offset=0, limit=None):
+        """
+        Returns one page of matching servers.
+
+        Returns:
+            dict: {'version', 'query', 'total', 'offset', 'limit', 'next_offset', 'servers'}, where
+                  'servers' are ServerRecords and 'next_offset' is None on the last page.
+        """
+        offset, limit = self.clamp(offset, limit)
+        version = self.registry.version
+        matches = self.search(query)
+        return {
+            "version": version,
+            "query": normalize_query(query),
+            "total": len(matches),
+            "offset": offset,
+            "limit": limit,
+            "next_offset": offset + limit if offset + limit < len(matches) else None,
+            "servers": matches[offset:offset + limit],
+        }
+
+    def page_json(self, query="", offset=0, limit=None):
+        """
+        Returns (version, body) where body is the page serialized as JSON bytes (cached per version).
+        """
+        offset, limit = self.clamp(offset, limit)
+        version = self.registry.version
+
+        def serialize():
+            page = self.page(query, offset, limit)
+            page["servers"] = [record.to_dict() for record in page["servers"]]
+            return json.dumps(page).encode('utf-8')
+        return version, self._cached(version, ('json', normalize_query(query), offset, limit), serialize)
+
+    def fragment(self, name, render, *args):
+        """
+        Returns the HTML fragment `name` for the current registry version, calling render(*args)
+        only when it isn't cached yet. `args` are part of the cache key (e.g. the search query and page).
+        """
+        version = self.registry.version
+        return self._cached(version, ('fragment', name) + args, lambda: render(*args))
+
+    def clear(self):
+        """Drops all cached values and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"version": self._version, "entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    # --- Internal helpers ---
+    @staticmethod
+    def _search(registry, query):
+        records = registry.all()
+        if not query:
+            return records
+        return tuple(record for record in records if query in _search_text(record))
+
+    def _cached(self, version, key, build):
+        with self._lock:
+            if version == self._version and key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = build() # Outside the lock; two callers may build the same value, which is harmless
+        with self._lock:
+            if version != self._version: # The server list changed: everything cached is stale
+                self._entries.clear()
+                self._version = version
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+# Process-wide listing used by the chat page, the admin page and /api/servers.
+server_listing = ServerListing()
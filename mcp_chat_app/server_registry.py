@@ -0,0 +1,258 @@
+# This file contains the registry of configured MCP servers.
+# It replaces the bare list of dicts that used to live in config.MCP_SERVERS: servers get stable
+# IDs (deleting one server no longer shifts the others), lookups by ID, host:port and name are
+# O(1), and writes are copy-on-write so request threads can read without taking a lock.
+
+import threading
+from types import MappingProxyType
+
+
+class ServerRecord:
+    """
+    A single configured server. Records are immutable: updates replace the record.
+    Dict-style read access (record['host'], record.get('type')) is supported so that code
+    and templates written against the old server dicts keep working.
+    """
+    __slots__ = ('id', 'name', 'host', 'port', 'type')
+
+    def __init__(self, id, name, host, port, type='Unknown'):
+        object.__setattr__(self, 'id', id)
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'host', host)
+        object.__setattr__(self, 'port', int(port))
+        object.__setattr__(self, 'type', type or 'Unknown')
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ServerRecord is immutable; use ServerRegistry.update()")
+
+    @property
+    def address(self):
+        """Normalized 'host:port' string used for address lookups."""
+        return make_address(self.host, self.port)
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def to_dict(self):
+        return {"id": self.id, "name": self.name, "host": self.host, "port": self.port, "type": self.type}
+
+    def __eq__(self, other):
+        return isinstance(other, ServerRecord) and self.to_dict() == other.to_dict()
+
+    def __hash__(self):
+        return hash((self.id, self.name, self.host, self.port, self.type))
+
+    def __repr__(self):
+        return f"ServerRecord(id={self.id}, name={self.name!r}, address={self.host}:{self.port}, type={self.type!r})"
+
+
+def make_address(host, port):
+    """Builds the normalized 'host:port' key. Host names are case-insensitive."""
+    return f"{host.strip().lower()}:{int(port)}"
+
+
+def parse_port(value):
+    """
+    Validates a port number from a form field or an imported row.
+
+    Returns:
+        int: The port.
+
+    Raises:
+        ValueError: If the value is not an integer between 1 and 65535.
+    """
+    port = int(value)
+    if port <= 0 or port > 65535:
+        raise ValueError("Port out of range")
+    return port
+
+
+class _RegistryState:
+    """An immutable generation of the registry: the records plus their lookup indexes."""
+    __slots__ = ('by_id', 'ordered', 'by_address', 'by_name', 'version')
+
+    def __init__(self, by_id, version):
+        self.by_id = by_id
+        self.ordered = tuple(by_id[server_id] for server_id in sorted(by_id))
+        self.version = version
+        self.by_address = {}
+        self.by_name = {}
+        for record in self.ordered:
+            self.by_address.setdefault(record.address, record) # Lowest ID wins for duplicate addresses
+            self.by_name.setdefault(record.name.lower(), []).append(record)
+
+
+class ServerRegistry:
+    """
+    Thread-safe registry of ServerRecords with stable integer IDs.
+
+    Readers use the current state without locking; each write builds a new state
+    under a lock and swaps it in with a single reference assignment. `version`
+    increases on every change so caches can cheaply detect that the server list changed.
+    """
+
+    def __init__(self, servers=()):
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._state = _RegistryState({}, 0)
+        self._listeners = []
+        if servers:
+            self.add_many(servers)
+
+    # --- Reads (lock-free) ---
+    @property
+    def version(self):
+        return self._state.version
+
+    @property
+    def next_id(self):
+        """The ID the next added server will get."""
+        return self._next_id
+
+    def records_by_id(self):
+        """Returns a read-only {id: record} mapping of the current state."""
+        return MappingProxyType(self._state.by_id)
+
+    def get(self, server_id):
+        """Returns the record with the given ID, or None."""
+        return self._state.by_id.get(server_id)
+
+    def get_by_address(self, host, port):
+        """Returns the record for host:port (the lowest ID if several share it), or None."""
+        return self._state.by_address.get(make_address(host, port))
+
+    def find_by_name(self, name):
+        """Returns all records with the given name (case-insensitive), in ID order."""
+        return list(self._state.by_name.get(name.strip().lower(), ()))
+
+    def all(self):
+        """Returns all records in ID order, as an immutable tuple."""
+        return self._state.ordered
+
+    def __iter__(self):
+        return iter(self._state.ordered)
+
+    def __len__(self):
+        return len(self._state.by_id)
+
+    def __bool__(self):
+        return bool(self._state.by_id)
+
+    def __contains__(self, server_id):
+        return server_id in self._state.by_id
+
+    # --- Writes (copy-on-write) ---
+    def add(self, name, host, port, type='Unknown'):
+        """Adds a server and returns its record."""
+        return self.add_many([{"name": name, "host": host, "port": port, "type": type}])[0]
+
+    def add_many(self, servers):
+        """
+        Adds several servers in a single registry change.
+
+        Args:
+            servers (iterable): Dicts (or records) with 'name', 'host', 'port' and optional 'type'.
+
+        Returns:
+            list: The new records, in the order given.
+        """
+        with self._lock:
+            by_id = dict(self._state.by_id)
+            added = []
+            for server in servers:
+                record = ServerRecord(self._next_id, server['name'], server['host'], server['port'],
+                                      server.get('type', 'Unknown'))
+                by_id[record.id] = record
+                added.append(record)
+                self._next_id += 1
+            if added:
+                self._swap(by_id)
+            return added
+
+    def update(self, server_id, **changes):
+        """
+        Replaces fields of a server. Returns the new record, or None if the ID is unknown.
+        """
+        return self.update_many({server_id: changes}).get(server_id)
+
+    def update_many(self, changes_by_id):
+        """
+        Applies {server_id: {field: value}} changes in a single registry change.
+        Unknown IDs are skipped. Returns {server_id: new_record} for the updated servers.
+        """
+        return self.apply(updates=changes_by_id)[0]
+
+    def remove(self, server_id):
+        """Removes a server. Returns the removed record, or None if the ID is unknown."""
+        removed = self.remove_many([server_id])
+        return removed[0] if removed else None
+
+    def remove_many(self, server_ids):
+        """Removes several servers in a single registry change. Returns the removed records."""
+        return self.apply(removals=server_ids)[1]
+
+    def apply(self, updates=None, removals=()):
+        """
+        Applies updates and removals together as a single registry change (used by batch admin edits).
+
+        Args:
+            updates (dict): {server_id: {field: value}}. Unknown IDs are skipped.
+            removals (iterable): IDs to remove. Unknown IDs are skipped.
+
+        Returns:
+            tuple: ({server_id: new_record} for updated servers, [removed records]).
+        """
+        with self._lock:
+            by_id = dict(self._state.by_id)
+            updated = {}
+            for server_id, changes in (updates or {}).items():
+                old = by_id.get(server_id)
+                if old is None:
+                    continue
+                fields = old.to_dict()
+                fields.update({k: v for k, v in changes.items() if k in ('name', 'host', 'port', 'type')})
+                by_id[server_id] = updated[server_id] = ServerRecord(**fields)
+            removed = [by_id.pop(server_id) for server_id in removals if server_id in by_id]
+            updated = {server_id: record for server_id, record in updated.items() if server_id in by_id}
+            if updated or removed:
+                self._swap(by_id)
+            return updated, removed
+
+    def clear(self):
+        """Removes all servers and restarts ID numbering (used when (re)loading defaults)."""
+        with self._lock:
+            self._next_id = 0
+            self._swap({})
+
+    def restore(self, records, next_id):
+        """
+        Replaces the whole registry with previously saved records, keeping their IDs
+        (used when loading persisted servers at startup).
+        """
+        with self._lock:
+            by_id = {record.id: record for record in records}
+            self._next_id = max([next_id] + [server_id + 1 for server_id in by_id])
+            self._swap(by_id)
+
+    def subscribe(self, listener):
+        """
+        Registers listener(registry) to be called after every change. Listeners run while
+        the write lock is held, so they must be quick (e.g. just set a flag or an event).
+        """
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    # --- Internal helpers ---
+    def _swap(self, by_id):
+        """Publishes a new state. Must be called with the lock held."""
+        self._state = _RegistryState(by_id, self._state.version + 1)
+        for listener in list(self._listeners):
+            listener(self)
@@ -0,0 +1,117 @@
+# This file contains the typed status record returned by MCPClient for every kind of probe
+# (Java status, Java Query, Bedrock). It replaces the ad-hoc result dicts: a slotted, immutable
+# record is smaller than a dict, can be shared between threads and caches without copying,
+# and still supports dict-style reads (status['online'], status.get('motd')) for existing callers.
+
+EDITION_JAVA = 'java'
+EDITION_BEDROCK = 'bedrock'
+
+
+def edition_for_type(server_type):
+    """Maps a configured server type (free text, e.g. 'Minecraft Bedrock') to the protocol to use."""
+    return EDITION_BEDROCK if server_type and 'bedrock' in server_type.lower() else EDITION_JAVA
+
+
+class ServerStatus:
+    """
+    The result of a status check. Fields that don't apply (e.g. `error` for an online server,
+    `map_name` for a Java server without Query) are None and left out of to_dict().
+    """
+    __slots__ = ('online', 'edition', 'version', 'protocol_version', 'motd', 'player_count', 'player_max',
+                 'players', 'map_name', 'gamemode', 'latency', 'resolve_ms', 'error')
+    _FIELDS = __slots__ # Subclasses declare empty __slots__, so the fields are read from here
+
+    def __init__(self, online, edition=None, version=None, protocol_version=None, motd=None,
+                 player_count=None, player_max=None, players=None, map_name=None, gamemode=None,
+                 latency=None, resolve_ms=None, error=None):
+        """
+        Args:
+            online (bool): Whether the server answered.
+            edition (str): EDITION_JAVA or EDITION_BEDROCK.
+            players (iterable): Names of online players, when the server reveals them.
+            latency (float): Round trip of the status ping in milliseconds.
+            resolve_ms (float): Time spent resolving the host name in milliseconds.
+            error (str): Why the check failed (offline servers only).
+        """
+        values = locals()
+        for field in self._FIELDS:
+            object.__setattr__(self, field, values[field])
+        if players is not None:
+            object.__setattr__(self, 'players', tuple(players))
+
+    @classmethod
+    def offline(cls, error, **fields):
+        return cls(False, error=error, **fields)
+
+    @classmethod
+    def unknown(cls, error, **fields):
+        """A placeholder for a check that didn't finish (see UnknownStatus)."""
+        return UnknownStatus(False, error=error, **fields)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds a record from a result dict (e.g. one produced by to_dict())."""
+        if isinstance(data, cls):
+            return data
+        return cls(**{k: v for k, v in data.items() if k in cls._FIELDS})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ServerStatus is immutable; use replace()")
+
+    def replace(self, **changes):
+        """Returns a copy with some fields changed."""
+        fields = {field: getattr(self, field) for field in self._FIELDS}
+        fields.update(changes)
+        return type(self)(**fields)
+
+    def to_dict(self):
+        """Returns the set fields as a JSON-serialisable dict."""
+        result = {}
+        for field in self._FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                result[field] = list(value) if field == 'players' else value
+        return result
+
+    # --- Dict-style read access, so code written against the old result dicts keeps working ---
+    def keys(self):
+        return [field for field in self._FIELDS if getattr(self, field) is not None]
+
+    def __getitem__(self, key):
+        value = getattr(self, key, None) if key in self._FIELDS else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in self._FIELDS else None
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return key in self._FIELDS and getattr(self, key) is not None
+
+    def __eq__(self, other):
+        if isinstance(other, (ServerStatus, dict)):
+            return self.to_dict() == (other.to_dict() if isinstance(other, ServerStatus) else other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, field) for field in self._FIELDS))
+
+    def __repr__(self):
+        return f"ServerStatus({', '.join(f'{k}={v!r}' for k, v in self.to_dict().items())})"
+
+
+class UnknownStatus(ServerStatus):
+    """
+    A placeholder for a status check that didn't finish, e.g. a probe cancelled at a batch deadline
+    or one skipped by the per-server probe rate limit.
+    It reads like an offline result (with an error saying why), but says nothing about the server:
+    it is never cached, recorded in the history or published as the server's status.
+    """
+    __slots__ = ()
+
+
+def is_unknown(status):
+    """Whether a status result is a placeholder rather than the outcome of a check (see UnknownStatus)."""
+    return isinstance(status, UnknownStatus)
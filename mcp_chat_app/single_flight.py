@@ -0,0 +1,285 @@
+# This file contains request coalescing ("single-flight") for expensive operations.
+# When a server goes down, many users ask about it at once; without coalescing every request ran
+# its own status probe against the same host:port and its own identical OpenAI completion. Here the
+# first caller for a key runs the operation and every concurrent caller with the same key waits for
+# its result instead, whether it runs on a request thread or on the ASGI event loop.
+
+import asyncio
+import hashlib
+import json
+import threading
+
+
+class _Abandoned(Exception):
+    """Outcome of a call whose leader went away (e.g. was cancelled) without a result."""
+
+
+class _Call:
+    """One in-flight operation and the callers waiting for it. Held by the caller running it (the leader)."""
+    __slots__ = ('key', 'result', 'error', 'done', 'waiters', 'futures')
+    leader = True
+
+    def __init__(self, key):
+        self.key = key
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self.waiters = 0      # Callers sharing this call besides the leader
+        self.futures = []     # (loop, future) of async waiters, woken when the call is resolved
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class _Follower:
+    """A caller sharing another caller's call (returned by SingleFlight.claim)."""
+    __slots__ = ('call',)
+    leader = False
+
+    def __init__(self, call):
+        self.call = call
+
+
+def _wake(future):
+    if not future.done(): # The waiter may have timed out or been cancelled meanwhile
+        future.set_result(None)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+
+    Use do()/async_do() to run a function, or claim()/resolve()/abandon() directly when the
+    result is produced piece by piece (e.g. a streamed reply). Results and errors are shared with
+    every waiter; nothing is kept once the call finishes, so this is not a cache.
+    """
+
+    def __init__(self, name):
+        """
+        Args:
+            name (str): Label used in log messages.
+        """
+        self.name = name
+        self._calls = {} # key -> _Call currently in flight
+        self._lock = threading.Lock()
+
+        # Counters, exposed through stats()
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.abandoned = 0
+        self.timeouts = 0
+        self.max_waiters = 0
+
+    def claim(self, key):
+        """
+        Joins the call in flight for `key`, or starts a new one.
+
+        Returns:
+            _Call: A call whose `leader` attribute is True if the caller must run the operation
+                   and finish with resolve() or abandon(); otherwise wait with wait()/async_wait().
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+                return _Follower(call)
+            call = self._calls[key] = _Call(key)
+            self.executions += 1
+            return call
+
+    def resolve(self, call, result=None, error=None):
+        """Finishes a call claimed as leader, handing `result` (or `error`) to all its waiters."""
+        with self._lock:
+            if self._calls.get(call.key) is call:
+                del self._calls[call.key]
+            if isinstance(error, _Abandoned):
+                self.abandoned += 1
+            elif error is not None:
+                self.errors += 1
+            call.result = result
+            call.error = error
+            futures, call.futures = call.futures, []
+            call.done.set()
+        for loop, future in futures:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError: # The waiter's event loop has been closed
+                pass
+
+    def abandon(self, call):
+        """Finishes a call claimed as leader without a result; its waiters run the operation themselves."""
+        self.resolve(call, error=_Abandoned(f"{self.name} call was abandoned"))
+
+    def wait(self, follower, timeout=None):
+        """
+        Blocks until the shared call is finished and returns its result (or raises its error).
+        Raises TimeoutError if it isn't finished within `timeout` seconds.
+        """
+        if not follower.call.done.wait(timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"Timed out waiting for the in-flight {self.name} call")
+        return follower.call.outcome()
+
+    async def async_wait(self, follower, timeout=None):
+        """Async version of wait(): awaits the shared call without blocking the event loop."""
+        call = follower.call
+        with self._lock:
+            future = None
+            if not call.done.is_set():
+                loop = asyncio.get_running_loop()
+                future = loop.create_future()
+                call.futures.append((loop, future))
+        if future is not None:
+            try:
+                await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                raise TimeoutError(f"Timed out waiting for the in-flight {self.name} call") from None
+        return call.outcome()
+
+    def do(self, key, fn, timeout=None):
+        """
+        Runs fn() unless a call with the same key is already in flight, in which case its result
+        is shared. `timeout` bounds how long a waiter waits (TimeoutError); the leader is not limited.
+        """
+        while True:
+            call = self.claim(key)
+            if call.leader:
+                try:
+                    result = fn()
+                except Exception as e:
+                    self.resolve(call, error=e)
+                    raise
+                except BaseException: # E.g. KeyboardInterrupt: nothing worth sharing
+                    self.abandon(call)
+                    raise
+                self.resolve(call, result)
+                return result
+            try:
+                return self.wait(call, timeout)
+            except _Abandoned:
+                continue # The leader went away; try again (possibly as the new leader)
+
+    async def async_do(self, key, fn, timeout=None):
+        """Async version of do(). fn() must return an awaitable. Waiters can share calls with do() callers."""
+        while True:
+            call = self.claim(key)
+            if call.leader:
+                try:
+                    result = await fn()
+                except Exception as e:
+                    self.resolve(call, error=e)
+                    raise
+                except BaseException: # Cancelled by the leader's own caller, not a failure to share
+                    self.abandon(call)
+                    raise
+                self.resolve(call, result)
+                return result
+            try:
+                return await self.async_wait(call, timeout)
+            except _Abandoned:
+                continue
+
+    def stream(self, key, fn, timeout=None):
+        """
+        Like do() for an operation producing string parts (e.g. a streamed reply): fn() returns an
+        iterable of parts. The leader's parts are yielded as they arrive; a waiter gets the joined
+        result as a single part once the leader has finished.
+        """
+        while True:
+            call = self.claim(key)
+            if not call.leader:
+                try:
+                    result = self.wait(call, timeout)
+                except _Abandoned:
+                    continue
+                if result:
+                    yield result
+                return
+            parts = []
+            try:
+                for part in fn():
+                    if part:
+                        parts.append(part)
+                        yield part
+            except Exception as e:
+                self.resolve(call, error=e)
+                raise
+            except BaseException: # GeneratorExit: the consumer went away before the end
+                self.abandon(call)
+                raise
+            self.resolve(call, "".join(parts))
+            return
+
+    async def async_stream(self, key, fn, timeout=None):
+        """Async version of stream(). fn() must return an awaitable resolving to an async iterable of parts."""
+        while True:
+            call = self.claim(key)
+            if not call.leader:
+                try:
+                    result = await self.async_wait(call, timeout)
+                except _Abandoned:
+                    continue
+                if result:
+                    yield result
+                return
+            parts = []
+            try:
+                async for part in await fn():
+                    if part:
+                        parts.append(part)
+                        yield part
+            except Exception as e:
+                self.resolve(call, error=e)
+                raise
+            except BaseException:
+                self.abandon(call)
+                raise
+            self.resolve(call, "".join(parts))
+            return
+
+    def in_flight(self):
+        """Returns the number of calls currently in flight."""
+        with self._lock:
+            return len(self._calls)
+
+    def reset(self):
+        """Resets the counters. Calls in flight are not affected."""
+        with self._lock:
+            self.calls = self.executions = self.coalesced = self.errors = 0
+            self.abandoned = self.timeouts = self.max_waiters = 0
+
+    def stats(self):
+        """Returns a snapshot of the counters."""
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "abandoned": self.abandoned,
+                "timeouts": self.timeouts,
+                "max_waiters": self.max_waiters,
+                "coalesced_rate": self.coalesced / self.calls if self.calls else 0.0,
+            }
+
+
+def prompt_key(model, messages):
+    """Builds the single-flight key of an LLM completion: exactly the same model and messages."""
+    raw = json.dumps([model, messages], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+# Process-wide single-flight groups: one for status probes (keyed by server), one for OpenAI completions.
+probe_flight = SingleFlight("status probe")
+llm_flight = SingleFlight("LLM completion")
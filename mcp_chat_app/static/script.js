@@ -1,16 +1,47 @@
 // This file will contain JavaScript for chat interface interactivity.
 
-console.log("MCP Chat script (v2.1 - UI Refinements) loaded.");
+console.log("MCP Chat script (v2.6 - Live server status) loaded.");
 
 // Get DOM elements
 const chatBox = document.getElementById('chat-box');
 const messageInput = document.getElementById('message-input');
 const sendButton = document.getElementById('send-button');
 const serverSelect = document.getElementById('mcp-server-select'); // Server select dropdown
+const compareToggle = document.getElementById('compare-servers'); // Allows selecting several servers
+const serverSearch = document.getElementById('server-search'); // Filters the dropdown through /api/servers
+const liveStatus = document.getElementById('server-live-status'); // Live status of the selected servers
 
 // To keep track of the "Thinking..." message element
 let thinkingMessageElement = null;
 
+// The server-side conversation this page belongs to (set from the first reply, sent with every message).
+let conversationId = null;
+
+// The page only renders the first page of servers; the dropdown loads search results and further pages lazily.
+const SERVER_SEARCH_DELAY_MS = 250;
+let serverSearchTimer = null;
+let serverQuery = '';
+let serverPageRequest = 0; // Responses to superseded requests are ignored
+let lastServerSelection = [];
+
+// Status changes of the selected servers are pushed over /status/stream while they stay selected.
+let statusSource = null;
+let liveStatuses = new Map(); // server id -> latest pushed status
+
+// Use the streaming endpoint when the browser can read response bodies incrementally.
+const STREAMING_ENABLED = typeof ReadableStream !== 'undefined' && typeof TextDecoder !== 'undefined';
+
+function formatMessage(message) {
+    /**
+     * Applies basic Markdown-like formatting (bold and italic) to a complete message.
+     * @param {string} message - The raw message text.
+     * @returns {string} HTML for the message.
+     */
+    message = message.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>'); // Bold
+    message = message.replace(/\*(.*?)\*/g, '<em>$1</em>');       // Italic
+    return message;
+}
+
 function displayMessage(sender, message, messageType = 'normal') {
     /**
      * Displays a message in the chat box.
@@ -26,13 +57,9 @@ function displayMessage(sender, message, messageType = 'normal') {
     senderSpan.textContent = `${sender}:`;
     messageElement.appendChild(senderSpan);
 
-    // Basic Markdown-like formatting for bold and italic
-    message = message.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>'); // Bold
-    message = message.replace(/\*(.*?)\*/g, '<em>$1</em>');       // Italic
-
     const contentSpan = document.createElement('span');
     contentSpan.classList.add('content');
-    contentSpan.innerHTML = message; // Use innerHTML to render basic formatting
+    contentSpan.innerHTML = formatMessage(message); // Use innerHTML to render basic formatting
     messageElement.appendChild(contentSpan);
 
     chatBox.appendChild(messageElement);
@@ -54,19 +81,296 @@ function removeThinkingIndicator() {
     thinkingMessageElement = null;
 }
 
+async function readErrorMessage(response) {
+    /**
+     * Extracts the error message from a failed (non-2xx) backend response.
+     */
+    let errorMsg = `Failed to get response from server (HTTP ${response.status})`;
+    try {
+        const errorResult = await response.json();
+        if (errorResult && errorResult.error) {
+            errorMsg = errorResult.error;
+        }
+    } catch (e) {
+        // Could not parse JSON error, use default HTTP error.
+        console.warn("Could not parse JSON error response from server:", e);
+    }
+    return errorMsg;
+}
+
+function createStreamingMessage() {
+    /**
+     * Creates an empty LLM message whose text is appended to as deltas arrive.
+     * Deltas are buffered and flushed at most once per animation frame as plain text nodes,
+     * so streaming never re-runs the markdown regexes; formatting is applied once at the end.
+     */
+    const messageElement = displayMessage("LLM Assistant", "", "llm");
+    const contentSpan = messageElement.querySelector('.content');
+    let fullText = '';
+    let pendingText = '';
+    let flushScheduled = false;
+
+    function flush() {
+        flushScheduled = false;
+        if (pendingText) {
+            contentSpan.appendChild(document.createTextNode(pendingText));
+            pendingText = '';
+            chatBox.scrollTop = chatBox.scrollHeight;
+        }
+    }
+
+    return {
+        append(delta) {
+            fullText += delta;
+            pendingText += delta;
+            if (!flushScheduled) {
+                flushScheduled = true;
+                requestAnimationFrame(flush);
+            }
+        },
+        finish() {
+            pendingText = '';
+            if (fullText) {
+                contentSpan.innerHTML = formatMessage(fullText);
+            } else if (messageElement.parentNode === chatBox) {
+                chatBox.removeChild(messageElement); // Nothing arrived, e.g. an error before the first token
+            }
+            chatBox.scrollTop = chatBox.scrollHeight;
+        }
+    };
+}
+
+function selectedServerContext() {
+    /**
+     * Returns the server part of a chat request for the current selection:
+     * {server_id} for one server (or general chat), {server_ids} for "all" or several servers.
+     */
+    if (!serverSelect) return { server_id: "" };
+    const values = Array.from(serverSelect.selectedOptions, option => option.value).filter(value => value !== "");
+    if (values.includes('all')) return { server_ids: 'all' };
+    if (values.length > 1) return { server_ids: values };
+    return { server_id: values.length ? values[0] : "" };
+}
+
+function serverOption(server) {
+    const option = document.createElement('option');
+    option.value = server.id;
+    option.textContent = `${server.name} (${server.host}:${server.port})`;
+    return option;
+}
+
+function showServerPage(page, append) {
+    /**
+     * Puts a page from /api/servers into the dropdown. A new search replaces the listed servers,
+     * a further page is appended; the general and "all" entries and selected servers always stay.
+     */
+    const selected = new Set(Array.from(serverSelect.selectedOptions, option => option.value));
+    for (const option of Array.from(serverSelect.options)) {
+        const isServer = option.value !== '' && option.value !== 'all';
+        if (option.value === 'more' || option.dataset.noMatch || (!append && isServer && !selected.has(option.value))) {
+            option.remove();
+        }
+    }
+    const listed = new Set(Array.from(serverSelect.options, option => option.value));
+    for (const server of page.servers) {
+        if (!listed.has(String(server.id))) serverSelect.appendChild(serverOption(server));
+    }
+    if (page.next_offset !== null) {
+        const more = document.createElement('option');
+        more.value = 'more';
+        more.dataset.nextOffset = page.next_offset;
+        more.textContent = `Load more servers... (${page.total - page.next_offset} left)`;
+        serverSelect.appendChild(more);
+    } else if (page.total === 0) {
+        const none = document.createElement('option');
+        none.disabled = true;
+        none.dataset.noMatch = 'true';
+        none.textContent = `No servers match '${page.query}'`;
+        serverSelect.appendChild(none);
+    }
+}
+
+async function loadServerPage(query, offset = 0) {
+    /**
+     * Fetches one page of servers matching the query. The browser revalidates earlier pages with
+     * their ETag, so repeating a search costs a 304 while the server list is unchanged.
+     */
+    const requestNumber = ++serverPageRequest;
+    const params = new URLSearchParams({ q: query, offset: String(offset) });
+    try {
+        const response = await fetch(`/api/servers?${params}`);
+        if (!response.ok) {
+            console.warn("Could not load servers:", await readErrorMessage(response));
+            return;
+        }
+        const page = await response.json();
+        if (requestNumber === serverPageRequest) { // Skip if a newer search was started meanwhile
+            showServerPage(page, offset > 0);
+        }
+    } catch (error) {
+        console.warn("Could not load servers:", error);
+    }
+}
+
+function renderLiveStatus() {
+    /**
+     * Shows the pushed status of the selected server, or how many of several selected servers are online.
+     */
+    if (!liveStatus) return;
+    const statuses = Array.from(liveStatuses.values());
+    liveStatus.className = '';
+    if (statuses.length === 0) {
+        liveStatus.textContent = '';
+    } else if (statuses.length === 1) {
+        const status = statuses[0];
+        liveStatus.className = status.online ? 'online' : 'offline';
+        liveStatus.textContent = status.online
+            ? `\u25CF ${status.name} online ${status.player_count ?? '?'}/${status.player_max ?? '?'}`
+            : `\u25CB ${status.name} offline`;
+    } else {
+        const online = statuses.filter(status => status.online).length;
+        liveStatus.textContent = `${online}/${statuses.length} online`;
+    }
+}
+
+function followServerStatus() {
+    /**
+     * Subscribes to status changes of the selected servers (replacing any earlier subscription).
+     */
+    if (statusSource) {
+        statusSource.close();
+        statusSource = null;
+    }
+    liveStatuses = new Map();
+    renderLiveStatus();
+    const context = selectedServerContext();
+    const servers = context.server_ids === 'all' ? 'all'
+        : (context.server_ids || [context.server_id]).filter(id => id !== "" && id !== 'more').join(',');
+    if (!servers || typeof EventSource === 'undefined') return;
+
+    statusSource = new EventSource(`/status/stream?${new URLSearchParams({ servers })}`);
+    statusSource.addEventListener('status', event => {
+        const status = JSON.parse(event.data);
+        liveStatuses.set(status.id, status);
+        renderLiveStatus();
+    });
+}
+
+function handleServerSelection() {
+    /**
+     * Picking "Load more servers..." fetches the next page and keeps the previous selection.
+     * Any other selection starts following the selected servers' live status.
+     */
+    const more = Array.from(serverSelect.selectedOptions).find(option => option.value === 'more');
+    if (!more) {
+        lastServerSelection = Array.from(serverSelect.selectedOptions, option => option.value);
+        followServerStatus();
+        return;
+    }
+    for (const option of serverSelect.options) {
+        option.selected = lastServerSelection.includes(option.value);
+    }
+    loadServerPage(serverQuery, Number(more.dataset.nextOffset));
+}
+
+async function streamReply(messageText, serverContext) {
+    /**
+     * Sends the message to the streaming endpoint and renders the reply as it arrives.
+     * The response is a server-sent event stream (see /chat_with_llm/stream in app.py).
+     */
+    const response = await fetch('/chat_with_llm/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({
+            message: messageText,
+            conversation_id: conversationId,
+            ...serverContext
+        })
+    });
+
+    if (!response.ok) { // Validation errors (e.g. API key missing) come back as plain JSON
+        removeThinkingIndicator();
+        displayMessage("System", `Error: ${await readErrorMessage(response)}`, "error");
+        return;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let reply = null;
+
+    function handleEvent(eventName, payload) {
+        if (eventName === 'meta') {
+            if (payload.conversation_id) {
+                conversationId = payload.conversation_id;
+            }
+            if (payload.server_data_used) {
+                console.log("Server data used by LLM:", payload.server_data_used);
+            }
+        } else if (eventName === 'error') {
+            displayMessage("System", `Error: ${payload.error}`, "error");
+        } else if (eventName === 'message' && payload.delta) {
+            if (!reply) { // First token: swap the thinking indicator for the reply
+                removeThinkingIndicator();
+                reply = createStreamingMessage();
+            }
+            reply.append(payload.delta);
+        }
+    }
+
+    try {
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line; keep any partial event in the buffer.
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let eventName = 'message';
+                let data = '';
+                for (const line of rawEvent.split('\n')) {
+                    if (line.startsWith('event: ')) eventName = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                }
+                if (data) handleEvent(eventName, JSON.parse(data));
+            }
+        }
+    } finally {
+        removeThinkingIndicator();
+        if (reply) reply.finish();
+    }
+}
+
 async function sendMessage() {
     /**
      * Gets the message from input, selected server, displays user message,
      * shows thinking indicator, sends to backend, and displays LLM response or error.
+     * Uses the streaming endpoint when supported, so the reply appears token by token.
      */
     const messageText = messageInput.value.trim();
-    const selectedServerId = serverSelect ? serverSelect.value : "";
+    const serverContext = selectedServerContext();
 
     if (messageText) {
         displayMessage("You", messageText, "user"); // Use 'user' type
         messageInput.value = '';
         showThinkingIndicator();
 
+        if (STREAMING_ENABLED) {
+            try {
+                await streamReply(messageText, serverContext);
+            } catch (error) { // Network errors or other JS errors during the stream
+                removeThinkingIndicator();
+                console.error('Network error or other issue streaming message:', error);
+                displayMessage("System", `Network Error: Could not connect. ${error.message}`, "error");
+            }
+            return;
+        }
+
         try {
             const response = await fetch('/chat_with_llm', {
                 method: 'POST',
@@ -75,7 +379,8 @@ async function sendMessage() {
                 },
                 body: JSON.stringify({
                     message: messageText,
-                    server_id: selectedServerId
+                    conversation_id: conversationId,
+                    ...serverContext
                 })
             });
 
@@ -83,6 +388,9 @@ async function sendMessage() {
 
             if (response.ok) {
                 const result = await response.json();
+                if (result.conversation_id) {
+                    conversationId = result.conversation_id;
+                }
                 if (result.reply) {
                     displayMessage("LLM Assistant", result.reply, "llm"); // Use 'llm' type
                 } else if (result.error) { // Errors from the backend (e.g. API key missing)
@@ -93,17 +401,7 @@ async function sendMessage() {
                     // displayMessage("System", `(Debug: Server context used: ${JSON.stringify(result.server_data_used, null, 2)})`, "info");
                 }
             } else { // HTTP errors (e.g. 500, 400 from backend itself)
-                let errorMsg = `Failed to get response from server (HTTP ${response.status})`;
-                try {
-                    const errorResult = await response.json();
-                    if (errorResult && errorResult.error) {
-                        errorMsg = errorResult.error;
-                    }
-                } catch (e) {
-                    // Could not parse JSON error, use default HTTP error.
-                    console.warn("Could not parse JSON error response from server:", e);
-                }
-                displayMessage("System", `Error: ${errorMsg}`, "error");
+                displayMessage("System", `Error: ${await readErrorMessage(response)}`, "error");
             }
         } catch (error) { // Network errors or other JS errors during fetch
             removeThinkingIndicator();
@@ -114,6 +412,24 @@ async function sendMessage() {
 }
 
 // Event Listeners
+if (compareToggle && serverSelect) {
+    compareToggle.addEventListener('change', () => {
+        serverSelect.multiple = compareToggle.checked; // Ctrl/Cmd-click to pick several servers
+        serverSelect.size = compareToggle.checked ? Math.min(serverSelect.options.length, 6) : 0;
+    });
+}
+if (serverSelect) {
+    serverSelect.addEventListener('change', handleServerSelection);
+}
+if (serverSearch && serverSelect) {
+    serverSearch.addEventListener('input', () => {
+        clearTimeout(serverSearchTimer); // Search once the user pauses typing
+        serverSearchTimer = setTimeout(() => {
+            serverQuery = serverSearch.value.trim();
+            loadServerPage(serverQuery);
+        }, SERVER_SEARCH_DELAY_MS);
+    });
+}
 if (sendButton) {
     sendButton.addEventListener('click', sendMessage);
 }
@@ -0,0 +1,323 @@
+# This file contains a shared, bounded cache for Minecraft server status results.
+# It sits in front of MCPClient.get_server_status so that chat requests about the same
+# server do not each pay for a fresh lookup + status round trip.
+
+import threading
+import time
+from collections import OrderedDict
+
+from . import config # Cache sizing and TTLs live in config
+from .mcp_client import MCPClient
+from .server_status import is_unknown
+from .status_history import status_history
+
+
+class _CacheEntry:
+    """A single cached status result and its freshness bookkeeping."""
+    __slots__ = ('result', 'expires_at', 'stale_until', 'refreshing')
+
+    def __init__(self, result, expires_at, stale_until):
+        self.result = result
+        self.expires_at = expires_at    # Served as a fresh hit until this time
+        self.stale_until = stale_until  # Served as stale (while revalidating) until this time
+        self.refreshing = False         # True while a background refresh is in flight
+
+
+class StatusCache:
+    """
+    A thread-safe LRU cache of server status results, keyed by (host, port, type).
+
+    Online results are kept for `ttl` seconds and offline/error results for the
+    (usually shorter) `negative_ttl`. Once an entry expires it is still served for
+    up to `stale_ttl` more seconds while a background thread refreshes it, so a
+    caller only ever blocks on a ping when there is no recent result at all.
+    """
+
+    def __init__(self, ttl=None, negative_ttl=None, stale_ttl=None, max_entries=None,
+                 fetcher=None, history=None, clock=time.monotonic):
+        """
+        Args:
+            ttl (float): Seconds an online result is considered fresh.
+            negative_ttl (float): Seconds an offline/error result is considered fresh.
+            stale_ttl (float): Extra seconds an expired result may be served while it is refreshed.
+            max_entries (int): Maximum number of cached servers before LRU eviction.
+            fetcher (callable): Called as fetcher(host, port, timeout=..., server_type=...) on a miss.
+                                Defaults to MCPClient.get_server_status (looked up at call time).
+            history (StatusHistory): If given, every stored result is also appended to it.
+            clock (callable): Monotonic time source, injectable for tests.
+        """
+        self.ttl = config.STATUS_CACHE_TTL if ttl is None else ttl
+        self.negative_ttl = config.STATUS_CACHE_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        self.stale_ttl = config.STATUS_CACHE_STALE_TTL if stale_ttl is None else stale_ttl
+        self.max_entries = config.STATUS_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self._fetcher = fetcher
+        self._history = history
+        self._clock = clock
+
+        self._entries = OrderedDict() # key -> _CacheEntry, least recently used first
+        self._lock = threading.Lock()
+        self._listeners = [] # Called with (key, result) for every fresh result (see subscribe)
+
+        # Counters, exposed through stats()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+
+    @staticmethod
+    def make_key(host, port, server_type=None):
+        """Builds the cache key for a server. Host names are case-insensitive."""
+        return (host.lower(), int(port), server_type or 'Unknown')
+
+    def get(self, host, port, server_type=None, timeout=3):
+        """
+        Returns the status for a server, using the cache whenever possible.
+
+        Args:
+            host (str): The hostname or IP address of the server.
+            port (int): The port number of the server.
+            server_type (str): The configured server type (part of the cache key).
+            timeout (int): Timeout passed to the fetcher on a miss or refresh.
+
+        Returns:
+            ServerStatus: The status result, as returned by MCPClient.get_server_status.
+        """
+        key = self.make_key(host, port, server_type)
+        cached = self._get_cached(key, host, port, timeout)
+        if cached is not None:
+            return cached
+
+        # Fetch outside the lock so one slow server does not block lookups for others.
+        result = self._fetch(host, port, key[2], timeout)
+        return self.put(host, port, server_type, result)
+
+    async def async_get(self, host, port, server_type=None, timeout=3):
+        """
+        Async version of get() for use on an event loop. A miss awaits
+        MCPClient.async_get_server_status instead of blocking the loop.
+        Stale entries are still refreshed on a background thread.
+        """
+        key = self.make_key(host, port, server_type)
+        cached = self._get_cached(key, host, port, timeout)
+        if cached is not None:
+            return cached
+
+        result = await MCPClient.async_get_server_status(host, port, timeout=timeout, server_type=key[2])
+        return self.put(host, port, server_type, result)
+
+    def get_many(self, servers, timeout=3, deadline=None):
+        """
+        Returns the status of many servers. Cached results are used where possible and all
+        misses are probed concurrently in a single batch, so the time taken is bounded by
+        `deadline` rather than growing with the number of servers.
+
+        Args:
+            servers (list): Servers with 'host', 'port' and optional 'type' keys (e.g. ServerRecords).
+            timeout (int): Timeout in seconds for each probe.
+            deadline (float): Overall time budget in seconds for the probes (see MCPClient.get_many).
+
+        Returns:
+            list: One ServerStatus per server, in the same order as `servers`.
+        """
+        results, misses = self._get_many_cached(servers, timeout)
+        if misses:
+            fetched = MCPClient.get_many(misses, timeout=timeout, deadline=deadline)
+            self._fill_misses(results, misses, fetched)
+        return results
+
+    async def async_get_many(self, servers, timeout=3, deadline=None):
+        """Async version of get_many(); misses are probed with MCPClient.async_get_many."""
+        results, misses = self._get_many_cached(servers, timeout)
+        if misses:
+            fetched = await MCPClient.async_get_many(misses, timeout=timeout, deadline=deadline)
+            self._fill_misses(results, misses, fetched)
+        return results
+
+    def put(self, host, port, server_type, result):
+        """
+        Stores a status result, evicting the least recently used entries if needed.
+        Only fresh probe results are stored, so this is also where they are added to the history.
+        Placeholders for checks that didn't finish or were rate limited (see server_status.UnknownStatus)
+        are not stored.
+
+        Returns:
+            ServerStatus: The result to show: `result` itself, or for a placeholder the last real
+            result known for the server (even if expired), when there is one.
+        """
+        key = self.make_key(host, port, server_type)
+        if is_unknown(result):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refreshing = False
+                    return entry.result
+            return result
+        now = self._clock()
+        ttl = self.ttl if result.get("online") else self.negative_ttl
+        entry = _CacheEntry(result, now + ttl, now + ttl + self.stale_ttl)
+
+        with self._lock:
+            previous = self._entries.get(key)
+            # Callers that shared one probe (see single_flight.py) each store its result; record it once.
+            fresh = previous is None or previous.result is not result
+            if self._history is not None and fresh:
+                self._history.record(key, result)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        if fresh:
+            for listener in list(self._listeners):
+                listener(key, result)
+        return result
+
+    def subscribe(self, listener):
+        """
+        Registers listener(key, result) to be called with every fresh probe result stored. Listeners
+        run on the thread that stored the result (a request or the poller), so they must be quick.
+        """
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def invalidate(self, host, port, server_type=None):
+        """Drops the cached result for a server, if any."""
+        with self._lock:
+            self._entries.pop(self.make_key(host, port, server_type), None)
+
+    def clear(self):
+        """Drops all cached results and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.stale_hits = self.misses = self.evictions = self.refreshes = 0
+
+    def stats(self):
+        """Returns a snapshot of the cache counters."""
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "refreshes": self.refreshes,
+                "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            }
+
+    # --- Internal helpers ---
+    def _get_cached(self, key, host, port, timeout, stale=None):
+        """
+        Returns the cached result for a key, or None on a miss. Updates the hit/miss counters.
+        A stale entry is refreshed on a background thread, or, if a `stale` list is given,
+        appended to it so the caller can refresh several entries in one batch.
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now < entry.expires_at:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return entry.result
+                if now < entry.stale_until:
+                    self.stale_hits += 1
+                    self._entries.move_to_end(key)
+                    if not entry.refreshing:
+                        entry.refreshing = True
+                        if stale is not None:
+                            stale.append(key)
+                        else:
+                            self._start_refresh(key, host, port, timeout)
+                    return entry.result
+            self.misses += 1
+            return None
+
+    def _get_many_cached(self, servers, timeout):
+        """
+        Returns (results, misses): results has None in place of every server in `misses`.
+        Stale entries among the servers are refreshed together on one background thread.
+        """
+        results = []
+        misses = []
+        stale = []
+        for server in servers:
+            key = self.make_key(server['host'], server['port'], server.get('type'))
+            cached = self._get_cached(key, server['host'], server['port'], timeout, stale)
+            results.append(cached)
+            if cached is None:
+                misses.append(server)
+        if stale:
+            self._start_refresh_many(stale, timeout)
+        return results, misses
+
+    def _fill_misses(self, results, misses, fetched):
+        """
+        Stores freshly probed results. Placeholders of probes cut off by the deadline are not stored,
+        and the last known result is used in their place where there is one (see put).
+        """
+        fetched = iter(fetched)
+        misses = iter(misses)
+        for index, cached in enumerate(results):
+            if cached is None:
+                server, result = next(misses), next(fetched)
+                results[index] = self.put(server['host'], server['port'], server.get('type'), result)
+
+    def _fetch(self, host, port, server_type, timeout):
+        fetcher = self._fetcher or MCPClient.get_server_status
+        return fetcher(host, port, timeout=timeout, server_type=server_type)
+
+    def _start_refresh(self, key, host, port, timeout):
+        """Refreshes a stale entry on a daemon thread. Must be called with the lock held."""
+        self.refreshes += 1
+        thread = threading.Thread(target=self._refresh, args=(key, host, port, timeout),
+                                  name=f"status-refresh-{host}:{port}", daemon=True)
+        thread.start()
+
+    def _refresh(self, key, host, port, timeout):
+        try:
+            result = self._fetch(host, port, key[2], timeout)
+        except Exception as e: # The fetcher should not raise, but never kill the stale entry over it
+            print(f"Background status refresh for {host}:{port} failed: {e}")
+            self._refresh_done(key)
+            return
+        self.put(host, port, key[2], result)
+
+    def _start_refresh_many(self, keys, timeout):
+        """Refreshes several stale entries with one batch of probes on a single daemon thread."""
+        with self._lock:
+            self.refreshes += len(keys)
+        thread = threading.Thread(target=self._refresh_many, args=(keys, timeout),
+                                  name=f"status-refresh-{len(keys)}-servers", daemon=True)
+        thread.start()
+
+    def _refresh_many(self, keys, timeout):
+        servers = [{'host': host, 'port': port, 'type': server_type} for host, port, server_type in keys]
+        try:
+            if self._fetcher is not None:
+                results = [self._fetch(server['host'], server['port'], server['type'], timeout) for server in servers]
+            else:
+                results = MCPClient.get_many(servers, timeout=timeout)
+        except Exception as e: # See _refresh
+            print(f"Background status refresh of {len(keys)} servers failed: {e}")
+            for key in keys:
+                self._refresh_done(key)
+            return
+        for server, result in zip(servers, results):
+            self.put(server['host'], server['port'], server['type'], result)
+
+    def _refresh_done(self, key):
+        """Lets a stale entry be refreshed again after a refresh that didn't store a result."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.refreshing = False
+
+
+# Process-wide cache shared by all request threads. Its results feed the status history.
+status_cache = StatusCache(history=status_history)
@@ -0,0 +1,399 @@
+# This file contains an in-memory time series of server status results.
+# Every probe result stored in the shared status cache is appended here (online flag, latency and
+# player count), so status is no longer thrown away after one prompt. Recent samples are kept in a
+# fixed-size ring buffer and rolled up into 1 minute / 1 hour / 1 day buckets, so memory per server
+# stays bounded no matter how long the app runs. Reading history never touches the network.
+
+import math
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from . import config
+
+# Rollup resolutions: name -> bucket width in seconds, finest first.
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+
+class _Ring:
+    """
+    Parallel typed arrays with a fixed capacity; once full, the oldest slot is overwritten.
+    `COLUMNS` lists (name, array typecode) pairs.
+    """
+    COLUMNS = ()
+    __slots__ = ('capacity', 'columns', 'head', 'size', 'wrapped')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.columns = tuple(array(code) for _, code in self.COLUMNS)
+        self.head = 0 # Index of the oldest slot once the ring is full
+        self.size = 0
+        self.wrapped = False # True once a row has been overwritten
+
+    def push(self, *values):
+        """Appends a row (overwriting the oldest one when full) and returns its slot index."""
+        if self.size < self.capacity:
+            for column, value in zip(self.columns, values):
+                column.append(value)
+            self.size += 1
+            return self.size - 1
+        index = self.head
+        self.wrapped = True
+        for column, value in zip(self.columns, values):
+            column[index] = value
+        self.head = (index + 1) % self.capacity
+        return index
+
+    @property
+    def full(self):
+        return self.size == self.capacity
+
+    def last_index(self):
+        """Slot index of the newest row (the ring must not be empty)."""
+        return (self.head - 1) % self.capacity if self.full else self.size - 1
+
+    def indexes(self):
+        """Slot indexes from the oldest row to the newest."""
+        if not self.full:
+            return range(self.size)
+        return [(self.head + i) % self.capacity for i in range(self.capacity)]
+
+
+class _SampleRing(_Ring):
+    """Raw samples. Latency and player count are NaN when unknown (e.g. the server was offline)."""
+    COLUMNS = (('time', 'd'), ('online', 'b'), ('latency', 'f'), ('players', 'f'))
+    __slots__ = ()
+
+    def add(self, at, online, latency, players):
+        self.push(at, online, latency, players)
+
+    def rows(self, since):
+        times, online, latency, players = self.columns
+        for i in self.indexes():
+            if times[i] >= since:
+                yield times[i], online[i], latency[i], players[i]
+
+
+class _BucketRing(_Ring):
+    """Rollup buckets of a fixed width, aggregating every sample that falls into them."""
+    COLUMNS = (('start', 'd'), ('count', 'I'), ('online', 'I'), ('latency_sum', 'd'), ('latency_count', 'I'),
+               ('latency_max', 'f'), ('players_sum', 'd'), ('players_count', 'I'), ('players_max', 'f'))
+    __slots__ = ('width',)
+
+    def __init__(self, width, capacity):
+        super().__init__(capacity)
+        self.width = width
+
+    def add(self, at, online, latency, players):
+        start = at - at % self.width
+        has_latency, has_players = not math.isnan(latency), not math.isnan(players)
+        if self.size and start <= self.columns[0][self.last_index()]:
+            # Same bucket as the newest one (or a sample from a clock that stepped back): fold it in.
+            i = self.last_index()
+            (_, count, online_count, latency_sum, latency_count, latency_max,
+             players_sum, players_count, players_max) = self.columns
+            count[i] += 1
+            online_count[i] += online
+            if has_latency:
+                latency_sum[i] += latency
+                latency_count[i] += 1
+                latency_max[i] = latency if math.isnan(latency_max[i]) else max(latency_max[i], latency)
+            if has_players:
+                players_sum[i] += players
+                players_count[i] += 1
+                players_max[i] = players if math.isnan(players_max[i]) else max(players_max[i], players)
+            return
+        self.push(start, 1, online, latency if has_latency else 0.0, int(has_latency), latency,
+                  players if has_players else 0.0, int(has_players), players)
+
+    def rows(self, since):
+        """Yields (start, count, online, latency_avg, latency_max, players_avg, players_max) per bucket."""
+        (starts, count, online, latency_sum, latency_count, latency_max,
+         players_sum, players_count, players_max) = self.columns
+        for i in self.indexes():
+            if starts[i] + self.width > since:
+                yield (starts[i], count[i], online[i],
+                       latency_sum[i] / latency_count[i] if latency_count[i] else math.nan, latency_max[i],
+                       players_sum[i] / players_count[i] if players_count[i] else math.nan, players_max[i])
+
+
+class _Series:
+    """The raw samples and rollups of one server."""
+    __slots__ = ('lock', 'raw', 'rollups', 'first')
+
+    def __init__(self, raw_samples, bucket_counts):
+        self.lock = threading.Lock()
+        self.raw = _SampleRing(raw_samples)
+        self.rollups = {name: _BucketRing(RESOLUTIONS[name], bucket_counts[name]) for name in RESOLUTIONS}
+        self.first = None # Time of the earliest sample recorded (rollup buckets start before it)
+
+    def add(self, at, online, latency, players):
+        with self.lock:
+            if self.first is None or at < self.first:
+                self.first = at
+            self.raw.add(at, online, latency, players)
+            for rollup in self.rollups.values():
+                rollup.add(at, online, latency, players)
+
+    def covers(self, ring, since):
+        """Whether a ring still holds everything from `since` onwards."""
+        return ring.size and (not ring.wrapped or ring.columns[0][ring.head] <= since)
+
+
+def percentile(sorted_values, q):
+    """Returns the q-th percentile (0-100) of a sorted list, interpolating between ranks."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def describe_span(seconds):
+    """Formats a window length for the prompt, e.g. 'hour', '6 hours' or '2 days' (roughly rounded)."""
+    for unit, size in (('day', 86400), ('hour', 3600), ('minute', 60)):
+        if seconds >= size * 0.9: # 59 minutes of samples read as "the last hour"
+            amount = round(seconds / size)
+            return unit if amount == 1 else f"{amount} {unit}s"
+    return f"{int(seconds)} seconds"
+
+
+class StatusHistory:
+    """
+    A thread-safe store of per-server status history, keyed by the StatusCache key (host, port, type).
+
+    The newest `raw_samples` probes of each server are kept as they are. Every probe is also added to
+    1m/1h/1d rollup buckets (count, online count, latency and player averages and maxima), so windows
+    longer than the raw buffer are answered from the finest rollup that still covers them.
+    At most `max_series` servers are tracked; the least recently updated ones are dropped first.
+    """
+
+    def __init__(self, raw_samples=None, minute_buckets=None, hour_buckets=None, day_buckets=None,
+                 max_series=None, clock=time.time):
+        """
+        Args:
+            raw_samples (int): Raw probe results kept per server.
+            minute_buckets (int): 1 minute buckets kept per server.
+            hour_buckets (int): 1 hour buckets kept per server.
+            day_buckets (int): 1 day buckets kept per server.
+            max_series (int): Maximum number of servers tracked before LRU eviction.
+            clock (callable): Wall-clock time source (Unix timestamps), injectable for tests.
+        """
+        self.raw_samples = config.STATUS_HISTORY_RAW_SAMPLES if raw_samples is None else raw_samples
+        self.bucket_counts = {
+            '1m': config.STATUS_HISTORY_MINUTE_BUCKETS if minute_buckets is None else minute_buckets,
+            '1h': config.STATUS_HISTORY_HOUR_BUCKETS if hour_buckets is None else hour_buckets,
+            '1d': config.STATUS_HISTORY_DAY_BUCKETS if day_buckets is None else day_buckets,
+        }
+        self.max_series = config.STATUS_HISTORY_MAX_SERIES if max_series is None else max_series
+        self._clock = clock
+
+        self._series = OrderedDict() # key -> _Series, least recently updated first
+        self._lock = threading.Lock()
+        self.samples_recorded = 0
+        self.evictions = 0
+
+    def record(self, key, status, at=None):
+        """
+        Appends a status result to a server's history.
+
+        Args:
+            key (tuple): StatusCache.make_key(host, port, type) of the server.
+            status (ServerStatus): The probe result.
+            at (float): Unix timestamp of the probe. Defaults to now.
+        """
+        at = self._clock() if at is None else at
+        online = bool(status.get('online'))
+        latency = status.get('latency') if online else None
+        players = status.get('player_count') if online else None
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(self.raw_samples, self.bucket_counts)
+                while len(self._series) > self.max_series:
+                    self._series.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._series.move_to_end(key)
+            self.samples_recorded += 1
+        series.add(at, int(online), math.nan if latency is None else float(latency),
+                   math.nan if players is None else float(players))
+
+    def recent(self, key, limit=100):
+        """
+        Returns the newest raw samples of a server, oldest first.
+
+        Returns:
+            list: Dicts with 'time', 'online', 'latency' and 'player_count' (None when unknown).
+        """
+        series = self._get(key)
+        if series is None or limit <= 0:
+            return []
+        with series.lock:
+            rows = list(series.raw.rows(-math.inf))[-limit:]
+        return [{'time': t, 'online': bool(online), 'latency': _number(latency), 'player_count': _number(players)}
+                for t, online, latency, players in rows]
+
+    def buckets(self, key, resolution, window=None):
+        """
+        Returns the rollup buckets of a server, oldest first.
+
+        Args:
+            key (tuple): The server's StatusCache key.
+            resolution (str): One of RESOLUTIONS ('1m', '1h' or '1d').
+            window (float): Only buckets overlapping the last `window` seconds. Defaults to all of them.
+
+        Returns:
+            list: Dicts with 'start', 'samples', 'uptime', 'latency_avg', 'latency_max',
+                  'player_avg' and 'player_max'.
+        """
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution '{resolution}'. Use one of: {', '.join(RESOLUTIONS)}.")
+        series = self._get(key)
+        if series is None:
+            return []
+        since = -math.inf if window is None else self._clock() - window
+        with series.lock:
+            rows = list(series.rollups[resolution].rows(since))
+        return [{'start': start, 'samples': count, 'uptime': round(online / count * 100, 2),
+                 'latency_avg': _number(latency_avg), 'latency_max': _number(latency_max),
+                 'player_avg': _number(players_avg), 'player_max': _number(players_max)}
+                for start, count, online, latency_avg, latency_max, players_avg, players_max in rows]
+
+    def summary(self, key, window=3600, percentiles=(50, 90, 99)):
+        """
+        Summarises a server's history over the last `window` seconds.
+
+        Raw samples are used while the raw buffer still covers the window; otherwise the finest
+        rollup that does, in which case latency and player percentiles are over bucket averages.
+
+        Returns:
+            dict: 'window', 'resolution', 'samples', 'since' (oldest data point used), 'uptime' (percent),
+                  and 'latency' / 'player_count' with a value per percentile plus 'max'.
+                  Values are None when there is no data.
+        """
+        resolution, since, points = self._window(key, window)
+        total = sum(count for _, count, _, _, _ in points)
+        online = sum(online for _, _, online, _, _ in points)
+        result = {'window': window, 'resolution': resolution, 'samples': total,
+                  'since': points[0][0] if points else None,
+                  'uptime': round(online / total * 100, 2) if total else None}
+        for field, column in (('latency', 3), ('player_count', 4)):
+            values = sorted(point[column] for point in points if not math.isnan(point[column]))
+            stats = {f"p{q}": _rounded(percentile(values, q)) for q in percentiles}
+            stats['max'] = _rounded(values[-1]) if values else None
+            result[field] = stats
+        return result
+
+    def trend(self, key, field='player_count', window=3600):
+        """
+        Compares the average of `field` ('player_count' or 'latency') at the start of the window
+        with its average at the end (each over the outer fifth of the window).
+
+        Returns:
+            float: The change in percent, or None if there is not enough history to tell.
+        """
+        column = {'latency': 3, 'player_count': 4}[field]
+        _, since, points = self._window(key, window)
+        edge = window / 5
+        now = self._clock()
+        early = [p[column] for p in points if p[0] < since + edge and not math.isnan(p[column])]
+        late = [p[column] for p in points if p[0] >= now - edge and not math.isnan(p[column])]
+        if not early or not late:
+            return None
+        before, after = sum(early) / len(early), sum(late) / len(late)
+        if before <= 0:
+            return None
+        return (after - before) / before * 100
+
+    def describe(self, key):
+        """
+        Describes notable trends of a server in one sentence for an LLM prompt, e.g.
+        "Trends: player count up 40% in the last hour; uptime 99% over the last day."
+        Returns "" when there is nothing worth mentioning. Numbers are rounded, so the
+        text only changes when the trend does (it is part of the response cache key).
+        """
+        parts = []
+        window = config.STATUS_HISTORY_TREND_WINDOW
+        change = self.trend(key, 'player_count', window)
+        if change is not None and abs(change) >= config.STATUS_HISTORY_TREND_MIN_CHANGE:
+            direction = "up" if change > 0 else "down"
+            parts.append(f"player count {direction} {int(round(abs(change), -1)) or 10}% "
+                         f"in the last {describe_span(window)}")
+
+        uptime_window = config.STATUS_HISTORY_UPTIME_WINDOW
+        summary = self.summary(key, uptime_window, percentiles=(50,))
+        series = self._get(key)
+        if summary['samples'] >= config.STATUS_HISTORY_MIN_SAMPLES and series is not None:
+            # 'since' may be the start of a rollup bucket, hours before the first sample was taken
+            covered = min(self._clock() - max(summary['since'], series.first), uptime_window)
+            if covered >= 60:
+                parts.append(f"uptime {_format_percent(summary['uptime'])} over the last {describe_span(covered)}")
+                if summary['latency']['p50'] is not None:
+                    parts.append(f"median latency {int(round(summary['latency']['p50'], -1))} ms")
+
+        return f"Trends: {'; '.join(parts)}. " if parts else ""
+
+    def forget(self, key):
+        """Drops the history of a server, if any."""
+        with self._lock:
+            self._series.pop(key, None)
+
+    def clear(self):
+        """Drops all history and resets the counters."""
+        with self._lock:
+            self._series.clear()
+            self.samples_recorded = self.evictions = 0
+
+    def stats(self):
+        """Returns a snapshot of the store counters."""
+        with self._lock:
+            series = list(self._series.values())
+            stats = {"servers": len(series), "max_series": self.max_series,
+                     "samples_recorded": self.samples_recorded, "evictions": self.evictions}
+        stats["bytes"] = sum(column.itemsize * len(column) for s in series
+                             for ring in (s.raw, *s.rollups.values()) for column in ring.columns)
+        return stats
+
+    # --- Internal helpers ---
+    def _get(self, key):
+        with self._lock:
+            return self._series.get(key)
+
+    def _window(self, key, window):
+        """
+        Returns (resolution, since, points) for the last `window` seconds, where each point is
+        (time, count, online, latency, players) from the finest data that covers the window.
+        """
+        since = self._clock() - window
+        series = self._get(key)
+        if series is None:
+            return 'raw', since, []
+        with series.lock:
+            if series.covers(series.raw, since):
+                return 'raw', since, [(t, 1, online, latency, players)
+                                      for t, online, latency, players in series.raw.rows(since)]
+            for name, rollup in series.rollups.items():
+                if series.covers(rollup, since) or name == '1d':
+                    return name, since, [(start, count, online, latency, players)
+                                         for start, count, online, latency, _, players, _ in rollup.rows(since)]
+
+
+def _number(value):
+    """Converts a stored float to a JSON-friendly value (None for NaN)."""
+    return None if math.isnan(value) else round(value, 2)
+
+
+def _rounded(value):
+    return None if value is None else round(value, 2)
+
+
+def _format_percent(value):
+    """Formats an uptime percentage: whole numbers, except just below 100% where decimals matter."""
+    return f"{math.floor(value * 10) / 10:g}%" if 99 <= value < 100 else f"{int(value)}%"
+
+
+# Process-wide history, fed by the shared status cache.
+status_history = StatusHistory()
@@ -0,0 +1,236 @@
+# This file contains the optional background status poller.
+# It sweeps the configured MCP servers on a jittered, adaptive schedule and publishes an
+# immutable snapshot of their status, so request handlers can read status without any network I/O.
+
+import math
+import random
+import threading
+import time
+from collections import Counter, namedtuple
+from types import MappingProxyType
+
+from . import config
+from .mcp_client import MCPClient
+from .server_status import is_unknown
+from .status_cache import StatusCache, status_cache
+
+
+# One server's entry in a published snapshot.
+# `status` is a read-only mapping in the MCPClient.get_server_status format,
+# `checked_at` is a Unix timestamp and `next_check_in` the current polling interval in seconds.
+SnapshotEntry = namedtuple('SnapshotEntry', ['name', 'host', 'port', 'type', 'status', 'checked_at', 'next_check_in'])
+
+
+class StatusSnapshot:
+    """An immutable view of the latest known status of every polled server."""
+    __slots__ = ('entries', 'generated_at', 'sweeps')
+
+    def __init__(self, entries, generated_at, sweeps):
+        self.entries = MappingProxyType(entries) # (host, port, type) cache key -> SnapshotEntry
+        self.generated_at = generated_at
+        self.sweeps = sweeps
+
+    def get(self, host, port, server_type=None):
+        """Returns the SnapshotEntry for a server, or None if it has not been polled yet."""
+        return self.entries.get(StatusCache.make_key(host, port, server_type))
+
+    def to_dict(self):
+        """Returns a JSON-serialisable representation of the snapshot."""
+        return {
+            "generated_at": self.generated_at,
+            "sweeps": self.sweeps,
+            "servers": [
+                {"name": e.name, "host": e.host, "port": e.port, "type": e.type,
+                 "status": dict(e.status), "checked_at": e.checked_at, "next_check_in": e.next_check_in}
+                for e in self.entries.values()
+            ],
+        }
+
+
+class _Schedule:
+    """Per-server polling state used to adapt the interval."""
+    __slots__ = ('next_due', 'interval', 'online', 'flap_score')
+
+    def __init__(self, next_due, interval):
+        self.next_due = next_due
+        self.interval = interval
+        self.online = None     # Last observed online flag (None until the first probe)
+        self.flap_score = 0.0  # Decaying count of recent online/offline flips
+
+
+class StatusPoller:
+    """
+    Polls every configured server in the background and publishes a StatusSnapshot.
+
+    Intervals adapt per server: a server that recently flipped between online and
+    offline is polled every `fast_interval` seconds, while a stable server backs off
+    towards `stable_interval` (online) or `offline_interval` (long offline). Every
+    interval is jittered so that sweeps do not synchronise into bursts.
+    """
+
+    def __init__(self, servers_source=None, cache=None, base_interval=None, fast_interval=None,
+                 stable_interval=None, offline_interval=None, jitter=None, timeout=None,
+                 clock=time.monotonic, rng=None):
+        """
+        Args:
+            servers_source (callable): Returns the current servers (a ServerRegistry or a list of dicts).
+                                        Defaults to config.MCP_SERVERS.
+            cache (StatusCache): Cache to write results through to. Defaults to the shared status_cache.
+            base_interval (float): Interval in seconds for a server that has no history yet.
+            fast_interval (float): Interval in seconds for flapping servers.
+            stable_interval (float): Longest interval in seconds for a stable online server.
+            offline_interval (float): Longest interval in seconds for a server that stays offline.
+            jitter (float): Fraction by which each interval is randomly stretched or shrunk.
+            timeout (float): Timeout in seconds for each probe.
+            clock (callable): Monotonic time source, injectable for tests.
+            rng (random.Random): Random source for jitter, injectable for tests.
+        """
+        self._servers_source = servers_source or (lambda: config.MCP_SERVERS)
+        self._cache = cache if cache is not None else status_cache
+        self.base_interval = config.STATUS_POLLER_BASE_INTERVAL if base_interval is None else base_interval
+        self.fast_interval = config.STATUS_POLLER_FAST_INTERVAL if fast_interval is None else fast_interval
+        self.stable_interval = config.STATUS_POLLER_STABLE_INTERVAL if stable_interval is None else stable_interval
+        self.offline_interval = config.STATUS_POLLER_OFFLINE_INTERVAL if offline_interval is None else offline_interval
+        self.jitter = config.STATUS_POLLER_JITTER if jitter is None else jitter
+        self.timeout = config.STATUS_POLLER_TIMEOUT if timeout is None else timeout
+        self._clock = clock
+        self._rng = rng or random.Random()
+
+        self._schedules = {} # cache key -> _Schedule; only touched by the polling thread
+        self._servers = {}   # cache key -> server, rebuilt when the server list changes
+        self._servers_version = None
+        self._snapshot = StatusSnapshot({}, None, 0)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def snapshot(self):
+        """The latest published StatusSnapshot. Reading it never blocks or touches the network."""
+        return self._snapshot
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Starts the polling thread (no-op if it is already running)."""
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="status-poller", daemon=True)
+        self._thread.start()
+        print("Background status poller started.")
+
+    def stop(self, timeout=5):
+        """Stops the polling thread and waits for the current sweep to finish."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def poll_once(self):
+        """
+        Probes every server that is due and publishes a new snapshot.
+
+        Returns:
+            float: Seconds until the next server is due.
+        """
+        now = self._clock()
+        servers = self._current_servers()
+
+        # Forget servers that were removed from the configuration.
+        removed = [key for key in self._schedules if key not in servers]
+        for key in removed:
+            del self._schedules[key]
+
+        due = []
+        for key, server in servers.items():
+            schedule = self._schedules.get(key)
+            if schedule is None:
+                schedule = self._schedules[key] = _Schedule(now, self.base_interval)
+            if schedule.next_due <= now:
+                due.append((key, server))
+
+        if due:
+            due_servers = [server for _, server in due]
+            results = MCPClient.get_many(due_servers, timeout=self.timeout, deadline=self.sweep_deadline(due_servers))
+            self._publish(servers, due, results)
+        elif removed:
+            self._publish(servers, [], [])
+
+        if not self._schedules:
+            return self.base_interval
+        return max(min(s.next_due for s in self._schedules.values()) - self._clock(), 0)
+
+    def sweep_deadline(self, servers):
+        """
+        Returns a deadline in seconds that lets a sweep of `servers` finish: the probes run in waves
+        of config.MCP_PROBE_CONCURRENCY (and config.MCP_PROBE_PER_HOST_LIMIT per host), each of which
+        may take up to the probe timeout.
+        """
+        per_host = Counter(server['host'].lower() for server in servers)
+        waves = max(math.ceil(len(servers) / config.MCP_PROBE_CONCURRENCY),
+                    math.ceil(max(per_host.values(), default=0) / config.MCP_PROBE_PER_HOST_LIMIT))
+        return waves * self.timeout + 1
+
+    # --- Internal helpers ---
+    def _current_servers(self):
+        """
+        Returns {cache key: server} for the configured servers. With a ServerRegistry source the
+        map is only rebuilt when the registry version changes, so idle sweeps over thousands of
+        servers don't re-key every server each second.
+        """
+        source = self._servers_source()
+        version = getattr(source, 'version', None)
+        if version is None or version != self._servers_version:
+            self._servers = {StatusCache.make_key(server['host'], server['port'], server.get('type')): server
+                             for server in list(source)}
+            self._servers_version = version
+        return self._servers
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                wait = self.poll_once()
+            except Exception as e: # Keep polling even if one sweep fails unexpectedly
+                print(f"Status poller sweep failed: {e}")
+                wait = self.base_interval
+            self._stop_event.wait(min(max(wait, 0.1), 1.0)) # Re-check at least every second for new servers
+
+    def _publish(self, servers, due, results):
+        now = self._clock()
+        checked_at = time.time()
+        entries = {key: entry for key, entry in self._snapshot.entries.items() if key in servers}
+
+        for (key, server), result in zip(due, results):
+            schedule = self._schedules[key]
+            if is_unknown(result): # Cut off by the deadline or rate limited: keep the last entry and try again soon
+                schedule.next_due = now + self.fast_interval
+                continue
+            self._reschedule(schedule, bool(result.get("online")), now)
+            self._cache.put(server['host'], server['port'], server.get('type'), result)
+            entries[key] = SnapshotEntry(server.get('name'), server['host'], server['port'], server.get('type'),
+                                         MappingProxyType(dict(result)), checked_at, round(schedule.interval, 2))
+
+        # Publishing is a single reference swap, so readers always see a complete snapshot.
+        self._snapshot = StatusSnapshot(entries, checked_at, self._snapshot.sweeps + 1)
+
+    def _reschedule(self, schedule, online, now):
+        flipped = schedule.online is not None and schedule.online != online
+        schedule.flap_score = schedule.flap_score * 0.5 + (1.0 if flipped else 0.0)
+        schedule.online = online
+
+        if schedule.flap_score >= 0.5:
+            interval = self.fast_interval
+        elif online:
+            interval = min(max(schedule.interval, self.base_interval) * 1.5, self.stable_interval)
+        else:
+            interval = min(max(schedule.interval, self.base_interval) * 2, self.offline_interval)
+        schedule.interval = interval
+
+        spread = interval * self.jitter
+        schedule.next_due = now + interval + self._rng.uniform(-spread, spread)
+
+
+# Process-wide poller. It only runs if started (see config.STATUS_POLLER_ENABLED).
+status_poller = StatusPoller()
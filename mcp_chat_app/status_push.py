@@ -0,0 +1,307 @@
+# This file contains the live status push channel (/status/stream).
+# The chat page used to learn a server's state only by sending a message, which triggered a fresh
+# probe. Now every fresh status result (from the background poller or a chat turn) is compared with
+# what subscribers were last told, and meaningful changes (online/offline flips, player count moves
+# past a threshold) are pushed to the browsers that subscribed to the server as server-sent events.
+# Changes are coalesced per tick, and each event is encoded once and shared by every subscriber of
+# the server, so thousands of open tabs cost a queue append each per tick.
+
+import asyncio
+import json
+import threading
+from collections import deque
+
+from . import config
+from .status_cache import StatusCache
+
+# Sent to idle streams so proxies keep them open and closed connections are noticed.
+HEARTBEAT = b": keep-alive\n\n"
+
+
+def parse_server_ids(value):
+    """
+    Parses the 'servers' parameter of a subscription: "all" (or empty) or comma-separated server IDs.
+
+    Returns:
+        frozenset: The server IDs, or None for all servers.
+
+    Raises:
+        ValueError: If an ID isn't a non-negative integer.
+    """
+    value = (value or '').strip()
+    if value in ('', 'all'):
+        return None
+    ids = [part.strip() for part in value.split(',') if part.strip()]
+    if not all(part.isdigit() for part in ids):
+        raise ValueError("servers must be \"all\" or comma-separated server IDs")
+    return frozenset(int(part) for part in ids)
+
+
+def status_fields(result):
+    """The status fields pushed to browsers (a small subset of a ServerStatus)."""
+    return {"online": bool(result.get('online')), "player_count": result.get('player_count'),
+            "player_max": result.get('player_max')}
+
+
+def encode_event(payload, event='status'):
+    """Encodes one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode('utf-8')
+
+
+class Subscriber:
+    """
+    One open status stream: the servers it follows and the encoded events waiting to be sent.
+    The stream is read with next() on a request thread or async_next() on the event loop.
+    """
+    __slots__ = ('ids', 'dropped', '_queue', '_lock', '_event', '_loop', '_future')
+
+    def __init__(self, ids, backlog):
+        self.ids = ids # frozenset of server IDs, or None for all servers
+        self.dropped = 0 # Chunks dropped because the client read too slowly
+        self._queue = deque(maxlen=backlog)
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._loop = None
+        self._future = None
+
+    def push(self, data):
+        """Queues encoded events (shared bytes, not copied) and wakes the reader."""
+        with self._lock:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(data)
+            future, self._future = self._future, None
+        self._event.set()
+        if future is not None:
+            try:
+                self._loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError: # The reader's event loop has been closed
+                pass
+
+    def next(self, timeout):
+        """Waits up to `timeout` seconds for events. Returns them as bytes, or None if there were none."""
+        self._event.wait(timeout)
+        return self._drain()
+
+    async def async_next(self, timeout):
+        """Async version of next()."""
+        with self._lock:
+            if not self._queue:
+                self._loop = asyncio.get_running_loop()
+                self._future = self._loop.create_future()
+            future = self._future
+        if future is not None:
+            try:
+                await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._drain()
+
+    def _drain(self):
+        with self._lock:
+            self._event.clear()
+            self._future = None
+            if not self._queue:
+                return None
+            data = b"".join(self._queue)
+            self._queue.clear()
+            return data
+
+
+def _wake(future):
+    if not future.done(): # The reader may have timed out or been cancelled meanwhile
+        future.set_result(None)
+
+
+class StatusBroadcaster:
+    """
+    Turns fresh status results into change events and fans them out to subscribers.
+
+    observe() is registered as a status cache listener. A change is an online/offline flip or a
+    player count moving by at least max(player_change, player_change_ratio * the count last pushed).
+    Changes are collected until the next tick; several changes of one server within a tick become
+    a single event with its latest state.
+    """
+
+    def __init__(self, servers_source=None, tick=None, player_change=None, player_change_ratio=None,
+                 backlog=None, max_subscribers=None):
+        """
+        Args:
+            servers_source (callable): Returns the current ServerRegistry. Defaults to config.MCP_SERVERS.
+            tick (float): Seconds between pushes; changes within a tick are coalesced.
+            player_change (int): Smallest player count change that is pushed.
+            player_change_ratio (float): Smallest player count change pushed, relative to the last pushed count.
+            backlog (int): Unread chunks kept per subscriber before the oldest are dropped.
+            max_subscribers (int): Open streams allowed at once.
+        """
+        self._servers_source = servers_source or (lambda: config.MCP_SERVERS)
+        self.tick = config.STATUS_PUSH_TICK if tick is None else tick
+        self.player_change = config.STATUS_PUSH_PLAYER_CHANGE if player_change is None else player_change
+        self.player_change_ratio = (config.STATUS_PUSH_PLAYER_CHANGE_RATIO if player_change_ratio is None
+                                    else player_change_ratio)
+        self.backlog = config.STATUS_PUSH_MAX_BACKLOG if backlog is None else backlog
+        self.max_subscribers = config.STATUS_PUSH_MAX_SUBSCRIBERS if max_subscribers is None else max_subscribers
+
+        self._latest = {}    # cache key -> status fields of the latest result (for new subscribers)
+        self._pushed = {}    # cache key -> status fields last pushed (the baseline for changes)
+        self._pending = {}   # cache key -> (status fields, set of changes) waiting for the next tick
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._index = {}     # cache key -> ServerRecords with that address, rebuilt when the registry changes
+        self._index_version = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # Counters
+        self.changes = 0
+        self.ticks = 0
+        self.events = 0
+        self.bytes_encoded = 0
+        self.deliveries = 0
+
+    # --- Producer side ---
+    def observe(self, key, result):
+        """Status cache listener: records a fresh result and queues it if it is a change."""
+        fields = status_fields(result)
+        with self._lock:
+            self._latest[key] = fields
+            changes = self._changes(self._pushed.get(key), fields)
+            if not changes:
+                return
+            self._pushed[key] = fields
+            pending = self._pending.get(key)
+            self._pending[key] = (fields, pending[1] | changes if pending else changes)
+            self.changes += 1
+
+    def _changes(self, pushed, fields):
+        if pushed is None or pushed['online'] != fields['online']:
+            return {'online'}
+        before, after = pushed['player_count'], fields['player_count']
+        if fields['online'] and before is not None and after is not None:
+            if abs(after - before) >= max(self.player_change, self.player_change_ratio * before):
+                return {'players'}
+        return set()
+
+    # --- Subscriptions ---
+    def subscribe(self, ids, max_subscribers=None):
+        """
+        Opens a stream for the given server IDs (None for all servers).
+
+        Args:
+            ids (frozenset): Server IDs to follow, or None for all servers.
+            max_subscribers (int): A lower cap on open streams than self.max_subscribers (optional).
+
+        Returns:
+            Subscriber: The stream, or None if the maximum number of streams are already open.
+        """
+        limit = self.max_subscribers if max_subscribers is None else min(max_subscribers, self.max_subscribers)
+        subscriber = Subscriber(ids, self.backlog)
+        with self._lock:
+            if len(self._subscribers) >= limit:
+                return None
+            self._subscribers.add(subscriber)
+        self.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def initial_events(self, ids):
+        """The current state of the subscribed servers that have been probed, encoded as events."""
+        registry = self._servers_source()
+        records = registry.all() if ids is None else [record for record in map(registry.get, ids) if record]
+        with self._lock:
+            latest = [(record, self._latest.get(StatusCache.make_key(record.host, record.port, record.type)))
+                      for record in records]
+        return b"".join(encode_event(dict(fields, id=record.id, name=record.name, changed=[]))
+                        for record, fields in latest if fields is not None)
+
+    # --- Fan-out ---
+    def flush(self):
+        """
+        Pushes the changes collected since the last tick. Each server's event is encoded once, and
+        subscribers following the same servers share one joined chunk.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            subscribers = list(self._subscribers)
+            self.ticks += 1
+        if not pending or not subscribers:
+            return
+        index = self._records_by_key()
+        events = {} # server ID -> encoded event
+        for key, (fields, changes) in pending.items():
+            for record in index.get(key, ()):
+                events[record.id] = encode_event(dict(fields, id=record.id, name=record.name, changed=sorted(changes)))
+        if not events:
+            return
+        chunks = {None: b"".join(events.values())} # Subscription (frozenset of IDs or None) -> shared chunk
+        delivered = 0
+        for subscriber in subscribers:
+            chunk = chunks.get(subscriber.ids)
+            if chunk is None:
+                chunk = chunks[subscriber.ids] = b"".join(events[i] for i in subscriber.ids if i in events)
+            if chunk:
+                subscriber.push(chunk)
+                delivered += 1
+        with self._lock:
+            self.events += len(events)
+            self.bytes_encoded += sum(len(event) for event in events.values())
+            self.deliveries += delivered
+
+    def _records_by_key(self):
+        registry = self._servers_source()
+        version = getattr(registry, 'version', None)
+        if version is None or version != self._index_version:
+            index = {}
+            for record in registry:
+                index.setdefault(StatusCache.make_key(record.host, record.port, record.type), []).append(record)
+            self._index, self._index_version = index, version
+        return self._index
+
+    # --- Ticker thread ---
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Starts the ticker thread (no-op if it is already running)."""
+        with self._lock:
+            if self.running:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="status-push", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.tick):
+            try:
+                self.flush()
+            except Exception as e: # Keep pushing even if one tick fails unexpectedly
+                print(f"Status push tick failed: {e}")
+
+    def clear(self):
+        """Forgets known states and pending changes and resets the counters (open streams stay open)."""
+        with self._lock:
+            self._latest.clear()
+            self._pushed.clear()
+            self._pending.clear()
+            self.changes = self.ticks = self.events = self.bytes_encoded = self.deliveries = 0
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "running": self.running, "tick": self.tick,
+                    "pending": len(self._pending), "changes": self.changes, "ticks": self.ticks,
+                    "events": self.events, "bytes_encoded": self.bytes_encoded, "deliveries": self.deliveries,
+                    "dropped": sum(subscriber.dropped for subscriber in self._subscribers)}
+
+
+# Process-wide broadcaster behind /status/stream. app.py registers its observe() with the status cache.
+status_push = StatusBroadcaster()
@@ -0,0 +1,368 @@
+# This file contains the sweep engine that probes very large fleets across several worker processes.
+# One process probing tens of thousands of servers is CPU-bound on protocol parsing and MOTD
+# decoding, whatever its event loop does. Here the servers are sharded by host across a pool of
+# worker processes, each running its own event loop (MCPClient.async_get_server_status with the
+# usual global and per-host limits). Results stream back in batches over pipes in a compact binary
+# format (see encode_batch) instead of pickled dicts, so the parent does little more than decode.
+#
+# Usage (from the project root), sweeping the configured servers or a server file:
+#   python -m mcp_chat_app.sweep --workers 8 --concurrency 256
+#   python -m mcp_chat_app.sweep --file servers.csv --timeout 2
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import struct
+import time
+import zlib
+from multiprocessing.connection import wait as wait_for_connections
+
+from . import config
+from .server_status import EDITION_BEDROCK, EDITION_JAVA, ServerStatus, edition_for_type
+from .status_history import percentile
+
+# --- Wire format ---
+# A batch is a record count followed by that many records. Each record is:
+#   index (uint32), probe time in seconds (float64), flags (uint8: online, Bedrock edition),
+#   presence mask (uint16, one bit per optional field below), then the present fields in order:
+#   integers as int64, floats as float64, strings as uint16 length + UTF-8, string lists as a
+#   uint16 count followed by strings.
+_OPTIONAL_FIELDS = (
+    ('version', 's'), ('protocol_version', 'i'), ('motd', 's'), ('player_count', 'i'), ('player_max', 'i'),
+    ('players', 'l'), ('map_name', 's'), ('gamemode', 's'), ('latency', 'f'), ('resolve_ms', 'f'), ('error', 's'),
+)
+_COUNT = struct.Struct('<I')
+_HEADER = struct.Struct('<IdBH')
+_INT = struct.Struct('<q') # Servers report whatever player_max they like, so not int32
+_FLOAT = struct.Struct('<d')
+_LENGTH = struct.Struct('<H')
+_FLAG_ONLINE = 1
+_FLAG_BEDROCK = 2
+_MAX_STRING = 0xFFFF
+
+
+def _pack_string(out, value):
+    data = str(value).encode('utf-8')[:_MAX_STRING]
+    out += _LENGTH.pack(len(data))
+    out += data
+
+
+def encode_record(index, elapsed, status):
+    """Encodes one probe result (see the wire format above). Returns bytes."""
+    flags = (_FLAG_ONLINE if status.online else 0) | (_FLAG_BEDROCK if status.edition == EDITION_BEDROCK else 0)
+    mask = 0
+    body = bytearray()
+    for bit, (field, kind) in enumerate(_OPTIONAL_FIELDS):
+        value = getattr(status, field)
+        if value is None:
+            continue
+        mask |= 1 << bit
+        if kind == 'i':
+            body += _INT.pack(value)
+        elif kind == 'f':
+            body += _FLOAT.pack(value)
+        elif kind == 's':
+            _pack_string(body, value)
+        else:
+            body += _LENGTH.pack(len(value))
+            for item in value:
+                _pack_string(body, item)
+    return _HEADER.pack(index, elapsed, flags, mask) + bytes(body)
+
+
+def encode_result(index, elapsed, status):
+    """
+    Like encode_record, but a result that can't be encoded (e.g. a number beyond int64) becomes an
+    offline record saying so, so one odd server doesn't take down the rest of its worker's shard.
+    """
+    try:
+        return encode_record(index, elapsed, status)
+    except (struct.error, TypeError, ValueError) as e:
+        return encode_record(index, elapsed, ServerStatus.offline(f"Status result could not be encoded: {e}",
+                                                                  edition=status.edition))
+
+
+def encode_batch(records):
+    """Joins encoded records into one batch message."""
+    return _COUNT.pack(len(records)) + b''.join(records)
+
+
+def decode_batch(data):
+    """
+    Decodes a batch message.
+
+    Returns:
+        list: (index, elapsed, ServerStatus) tuples, in the order they were encoded.
+    """
+    view = memoryview(data)
+    (count,) = _COUNT.unpack_from(view, 0)
+    offset = _COUNT.size
+    results = []
+
+    def read_string():
+        nonlocal offset
+        (length,) = _LENGTH.unpack_from(view, offset)
+        offset += _LENGTH.size
+        value = bytes(view[offset:offset + length]).decode('utf-8', errors='replace')
+        offset += length
+        return value
+
+    for _ in range(count):
+        index, elapsed, flags, mask = _HEADER.unpack_from(view, offset)
+        offset += _HEADER.size
+        fields = {'edition': EDITION_BEDROCK if flags & _FLAG_BEDROCK else EDITION_JAVA}
+        for bit, (field, kind) in enumerate(_OPTIONAL_FIELDS):
+            if not mask & (1 << bit):
+                continue
+            if kind == 'i':
+                (fields[field],) = _INT.unpack_from(view, offset)
+                offset += _INT.size
+            elif kind == 'f':
+                (fields[field],) = _FLOAT.unpack_from(view, offset)
+                offset += _FLOAT.size
+            elif kind == 's':
+                fields[field] = read_string()
+            else:
+                (length,) = _LENGTH.unpack_from(view, offset)
+                offset += _LENGTH.size
+                fields[field] = [read_string() for _ in range(length)]
+        results.append((index, elapsed, ServerStatus(bool(flags & _FLAG_ONLINE), **fields)))
+    return results
+
+
+# --- Worker processes ---
+def shard_for(host, shards):
+    """Picks the shard of a host. All servers on one host share a worker, so its DNS cache and per-host limit apply."""
+    return zlib.crc32(host.lower().encode('utf-8')) % shards
+
+
+async def _probe_shard(servers, conn, options):
+    """Probes one shard's servers concurrently and sends the results back in batches as they finish."""
+    from .mcp_client import MCPClient # Imported in the worker, so the parent doesn't need mcstatus loaded
+
+    global_limit = asyncio.Semaphore(options['concurrency'])
+    host_limits = {}
+    pending = []
+    last_flush = time.monotonic()
+
+    def flush():
+        nonlocal last_flush
+        if pending:
+            conn.send_bytes(encode_batch(pending))
+            pending.clear()
+        last_flush = time.monotonic()
+
+    async def probe(index, host, port, server_type):
+        host_limit = host_limits.setdefault(host.lower(), asyncio.Semaphore(options['per_host_limit']))
+        async with global_limit, host_limit:
+            started = time.perf_counter()
+            status = await MCPClient.async_get_server_status(host, port, timeout=options['timeout'],
+                                                           server_type=server_type)
+            elapsed = time.perf_counter() - started
+        pending.append(encode_result(index, elapsed, status))
+        if len(pending) >= options['batch_size'] or time.monotonic() - last_flush >= options['flush_interval']:
+            flush()
+
+    await asyncio.gather(*(probe(*server) for server in servers))
+    flush()
+
+
+def _worker_main(servers, conn, options):
+    """Entry point of a worker process: probes its shard, then closes the pipe (which marks it done)."""
+    try:
+        asyncio.run(_probe_shard(servers, conn, options))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+
+
+# --- Parent side ---
+class SweepReport:
+    """The outcome of a sweep: one ServerStatus per server plus throughput and probe time statistics."""
+
+    def __init__(self, servers, results, durations, elapsed, workers, wire_bytes):
+        self.servers = servers
+        self.results = results       # ServerStatus per server, in the order of `servers`
+        self.durations = durations   # Seconds per completed probe, as measured in the workers
+        self.elapsed = elapsed
+        self.workers = workers
+        self.wire_bytes = wire_bytes # Bytes received from the workers
+
+    @property
+    def online(self):
+        return sum(1 for result in self.results if result.online)
+
+    def to_dict(self):
+        durations = sorted(self.durations)
+        ms = lambda pct: round(percentile(durations, pct) * 1000, 1) if durations else None
+        return {
+            "servers": len(self.servers),
+            "online": self.online,
+            "offline": len(self.servers) - self.online,
+            "workers": self.workers,
+            "elapsed_s": round(self.elapsed, 3),
+            "probes_per_second": round(len(self.servers) / self.elapsed, 1) if self.elapsed else None,
+            "p50_ms": ms(50),
+            "p95_ms": ms(95),
+            "p99_ms": ms(99),
+            "max_ms": round(durations[-1] * 1000, 1) if durations else None,
+            "wire_bytes_per_result": round(self.wire_bytes / len(self.servers), 1) if self.servers else None,
+        }
+
+
+class SweepEngine:
+    """
+    Probes a list of servers across a pool of worker processes, each with its own event loop.
+
+    Workers are started per sweep and exit when their shard is done, so the engine holds no
+    processes between sweeps.
+    """
+
+    def __init__(self, workers=None, concurrency=None, per_host_limit=None, timeout=None, batch_size=None,
+                 flush_interval=None, start_method=None):
+        """
+        Args:
+            workers (int): Number of worker processes (0 or None: config.SWEEP_WORKERS, where 0 means one per CPU).
+            concurrency (int): Probes in flight at once in each worker.
+            per_host_limit (int): Probes in flight against a single host.
+            timeout (float): Timeout in seconds for each probe.
+            batch_size (int): Results per batch sent back by a worker.
+            flush_interval (float): Seconds after which a worker sends a partial batch anyway.
+            start_method (str): multiprocessing start method ('spawn', 'forkserver' or 'fork').
+        """
+        workers = workers or config.SWEEP_WORKERS
+        self.workers = workers or os.cpu_count() or 1
+        self.concurrency = concurrency or config.SWEEP_CONCURRENCY_PER_WORKER
+        self.per_host_limit = per_host_limit or config.SWEEP_PER_HOST_LIMIT
+        self.timeout = timeout or config.SWEEP_PROBE_TIMEOUT
+        self.batch_size = batch_size or config.SWEEP_BATCH_SIZE
+        self.flush_interval = config.SWEEP_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._context = multiprocessing.get_context(start_method or config.SWEEP_START_METHOD)
+
+        # Counters
+        self.sweeps = 0
+        self.wire_bytes = 0 # Bytes received from workers over all sweeps
+
+    def iter_batches(self, servers, deadline=None):
+        """
+        Starts the workers and yields decoded result batches as they arrive.
+
+        Args:
+            servers (list): Servers with 'host', 'port' and optional 'type' keys (dicts or ServerRecords).
+            deadline (float): Overall time budget in seconds; workers still running then are stopped.
+
+        Yields:
+            list: (index into `servers`, probe seconds, ServerStatus) tuples. Servers whose worker
+                  died or missed the deadline are yielded last with an offline result and no probe time.
+        """
+        shards = [[] for _ in range(min(self.workers, len(servers)) or 1)]
+        for index, server in enumerate(servers):
+            shards[shard_for(server['host'], len(shards))].append(
+                (index, server['host'], int(server['port']), server.get('type')))
+        options = {'concurrency': self.concurrency, 'per_host_limit': self.per_host_limit, 'timeout': self.timeout,
+                   'batch_size': self.batch_size, 'flush_interval': self.flush_interval}
+
+        processes = {}
+        for shard in shards:
+            if not shard:
+                continue
+            reader, writer = self._context.Pipe(duplex=False)
+            process = self._context.Process(target=_worker_main, args=(shard, writer, options), daemon=True)
+            process.start()
+            writer.close() # Only the worker writes; its exit then shows up as EOF here
+            processes[reader] = process
+
+        missing = set(range(len(servers)))
+        deadline_at = time.monotonic() + deadline if deadline is not None else None
+        try:
+            while processes:
+                remaining = None if deadline_at is None else deadline_at - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                for reader in wait_for_connections(list(processes), timeout=remaining):
+                    try:
+                        data = reader.recv_bytes()
+                    except (EOFError, OSError): # Shard done (or the worker died)
+                        processes.pop(reader).join()
+                        reader.close()
+                        continue
+                    batch = decode_batch(data)
+                    self.wire_bytes += len(data)
+                    for index, _, _ in batch:
+                        missing.discard(index)
+                    yield batch
+        finally:
+            for reader, process in processes.items(): # Past the deadline, or the caller stopped iterating
+                process.terminate()
+                process.join()
+                reader.close()
+
+        if missing:
+            reason = ("Status check did not finish within the sweep deadline." if processes
+                      else "The sweep worker probing this server exited unexpectedly.")
+            yield [(index, None, ServerStatus.offline(reason, edition=edition_for_type(servers[index].get('type'))))
+                   for index in sorted(missing)]
+
+    def sweep(self, servers, deadline=None):
+        """
+        Probes all servers and waits for the results.
+
+        Returns:
+            SweepReport: Results in the order of `servers`, with throughput and probe time statistics.
+        """
+        servers = list(servers)
+        results = [None] * len(servers)
+        durations = []
+        wire_bytes_before = self.wire_bytes
+        started = time.perf_counter()
+        for batch in self.iter_batches(servers, deadline):
+            for index, elapsed, status in batch:
+                results[index] = status
+                if elapsed is not None:
+                    durations.append(elapsed)
+        self.sweeps += 1
+        return SweepReport(servers, results, durations, time.perf_counter() - started, min(self.workers, len(servers)),
+                           self.wire_bytes - wire_bytes_before)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Probe all configured servers across several worker processes.")
+    parser.add_argument('--file', help="Sweep the servers in this CSV, JSON or NDJSON file instead of the configured ones.")
+    parser.add_argument('--workers', type=int, default=0, help="Worker processes (default: one per CPU core).")
+    parser.add_argument('--concurrency', type=int, help="Probes in flight per worker.")
+    parser.add_argument('--per-host-limit', type=int, help="Probes in flight against one host.")
+    parser.add_argument('--timeout', type=float, help="Timeout in seconds per probe.")
+    parser.add_argument('--deadline', type=float, help="Overall time budget in seconds.")
+    parser.add_argument('--start-method', choices=('spawn', 'forkserver', 'fork'), help="How workers are started.")
+    args = parser.parse_args()
+
+    if args.file:
+        from .server_io import detect_format, import_servers
+        from .server_registry import ServerRegistry
+        servers = ServerRegistry()
+        with open(args.file, 'rb') as f:
+            import_servers(servers, f, detect_format(filename=args.file))
+    else:
+        from .app import initialize_app_config # Loads persisted or default servers
+        initialize_app_config()
+        servers = config.MCP_SERVERS
+    servers = list(servers)
+    if not servers:
+        print("No servers to sweep.")
+        return
+
+    engine = SweepEngine(args.workers, args.concurrency, args.per_host_limit, args.timeout,
+                         start_method=args.start_method)
+    print(f"Sweeping {len(servers)} servers with {min(engine.workers, len(servers))} worker processes...")
+    report = engine.sweep(servers, deadline=args.deadline).to_dict()
+    print(f"  {report['probes_per_second']} probes/s ({report['servers']} in {report['elapsed_s']}s), "
+          f"{report['online']} online, {report['offline']} offline")
+    print(f"  probe time p50 {report['p50_ms']} ms, p95 {report['p95_ms']} ms, p99 {report['p99_ms']} ms, "
+          f"max {report['max_ms']} ms")
+    print(f"  {report['wire_bytes_per_result']} bytes per result on the wire")
+
+
+if __name__ == '__main__':
+    main()
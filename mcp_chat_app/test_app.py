@@ -1,12 +1,55 @@
+import asyncio
+import io
+import os
+import socket
+import tempfile
 import unittest
 import json
 import copy
-from unittest.mock import patch, MagicMock
+import threading
+import time
+from unittest.mock import patch, MagicMock, AsyncMock, PropertyMock
+
+import dns.exception
+from flask.testing import FlaskClient
+import dns.resolver
+import httpx
 
 # Assuming test_app.py is in mcp_chat_app directory, or mcp_chat_app is in PYTHONPATH
 from .app import app, initialize_app_config # Import Flask app instance and init function
+from . import admission as admission_module
 from . import config # Import config module (mcp_chat_app.config)
 from .mcp_client import MCPClient # Import MCPClient for direct testing
+from .chat_tools import tool_stats
+from .conversation import ConversationStore, conversation_store
+from .dns_cache import HostNotFoundError, ResolverCache, resolver_cache
+from .host_health import CLOSED, HALF_OPEN, OPEN, HostHealth, host_health
+from .llm_client import client_manager
+from .metrics import HTTP_REQUESTS, OPENAI_SECONDS, REPLY_CACHE, MetricsRegistry, registry as metrics_registry
+from .persistence import ConfigStore
+from . import prompts
+from . import server_io
+from .server_context import build_context
+from .response_cache import MemoryBackend, SQLiteBackend, ResponseCache, make_key, response_cache, status_fingerprint
+from .server_listing import ServerListing
+from .server_registry import ServerRegistry
+from .server_status import ServerStatus, is_unknown
+from .single_flight import SingleFlight, llm_flight, probe_flight
+from .status_cache import StatusCache, status_cache
+from .status_history import StatusHistory, status_history
+from .status_poller import StatusPoller, status_poller
+from .status_push import StatusBroadcaster, parse_server_ids, status_push
+from .sweep import SweepEngine, decode_batch, encode_batch, encode_record, encode_result
+from .token_count import count_message_tokens
+
+class _ClosingClient(FlaskClient):
+    """Test client that reads and closes each response body, as a WSGI server does (releasing admission slots)."""
+
+    def open(self, *args, buffered=True, **kwargs):
+        return super().open(*args, buffered=buffered, **kwargs)
+
+app.test_client_class = _ClosingClient
+
 
 class TestApp(unittest.TestCase):
 
@@ -30,6 +73,21 @@ class TestApp(unittest.TestCase):
         # Reset OpenAI API Key
         config.OPENAI_API_KEY = None
 
+        # Drop cached server status, cached replies and the shared OpenAI client so each test sees its own mocks
+        status_cache.clear()
+        status_history.clear()
+        resolver_cache.clear()
+        host_health.clear()
+        response_cache.clear()
+        conversation_store.clear()
+        llm_flight.reset()
+        client_manager.reset()
+        prompts.token_usage.reset()
+        admission_module.client_limiter.clear()
+        admission_module.openai_limits.clear()
+        admission_module.probe_limiter.clear()
+        status_push.clear()
+
         # Set a dummy secret key for flash messages context
         app.secret_key = 'test_secret_key_for_unittest'
 
@@ -73,7 +131,7 @@ class TestApp(unittest.TestCase):
         initialize_app_config() # Call the specific function from app.py
         self.assertTrue(len(config.MCP_SERVERS) > 0, "MCP_SERVERS should be populated from defaults")
         if config.DEFAULT_MCP_SERVERS: # Check if there are defaults to compare against
-            self.assertEqual(config.MCP_SERVERS[0]['name'], config.DEFAULT_MCP_SERVERS[0]['name'])
+            self.assertEqual(config.MCP_SERVERS.get(0)['name'], config.DEFAULT_MCP_SERVERS[0]['name'])
 
 
     # --- Test Server Management ---
@@ -86,14 +144,14 @@ class TestApp(unittest.TestCase):
         self.assertEqual(response_post.status_code, 200)
         self.assertIn(b"Server &#39;NewTestServer&#39; added successfully!", response_post.data)
         self.assertEqual(len(config.MCP_SERVERS), initial_server_count + 1)
-        self.assertEqual(config.MCP_SERVERS[-1]['name'], 'NewTestServer')
+        self.assertEqual(config.MCP_SERVERS.all()[-1]['name'], 'NewTestServer')
 
     def test_delete_server(self):
         # Ensure there's a server to delete (defaults are loaded in setUp)
         if not config.MCP_SERVERS: self.fail("MCP_SERVERS empty, cannot test delete.")
 
         initial_server_count = len(config.MCP_SERVERS)
-        server_name_to_delete = config.MCP_SERVERS[0]['name']
+        server_name_to_delete = config.MCP_SERVERS.get(0)['name']
 
         response = self.client.post(f'/admin/delete_server/0', follow_redirects=True)
         self.assertEqual(response.status_code, 200) # After redirect
@@ -108,9 +166,22 @@ class TestApp(unittest.TestCase):
         self.assertIn(b"Error: Attempted to delete server with invalid ID.", response.data)
         self.assertEqual(len(config.MCP_SERVERS), initial_server_count) # No change
 
+    def test_delete_server_keeps_other_ids_stable(self):
+        second_server = config.MCP_SERVERS.get(1)
+        self.client.post('/admin/delete_server/0')
+        self.assertIsNone(config.MCP_SERVERS.get(0))
+        self.assertEqual(config.MCP_SERVERS.get(1), second_server) # No index shifting
+
+        response = self.client.post('/admin/delete_server/0', follow_redirects=True)
+        self.assertIn(b"Error: Attempted to delete server with invalid ID.", response.data)
+
+        response = self.client.get('/admin')
+        self.assertIn(b'/admin/edit_server/1', response.data) # Links use stable IDs
+        self.assertNotIn(b'/admin/edit_server/0', response.data)
+
     def test_edit_server_get(self):
         if not config.MCP_SERVERS: self.fail("MCP_SERVERS empty, cannot test edit GET.")
-        server_to_edit = config.MCP_SERVERS[0]
+        server_to_edit = config.MCP_SERVERS.get(0)
         response = self.client.get(f'/admin/edit_server/0')
         self.assertEqual(response.status_code, 200)
         self.assertIn(b"Edit Server Configuration", response.data)
@@ -119,7 +190,7 @@ class TestApp(unittest.TestCase):
 
     def test_edit_server_post_success(self):
         if not config.MCP_SERVERS: self.fail("MCP_SERVERS empty, cannot test edit POST.")
-        original_server_name = config.MCP_SERVERS[0]['name']
+        original_server_name = config.MCP_SERVERS.get(0)['name']
 
         response = self.client.post('/admin/edit_server/0', data={
             'server-name': 'UpdatedServer', 'server-host': 'updated.host.com',
@@ -127,13 +198,13 @@ class TestApp(unittest.TestCase):
         }, follow_redirects=True)
         self.assertEqual(response.status_code, 200)
         self.assertIn(bytes(f"Server &#39;UpdatedServer&#39; updated successfully.", 'utf-8'), response.data)
-        self.assertEqual(config.MCP_SERVERS[0]['name'], 'UpdatedServer')
-        self.assertEqual(config.MCP_SERVERS[0]['host'], 'updated.host.com')
-        self.assertNotEqual(config.MCP_SERVERS[0]['name'], original_server_name)
+        self.assertEqual(config.MCP_SERVERS.get(0)['name'], 'UpdatedServer')
+        self.assertEqual(config.MCP_SERVERS.get(0)['host'], 'updated.host.com')
+        self.assertNotEqual(config.MCP_SERVERS.get(0)['name'], original_server_name)
 
     def test_edit_server_post_invalid_data(self):
         if not config.MCP_SERVERS: self.fail("MCP_SERVERS empty, cannot test edit POST invalid.")
-        original_server = copy.deepcopy(config.MCP_SERVERS[0])
+        original_server = config.MCP_SERVERS.get(0) # Records are immutable
 
         response = self.client.post('/admin/edit_server/0', data={
             'server-name': '', 'server-host': 'updated.host.com', # Empty name
@@ -141,7 +212,95 @@ class TestApp(unittest.TestCase):
         }) # No redirect follow, check rendered page
         self.assertEqual(response.status_code, 200)
         self.assertIn(b"All fields (Server Name, Host, Port) are required.", response.data)
-        self.assertEqual(config.MCP_SERVERS[0]['name'], original_server['name']) # Should not change
+        self.assertEqual(config.MCP_SERVERS.get(0)['name'], original_server['name']) # Should not change
+
+
+    # --- Test bulk import/export and batch edits ---
+    def test_import_json_skips_duplicates_and_reports_invalid_rows(self):
+        count = len(config.MCP_SERVERS)
+        rows = [{'name': 'New A', 'host': 'a.example', 'port': 25565},
+                {'name': 'Dup', 'host': 'MC.HYPIXEL.NET', 'port': 25565}, # Already configured
+                {'name': 'Bad', 'host': 'b.example', 'port': 70000},
+                {'name': 'New B', 'host': 'b.example', 'port': '19132', 'type': 'Minecraft Bedrock'}]
+        response = self.client.post('/admin/servers/import', data=json.dumps(rows), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        summary = response.get_json()
+        self.assertEqual((summary['imported'], summary['skipped'], summary['invalid']), (2, 1, 1))
+        self.assertEqual(summary['errors'][0]['line'], 3)
+        self.assertIn("Port must be between 1 and 65535", summary['errors'][0]['error'])
+        self.assertEqual(len(config.MCP_SERVERS), count + 2)
+        self.assertEqual(config.MCP_SERVERS.get_by_address('b.example', 19132).type, 'Minecraft Bedrock')
+
+    def test_json_import_is_parsed_incrementally(self):
+        rows = [{'name': f'S{i}', 'host': f's{i}.example', 'port': 25565} for i in range(20)]
+        with patch.object(server_io, 'READ_CHUNK_SIZE', 7): # Items are split across many reads
+            parsed = list(server_io.iter_rows(io.BytesIO(json.dumps(rows).encode()), 'json'))
+        self.assertEqual([row for _, row in parsed], rows)
+        with self.assertRaises(server_io.ImportFormatError):
+            list(server_io.iter_rows(io.BytesIO(b'[{"name": "x"}'), 'json'))
+
+    @patch('mcp_chat_app.app.MCPClient.get_many')
+    def test_import_csv_upload_with_probe(self, mock_get_many):
+        mock_get_many.side_effect = lambda servers, **kwargs: [
+            {"online": True, "player_count": 1, "player_max": 10} if s.host == 'up.example'
+            else {"online": False, "error": "Connection refused."} for s in servers]
+        upload = b"name,host,port,type\nUp,up.example,25565,Minecraft Java\nDown,down.example,25566,\n"
+        response = self.client.post('/admin/servers/import', data={
+            'file': (io.BytesIO(upload), 'servers.csv'), 'probe': '1'
+        }, content_type='multipart/form-data', follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Imported 2 servers", response.data)
+        self.assertIn(b"1 of 2 imported servers are online", response.data)
+        self.assertEqual(mock_get_many.call_count, 1) # All imported servers probed in one concurrent batch
+        self.assertEqual(status_cache.get('up.example', 25565, 'Minecraft Java')['online'], True)
+
+    @patch('mcp_chat_app.app.MCPClient.get_many')
+    def test_import_probe_skips_servers_not_checked_in_time(self, mock_get_many):
+        mock_get_many.side_effect = lambda servers, **kwargs: [
+            ServerStatus(True, player_count=1) if s.host == 'up.example'
+            else ServerStatus.unknown("Status check did not finish within the 1 second deadline.") for s in servers]
+        upload = b"name,host,port\nUp,up.example,25565\nSlow,slow.example,25565\n"
+        response = self.client.post('/admin/servers/import?probe=1', data=upload, content_type='text/csv')
+        self.assertEqual(response.get_json()['probe'], {"checked": 1, "online": 1, "unchecked": 1, "offline": []})
+        self.assertEqual(status_cache.stats()['size'], 1) # Only the real result was cached
+
+    def test_export_round_trip(self):
+        for fmt in ('csv', 'json', 'ndjson'):
+            response = self.client.get(f'/admin/servers/export?format={fmt}')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('attachment', response.headers['Content-Disposition'])
+            result = server_io.import_servers(ServerRegistry(), io.BytesIO(response.data), fmt)
+            self.assertEqual([(r.name, r.host, r.port, r.type) for r in result['imported']],
+                             [(r.name, r.host, r.port, r.type) for r in config.MCP_SERVERS], fmt)
+        self.assertEqual(self.client.get('/admin/servers/export?format=xml').status_code, 400)
+
+    def test_batch_update_and_delete_is_one_change(self):
+        version = config.MCP_SERVERS.version
+        response = self.client.post('/admin/servers/batch', json={
+            'update': {'0': {'name': 'Renamed', 'port': '25570'}}, 'delete': [1, 2, 99]})
+        self.assertEqual(response.get_json(), {'updated': 1, 'deleted': 2, 'missing': [99]})
+        self.assertEqual(config.MCP_SERVERS.version, version + 1)
+        self.assertEqual((config.MCP_SERVERS.get(0).name, config.MCP_SERVERS.get(0).port), ('Renamed', 25570))
+        self.assertEqual([r.id for r in config.MCP_SERVERS], [0, 3])
+
+        response = self.client.post('/admin/servers/batch', json={
+            'update': {'0': {'name': 'Again'}, '3': {'port': 0}}, 'delete': [0]})
+        self.assertEqual(response.status_code, 400) # One bad update rejects the whole batch
+        self.assertEqual(config.MCP_SERVERS.get(0).name, 'Renamed')
+
+        for body in ([1, 2], {'delete': 3}, {'delete': ['x']}, {'update': [0]},
+                     {'update': {'0': {'host': None}}}, {'update': {'0': {'name': ' '}}}):
+            response = self.client.post('/admin/servers/batch', json=body)
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual([r.id for r in config.MCP_SERVERS], [0, 3])
+
+        response = self.client.post('/admin/servers/batch', json={'update': {'3': {'name': 42, 'port': 25580.0}}})
+        self.assertEqual(response.status_code, 200) # Coerced the same way imported rows are
+        self.assertEqual((config.MCP_SERVERS.get(3).name, config.MCP_SERVERS.get(3).port), ('42', 25580))
+
+        response = self.client.post('/admin/servers/batch', data={'server_ids': ['0', '3']}, follow_redirects=True)
+        self.assertIn(b"Deleted 2 servers.", response.data)
+        self.assertFalse(config.MCP_SERVERS)
 
 
     # --- Test API Key Configuration ---
@@ -162,10 +321,57 @@ class TestApp(unittest.TestCase):
         self.assertIn(b"test...", response_set.data) # Check for partial key display
 
 
+    def test_api_servers_pages_search_and_etag(self):
+        response = self.client.get('/api/servers?q=JAVA&limit=2')
+        self.assertEqual(response.status_code, 200)
+        page = response.get_json()
+        self.assertEqual(page['total'], 3) # Matches the type, case-insensitively
+        self.assertEqual([server['id'] for server in page['servers']], [0, 1])
+        self.assertEqual(page['next_offset'], 2)
+        etag = response.headers['ETag']
+
+        not_modified = self.client.get('/api/servers?q=JAVA&limit=2', headers={'If-None-Match': etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.data, b"")
+
+        last_page = self.client.get('/api/servers?q=java&offset=2&limit=2').get_json()
+        self.assertEqual([server['id'] for server in last_page['servers']], [3])
+        self.assertIsNone(last_page['next_offset'])
+
+        config.MCP_SERVERS.add("New Java", "new.example.org", 25565, "Minecraft Java")
+        changed = self.client.get('/api/servers?q=JAVA&limit=2', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200) # The server list changed, so the ETag did too
+        self.assertEqual(changed.get_json()['total'], 4)
+
+        self.assertEqual(self.client.get('/api/servers?offset=x').status_code, 400)
+
+    def test_index_and_admin_pages_list_one_page_of_servers(self):
+        config.MCP_SERVERS.add_many([{'name': f'Bulk {i}', 'host': f'bulk{i}.example.org', 'port': 25565}
+                                     for i in range(config.SERVER_LIST_PAGE_SIZE)])
+
+        index = self.client.get('/')
+        self.assertIn(b'Hypixel', index.data)
+        self.assertNotIn(b'Bulk 49', index.data) # Beyond the first page; fetched by the dropdown on demand
+        self.assertIn(b'data-next-offset="50"', index.data)
+        self.assertEqual(self.client.get('/', headers={'If-None-Match': index.headers['ETag']}).status_code, 304)
+
+        admin_page = self.client.get('/admin?page=2')
+        self.assertIn(b'Bulk 49', admin_page.data)
+        self.assertNotIn(b'Hypixel', admin_page.data)
+        self.assertIn(b'Page 2 of 2', admin_page.data)
+
+        searched = self.client.get('/admin?q=bulk4')
+        self.assertIn(b'Bulk 40', searched.data)
+        self.assertNotIn(b'Bulk 39', searched.data)
+
+        config.MCP_SERVERS.update(0, name='Renamed')
+        self.assertIn(b'Renamed', self.client.get('/admin').data) # Cached rows are dropped when the list changes
+
+
     # --- Test MCPClient (with mocks) ---
-    @patch('mcp_chat_app.mcp_client.JavaServer.lookup')
-    def test_mcp_client_get_status_online(self, mock_lookup):
-        mock_server_instance = MagicMock()
+    @patch('mcp_chat_app.mcp_client._java_status')
+    def test_mcp_client_get_status_online(self, mock_java_status):
+        resolver_cache.put('dummy.host', '203.0.113.10', ttl=60) # Resolved by an earlier probe
         mock_status_response = MagicMock()
         mock_status_response.version.name = "1.19 Test"
         mock_status_response.version.protocol = 750
@@ -173,9 +379,7 @@ class TestApp(unittest.TestCase):
         mock_status_response.players.online = 10
         mock_status_response.players.max = 100
         mock_status_response.latency = 50.0
-
-        mock_server_instance.status.return_value = mock_status_response
-        mock_lookup.return_value = mock_server_instance
+        mock_java_status.return_value = mock_status_response
 
         client_result = MCPClient.get_server_status('dummy.host', 25565)
 
@@ -183,19 +387,194 @@ class TestApp(unittest.TestCase):
         self.assertEqual(client_result['version'], "1.19 Test")
         self.assertEqual(client_result['motd'], "Test MOTD")
         self.assertEqual(client_result['player_count'], 10)
-        mock_lookup.assert_called_once_with("dummy.host:25565", timeout=5) # Default timeout
+        self.assertIn('resolve_ms', client_result) # Name resolution is timed separately from the ping
+        # Connects to the cached IP, with the host name for the handshake and the default timeout
+        mock_java_status.assert_called_once_with('dummy.host', '203.0.113.10', 25565, 5)
 
-    @patch('mcp_chat_app.mcp_client.JavaServer.lookup')
-    def test_mcp_client_get_status_offline_or_error(self, mock_lookup):
-        mock_lookup.side_effect = Exception("Test connection error")
-        client_result = MCPClient.get_server_status('error.host', 25565)
+    def test_mcp_client_handshake_names_the_configured_host(self):
+        handshakes = []
+        listener = socket.create_server(('127.0.0.1', 0))
+        self.addCleanup(listener.close)
+
+        def read_varint(conn):
+            value, shift = 0, 0
+            while True:
+                byte = conn.recv(1)[0]
+                value |= (byte & 0x7F) << shift
+                shift += 7
+                if not byte & 0x80:
+                    return value
+
+        def varint(value):
+            out = b''
+            while True:
+                byte, value = value & 0x7F, value >> 7
+                out += bytes([byte | (0x80 if value else 0)])
+                if not value:
+                    return out
+
+        def serve():
+            conn, _ = listener.accept()
+            with conn:
+                packet = io.BytesIO(conn.recv(read_varint(conn), socket.MSG_WAITALL))
+                packet.read(1) # Packet ID 0 (handshake)
+                while packet.read(1)[0] & 0x80: # Protocol version (varint)
+                    pass
+                handshakes.append(packet.read(packet.read(1)[0]).decode('utf-8')) # Host names here are short
+                conn.recv(read_varint(conn), socket.MSG_WAITALL) # Status request
+                body = json.dumps({"version": {"name": "1.21", "protocol": 767}, "players": {"online": 1, "max": 20},
+                                   "description": "Behind a proxy"}).encode('utf-8')
+                payload = b'\x00' + varint(len(body)) + body
+                conn.sendall(varint(len(payload)) + payload)
+
+        threading.Thread(target=serve, daemon=True).start()
+        port = listener.getsockname()[1]
+        resolver_cache.put('play.virtual.example', '127.0.0.1', ttl=60)
+        result = MCPClient.get_server_status('play.virtual.example', port, timeout=2)
+        self.assertTrue(result['online'], result.get('error'))
+        self.assertEqual(result['motd'], "Behind a proxy")
+        self.assertEqual(handshakes, ['play.virtual.example']) # Not the IP the socket was opened to
+
+    @patch('mcp_chat_app.mcp_client.JavaServer')
+    def test_java_status_falls_back_to_public_api(self, mock_java_server):
+        from . import mcp_client
+        with patch.object(mcp_client, '_CONNECT_TO_IP', False): # mcstatus without the internals we use
+            result = mcp_client._java_status('play.example', '203.0.113.10', 25565, 5)
+        mock_java_server.assert_called_once_with('play.example', 25565, timeout=5)
+        self.assertIs(result, mock_java_server.return_value.status.return_value)
+
+    @patch('mcp_chat_app.mcp_client._java_status')
+    def test_mcp_client_get_status_offline_or_error(self, mock_java_status):
+        mock_java_status.side_effect = Exception("Test connection error")
+        client_result = MCPClient.get_server_status('192.0.2.1', 25565)
         self.assertFalse(client_result['online'])
         self.assertIn("Test connection error", client_result['error'])
 
 
+    @patch('mcp_chat_app.mcp_client._async_java_status', new_callable=AsyncMock)
+    def test_mcp_client_async_get_status_online(self, mock_async_java_status):
+        mock_status_response = MagicMock()
+        mock_status_response.version.name = "1.20 Async"
+        mock_status_response.motd.to_plain.return_value = "Async MOTD"
+        mock_status_response.players.online = 3
+        mock_status_response.players.max = 30
+        mock_async_java_status.return_value = mock_status_response
+
+        resolver_cache.put('dummy.host', '2001:db8::10', ttl=60)
+        client_result = asyncio.run(MCPClient.async_get_server_status('dummy.host', 25565))
+
+        self.assertTrue(client_result['online'])
+        self.assertEqual(client_result['version'], "1.20 Async")
+        self.assertEqual(client_result['player_count'], 3)
+        mock_async_java_status.assert_awaited_once_with('dummy.host', '2001:db8::10', 25565, 5)
+
+    @patch('mcp_chat_app.mcp_client._java_status')
+    @patch('mcp_chat_app.mcp_client.BedrockServer.lookup')
+    def test_mcp_client_dispatches_bedrock_by_type(self, mock_bedrock_lookup, mock_java_status):
+        status = MagicMock(map_name="Bedrock level", gamemode="Survival", latency=4.2)
+        status.version.name = "1.20.80"
+        status.motd.to_plain.return_value = "Bedrock MOTD"
+        status.players.online, status.players.max = 2, 10
+        mock_bedrock_lookup.return_value.status.return_value = status
+
+        result = MCPClient.get_server_status('127.0.0.1', 19132, server_type='Minecraft Bedrock')
+
+        self.assertIsInstance(result, ServerStatus)
+        self.assertEqual((result.online, result.edition, result.map_name), (True, 'bedrock', "Bedrock level"))
+        self.assertEqual(result['player_count'], 2)
+        mock_bedrock_lookup.assert_called_once_with("127.0.0.1:19132", timeout=5)
+        mock_bedrock_lookup.return_value.status.assert_called_once_with(tries=1)
+        mock_java_status.assert_not_called()
+
+    @patch('mcp_chat_app.mcp_client._java_status')
+    @patch('mcp_chat_app.mcp_client.JavaServer.lookup')
+    def test_mcp_client_query_adds_player_list(self, mock_lookup, mock_java_status):
+        status = MagicMock(latency=12.0)
+        status.players.online, status.players.max, status.players.sample = 2, 20, None
+        query_response = MagicMock(map_name="world")
+        query_response.players.online, query_response.players.max = 2, 20
+        query_response.players.list = ["Alex", "Steve"]
+        mock_java_status.return_value = status
+        server = mock_lookup.return_value
+        server.query.return_value = query_response
+
+        result = MCPClient.get_server_status('192.0.2.20', 25565, query=True)
+        self.assertEqual(result.players, ("Alex", "Steve"))
+        self.assertEqual(result.map_name, "world")
+
+        server.query.side_effect = OSError("timed out") # Query disabled on the server
+        mock_lookup.reset_mock()
+        result = MCPClient.get_server_status('192.0.2.21', 25565, query=True)
+        self.assertTrue(result.online) # The status ping result is still returned
+        MCPClient.get_server_status('192.0.2.21', 25565, query=True)
+        self.assertEqual(server.query.call_count, 1) # Not asked again right away
+
+        with patch.object(config, 'STATUS_QUERY_UNSUPPORTED_MAX_ENTRIES', 1):
+            MCPClient._mark_query_unsupported('192.0.2.22', 25565) # Evicts the least recently marked server
+        self.assertTrue(MCPClient._should_query('192.0.2.21', 25565, True))
+        self.assertFalse(MCPClient._should_query('192.0.2.22', 25565, True))
+
+    def test_server_status_record(self):
+        status = ServerStatus(True, edition='java', player_count=3, player_max=10, players=['Alex'])
+        self.assertEqual(status.to_dict(), {'online': True, 'edition': 'java', 'player_count': 3,
+                                            'player_max': 10, 'players': ['Alex']})
+        self.assertEqual(status.get('error', 'none'), 'none') # Unset fields read like missing keys
+        self.assertEqual(dict(status)['player_count'], 3)
+        self.assertEqual(status.replace(player_count=4).player_count, 4)
+        with self.assertRaises(AttributeError):
+            status.online = False
+
+    @patch('mcp_chat_app.mcp_client._java_status')
+    def test_mcp_client_unresolvable_host_fails_fast(self, mock_java_status):
+        resolver_cache.put('gone.example', None, ttl=60) # Cached NXDOMAIN
+        client_result = MCPClient.get_server_status('gone.example', 25565)
+        self.assertFalse(client_result['online'])
+        self.assertEqual(client_result['error'], "Server address 'gone.example' could not be resolved.")
+        mock_java_status.assert_not_called()
+
+    def test_mcp_client_async_get_many_runs_concurrently(self):
+        async def fake_status(host, port, timeout=5, server_type=None, clipped=False):
+            await asyncio.sleep(0.2)
+            return {"online": True, "host": host}
+
+        servers = [{'host': f'host{i}.example', 'port': 25565} for i in range(5)]
+        with patch.object(MCPClient, 'async_get_server_status', side_effect=fake_status):
+            started = time.perf_counter()
+            results = MCPClient.get_many(servers, concurrency=10)
+            elapsed = time.perf_counter() - started
+
+        self.assertLess(elapsed, 0.6) # Roughly the slowest probe, not the sum (1.0s)
+        self.assertEqual([r['host'] for r in results], [s['host'] for s in servers]) # Order preserved
+
+    def test_mcp_client_async_get_many_limits_and_deadline(self):
+        in_flight = {'now': 0, 'max': 0}
+
+        async def fake_status(host, port, timeout=5, server_type=None, clipped=False):
+            in_flight['now'] += 1
+            in_flight['max'] = max(in_flight['max'], in_flight['now'])
+            try:
+                await asyncio.sleep(5 if host == 'blackhole.example' else 0.05)
+            finally:
+                in_flight['now'] -= 1
+            return {"online": True}
+
+        servers = [{'host': 'same.example', 'port': 25565 + i} for i in range(4)]
+        servers.append({'host': 'blackhole.example', 'port': 25565})
+        with patch.object(MCPClient, 'async_get_server_status', side_effect=fake_status):
+            started = time.perf_counter()
+            results = MCPClient.get_many(servers, concurrency=10, per_host_limit=2, deadline=0.5)
+            elapsed = time.perf_counter() - started
+
+        self.assertLess(elapsed, 1.5)
+        self.assertLessEqual(in_flight['max'], 3) # 2 for 'same.example' + 1 for the blackhole
+        self.assertTrue(all(r['online'] for r in results[:4]))
+        self.assertFalse(results[4]['online'])
+        self.assertIn("deadline", results[4]['error'])
+
+
     # --- Test /chat_with_llm Endpoint (with mocks) ---
     @patch('mcp_chat_app.app.MCPClient.get_server_status') # Path to MCPClient as imported in app.py
-    @patch('mcp_chat_app.app.OpenAI') # Path to OpenAI as imported in app.py
+    @patch('mcp_chat_app.llm_client.OpenAI') # OpenAI is constructed by the shared client manager
     def test_chat_with_llm_no_api_key(self, mock_openai_class, mock_mcp_get_status):
         config.OPENAI_API_KEY = None
         response = self.client.post('/chat_with_llm', json={'message': 'Hello'})
@@ -204,7 +583,7 @@ class TestApp(unittest.TestCase):
         self.assertIn("OpenAI API Key not configured", json_data['error'])
 
     @patch('mcp_chat_app.app.MCPClient.get_server_status')
-    @patch('mcp_chat_app.app.OpenAI')
+    @patch('mcp_chat_app.llm_client.OpenAI')
     def test_chat_with_llm_general_query(self, mock_openai_class, mock_mcp_get_status):
         config.OPENAI_API_KEY = 'fake_test_key'
         mock_openai_instance = mock_openai_class.return_value
@@ -224,7 +603,7 @@ class TestApp(unittest.TestCase):
 
 
     @patch('mcp_chat_app.app.MCPClient.get_server_status')
-    @patch('mcp_chat_app.app.OpenAI')
+    @patch('mcp_chat_app.llm_client.OpenAI')
     def test_chat_with_llm_with_mcp_server_online(self, mock_openai_class, mock_mcp_get_status):
         config.OPENAI_API_KEY = 'fake_test_key'
         # Ensure there's a server to select
@@ -239,13 +618,14 @@ class TestApp(unittest.TestCase):
         mock_completion.choices[0].message.content = "LLM reply about online server"
         mock_openai_instance.chat.completions.create.return_value = mock_completion
 
-        server_to_query = config.MCP_SERVERS[0]
+        server_to_query = config.MCP_SERVERS.get(0)
         response = self.client.post('/chat_with_llm', json={'message': 'Tell me about this server.', 'server_id': '0'})
 
         self.assertEqual(response.status_code, 200)
         json_data = response.get_json()
         self.assertEqual(json_data['reply'], "LLM reply about online server")
-        mock_mcp_get_status.assert_called_once_with(server_to_query['host'], server_to_query['port'], timeout=3)
+        mock_mcp_get_status.assert_called_once_with(server_to_query['host'], server_to_query['port'], timeout=3,
+                                                    server_type=server_to_query['type'])
 
         args, kwargs = mock_openai_instance.chat.completions.create.call_args
         user_prompt = kwargs['messages'][-1]['content']
@@ -254,7 +634,7 @@ class TestApp(unittest.TestCase):
 
 
     @patch('mcp_chat_app.app.MCPClient.get_server_status')
-    @patch('mcp_chat_app.app.OpenAI')
+    @patch('mcp_chat_app.llm_client.OpenAI')
     def test_chat_with_llm_with_mcp_server_offline(self, mock_openai_class, mock_mcp_get_status):
         config.OPENAI_API_KEY = 'fake_test_key'
         if not config.MCP_SERVERS: self.fail("MCP_SERVERS empty for offline test.")
@@ -277,7 +657,7 @@ class TestApp(unittest.TestCase):
 
 
     @patch('mcp_chat_app.app.MCPClient.get_server_status')
-    @patch('mcp_chat_app.app.OpenAI')
+    @patch('mcp_chat_app.llm_client.OpenAI')
     def test_chat_with_llm_openai_api_error(self, mock_openai_class, mock_mcp_get_status):
         config.OPENAI_API_KEY = 'fake_test_key'
         mock_openai_instance = mock_openai_class.return_value
@@ -289,5 +669,1766 @@ class TestApp(unittest.TestCase):
         self.assertIn("OpenAI API error: OpenAI API is down", json_data['error'])
 
 
+    def test_chat_with_llm_reuses_cached_status(self):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        with patch('mcp_chat_app.app.MCPClient.get_server_status') as mock_mcp_get_status, \
+             patch('mcp_chat_app.llm_client.OpenAI') as mock_openai_class:
+            mock_mcp_get_status.return_value = {"online": True, "version": "1.20", "motd": "Cached MOTD",
+                                                "player_count": 1, "player_max": 10, "latency": 5}
+            mock_openai_class.return_value.chat.completions.create.return_value.choices[0].message.content = "ok"
+
+            for _ in range(3):
+                response = self.client.post('/chat_with_llm', json={'message': 'Status?', 'server_id': '0'})
+                self.assertEqual(response.status_code, 200)
+
+            mock_mcp_get_status.assert_called_once() # Later turns were served from the cache
+            stats = self.client.get('/admin/stats').get_json()['status_cache']
+            self.assertEqual(stats['misses'], 1)
+            self.assertEqual(stats['hits'], 2)
+
+    def test_server_history_endpoint(self):
+        server = config.MCP_SERVERS.get(0)
+        key = status_cache.make_key(server.host, server.port, server.type)
+        now = time.time()
+        for i in range(10):
+            status = {"online": i != 3, "latency": 20 + i, "player_count": 10 + i}
+            status_history.record(key, status, at=now - 50 + i * 5)
+
+        response = self.client.get('/servers/0/history?limit=4&window=600&resolution=1m')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['server']['name'], server.name)
+        self.assertEqual([s['player_count'] for s in data['samples']], [16, 17, 18, 19])
+        self.assertEqual(data['summary']['samples'], 10)
+        self.assertEqual(data['summary']['uptime'], 90.0)
+        self.assertEqual(data['summary']['latency']['max'], 29)
+        self.assertEqual(sum(bucket['samples'] for bucket in data['buckets']), 10)
+
+        self.assertEqual(self.client.get('/servers/999/history').status_code, 404)
+        self.assertEqual(self.client.get('/servers/0/history?resolution=1w').status_code, 400)
+        for window in ('nan', 'inf', '-1', '0'):
+            self.assertEqual(self.client.get(f'/servers/0/history?window={window}').status_code, 400, window)
+
+    @patch('mcp_chat_app.app.MCPClient.get_server_status')
+    @patch('mcp_chat_app.llm_client.OpenAI')
+    def test_chat_with_llm_includes_history_trends(self, mock_openai_class, mock_mcp_get_status):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        server = config.MCP_SERVERS.get(0)
+        key = status_cache.make_key(server.host, server.port, server.type)
+        now = time.time()
+        for minute in range(60): # Player count grows from 50 to about 70 over the hour
+            status_history.record(key, {"online": True, "latency": 40, "player_count": 50 + minute // 3},
+                                  at=now - 3540 + minute * 60)
+        mock_mcp_get_status.return_value = {"online": True, "version": "1.20", "player_count": 70,
+                                            "player_max": 100, "latency": 40}
+        mock_openai_class.return_value.chat.completions.create.return_value.choices[0].message.content = "ok"
+
+        response = self.client.post('/chat_with_llm', json={'message': 'Is it busy?', 'server_id': '0'})
+        self.assertEqual(response.status_code, 200)
+        user_prompt = mock_openai_class.return_value.chat.completions.create.call_args.kwargs['messages'][-1]['content']
+        self.assertIn("player count up 30% in the last hour", user_prompt)
+        self.assertIn("uptime 100% over the last hour", user_prompt)
+        self.assertIn("median latency 40 ms", user_prompt)
+
+    @patch('mcp_chat_app.status_cache.MCPClient.get_many')
+    @patch('mcp_chat_app.llm_client.OpenAI')
+    def test_chat_with_llm_multiple_servers(self, mock_openai_class, mock_get_many):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        mock_get_many.return_value = [
+            ServerStatus(True, version="1.20", player_count=5, player_max=20, latency=80.4),
+            ServerStatus.offline("Connection refused."),
+            ServerStatus(True, version="1.21", player_count=1, player_max=10, latency=12.0),
+        ]
+        mock_openai_class.return_value.chat.completions.create.return_value.choices[0].message.content = "ok"
+
+        response = self.client.post('/chat_with_llm', json={'message': 'Which one has the lowest ping?',
+                                                            'server_ids': [0, '1', 3, 42]})
+        self.assertEqual(response.status_code, 200)
+        mock_get_many.assert_called_once() # All servers probed in one concurrent batch
+        self.assertEqual(len(mock_get_many.call_args.args[0]), 3)
+        self.assertEqual(mock_get_many.call_args.kwargs['deadline'], config.CHAT_MULTI_SERVER_DEADLINE)
+
+        user_prompt = mock_openai_class.return_value.chat.completions.create.call_args.kwargs['messages'][-1]['content']
+        self.assertIn("3 Minecraft servers (2 online)", user_prompt)
+        rows = [line for line in user_prompt.splitlines() if ' | ' in line][1:]
+        self.assertTrue(rows[0].startswith("Another Java Server | javaminecraft.example.org:25565 | online | 1/10"))
+        self.assertIn("| online | 5/20 | 1.20 | 80", rows[1])
+        self.assertIn("offline (Connection refused.)", rows[2])
+        self.assertIn("Some of the selected server IDs were invalid.", user_prompt)
+        self.assertEqual([s['id'] for s in response.get_json()['server_data_used']], [3, 0, 1])
+
+        # Statuses are cached, so asking again doesn't probe
+        self.client.post('/chat_with_llm', json={'message': 'And now?', 'server_ids': [0, 1, 3]})
+        mock_get_many.assert_called_once()
+
+    def test_chat_with_llm_all_servers_bounded_by_deadline(self):
+        config.OPENAI_API_KEY = 'fake_test_key'
+
+        async def probe(host, port, timeout=5, server_type=None, clipped=False):
+            if host == 'mc.hypixel.net':
+                await asyncio.sleep(5) # Never answers in time
+            return ServerStatus(True, player_count=1, player_max=10, latency=10)
+
+        with patch.object(config, 'CHAT_MULTI_SERVER_DEADLINE', 0.2), \
+             patch('mcp_chat_app.mcp_client.MCPClient.async_get_server_status', side_effect=probe), \
+             patch('mcp_chat_app.llm_client.OpenAI') as mock_openai_class:
+            mock_openai_class.return_value.chat.completions.create.return_value.choices[0].message.content = "ok"
+            started = time.monotonic()
+            response = self.client.post('/chat_with_llm', json={'message': 'How are my servers?', 'server_id': 'all'})
+            self.assertLess(time.monotonic() - started, 2)
+
+        self.assertEqual(response.status_code, 200)
+        user_prompt = mock_openai_class.return_value.chat.completions.create.call_args.kwargs['messages'][-1]['content']
+        self.assertIn(f"{len(config.MCP_SERVERS)} Minecraft servers ({len(config.MCP_SERVERS) - 1} online)", user_prompt)
+        self.assertIn("Hypixel | mc.hypixel.net:25565 | unknown (Status check did not finish", user_prompt)
+        # The placeholder is not a verdict, so it is neither cached nor recorded
+        self.assertEqual(status_cache.stats()['size'], len(config.MCP_SERVERS) - 1)
+        self.assertEqual(status_history.stats()['servers'], len(config.MCP_SERVERS) - 1)
+
+    def test_chat_with_llm_rejects_bad_server_ids(self):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        response = self.client.post('/chat_with_llm', json={'message': 'Hi', 'server_ids': 'some'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_multi_server_context_token_budget(self):
+        servers = [{'name': f"Server {i}", 'host': f"host{i}.example.com", 'port': 25565} for i in range(50)]
+        statuses = [ServerStatus(True, player_count=i, player_max=100, latency=10) for i in range(50)]
+        context, shown = build_context("Which server is the most popular?", servers, statuses, token_budget=200)
+        self.assertLess(len(context), 200 * 4 + 100)
+        self.assertEqual(shown[0][0]['name'], "Server 49") # Most players first for a popularity question
+        self.assertIn(f"({50 - len(shown)} more servers not shown.)", context)
+
+        context, shown = build_context("How is Server 7 doing?", servers, statuses, token_budget=200)
+        self.assertEqual(shown[0][0]['name'], "Server 7") # Servers named in the message come first
+
+    @staticmethod
+    def _tool_call(call_id, name, arguments):
+        call = MagicMock(id=call_id)
+        call.function.name = name
+        call.function.arguments = json.dumps(arguments)
+        return call
+
+    @staticmethod
+    def _completion(content=None, tool_calls=None):
+        completion = MagicMock()
+        completion.choices[0].message.content = content
+        completion.choices[0].message.tool_calls = tool_calls
+        return completion
+
+    @patch('mcp_chat_app.status_cache.MCPClient.get_many')
+    @patch('mcp_chat_app.llm_client.OpenAI')
+    def test_chat_with_llm_tools_skip_probe_when_not_needed(self, mock_openai_class, mock_get_many):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        tool_stats.reset()
+        create = mock_openai_class.return_value.chat.completions.create
+        create.return_value = self._completion("You're welcome!")
+
+        response = self.client.post('/chat_with_llm', json={'message': 'thanks!', 'server_id': '0', 'tools': True})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['reply'], "You're welcome!")
+        self.assertEqual(data['tool_metrics'], {"rounds": 0, "tool_calls": 0, "status_lookups": 0, "probes_avoided": 1})
+        mock_get_many.assert_not_called()
+        self.assertIn("server_id 0", create.call_args.kwargs['messages'][-1]['content'])
+        self.assertEqual([t['function']['name'] for t in create.call_args.kwargs['tools']],
+                         ['get_server_status', 'list_servers', 'get_server_history'])
+        self.assertEqual(self.client.get('/admin/stats').get_json()['chat_tools']['probes_avoided'], 1)
+
+    @patch('mcp_chat_app.status_cache.MCPClient.get_many')
+    @patch('mcp_chat_app.llm_client.OpenAI')
+    def test_chat_with_llm_tools_parallel_status_calls(self, mock_openai_class, mock_get_many):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        mock_get_many.return_value = [ServerStatus(True, player_count=5, player_max=20, latency=80),
+                                      ServerStatus(True, player_count=1, player_max=10, latency=12)]
+        create = mock_openai_class.return_value.chat.completions.create
+        create.side_effect = [
+            self._completion(tool_calls=[self._tool_call("call_1", "get_server_status", {"server_id": 0}),
+                                         self._tool_call("call_2", "get_server_status", {"name": "another java server"}),
+                                         self._tool_call("call_3", "list_servers", {"query": "bedrock"})]),
+            self._completion("Another Java Server has the lowest ping."),
+        ]
+
+        response = self.client.post('/chat_with_llm', json={'message': 'Which has the lowest ping?',
+                                                            'server_ids': 'all', 'tools': True})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['reply'], "Another Java Server has the lowest ping.")
+        mock_get_many.assert_called_once() # Both status calls probed in one concurrent batch
+        self.assertEqual([s.id for s in mock_get_many.call_args.args[0]], [0, 3])
+        self.assertEqual(data['tool_metrics'], {"rounds": 1, "tool_calls": 3, "status_lookups": 2, "probes_avoided": 2})
+        self.assertEqual([s['id'] for s in data['server_data_used']], [0, 3])
+
+        messages = create.call_args.kwargs['messages']
+        self.assertEqual(messages[-4]['role'], 'assistant')
+        self.assertEqual([m['tool_call_id'] for m in messages[-3:]], ["call_1", "call_2", "call_3"])
+        self.assertEqual(json.loads(messages[-2]['content'])['status']['latency'], 12)
+        self.assertEqual(json.loads(messages[-1]['content'])['total'], 1) # Only "Local Test Bedrock" matches
+
+    @patch('mcp_chat_app.status_cache.MCPClient.get_many')
+    @patch('mcp_chat_app.llm_client.OpenAI')
+    def test_chat_with_llm_stream_tools(self, mock_openai_class, mock_get_many):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        mock_get_many.return_value = [ServerStatus(True, player_count=7, player_max=20)]
+
+        def chunk(content=None, tool_calls=None):
+            chunk = MagicMock()
+            chunk.choices[0].delta.content = content
+            chunk.choices[0].delta.tool_calls = tool_calls
+            return chunk
+
+        def call_delta(arguments, call_id=None, name=None):
+            delta = MagicMock(index=0, id=call_id)
+            delta.function.name = name
+            delta.function.arguments = arguments
+            return delta
+
+        create = mock_openai_class.return_value.chat.completions.create
+        create.side_effect = [
+            iter([chunk(tool_calls=[call_delta('{"server_', call_id="call_1", name="get_server_status")]),
+                  chunk(tool_calls=[call_delta('id": 0}')])]),
+            iter([chunk("7 players "), chunk("are online.")]),
+        ]
+        response = self.client.post('/chat_with_llm/stream', json={'message': 'How many players?',
+                                                                   'server_id': '0', 'tools': True})
+        body = response.get_data(as_text=True)
+        self.assertIn('data: {"delta": "7 players "}', body)
+        self.assertIn('"tool_metrics": {"rounds": 1, "tool_calls": 1, "status_lookups": 1, "probes_avoided": 0}', body)
+        tool_message = create.call_args.kwargs['messages'][-1]
+        self.assertEqual(tool_message['tool_call_id'], "call_1")
+        self.assertEqual(json.loads(tool_message['content'])['status']['player_count'], 7)
+
+    @patch('mcp_chat_app.llm_client.OpenAI')
+    def test_chat_with_llm_coalesces_identical_prompts(self, mock_openai_class):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        release = threading.Event()
+
+        def slow_completion(**kwargs):
+            release.wait(5)
+            completion = MagicMock()
+            completion.choices[0].message.content = "Everyone gets this answer."
+            return completion
+
+        create = mock_openai_class.return_value.chat.completions.create
+        create.side_effect = slow_completion
+        replies = []
+
+        def ask():
+            with app.test_client() as client: # "cache": false, so only coalescing can avoid the second call
+                replies.append(client.post('/chat_with_llm', json={'message': 'Is it down?', 'cache': False}).get_json())
+
+        threads = [threading.Thread(target=ask) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for _ in range(500): # Until the second request has joined the first one's call
+            if llm_flight.stats()['coalesced']:
+                break
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual([reply['reply'] for reply in replies], ["Everyone gets this answer."] * 2)
+        self.assertEqual(self.client.get('/admin/stats').get_json()['single_flight']['llm']['coalesced'], 1)
+
+    @patch('mcp_chat_app.llm_client.OpenAI')
+    def test_metrics_endpoint(self, mock_openai_class):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        mock_openai_class.return_value.chat.completions.create.return_value.choices[0].message.content = "Hi!"
+        labels = ('/chat_with_llm', 'none')
+        before = (metrics_registry.value(OPENAI_SECONDS, *labels), metrics_registry.value(REPLY_CACHE, *labels, 'miss'),
+                  metrics_registry.value(HTTP_REQUESTS, '/chat_with_llm', '200'))
+
+        response = self.client.post('/chat_with_llm', json={'message': 'Hello metrics'})
+        response.close() # Requests are counted once their body has been sent
+        self.client.post('/chat_with_llm', json={'message': 'Hello metrics'}).close() # Served from the cache
+
+        after = (metrics_registry.value(OPENAI_SECONDS, *labels), metrics_registry.value(REPLY_CACHE, *labels, 'miss'),
+                 metrics_registry.value(HTTP_REQUESTS, '/chat_with_llm', '200'))
+        self.assertEqual([a - b for a, b in zip(after, before)], [1, 1, 2])
+        self.assertGreaterEqual(metrics_registry.value(REPLY_CACHE, *labels, 'hit'), 1)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        text = response.get_data(as_text=True)
+        self.assertIn('# TYPE mcp_chat_openai_seconds histogram', text)
+        self.assertIn('mcp_chat_openai_seconds_bucket{route="/chat_with_llm",server="none",le="+Inf"}', text)
+        self.assertIn('mcp_chat_cache_hits_total{cache="reply"} 1', text)
+        self.assertIn('mcp_chat_http_requests_in_flight{route="/metrics"} 1', text) # This request
+
+    @patch('mcp_chat_app.llm_client.OpenAI')
+    def test_chat_with_llm_conversation_memory(self, mock_openai_class):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        create = mock_openai_class.return_value.chat.completions.create
+        create.return_value.choices[0].message.content = "Redstone is Minecraft's wiring."
+
+        first = self.client.post('/chat_with_llm', json={'message': 'What is redstone?'}).get_json()
+        conversation_id = first['conversation_id']
+        self.assertTrue(conversation_id)
+
+        create.return_value.choices[0].message.content = "Start with a simple door circuit."
+        second = self.client.post('/chat_with_llm', json={'message': 'How do I learn it?',
+                                                          'conversation_id': conversation_id}).get_json()
+        self.assertEqual(second['conversation_id'], conversation_id)
+        messages = create.call_args.kwargs['messages']
+        self.assertEqual([m['role'] for m in messages], ['system', 'user', 'assistant', 'user'])
+        self.assertEqual(messages[1]['content'], 'What is redstone?') # The raw message, not the full prompt
+        self.assertEqual(messages[2]['content'], "Redstone is Minecraft's wiring.")
+
+        # Unknown IDs start a new conversation instead of failing
+        third = self.client.post('/chat_with_llm', json={'message': 'Hi', 'conversation_id': 'nope'}).get_json()
+        self.assertNotEqual(third['conversation_id'], conversation_id)
+        self.assertEqual(len(create.call_args.kwargs['messages']), 2)
+
+        self.assertEqual(self.client.delete(f'/conversations/{conversation_id}').status_code, 200)
+        self.assertEqual(self.client.delete(f'/conversations/{conversation_id}').status_code, 404)
+
+    def test_status_endpoint_without_poller(self):
+        response = self.client.get('/status')
+        self.assertEqual(response.status_code, 200)
+        json_data = response.get_json()
+        self.assertFalse(json_data['poller_running'])
+        self.assertEqual(json_data['servers'], [])
+
+    def test_chat_with_llm_reads_poller_snapshot(self):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        poller = StatusPoller(servers_source=lambda: config.MCP_SERVERS, cache=StatusCache(fetcher=MagicMock()))
+        snapshot_result = {"online": True, "version": "1.20", "motd": "Snapshot MOTD", "player_count": 7, "player_max": 50}
+        with patch('mcp_chat_app.status_poller.MCPClient.get_many', return_value=[snapshot_result] * len(config.MCP_SERVERS)):
+            poller.poll_once()
+
+        with patch('mcp_chat_app.app.status_poller', poller), \
+             patch.object(StatusPoller, 'running', new_callable=PropertyMock, return_value=True), \
+             patch('mcp_chat_app.app.MCPClient.get_server_status') as mock_mcp_get_status, \
+             patch('mcp_chat_app.llm_client.OpenAI') as mock_openai_class:
+            mock_openai_instance = mock_openai_class.return_value
+            mock_openai_instance.chat.completions.create.return_value.choices[0].message.content = "ok"
+            response = self.client.post('/chat_with_llm', json={'message': 'Status?', 'server_id': '0'})
+            status_response = self.client.get('/status').get_json()
+
+        self.assertEqual(response.status_code, 200)
+        mock_mcp_get_status.assert_not_called() # No network I/O in the request path
+        args, kwargs = mock_openai_instance.chat.completions.create.call_args
+        self.assertIn("Snapshot MOTD", kwargs['messages'][-1]['content'])
+        self.assertTrue(status_response['poller_running'])
+        self.assertEqual(len(status_response['servers']), len(config.MCP_SERVERS))
+
+    @patch('mcp_chat_app.app.MCPClient.get_server_status')
+    @patch('mcp_chat_app.llm_client.OpenAI')
+    def test_chat_with_llm_reuses_openai_client(self, mock_openai_class, mock_mcp_get_status):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        mock_openai_class.return_value.chat.completions.create.return_value.choices[0].message.content = "ok"
+
+        for _ in range(3):
+            self.client.post('/chat_with_llm', json={'message': 'Hello', 'server_id': '', 'cache': False})
+        mock_openai_class.assert_called_once() # One client for all requests
+
+        self.client.post('/admin/save_api_key', data={'openai-api-key': 'new_key_456'})
+        self.client.post('/chat_with_llm', json={'message': 'Hello', 'server_id': '', 'cache': False})
+        self.assertEqual(mock_openai_class.call_count, 2) # Rebuilt once for the new key
+        self.assertEqual(mock_openai_class.call_args.kwargs['api_key'], 'new_key_456')
+        self.assertEqual(client_manager.stats()['builds'], 2)
+
+    @staticmethod
+    def _stream_chunk(content):
+        chunk = MagicMock()
+        chunk.choices[0].delta.content = content
+        return chunk
+
+    @patch('mcp_chat_app.app.MCPClient.get_server_status')
+    @patch('mcp_chat_app.llm_client.OpenAI')
+    def test_chat_with_llm_stream(self, mock_openai_class, mock_mcp_get_status):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        mock_mcp_get_status.return_value = {"online": True, "version": "1.20", "motd": "Stream MOTD",
+                                            "player_count": 2, "player_max": 20}
+        mock_openai_instance = mock_openai_class.return_value
+        mock_openai_instance.chat.completions.create.return_value = iter(
+            [self._stream_chunk("Hel"), self._stream_chunk(None), self._stream_chunk("lo!")])
+
+        response = self.client.post('/chat_with_llm/stream', json={'message': 'Hi', 'server_id': '0'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        body = response.get_data(as_text=True)
+
+        events = [event for event in body.split("\n\n") if event]
+        self.assertTrue(events[0].startswith("event: meta"))
+        self.assertIn("Stream MOTD", events[0])
+        self.assertEqual(events[1], 'data: {"delta": "Hel"}')
+        self.assertEqual(events[2], 'data: {"delta": "lo!"}') # Empty deltas are skipped
+        self.assertTrue(events[3].startswith("event: done"))
+        args, kwargs = mock_openai_instance.chat.completions.create.call_args
+        self.assertTrue(kwargs['stream'])
+        self.assertIn("Stream MOTD", kwargs['messages'][-1]['content'])
+
+    @patch('mcp_chat_app.llm_client.OpenAI')
+    def test_chat_with_llm_model_choice_and_token_usage(self, mock_openai_class):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        create = mock_openai_class.return_value.chat.completions.create
+        create.return_value.choices[0].message.content = "Hi!"
+        create.return_value.usage = MagicMock(prompt_tokens=30, completion_tokens=5)
+        create.return_value.usage.prompt_tokens_details.cached_tokens = 20
+
+        response = self.client.post('/chat_with_llm', json={'message': 'Hello', 'model': 'gpt-4o-mini'})
+        json_data = response.get_json()
+        self.assertEqual(create.call_args.kwargs['model'], 'gpt-4o-mini')
+        self.assertEqual(json_data['model'], 'gpt-4o-mini')
+        self.assertGreater(json_data['prompt_tokens'], 0) # Counted before sending
+        self.assertEqual(json_data['usage'], {"prompt_tokens": 30, "completion_tokens": 5, "total_tokens": 35,
+                                              "cached_prompt_tokens": 20})
+        usage = self.client.get('/admin/stats').get_json()['token_usage']
+        self.assertEqual(usage['gpt-4o-mini']['requests'], 1)
+        self.assertEqual(usage['gpt-4o-mini']['cached_prompt_tokens'], 20)
+
+        response = self.client.post('/chat_with_llm', json={'message': 'Hello', 'model': 'gpt-0'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Unknown model", response.get_json()['error'])
+
+        # Streams ask for a final usage chunk and report it in the done event
+        usage_chunk = MagicMock(choices=[], usage=MagicMock(prompt_tokens=12, completion_tokens=3))
+        usage_chunk.usage.prompt_tokens_details = None
+        create.return_value = iter([self._stream_chunk("Hi"), usage_chunk])
+        response = self.client.post('/chat_with_llm/stream', json={'message': 'Hey'})
+        done = [event for event in response.get_data(as_text=True).split("\n\n") if event][-1]
+        self.assertTrue(done.startswith("event: done"))
+        self.assertEqual(json.loads(done.split("data: ", 1)[1])['usage']['total_tokens'], 15)
+        self.assertEqual(create.call_args.kwargs['stream_options'], {"include_usage": True})
+        self.assertEqual(create.call_args.kwargs['model'], config.CHAT_MODEL)
+
+    @patch('mcp_chat_app.llm_client.OpenAI')
+    def test_chat_with_llm_stream_errors(self, mock_openai_class):
+        config.OPENAI_API_KEY = None
+        response = self.client.post('/chat_with_llm/stream', json={'message': 'Hi'})
+        self.assertEqual(response.status_code, 503) # Validation errors are plain JSON, not a stream
+
+        config.OPENAI_API_KEY = 'fake_test_key'
+        mock_openai_class.return_value.chat.completions.create.side_effect = Exception("OpenAI API is down")
+        response = self.client.post('/chat_with_llm/stream', json={'message': 'Hi', 'server_id': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('event: error\ndata: {"error": "OpenAI API error: OpenAI API is down"}',
+                      response.get_data(as_text=True))
+
+    @patch('mcp_chat_app.app.MCPClient.get_server_status')
+    @patch('mcp_chat_app.llm_client.OpenAI')
+    def test_chat_with_llm_response_cache(self, mock_openai_class, mock_mcp_get_status):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        mock_mcp_get_status.return_value = {"online": True, "version": "1.20", "player_count": 10, "player_max": 100}
+        create = mock_openai_class.return_value.chat.completions.create
+        create.return_value.choices[0].message.content = "It is up."
+
+        first = self.client.post('/chat_with_llm', json={'message': 'Is it up?', 'server_id': '0'}).get_json()
+        second = self.client.post('/chat_with_llm', json={'message': '  is it UP ', 'server_id': '0'}).get_json()
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached']) # Normalized message, same status fingerprint
+        self.assertEqual(second['reply'], "It is up.")
+        self.assertEqual(create.call_count, 1)
+
+        # Opting out always reaches the LLM
+        opted_out = self.client.post('/chat_with_llm', json={'message': 'Is it up?', 'server_id': '0', 'cache': False})
+        self.assertFalse(opted_out.get_json()['cached'])
+        self.assertEqual(create.call_count, 2)
+
+        # A material change in the server status invalidates the cached answer
+        status_cache.clear()
+        mock_mcp_get_status.return_value = {"online": False, "error": "Connection refused."}
+        self.client.post('/chat_with_llm', json={'message': 'Is it up?', 'server_id': '0'})
+        self.assertEqual(create.call_count, 3)
+
+        stats = self.client.get('/admin/stats').get_json()['response_cache']
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['bypasses'], 1)
+
+    @patch('mcp_chat_app.llm_client.OpenAI')
+    def test_chat_with_llm_stream_uses_response_cache(self, mock_openai_class):
+        config.OPENAI_API_KEY = 'fake_test_key'
+        create = mock_openai_class.return_value.chat.completions.create
+        create.return_value = iter([self._stream_chunk("Hi "), self._stream_chunk("there")])
+
+        self.client.post('/chat_with_llm/stream', json={'message': 'Hello', 'server_id': ''}).get_data()
+        body = self.client.post('/chat_with_llm/stream', json={'message': 'Hello', 'server_id': ''}).get_data(as_text=True)
+        self.assertIn('data: {"delta": "Hi there"}', body)
+        self.assertIn('"cached": true', body)
+        self.assertEqual(create.call_count, 1)
+
+
+class TestConfigStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'config.sqlite3')
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        self.tmpdir.cleanup()
+
+    def open_store(self, registry):
+        store = ConfigStore(self.path, flush_interval=60) # Tests flush explicitly
+        self.stores.append(store)
+        store.load(registry)
+        store.attach(registry)
+        return store
+
+    def test_round_trip_keeps_ids_and_settings(self):
+        registry = ServerRegistry()
+        store = self.open_store(registry)
+        registry.add_many([{'name': f'S{i}', 'host': f's{i}.example', 'port': 25565} for i in range(3)])
+        registry.update(1, name='Renamed')
+        registry.remove(2) # The highest ID; it must still not be reused after a restart
+        store.set_setting('openai_api_key', 'sk-saved')
+        store.flush()
+
+        reloaded = ServerRegistry()
+        second = ConfigStore(self.path)
+        self.stores.append(second)
+        self.assertEqual(second.load(reloaded), 2)
+        self.assertEqual([r.to_dict() for r in reloaded], [r.to_dict() for r in registry])
+        self.assertEqual(reloaded.add('New', 'new.example', 25565).id, 3)
+        self.assertEqual(second.get_setting('openai_api_key'), 'sk-saved')
+
+    def test_burst_of_changes_is_written_in_one_flush(self):
+        registry = ServerRegistry()
+        store = self.open_store(registry)
+        for i in range(50):
+            registry.add(f'S{i}', f's{i}.example', 25565)
+        registry.remove(0)
+        self.assertEqual(store.flush(), 50) # 49 servers + the next-ID setting
+        self.assertEqual(store.stats()['flushes'], 1)
+        self.assertEqual(store.flush(), 0) # Nothing left to write
+
+    def test_empty_database_leaves_registry_untouched(self):
+        registry = ServerRegistry([{'name': 'Default', 'host': 'default.example', 'port': 25565}])
+        store = self.open_store(registry)
+        self.assertEqual(len(registry), 1)
+        store.flush() # Servers present before attaching are saved too
+        self.assertEqual(ConfigStore(self.path).load(ServerRegistry()), 1)
+
+    def test_app_reloads_saved_servers_and_api_key(self):
+        from . import app as app_module
+        with patch.object(config, 'PERSISTENCE_ENABLED', True), patch.object(config, 'PERSISTENCE_DB_PATH', self.path), \
+                patch.object(config, 'OPENAI_API_KEY', None):
+            config.MCP_SERVERS.clear()
+            initialize_app_config()
+            store = app_module.config_store
+            try:
+                config.MCP_SERVERS.remove(0)
+                app.test_client().post('/admin/save_api_key', data={'openai-api-key': 'sk-persisted'})
+                store.flush()
+            finally:
+                store.close()
+                app_module.config_store = None
+
+            config.MCP_SERVERS.clear()
+            config.OPENAI_API_KEY = None
+            initialize_app_config()
+            try:
+                self.assertEqual(len(config.MCP_SERVERS), len(config.DEFAULT_MCP_SERVERS) - 1)
+                self.assertIsNone(config.MCP_SERVERS.get(0))
+                self.assertEqual(config.OPENAI_API_KEY, 'sk-persisted')
+            finally:
+                app_module.config_store.close()
+                app_module.config_store = None
+
+
+class TestServerRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = ServerRegistry([
+            {'name': 'Alpha', 'host': 'Alpha.Example', 'port': 25565, 'type': 'Minecraft Java'},
+            {'name': 'Beta', 'host': 'beta.example', 'port': 19132, 'type': 'Minecraft Bedrock'},
+        ])
+
+    def test_lookups(self):
+        self.assertEqual(self.registry.get(1).name, 'Beta')
+        self.assertEqual(self.registry.get_by_address('alpha.example', 25565).id, 0) # Case-insensitive host
+        self.assertEqual([r.id for r in self.registry.find_by_name('beta')], [1])
+        self.assertIsNone(self.registry.get(99))
+        self.assertEqual(self.registry.get(0)['host'], 'Alpha.Example') # Dict-style access still works
+
+    def test_ids_are_stable_and_never_reused(self):
+        self.registry.remove(0)
+        added = self.registry.add('Gamma', 'gamma.example', 25565)
+        self.assertEqual(added.id, 2)
+        self.assertEqual([r.id for r in self.registry], [1, 2])
+        self.assertIsNone(self.registry.get_by_address('alpha.example', 25565))
+
+    def test_copy_on_write_and_version(self):
+        version = self.registry.version
+        before = self.registry.all()
+        updated = self.registry.update(0, port=25566)
+        self.assertEqual(updated.port, 25566)
+        self.assertEqual(before[0].port, 25565) # Readers holding the old state are unaffected
+        self.assertEqual(self.registry.version, version + 1)
+        self.assertIsNotNone(self.registry.get_by_address('alpha.example', 25566))
+        with self.assertRaises(AttributeError):
+            updated.port = 1 # Records are immutable
+
+    def test_batch_writes_are_single_changes(self):
+        version = self.registry.version
+        self.registry.add_many([{'name': f'S{i}', 'host': f's{i}.example', 'port': 25565} for i in range(100)])
+        self.assertEqual(self.registry.version, version + 1)
+        self.registry.remove_many(range(2, 52))
+        self.assertEqual(len(self.registry), 52)
+        self.assertEqual(self.registry.version, version + 2)
+
+
+class TestASGIApp(unittest.TestCase):
+
+    def setUp(self):
+        config.MCP_SERVERS.clear()
+        config.MCP_SERVERS.add_many(copy.deepcopy(config.DEFAULT_MCP_SERVERS))
+        config.OPENAI_API_KEY = 'fake_test_key'
+        status_cache.clear()
+        response_cache.clear()
+        client_manager.reset()
+        admission_module.client_limiter.clear()
+        admission_module.openai_limits.clear()
+
+    def tearDown(self):
+        config.MCP_SERVERS.clear()
+        config.OPENAI_API_KEY = None
+
+    def _request(self, method, path, **kwargs):
+        from .asgi import app as asgi_app
+        async def run():
+            transport = httpx.ASGITransport(app=asgi_app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as http:
+                return await http.request(method, path, **kwargs)
+        return asyncio.run(run())
+
+    @patch('mcp_chat_app.status_cache.MCPClient.async_get_server_status', new_callable=AsyncMock)
+    @patch('mcp_chat_app.llm_client.AsyncOpenAI')
+    def test_chat_with_llm_async(self, mock_async_openai_class, mock_async_get_status):
+        mock_async_get_status.return_value = {"online": True, "version": "1.20", "motd": "Async MOTD",
+                                              "player_count": 5, "player_max": 20}
+        mock_completion = MagicMock()
+        mock_completion.choices[0].message.content = "Async reply"
+        create = mock_async_openai_class.return_value.chat.completions.create = AsyncMock(return_value=mock_completion)
+
+        response = self._request('POST', '/chat_with_llm', json={'message': 'Status?', 'server_id': '0'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['reply'], "Async reply")
+        server = config.MCP_SERVERS.get(0)
+        mock_async_get_status.assert_awaited_once_with(server['host'], server['port'], timeout=3, server_type=server['type'])
+        self.assertIn("Async MOTD", create.call_args.kwargs['messages'][-1]['content'])
+
+        response = self._request('POST', '/chat_with_llm', json={'server_id': ''})
+        self.assertEqual(response.status_code, 400) # Same validation as the Flask route
+
+    @patch('mcp_chat_app.status_cache.MCPClient.async_get_many', new_callable=AsyncMock)
+    @patch('mcp_chat_app.llm_client.AsyncOpenAI')
+    def test_chat_with_llm_multiple_servers_async(self, mock_async_openai_class, mock_async_get_many):
+        mock_async_get_many.side_effect = lambda servers, **kwargs: [ServerStatus(True, player_count=2, player_max=8)
+                                                                      for _ in servers]
+        mock_completion = MagicMock()
+        mock_completion.choices[0].message.content = "Async reply"
+        create = mock_async_openai_class.return_value.chat.completions.create = AsyncMock(return_value=mock_completion)
+
+        response = self._request('POST', '/chat_with_llm', json={'message': 'Compare them', 'server_ids': 'all'})
+        self.assertEqual(response.status_code, 200)
+        mock_async_get_many.assert_awaited_once()
+        self.assertEqual(len(response.json()['server_data_used']), len(config.MCP_SERVERS))
+        self.assertIn("Minecraft servers (4 online)", create.call_args.kwargs['messages'][-1]['content'])
+
+    @patch('mcp_chat_app.llm_client.AsyncOpenAI')
+    def test_chat_with_llm_stream_async(self, mock_async_openai_class):
+        async def fake_stream():
+            for text in ("As", "ync"):
+                chunk = MagicMock()
+                chunk.choices[0].delta.content = text
+                yield chunk
+        mock_async_openai_class.return_value.chat.completions.create = AsyncMock(return_value=fake_stream())
+
+        response = self._request('POST', '/chat_with_llm/stream', json={'message': 'Hi', 'server_id': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['content-type'].startswith('text/event-stream'))
+        self.assertIn('data: {"delta": "As"}\n\ndata: {"delta": "ync"}\n\nevent: done', response.text)
+
+    def test_other_routes_are_served_by_flask(self):
+        response = self._request('GET', '/admin')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("MCP Server & LLM Configuration", response.text)
+        self.assertEqual(self._request('GET', '/status').json()['poller_running'], False)
+        self.assertEqual(self._request('GET', '/status/stream?servers=x').status_code, 400) # Served natively
+
+    @patch('mcp_chat_app.app.MCPClient.get_many')
+    @patch('mcp_chat_app.asgi.MCPClient.async_get_many', new_callable=AsyncMock)
+    def test_import_with_probe_is_served_natively(self, mock_async_get_many, mock_get_many):
+        mock_async_get_many.side_effect = lambda servers, **kwargs: [
+            ServerStatus(True, player_count=1) if s.host == 'up.example'
+            else ServerStatus.offline("Connection refused.") for s in servers]
+        upload = b"name,host,port\nUp,up.example,25565\nDown,down.example,25565\nBad,,1\n"
+        response = self._request('POST', '/admin/servers/import?probe=1', content=upload,
+                                 headers={'Content-Type': 'text/csv'})
+        self.assertEqual(response.status_code, 200)
+        summary = response.json()
+        self.assertEqual((summary['imported'], summary['invalid']), (2, 1))
+        self.assertEqual((summary['probe']['checked'], summary['probe']['online']), (2, 1))
+        mock_async_get_many.assert_awaited_once()
+        mock_get_many.assert_not_called() # No bridge thread held for the probes
+        self.assertEqual(status_cache.get('up.example', 25565, 'Unknown')['player_count'], 1)
+
+        response = self._request('POST', '/admin/servers/import?probe=1&format=xml', content=b"")
+        self.assertEqual(response.status_code, 400)
+        response = self._request('POST', '/admin/servers/import?probe=1', content=b"[{",
+                                 headers={'Content-Type': 'application/json'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_status_fingerprint_is_coarse(self):
+        server = {'host': 'Play.Example', 'port': 25565}
+        base = {"online": True, "version": "1.20", "player_max": 100}
+        fp = lambda players: status_fingerprint(server, dict(base, player_count=players))
+        self.assertEqual(fp(100), fp(105)) # Small fluctuation
+        self.assertNotEqual(fp(100), fp(150)) # Material change
+        self.assertNotEqual(fp(0), fp(1))
+        self.assertNotEqual(fp(10), status_fingerprint(server, {"online": False}))
+
+    def test_key_depends_on_model_and_system_prompt(self):
+        key = make_key("Hello", "gpt-3.5-turbo", "system", "")
+        self.assertEqual(key, make_key("hello!", "gpt-3.5-turbo", "system", ""))
+        self.assertNotEqual(key, make_key("Hello", "gpt-4o", "system", ""))
+        self.assertNotEqual(key, make_key("Hello", "gpt-3.5-turbo", "other system", ""))
+
+    def test_memory_backend_ttl_and_lru(self):
+        now = [0.0]
+        cache = ResponseCache(MemoryBackend(max_entries=2, ttl=10, clock=lambda: now[0]))
+        cache.put('a', 'A')
+        cache.put('b', 'B')
+        cache.get('a')
+        cache.put('c', 'C') # Evicts 'b'
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'A')
+        now[0] = 11
+        self.assertIsNone(cache.get('a')) # Expired
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (2, 2, 1))
+
+    def test_sqlite_backend_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'responses.sqlite3')
+            ResponseCache(SQLiteBackend(path, max_entries=2, ttl=60)).put('k', 'cached reply')
+            reopened = ResponseCache(SQLiteBackend(path, max_entries=2, ttl=60))
+            self.assertEqual(reopened.get('k'), 'cached reply')
+            reopened.put('k2', 'two')
+            reopened.put('k3', 'three') # Over max_entries: least recently used entry is evicted
+            self.assertEqual(len(reopened.backend), 2)
+            self.assertEqual(reopened.stats()['evictions'], 1)
+
+
+class TestStatusPoller(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.servers = [{'name': 'A', 'host': 'a.example', 'port': 25565, 'type': 'Minecraft Java'}]
+        self.cache = StatusCache(fetcher=MagicMock())
+        self.poller = StatusPoller(servers_source=lambda: self.servers, cache=self.cache,
+                                   base_interval=10, fast_interval=2, stable_interval=60, offline_interval=300,
+                                   jitter=0, clock=lambda: self.now)
+
+    def _poll(self, *results):
+        with patch('mcp_chat_app.status_poller.MCPClient.get_many', return_value=list(results)) as mock_get_many:
+            self.poller.poll_once()
+        return mock_get_many
+
+    def _schedule(self):
+        return self.poller._schedules[StatusCache.make_key('a.example', 25565, 'Minecraft Java')]
+
+    def test_publishes_snapshot_and_fills_cache(self):
+        self._poll({"online": True, "player_count": 4})
+        entry = self.poller.snapshot.get('a.example', 25565, 'Minecraft Java')
+        self.assertEqual(entry.status['player_count'], 4)
+        self.assertEqual(self.poller.snapshot.sweeps, 1)
+        with self.assertRaises(TypeError):
+            entry.status['player_count'] = 5 # Snapshots are read-only
+        self.assertEqual(self.cache.get('a.example', 25565, 'Minecraft Java')['player_count'], 4)
+
+    def test_only_due_servers_are_probed(self):
+        self._poll({"online": True})
+        self.now = 1
+        mock_get_many = self._poll()
+        mock_get_many.assert_not_called()
+
+    def test_stable_servers_back_off_and_flapping_servers_speed_up(self):
+        self._poll({"online": True})
+        self.assertEqual(self._schedule().interval, 15)
+        for _ in range(5):
+            self.now = self._schedule().next_due
+            self._poll({"online": True})
+        self.assertEqual(self._schedule().interval, 60) # Capped at stable_interval
+
+        self.now = self._schedule().next_due
+        self._poll({"online": False, "error": "Connection refused."})
+        self.assertEqual(self._schedule().interval, 2) # Flipped, so poll fast
+
+    def test_deadline_placeholders_keep_the_last_entry(self):
+        self._poll(ServerStatus(True, player_count=4))
+        interval = self._schedule().interval
+        self.now = self._schedule().next_due
+        self._poll(ServerStatus.unknown("Status check did not finish within the 4 second deadline."))
+        entry = self.poller.snapshot.get('a.example', 25565, 'Minecraft Java')
+        self.assertTrue(entry.status['online']) # Not reported offline
+        self.assertEqual(self._schedule().interval, interval) # No back-off
+        self.assertEqual(self._schedule().next_due, self.now + 2) # Retried after fast_interval
+        self.assertEqual(self.cache.get('a.example', 25565, 'Minecraft Java')['player_count'], 4)
+
+    def test_sweep_deadline_leaves_time_for_every_wave(self):
+        self.poller.timeout = 1
+        many = [{'host': f'h{i}.example', 'port': 25565} for i in range(300)]
+        with patch.object(config, 'MCP_PROBE_CONCURRENCY', 64):
+            self.assertEqual(self.poller.sweep_deadline(many), 5 * 1 + 1) # 300 probes in waves of 64
+        same_host = [{'host': 'one.example', 'port': 25565 + i} for i in range(10)]
+        with patch.object(config, 'MCP_PROBE_PER_HOST_LIMIT', 4):
+            self.assertEqual(self.poller.sweep_deadline(same_host), 3 * 1 + 1)
+
+    def test_removed_servers_leave_the_snapshot(self):
+        self._poll({"online": True})
+        self.servers = []
+        self.poller.poll_once()
+        self.assertEqual(len(self.poller.snapshot.entries), 0)
+
+
+class _FakeAnswer:
+    """Stands in for a dnspython answer with a single record."""
+
+    def __init__(self, address, ttl):
+        self.rrset = MagicMock(ttl=ttl) if address else None
+        self.response = MagicMock(authority=[])
+        self._address = address
+
+    def __getitem__(self, index):
+        return self._address
+
+
+class TestResolverCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [1000.0]
+        self.cache = ResolverCache(min_ttl=5, max_ttl=600, negative_ttl=30, max_entries=10,
+                                   slow_threshold=0.2, clock=lambda: self.now[0])
+
+    @patch('dns.resolver.resolve')
+    def test_answers_are_cached_for_their_ttl(self, mock_resolve):
+        mock_resolve.return_value = _FakeAnswer('198.51.100.7', ttl=60)
+        self.assertEqual(self.cache.resolve('Play.Example.')[0], '198.51.100.7')
+        self.assertEqual(self.cache.resolve('play.example')[0], '198.51.100.7') # Same normalized name
+        self.assertEqual(mock_resolve.call_count, 1)
+
+        self.now[0] += 61
+        mock_resolve.return_value = _FakeAnswer('198.51.100.8', ttl=60)
+        self.assertEqual(self.cache.resolve('play.example')[0], '198.51.100.8')
+        self.assertEqual(mock_resolve.call_count, 2)
+
+    @patch('socket.getaddrinfo', side_effect=socket.gaierror("Name or service not known"))
+    @patch('dns.resolver.resolve', side_effect=dns.resolver.NXDOMAIN())
+    def test_nxdomain_is_cached(self, mock_resolve, mock_getaddrinfo):
+        for _ in range(3):
+            with self.assertRaises(HostNotFoundError):
+                self.cache.resolve('missing.example')
+        self.assertEqual(mock_resolve.call_count, 1)
+        self.assertEqual(self.cache.stats()['negative_hits'], 2)
+
+    @patch('dns.resolver.resolve')
+    def test_falls_back_to_last_known_good_address(self, mock_resolve):
+        mock_resolve.return_value = _FakeAnswer('198.51.100.7', ttl=10)
+        self.cache.resolve('play.example')
+        self.now[0] += 11
+        mock_resolve.side_effect = dns.exception.Timeout()
+        self.assertEqual(self.cache.resolve('play.example', timeout=5)[0], '198.51.100.7')
+        self.assertEqual(mock_resolve.call_args.kwargs['lifetime'], 0.2) # Slow resolver only gets the threshold
+        self.assertEqual(self.cache.stats()['stale_fallbacks'], 1)
+        with self.assertRaises(dns.exception.Timeout): # No fallback for a name never resolved
+            self.cache.resolve('other.example')
+
+    def test_ip_literals_skip_resolution(self):
+        self.assertEqual(self.cache.resolve('127.0.0.1'), ('127.0.0.1', 0.0))
+        self.assertEqual(self.cache.stats()['misses'], 0)
+
+
+class TestStatusCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.fetcher = MagicMock(return_value={"online": True, "player_count": 1})
+        self.cache = StatusCache(ttl=30, negative_ttl=5, stale_ttl=60, max_entries=2,
+                                 fetcher=self.fetcher, clock=lambda: self.now)
+
+    def test_hit_within_ttl(self):
+        self.cache.get('host.a', 25565, 'Minecraft Java')
+        self.now += 10
+        self.cache.get('HOST.A', 25565, 'Minecraft Java') # Host names are case-insensitive
+        self.fetcher.assert_called_once_with('host.a', 25565, timeout=3, server_type='Minecraft Java')
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_negative_results_use_shorter_ttl(self):
+        cache = StatusCache(ttl=30, negative_ttl=5, stale_ttl=0, fetcher=self.fetcher, clock=lambda: self.now)
+        self.fetcher.return_value = {"online": False, "error": "Connection refused."}
+        cache.get('down.host', 25565)
+        self.assertEqual(cache._entries[StatusCache.make_key('down.host', 25565)].expires_at, self.now + 5)
+        self.now += 4
+        cache.get('down.host', 25565)
+        self.assertEqual(self.fetcher.call_count, 1)
+        self.now += 2 # Past negative_ttl; with no stale window this is a plain miss, fetched in the caller
+        cache.get('down.host', 25565)
+        self.assertEqual(self.fetcher.call_count, 2)
+
+    def test_unknown_placeholders_are_not_cached(self):
+        self.cache.get('host.a', 25565)
+        self.now += 40 # Stale
+        self.cache.put('host.a', 25565, None, ServerStatus.unknown("Status check did not finish."))
+        self.assertEqual(self.cache.stats()['size'], 1)
+        self.assertEqual(self.cache.get('host.a', 25565)['player_count'], 1) # Still the last real result
+
+        self.cache.clear()
+        with patch('mcp_chat_app.status_cache.MCPClient.get_many',
+                   return_value=[ServerStatus.unknown("Status check did not finish.")]):
+            results = self.cache.get_many([{'host': 'host.b', 'port': 25565}], deadline=1)
+        self.assertTrue(is_unknown(results[0]))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_stale_entries_are_refreshed_in_one_batch(self):
+        cache = StatusCache(ttl=30, negative_ttl=5, stale_ttl=60, clock=lambda: self.now)
+        servers = [{'host': f'host.{i}', 'port': 25565} for i in range(5)]
+        for server in servers:
+            cache.put(server['host'], server['port'], None, ServerStatus(True, player_count=1))
+        self.now += 40 # All stale
+        refreshed = threading.Event()
+        def get_many(batch, timeout=3):
+            refreshed.set()
+            return [ServerStatus(True, player_count=2) for _ in batch]
+        with patch('mcp_chat_app.status_cache.MCPClient.get_many', side_effect=get_many) as mock_get_many, \
+             patch('mcp_chat_app.status_cache.threading.Thread', wraps=threading.Thread) as mock_thread:
+            results = cache.get_many(servers)
+            self.assertEqual([r['player_count'] for r in results], [1] * 5) # Stale values returned immediately
+            self.assertTrue(refreshed.wait(2))
+            for _ in range(100):
+                if all(cache.get(s['host'], s['port'])['player_count'] == 2 for s in servers):
+                    break
+                time.sleep(0.01)
+        mock_get_many.assert_called_once()
+        self.assertEqual(len(mock_get_many.call_args.args[0]), 5)
+        self.assertEqual(mock_thread.call_count, 1)
+        self.assertEqual([cache.get(s['host'], s['port'])['player_count'] for s in servers], [2] * 5)
+
+    def test_stale_while_revalidate(self):
+        self.cache.get('host.a', 25565)
+        refreshed = threading.Event()
+        def slow_refresh(host, port, timeout, server_type=None):
+            refreshed.set()
+            return {"online": True, "player_count": 2}
+        self.cache._fetcher = slow_refresh
+        self.now += 40 # Expired, but within the stale window
+
+        result = self.cache.get('host.a', 25565)
+        self.assertEqual(result['player_count'], 1) # Stale value returned immediately
+        self.assertTrue(refreshed.wait(2))
+        for _ in range(100): # Wait for the refreshed value to be stored
+            if self.cache.get('host.a', 25565)['player_count'] == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.cache.get('host.a', 25565)['player_count'], 2)
+        self.assertEqual(self.cache.stats()['refreshes'], 1)
+
+    def test_lru_eviction(self):
+        self.cache.get('a', 1)
+        self.cache.get('b', 1)
+        self.cache.get('a', 1) # 'a' becomes most recently used
+        self.cache.get('c', 1) # Evicts 'b'
+        stats = self.cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['size'], 2)
+        self.cache.get('b', 1)
+        self.assertEqual(self.fetcher.call_count, 4)
+
+
 if __name__ == '__main__':
     unittest.main()
+
+
+class TestStatusHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1_000_000.0
+        self.history = StatusHistory(raw_samples=10, minute_buckets=5, hour_buckets=3, day_buckets=2,
+                                     max_series=2, clock=lambda: self.now)
+        self.key = ('host.a', 25565, 'Minecraft Java')
+
+    def record(self, count, every, online=True, players=10, latency=20):
+        for _ in range(count):
+            self.now += every
+            self.history.record(self.key, ServerStatus(online, player_count=players if online else None,
+                                                       latency=latency if online else None))
+
+    def test_raw_ring_keeps_newest_samples(self):
+        for players in range(15):
+            self.record(1, 5, players=players)
+        samples = self.history.recent(self.key, limit=100)
+        self.assertEqual([s['player_count'] for s in samples], list(range(5, 15))) # Oldest 5 overwritten
+        self.assertEqual(len(self.history.recent(self.key, limit=3)), 3)
+        self.assertEqual(self.history.recent(('other', 1, 'Unknown')), [])
+
+    def test_summary_percentiles_and_uptime(self):
+        for latency in range(10, 100, 10):
+            self.record(1, 5, latency=latency)
+        self.record(1, 5, online=False)
+        summary = self.history.summary(self.key, window=60)
+        self.assertEqual(summary['resolution'], 'raw')
+        self.assertEqual((summary['samples'], summary['uptime']), (10, 90.0))
+        self.assertEqual(summary['latency']['p50'], 50)
+        self.assertEqual(summary['latency']['max'], 90)
+
+    def test_long_windows_use_rollups(self):
+        self.record(120, 30, players=8) # An hour of samples; raw only holds the last 5 minutes
+        self.record(60, 30, online=False)
+        summary = self.history.summary(self.key, window=7200)
+        self.assertNotEqual(summary['resolution'], 'raw')
+        self.assertEqual(summary['samples'], 180)
+        self.assertAlmostEqual(summary['uptime'], 66.67)
+        hours = self.history.buckets(self.key, '1h')
+        self.assertEqual(sum(bucket['samples'] for bucket in hours), 180)
+        self.assertLessEqual(len(self.history.buckets(self.key, '1m')), 5) # Bounded by the bucket count
+        with self.assertRaises(ValueError):
+            self.history.buckets(self.key, '5m')
+
+    def test_memory_is_bounded(self):
+        self.record(100, 3600)
+        size = self.history.stats()['bytes']
+        self.record(1000, 3600)
+        self.assertEqual(self.history.stats()['bytes'], size)
+        self.history.record(('host.b', 1, 'Unknown'), ServerStatus(True))
+        self.history.record(('host.c', 1, 'Unknown'), ServerStatus(True))
+        self.assertEqual(self.history.stats()['servers'], 2) # host.a was evicted
+        self.assertEqual(self.history.recent(self.key), [])
+
+    def test_trend_and_description(self):
+        self.assertEqual(self.history.describe(self.key), "")
+        self.history = StatusHistory(clock=lambda: self.now)
+        for players in range(100, 40, -1): # Falling from 100 to 41 players over an hour (~95 -> ~47 at the edges)
+            self.record(1, 60, players=players)
+        self.assertAlmostEqual(self.history.trend(self.key, window=3600), -50.5, places=1)
+        self.assertEqual(self.history.trend(self.key, 'latency', 3600), 0)
+        self.assertEqual(self.history.describe(self.key),
+                         "Trends: player count down 50% in the last hour; uptime 100% over the last hour; "
+                         "median latency 20 ms. ")
+
+    def test_description_covers_only_recorded_time(self):
+        self.record(20, 60) # 20 minutes of samples, summarised from an hour bucket that began well before them
+        self.assertNotEqual(self.history.summary(self.key, 86400)['resolution'], 'raw')
+        self.assertEqual(self.history.describe(self.key),
+                         "Trends: uptime 100% over the last 19 minutes; median latency 20 ms. ")
+
+
+class _DeferredExecutor:
+    """Collects submitted jobs so tests decide when background work runs."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args):
+        self.jobs.append((fn, args))
+
+    def run_all(self):
+        jobs, self.jobs = self.jobs, []
+        for fn, args in jobs:
+            fn(*args)
+
+
+class TestConversationStore(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = _DeferredExecutor()
+        self.summarizer = MagicMock(return_value="The user asked about servers 0 to 9.")
+        self.store = ConversationStore(max_conversations=2, idle_ttl=60, token_budget=200, max_turns=50,
+                                       summarizer=self.summarizer, executor=self.executor)
+
+    def test_history_stays_within_budget_and_summarizes_in_background(self):
+        conversation = self.store.get_or_create()
+        for i in range(30):
+            self.store.add_turn(conversation, f"Tell me about server {i}, please. " * 2, f"Server {i} is fine. " * 3)
+            history = self.store.history(conversation)
+            self.assertLessEqual(count_message_tokens(history), 200) # Flat, however long the conversation gets
+        self.assertEqual(history[-1]['content'], "Server 29 is fine. " * 3)
+        self.assertEqual(len(self.executor.jobs), 1) # One summary in flight at a time, never inline
+        self.summarizer.assert_not_called()
+
+        self.executor.run_all()
+        previous_summary, turns = self.summarizer.call_args.args
+        self.assertEqual(previous_summary, "")
+        self.assertEqual(turns[0][0], "Tell me about server 0, please. " * 2)
+        history = self.store.history(conversation)
+        self.assertEqual(history[0], {"role": "system",
+                                      "content": "Summary of the earlier conversation: The user asked about servers 0 to 9."})
+        self.assertLessEqual(count_message_tokens(history), 200)
+        self.assertEqual(self.store.stats()['summaries'], 1)
+
+    def test_failed_summary_keeps_turns(self):
+        self.summarizer.side_effect = Exception("API down")
+        conversation = self.store.get_or_create()
+        for i in range(20):
+            self.store.add_turn(conversation, f"Question {i} " * 10, f"Answer {i} " * 10)
+        self.store.history(conversation)
+        self.executor.run_all()
+        self.assertEqual(len(conversation.turns), 20)
+        self.assertFalse(conversation.summarizing)
+        self.assertEqual(self.store.stats()['summary_failures'], 1)
+
+    def test_conversations_are_bounded(self):
+        first = self.store.get_or_create()
+        self.assertIs(self.store.get_or_create(first.id), first)
+        self.store.get_or_create()
+        self.store.get_or_create()
+        self.assertIsNot(self.store.get_or_create(first.id), first) # Evicted (LRU), so a new one is started
+        self.assertEqual(self.store.stats()['evictions'], 2)
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.flight = SingleFlight("test")
+
+    def _run_concurrently(self, count, target):
+        """Starts `count` threads running target(). Returns the threads and their (future) results."""
+        results = [None] * count
+
+        def run(index):
+            try:
+                results[index] = target()
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def _wait_for_waiters(self, flight, count):
+        for _ in range(500):
+            if flight.stats()['coalesced'] >= count:
+                return
+            time.sleep(0.01)
+        self.fail("waiters did not join the call in flight")
+
+    def test_concurrent_calls_share_one_execution_and_errors(self):
+        release = threading.Event()
+        fn = MagicMock(side_effect=lambda: release.wait(5) and "result")
+        threads, results = self._run_concurrently(5, lambda: self.flight.do("key", fn))
+        self._wait_for_waiters(self.flight, 4)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(fn.call_count, 1)
+        self.assertEqual(results, ["result"] * 5)
+
+        # Nothing is kept once the call is done, and errors reach every waiter
+        release.clear()
+        def failing():
+            release.wait(5)
+            raise ValueError("boom")
+        threads, results = self._run_concurrently(3, lambda: self.flight.do("key", failing))
+        self._wait_for_waiters(self.flight, 6)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        stats = self.flight.stats()
+        self.assertEqual((stats['executions'], stats['coalesced'], stats['errors'], stats['in_flight']), (2, 6, 1, 0))
+
+    def test_async_waiters_share_with_threads_and_retry_abandoned_calls(self):
+        async def scenario():
+            started = asyncio.Event()
+            calls = []
+
+            async def probe():
+                calls.append(1)
+                started.set()
+                await asyncio.sleep(0.05)
+                return len(calls)
+
+            leader = asyncio.ensure_future(self.flight.async_do("key", probe))
+            await started.wait()
+            waiter = asyncio.ensure_future(self.flight.async_do("key", probe))
+            await asyncio.sleep(0)
+            leader.cancel() # The leader's caller gave up: the waiter runs the probe itself
+            self.assertEqual(await waiter, 2)
+
+            # A thread blocked in do() gets the result of a call led on the event loop
+            started.clear()
+            leader = asyncio.ensure_future(self.flight.async_do("other", probe))
+            await started.wait()
+            in_thread = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: self.flight.do("other", MagicMock(side_effect=AssertionError)))
+            self.assertEqual(in_thread, await leader)
+
+        asyncio.run(scenario())
+        self.assertEqual(self.flight.stats()['abandoned'], 1)
+
+    def test_stream_waiters_get_the_joined_reply(self):
+        release = threading.Event()
+
+        def parts():
+            yield "Hello"
+            release.wait(5)
+            yield ", world"
+
+        leader = self.flight.stream("key", parts)
+        self.assertEqual(next(leader), "Hello")
+        threads, results = self._run_concurrently(1, lambda: list(self.flight.stream("key", parts)))
+        self._wait_for_waiters(self.flight, 1)
+        release.set()
+        self.assertEqual(list(leader), [", world"])
+        threads[0].join(5)
+        self.assertEqual(results, [["Hello, world"]])
+
+    def test_mcp_client_coalesces_probes_of_the_same_server(self):
+        probe_flight.reset()
+        release = threading.Event()
+        online = ServerStatus(True, player_count=3)
+        probe = MagicMock(side_effect=lambda *args: release.wait(5) and online)
+        with patch.object(MCPClient, '_probe_status', probe):
+            threads, results = self._run_concurrently(
+                4, lambda: MCPClient.get_server_status('Play.Example.com', 25565, timeout=5, server_type='Minecraft Java'))
+            self._wait_for_waiters(probe_flight, 3)
+            release.set()
+            for thread in threads:
+                thread.join(5)
+        self.assertEqual(probe.call_count, 1)
+        self.assertTrue(all(result is online for result in results))
+
+        # Each caller stores the shared result in the status cache, but the history records it once
+        history = StatusHistory()
+        cache = StatusCache(history=history)
+        for _ in results:
+            cache.put('play.example.com', 25565, 'Minecraft Java', online)
+        self.assertEqual(len(history.recent(cache.make_key('play.example.com', 25565, 'Minecraft Java'))), 1)
+
+
+class TestHostHealth(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.health = HostHealth(enabled=True, samples=10, min_samples=3, timeout_multiplier=3, min_timeout=0.5,
+                                 failure_threshold=3, cooldown=30, max_cooldown=100, max_hosts=10,
+                                 clock=lambda: self.now)
+        self.offline = ServerStatus.offline("Connection refused.")
+        self.online = ServerStatus(True, player_count=1)
+
+    def test_circuit_opens_trials_and_recovers(self):
+        for _ in range(3):
+            self.assertIsNone(self.health.check('Dead.Example.com', 25565))
+            self.health.record('dead.example.com', 25565, self.offline, 0.01, 3)
+        self.assertEqual(self.health.state('dead.example.com', 25565), OPEN)
+        self.assertIs(self.health.check('dead.example.com', 25565), self.offline) # Served without probing
+
+        self.now += 30
+        self.assertIsNone(self.health.check('dead.example.com', 25565)) # The one trial probe
+        self.assertEqual(self.health.state('dead.example.com', 25565), HALF_OPEN)
+        self.assertIs(self.health.check('dead.example.com', 25565), self.offline) # Others still short-circuit
+        self.health.record('dead.example.com', 25565, self.offline, 0.01, 3)
+
+        self.now += 30 # The failed trial doubled the cooldown
+        self.assertIsNotNone(self.health.check('dead.example.com', 25565))
+        self.now += 30
+        self.assertIsNone(self.health.check('dead.example.com', 25565))
+        self.health.record('dead.example.com', 25565, self.online, 0.05, 3)
+        self.assertEqual(self.health.state('dead.example.com', 25565), CLOSED)
+
+        stats = self.health.stats()
+        self.assertEqual((stats['opens'], stats['trials'], stats['recoveries'], stats['short_circuits']), (2, 2, 1, 3))
+        self.assertEqual(stats['open_circuits'], {})
+
+    def test_timeout_follows_recent_p99(self):
+        self.assertEqual(self.health.timeout_for('fast.example.com', 25565, 3), 3) # Too few samples yet
+        for _ in range(3):
+            self.health.record('fast.example.com', 25565, self.online, 0.05, 3)
+        self.assertEqual(self.health.timeout_for('fast.example.com', 25565, 3), 0.5) # Never below the minimum
+        self.health.record('fast.example.com', 25565, self.online, 0.4, 3)
+        self.assertAlmostEqual(self.health.timeout_for('fast.example.com', 25565, 3), 0.4 * 3, delta=0.05)
+
+        # A probe that ran into its tightened timeout widens it again, up to the caller's timeout
+        self.health.record('fast.example.com', 25565, self.offline, 1.2, 1.2)
+        self.assertEqual(self.health.timeout_for('fast.example.com', 25565, 3), 3)
+        self.assertEqual(self.health.timeout_for('fast.example.com', 25565, 2), 2)
+
+    def test_deadline_clipped_failures_are_not_counted(self):
+        for _ in range(3): # Probes cut short by a batch deadline
+            self.health.record('slow.example.com', 25565, self.offline, 0.01, 0.01, clipped=True)
+        self.assertEqual(self.health.state('slow.example.com', 25565), CLOSED)
+
+        for _ in range(3):
+            self.health.record('dead.example.com', 25565, self.offline, 3, 3)
+        self.now += 30
+        self.assertIsNone(self.health.check('dead.example.com', 25565)) # Trial probe...
+        self.health.record('dead.example.com', 25565, self.offline, 0.01, 0.01, clipped=True) # ...cut short
+        self.assertEqual(self.health.state('dead.example.com', 25565), OPEN)
+        self.assertIsNone(self.health.check('dead.example.com', 25565)) # The next caller runs a new trial
+        self.health.release_trial('dead.example.com', 25565) # e.g. that trial was cancelled
+        self.assertIsNone(self.health.check('dead.example.com', 25565))
+        self.assertEqual(self.health.stats()['opens'], 1)
+
+    def test_get_many_deadline_does_not_open_healthy_circuits(self):
+        host_health.clear()
+
+        async def answers_in(host, port, timeout, server_type, query):
+            if timeout < 0.2:
+                await asyncio.sleep(timeout)
+                return ServerStatus.offline(f"Connection timed out after {timeout} seconds.")
+            await asyncio.sleep(0.2)
+            return ServerStatus(True, player_count=1)
+
+        servers = [{'host': f'healthy{i}.example', 'port': 25565} for i in range(12)]
+        with patch.object(MCPClient, '_async_probe_status', side_effect=answers_in), \
+             patch.object(host_health, 'failure_threshold', 1), patch.object(host_health, 'enabled', True):
+            for _ in range(2):
+                results = MCPClient.get_many(servers, concurrency=4, timeout=3, deadline=0.3)
+                self.assertTrue(all(result['online'] or is_unknown(result) for result in results))
+        self.assertEqual(sum(result['online'] for result in results), 4) # The first wave finished
+        self.assertEqual(host_health.stats()['opens'], 0)
+        host_health.clear()
+
+    def test_mcp_client_skips_dead_hosts(self):
+        host_health.clear()
+        offline = ServerStatus.offline("Connection timed out after 3 seconds.")
+        probe = MagicMock(return_value=offline)
+        with patch.object(MCPClient, '_probe_status', probe), \
+             patch.object(host_health, 'failure_threshold', 2), patch.object(host_health, 'enabled', True):
+            results = [MCPClient.get_server_status('down.example.com', 25565, timeout=3) for _ in range(3)]
+            async_result = asyncio.run(MCPClient.async_get_server_status('down.example.com', 25565, timeout=3))
+        self.assertEqual(probe.call_count, 2)
+        self.assertTrue(all(result is offline for result in results + [async_result]))
+        self.assertEqual(host_health.stats()['short_circuits'], 2)
+        host_health.clear()
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry(enabled=True)
+        self.requests = self.registry.counter('test_requests_total', 'Requests.', ('route',))
+        self.latency = self.registry.histogram('test_latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1))
+
+    def test_per_thread_values_are_summed_and_survive_their_threads(self):
+        def work():
+            for _ in range(100):
+                self.requests.inc('/a')
+            self.latency.observe(0.05, '/a')
+            self.latency.observe(0.5, '/a')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.requests.inc('/b', amount=2)
+
+        self.assertEqual(self.registry.value(self.requests, '/a'), 400)
+        self.assertEqual(self.registry._shards[-1][1][(self.requests, ('/b',))], 2) # Only this thread's shard is live
+        self.assertEqual(len(self.registry._shards), 1) # The ended threads' shards were folded in
+        text = self.registry.render()
+        self.assertIn('test_requests_total{route="/a"} 400\n', text)
+        self.assertIn('test_latency_seconds_bucket{route="/a",le="0.1"} 4\n', text)
+        self.assertIn('test_latency_seconds_bucket{route="/a",le="1"} 8\n', text)
+        self.assertIn('test_latency_seconds_bucket{route="/a",le="+Inf"} 8\n', text)
+        self.assertIn('test_latency_seconds_sum{route="/a"} 2.2\n', text)
+        self.assertIn('test_latency_seconds_count{route="/a"} 8\n', text)
+
+    def test_collectors_and_disabled_registry(self):
+        self.registry.add_collector(lambda: [('test_size', 'gauge', 'Size.', [({'cache': 'a"b'}, 3)])])
+        self.assertIn('test_size{cache="a\\"b"} 3\n', self.registry.render())
+
+        disabled = MetricsRegistry(enabled=False)
+        counter = disabled.counter('test_total', 'Total.')
+        counter.inc()
+        self.assertEqual(disabled.value(counter), 0)
+
+
+class TestServerListing(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = ServerRegistry([{'name': f'Server {i}', 'host': f'host{i}.example.org', 'port': 25565,
+                                         'type': 'Minecraft Bedrock' if i % 2 else 'Minecraft Java'}
+                                        for i in range(10)])
+        self.listing = ServerListing(self.registry, page_size=3, max_page_size=5, max_entries=16)
+
+    def test_pages_are_clamped_and_searchable(self):
+        page = self.listing.page("  BEDROCK ", offset=0, limit=100)
+        self.assertEqual(page['limit'], 5)
+        self.assertEqual(page['total'], 5)
+        self.assertEqual([record.id for record in page['servers']], [1, 3, 5, 7, 9])
+        self.assertIsNone(page['next_offset'])
+
+        page = self.listing.page("host1", offset=-3)
+        self.assertEqual((page['offset'], page['limit']), (0, 3))
+        self.assertEqual([record.id for record in page['servers']], [1])
+
+    def test_cached_values_are_reused_until_the_registry_changes(self):
+        renders = []
+
+        def render(query):
+            renders.append(query)
+            return f"rendered {len(self.listing.search(query))}"
+
+        self.assertEqual(self.listing.fragment('rows', render, 'java'), "rendered 5")
+        self.assertEqual(self.listing.fragment('rows', render, 'java'), "rendered 5")
+        self.assertEqual(renders, ['java'])
+        etag = self.listing.etag()
+
+        self.registry.add('Another', 'another.example.org', 25565, 'Minecraft Java')
+        self.assertEqual(self.listing.fragment('rows', render, 'java'), "rendered 6")
+        self.assertEqual(renders, ['java', 'java'])
+        self.assertNotEqual(self.listing.etag(), etag)
+        self.assertEqual(self.listing.stats()['version'], self.registry.version)
+
+
+class TestSweep(unittest.TestCase):
+
+    def test_wire_format_round_trip(self):
+        statuses = [
+            ServerStatus(True, edition='java', version='1.20.4', protocol_version=765, motd='Welcome \u00a7 h\u00e9',
+                         player_count=3, player_max=100, players=['Steve', 'Alex'], latency=12.5, resolve_ms=0.25),
+            ServerStatus(True, edition='bedrock', version='1.20', protocol_version=-1, player_count=0,
+                         player_max=10, map_name='world', gamemode='Survival', latency=3.0),
+            ServerStatus.offline("Connection refused.", edition='java'),
+        ]
+        data = encode_batch([encode_record(index, index / 10, status) for index, status in enumerate(statuses)])
+        decoded = decode_batch(data)
+        self.assertEqual([(index, elapsed) for index, elapsed, _ in decoded], [(0, 0.0), (1, 0.1), (2, 0.2)])
+        self.assertEqual([status for _, _, status in decoded], statuses)
+        self.assertLess(len(data), sum(len(json.dumps(status.to_dict())) for status in statuses))
+
+    def test_wire_format_survives_out_of_range_numbers(self):
+        big = ServerStatus(True, edition='java', player_count=5, player_max=2**31, protocol_version=-2**40)
+        (_, _, decoded), = decode_batch(encode_batch([encode_record(0, 0.1, big)]))
+        self.assertEqual(decoded, big)
+
+        huge = ServerStatus(True, edition='bedrock', player_count=1, player_max=2**64)
+        data = encode_batch([encode_result(0, 0.1, huge), encode_result(1, 0.2, big)])
+        (_, _, first), (_, _, second) = decode_batch(data)
+        self.assertFalse(first.online)
+        self.assertEqual(first.edition, 'bedrock')
+        self.assertIn("could not be encoded", first.error)
+        self.assertEqual(second, big) # The next record is unaffected
+
+    def test_sweep_across_worker_processes(self):
+        listener = socket.socket() # Accepts connections (via the backlog) but never answers
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(8)
+        self.addCleanup(listener.close)
+        with socket.socket() as probe_socket:
+            probe_socket.bind(('127.0.0.1', 0))
+            closed_port = probe_socket.getsockname()[1]
+
+        servers = [{'name': 'Refused', 'host': '127.0.0.1', 'port': closed_port, 'type': 'Minecraft Java'},
+                   {'name': 'Refused too', 'host': '127.0.0.2', 'port': closed_port, 'type': 'Minecraft Java'}]
+        report = SweepEngine(workers=2, timeout=2, start_method='spawn').sweep(servers)
+        self.assertEqual([status.error for status in report.results], ["Connection refused.", "Connection refused."])
+        self.assertEqual(len(report.durations), 2)
+        self.assertEqual(report.to_dict()['offline'], 2)
+
+        silent = [{'name': 'Silent', 'host': '127.0.0.1', 'port': listener.getsockname()[1], 'type': 'Minecraft Java'}]
+        report = SweepEngine(workers=1, timeout=30, start_method='spawn').sweep(silent, deadline=0.5)
+        self.assertIn("deadline", report.results[0].error)
+        self.assertEqual(report.durations, [])
+
+
+class TestPrompts(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ServerRegistry().add("Bedrock Realm", "bedrock.example.com", 19132, "Minecraft Bedrock")
+        prompts.token_usage.reset()
+
+    def test_templates_render_only_sections_with_values(self):
+        context = prompts.server_context(self.server, {
+            "online": True, "edition": "bedrock", "version": "1.21", "motd": "Hi", "player_count": 3,
+            "player_max": 10, "gamemode": "Survival", "map_name": None})
+        self.assertIn("(Host: bedrock.example.com:19132)", context)
+        self.assertIn("Players: 3/10. It is a Bedrock Edition server. Game mode: Survival. ", context)
+        self.assertNotIn("Map:", context)
+
+        offline = prompts.server_context(self.server, {"online": False}, "Usually 5 players. ")
+        self.assertIn("appears to be offline", offline)
+        self.assertTrue(offline.endswith("Error: Not specified. Usually 5 players. "))
+        self.assertEqual(prompts.user_message("", "Hi"), 'User\'s message: "Hi"')
+
+    def test_select_model_and_fit_to_budget(self):
+        self.assertEqual(prompts.select_model(None), config.CHAT_MODEL)
+        self.assertEqual(prompts.select_model('gpt-4o'), 'gpt-4o')
+        with self.assertRaises(ValueError):
+            prompts.select_model('gpt-0')
+        self.assertLessEqual(prompts.prompt_budget('gpt-3.5-turbo'),
+                             config.CHAT_MODELS['gpt-3.5-turbo'] - config.CHAT_REPLY_TOKEN_RESERVE)
+
+        messages = ([{"role": "system", "content": prompts.SYSTEM_PROMPT},
+                     {"role": "system", "content": "Summary of earlier turns."}] +
+                    [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " * 20} for i in range(4)] +
+                    [{"role": "user", "content": "New question"}])
+        fitted, tokens, dropped = prompts.fit_to_budget(messages, 'gpt-4o')
+        self.assertEqual((fitted, dropped), (messages, 0))
+        self.assertEqual(tokens, count_message_tokens(messages, 'gpt-4o'))
+
+        budget = count_message_tokens(messages[:2] + messages[4:], 'gpt-4o')
+        fitted, tokens, dropped = prompts.fit_to_budget(messages, 'gpt-4o', budget)
+        self.assertEqual(dropped, 2) # Oldest turns first; the summary is kept
+        self.assertEqual(fitted, messages[:2] + messages[4:])
+        self.assertEqual(tokens, budget)
+
+        fitted, _, dropped = prompts.fit_to_budget(messages, 'gpt-4o', 1)
+        self.assertEqual(fitted, [messages[0], messages[-1]]) # System prompt and new message are always kept
+        self.assertEqual(dropped, 5)
+
+    def test_token_usage_records_reported_usage_only(self):
+        self.assertIsNone(prompts.token_usage.record('gpt-4o', MagicMock())) # No ints: nothing reported
+        self.assertIsNone(prompts.token_usage.record('gpt-4o', None))
+        usage = MagicMock(prompt_tokens=100, completion_tokens=20)
+        usage.prompt_tokens_details.cached_tokens = 64
+        self.assertEqual(prompts.token_usage.record('gpt-4o', usage)['cached_prompt_tokens'], 64)
+        prompts.token_usage.record('gpt-4o', usage)
+        self.assertEqual(prompts.token_usage.stats(), {'gpt-4o': {
+            "requests": 2, "prompt_tokens": 200, "completion_tokens": 40, "total_tokens": 240,
+            "cached_prompt_tokens": 128}})
+
+
+class TestAdmission(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        app.testing = True
+        self.client = app.test_client()
+        admission_module.client_limiter.clear()
+        admission_module.openai_limits.clear()
+        admission_module.probe_limiter.clear()
+
+    def test_rate_limiter_token_buckets_per_key(self):
+        limiter = admission_module.RateLimiter('test', 1, burst=2, max_keys=2, clock=lambda: self.now)
+        self.assertEqual(limiter.acquire('a'), 0)
+        self.assertEqual(limiter.acquire('a'), 0)
+        self.assertAlmostEqual(limiter.acquire('a'), 1.0) # Empty: one token a second
+        self.assertEqual(limiter.acquire('b'), 0) # Other keys have their own bucket
+        self.now += 1
+        self.assertEqual(limiter.acquire('a'), 0)
+        self.assertAlmostEqual(limiter.acquire('a', amount=5), 2.0) # Larger than the bucket: waits for a full one
+        limiter.acquire('c') # Evicts the least recently used key ('b')
+        self.assertEqual(limiter.stats()['keys'], 2)
+        self.assertEqual(limiter.stats()['limited'], 2)
+        self.assertEqual(admission_module.RateLimiter('off', None).acquire('a', amount=10**6), 0)
+
+    def test_admission_queue_priority_and_rejections(self):
+        controller = admission_module.AdmissionController(max_concurrent=2, max_queue=2, queue_timeout=2,
+                                                          admin_reserved=1)
+        controller.enter('chat') # Chat may use one slot, the other is reserved for admin
+        controller.enter('admin')
+        order = []
+
+        def wait_for_slot(lane):
+            controller.enter(lane)
+            order.append(lane)
+
+        threads = [threading.Thread(target=wait_for_slot, args=(lane,)) for lane in ('chat', 'admin')]
+        for depth, thread in enumerate(threads, 1): # Queue the chat request first
+            thread.start()
+            while controller.queue_depth < depth:
+                time.sleep(0.001)
+        with self.assertRaises(admission_module.Rejected) as rejected:
+            controller.enter('chat') # Queue full
+        self.assertEqual((rejected.exception.status, rejected.exception.reason), (503, 'queue_full'))
+        self.assertGreaterEqual(rejected.exception.retry_after, 1)
+
+        controller.release(0.5)
+        threads[1].join(2)
+        self.assertEqual(order, ['admin']) # Queued admin requests go first
+        controller.release(0.5)
+        controller.release(0.5)
+        threads[0].join(2)
+        self.assertEqual(order, ['admin', 'chat'])
+        self.assertEqual(controller.stats()['active'], 1)
+        self.assertEqual(controller.stats()['rejected'], {'queue_full': 1})
+
+        impatient = admission_module.AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.05,
+                                                         admin_reserved=0)
+        impatient.enter('chat')
+        with self.assertRaises(admission_module.Rejected) as rejected:
+            impatient.enter('chat')
+        self.assertEqual(rejected.exception.reason, 'queue_timeout')
+        self.assertEqual(impatient.queue_depth, 0)
+
+    def test_async_admission_waits_on_the_event_loop(self):
+        controller = admission_module.AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=2,
+                                                          admin_reserved=0)
+
+        async def scenario():
+            await controller.async_enter('chat')
+            waiting = asyncio.ensure_future(controller.async_enter('chat'))
+            await asyncio.sleep(0.01)
+            self.assertEqual(controller.queue_depth, 1)
+            threading.Thread(target=controller.release, args=(0.1,)).start() # Released from another thread
+            await asyncio.wait_for(waiting, 2)
+
+        asyncio.run(scenario())
+        self.assertEqual(controller.stats()['active'], 1)
+
+    def test_chat_routes_enforce_client_and_openai_limits(self):
+        with patch.object(admission_module.client_limiter, 'rate', 0.01), \
+             patch.object(admission_module.client_limiter, 'burst', 1):
+            self.client.post('/chat_with_llm', json={'message': 'Hi'})
+            response = self.client.post('/chat_with_llm', json={'message': 'Hi'})
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers['Retry-After'], str(response.get_json()['retry_after']))
+            self.assertEqual(self.client.get('/admin/stats').status_code, 200) # Admin routes aren't client-limited
+        admission_module.client_limiter.clear()
+
+        config.OPENAI_API_KEY = 'fake_test_key'
+        try:
+            with patch.object(admission_module.openai_limits.tokens, 'rate', 1), \
+                 patch.object(admission_module.openai_limits.tokens, 'burst', 100), \
+                 patch('mcp_chat_app.llm_client.OpenAI') as mock_openai_class:
+                mock_openai_class.return_value.chat.completions.create.return_value.choices[0].message.content = "ok"
+                self.assertEqual(self.client.post('/chat_with_llm', json={'message': 'Hi'}).status_code, 200)
+                response = self.client.post('/chat_with_llm/stream', json={'message': 'Hi again'})
+                self.assertEqual(response.status_code, 429) # Plain JSON, before any event is streamed
+                self.assertIn("token rate limit", response.get_json()['error'])
+                self.assertEqual(mock_openai_class.return_value.chat.completions.create.call_count, 1)
+        finally:
+            config.OPENAI_API_KEY = None
+            client_manager.reset()
+        stats = self.client.get('/admin/stats').get_json()['admission']
+        self.assertEqual(stats['openai']['tokens']['limited'], 1)
+        self.assertEqual(stats['active'], 1) # Only this stats request
+
+    def test_probe_rate_limit_per_server(self):
+        with patch.object(admission_module.probe_limiter, 'rate', 0.01), \
+             patch.object(admission_module.probe_limiter, 'burst', 1):
+            self.assertIsNone(MCPClient._probe_rate_limited('Mc.Example.com', 25565, 'Minecraft Java'))
+            limited = MCPClient._probe_rate_limited('mc.example.com', 25565, 'Minecraft Java')
+            self.assertIsNone(MCPClient._probe_rate_limited('mc.example.com', 25566, 'Minecraft Java'))
+        self.assertTrue(is_unknown(limited)) # Not a verdict about the server
+        self.assertIn("rate limit", limited['error'])
+
+    def test_rate_limited_probe_keeps_the_last_result(self):
+        cache = StatusCache(ttl=0, negative_ttl=0, stale_ttl=0, history=StatusHistory())
+        observed = []
+        cache.subscribe(lambda key, result: observed.append(result))
+        with patch.object(admission_module.probe_limiter, 'rate', 0.01), \
+             patch.object(admission_module.probe_limiter, 'burst', 1), \
+             patch('mcp_chat_app.mcp_client.MCPClient._probe_status',
+                   return_value=ServerStatus(True, player_count=3, player_max=20)) as mock_probe:
+            first = cache.get('mc.example.com', 25565, 'Minecraft Java')
+            second = cache.get('mc.example.com', 25565, 'Minecraft Java') # Expired, but rate limited
+        mock_probe.assert_called_once()
+        self.assertIs(second, first)
+        self.assertEqual(observed, [first]) # Nothing pushed or recorded for the limited call
+        self.assertEqual(cache.stats()['size'], 1)
+
+
+class TestStatusPush(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = ServerRegistry([
+            {'name': 'Alpha', 'host': 'alpha.example', 'port': 25565, 'type': 'Minecraft Java'},
+            {'name': 'Beta', 'host': 'beta.example', 'port': 19132, 'type': 'Minecraft Bedrock'},
+        ])
+        self.broadcaster = StatusBroadcaster(servers_source=lambda: self.registry, tick=60, player_change=2,
+                                             player_change_ratio=0.1, backlog=2, max_subscribers=2)
+        self.addCleanup(self.broadcaster.stop)
+
+    def _observe(self, server_id, online=True, players=10):
+        record = self.registry.get(server_id)
+        self.broadcaster.observe(StatusCache.make_key(record.host, record.port, record.type),
+                                 ServerStatus(online, player_count=players if online else None, player_max=100))
+
+    @staticmethod
+    def _events(chunk):
+        return [json.loads(line[len("data: "):]) for line in chunk.decode('utf-8').splitlines()
+                if line.startswith("data: ")]
+
+    def test_parse_server_ids(self):
+        self.assertIsNone(parse_server_ids(None))
+        self.assertIsNone(parse_server_ids('all'))
+        self.assertEqual(parse_server_ids('3, 0,3'), frozenset({0, 3}))
+        with self.assertRaises(ValueError):
+            parse_server_ids('1,two')
+
+    def test_only_meaningful_changes_are_pushed_and_coalesced(self):
+        subscriber = self.broadcaster.subscribe(None)
+        self._observe(0, players=10) # First result of a server
+        self._observe(0, players=11) # Below the threshold
+        self._observe(0, players=13) # 3 players since the last push: pushed, merged into the same event
+        self.broadcaster.flush()
+        events = self._events(subscriber.next(0))
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0], {"online": True, "player_count": 13, "player_max": 100, "id": 0,
+                                     "name": "Alpha", "changed": ["online", "players"]})
+
+        self._observe(0, players=14) # Below max(2, 10% of 13)
+        self.broadcaster.flush()
+        self.assertIsNone(subscriber.next(0))
+        self._observe(0, online=False)
+        self.broadcaster.flush()
+        self.assertEqual(self._events(subscriber.next(0))[0]['changed'], ["online"])
+        self.assertEqual(self.broadcaster.stats()['changes'], 3)
+
+    def test_events_are_encoded_once_and_shared(self):
+        everyone = self.broadcaster.subscribe(None)
+        beta_only = self.broadcaster.subscribe(frozenset({1}))
+        self.assertIsNone(self.broadcaster.subscribe(None)) # max_subscribers reached
+        self._observe(0)
+        self._observe(1)
+        self.broadcaster.flush()
+        chunk = everyone.next(0)
+        self.assertEqual([event['id'] for event in self._events(chunk)], [0, 1])
+        self.assertEqual([event['id'] for event in self._events(beta_only.next(0))], [1])
+        self.assertEqual(self.broadcaster.stats()['events'], 2)
+
+        self.broadcaster.unsubscribe(beta_only)
+        second = self.broadcaster.subscribe(None)
+        self._observe(0, online=False)
+        self.broadcaster.flush()
+        self.assertIs(everyone.next(0), second.next(0)) # Same bytes object for the same subscription
+        self.assertEqual([event['id'] for event in self._events(self.broadcaster.initial_events(frozenset({0})))], [0])
+
+        for players in (50, 60, 70): # A reader that falls behind loses the oldest pushes
+            self._observe(1, players=players)
+            self.broadcaster.flush()
+        self.assertEqual([event['player_count'] for event in self._events(everyone.next(0))], [60, 70])
+        self.assertEqual(self.broadcaster.stats()['dropped'], 2)
+
+    def test_async_subscriber_is_woken_from_another_thread(self):
+        subscriber = self.broadcaster.subscribe(None)
+
+        async def wait():
+            pushed = asyncio.get_running_loop().run_in_executor(None, lambda: (self._observe(1),
+                                                                               self.broadcaster.flush()))
+            chunk = await subscriber.async_next(5)
+            await pushed
+            return chunk
+        self.assertEqual(self._events(asyncio.run(wait()))[0]['name'], 'Beta')
+
+    @patch('mcp_chat_app.status_cache.MCPClient.get_server_status')
+    def test_status_stream_route(self, mock_get_status):
+        config.MCP_SERVERS.clear()
+        config.MCP_SERVERS.add_many(copy.deepcopy(config.DEFAULT_MCP_SERVERS))
+        self.addCleanup(config.MCP_SERVERS.clear)
+        status_cache.clear()
+        status_push.clear()
+        self.addCleanup(status_push.stop)
+        client = app.test_client()
+        self.assertEqual(client.get('/status/stream?servers=0,x').status_code, 400)
+
+        mock_get_status.return_value = ServerStatus(True, player_count=7, player_max=50)
+        server = config.MCP_SERVERS.get(2)
+        status_cache.get(server.host, server.port, server.type) # A probe feeds the broadcaster
+        response = client.get('/status/stream?servers=2', buffered=False)
+        try:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+            self.assertEqual(status_push.stats()['subscribers'], 1)
+            events = self._events(next(iter(response.response)))
+            self.assertEqual(events, [{"online": True, "player_count": 7, "player_max": 50, "id": 2,
+                                       "name": "Local Test Bedrock", "changed": []}])
+            with patch.object(config, 'STATUS_PUSH_MAX_WSGI_SUBSCRIBERS', 1): # Each stream holds a thread here
+                rejected = client.get('/status/stream?servers=2')
+            self.assertEqual(rejected.status_code, 503)
+        finally:
+            response.close()
+        self.assertEqual(status_push.stats()['subscribers'], 0)
@@ -0,0 +1,64 @@
+# This file contains token counting for prompt budgets (conversation history, server tables).
+# tiktoken gives exact counts for OpenAI models when it is installed and its encoding files are
+# available; otherwise a cheap character-based estimate is used so budgets still work.
+
+import threading
+
+from . import config
+
+try:
+    import tiktoken # Optional: pip install tiktoken
+except ImportError:
+    tiktoken = None
+
+# Tokens added per chat message for the role and separators (OpenAI's chat format overhead).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encodings = {} # model -> tiktoken Encoding, or None if it couldn't be loaded
+_encodings_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (about 4 characters per token for English text and tables)."""
+    return (len(text) + 3) // 4
+
+
+def _encoding_for(model):
+    encoding = _encodings.get(model, False)
+    if encoding is not False:
+        return encoding
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                try:
+                    _encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError: # Unknown model name: use the encoding of current chat models
+                    _encodings[model] = tiktoken.get_encoding('cl100k_base')
+            except Exception as e: # E.g. the encoding file can't be downloaded (offline)
+                print(f"tiktoken encoding for {model} unavailable, estimating token counts: {e}")
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def count_tokens(text, model=None):
+    """
+    Counts the tokens in a piece of text.
+
+    Args:
+        text (str): The text.
+        model (str): Model whose tokenizer to use. Defaults to config.TOKEN_COUNT_MODEL.
+
+    Returns:
+        int: The exact count with tiktoken, otherwise an estimate.
+    """
+    if not text:
+        return 0
+    encoding = _encoding_for(model or config.TOKEN_COUNT_MODEL) if tiktoken is not None else None
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages, model=None):
+    """Counts the prompt tokens of a list of chat messages, including per-message overhead."""
+    return sum(count_tokens(message.get('content') or '', model) + MESSAGE_OVERHEAD_TOKENS for message in messages)